@@ -3,8 +3,9 @@ import pandas as pd
 if __name__ == "__main__":
     date = pd.to_datetime("2010-01-01")
 
-    dataset = pd.read_csv("../dataset_development/datasets/completed/ml_dataset.csv", low_memory=True, parse_dates=["date"], index_col="date")
-    dataset = dataset.loc[dataset.index >= date]
+    # Only the years from $date are read from the partitioned dataset
+    dataset = pd.read_parquet("../dataset_development/datasets/completed/ml_dataset", filters=[("year", ">=", date.year), ("date", ">=", date)])
+    dataset = dataset.drop("year", axis=1).set_index("date")
     dataset = dataset.sort_values(by=["date", "ticker"])
 
     sep = pd.read_csv("../dataset_development/datasets/sharadar/SEP_PURGED_ADJUSTED.csv", parse_dates=["date"], index_col="date")
@@ -2,6 +2,10 @@
 Reference for dataset column names.
 By commenting a feature out, the feature will be omitted from training when running one of the model training scripts.
 """
+import pandas as pd
+import numpy as np
+
+ml_dataset_path = "./dataset_development/datasets/completed/ml_dataset"
 
 features = [
     "age",
@@ -141,9 +145,46 @@ labels = [
 
 base_cols = ["ticker", "date", "calendardate", "datekey"]
 
+# Flags, scores and age are stored as they are, for filtering. finalize_dataset adds copies scaled per date like the other
+# features (<feature>_scaled), which the models that need scaled inputs (linear, PCA, DNN) use instead.
+unscaled_features = ["sin", "ipo", "ps", "ms", "nincr", "age"]
+scaled_features = [feature + "_scaled" if feature in unscaled_features else feature for feature in features]
+
 tbm_columns = [
     "ewmstd_2y_monthly",
     "timeout",
     "date", # NOTE: Required to be set as index
     "ticker", # NOTE: Required for job splitting
 ]
+
+
+def load_ml_dataset(columns: list=None, start=None, end=None, path: str=ml_dataset_path) -> pd.DataFrame:
+    """
+    Reads the year partitioned parquet dataset written by finalize_dataset (requires pyarrow), indexed by date.
+    Only $columns are read (all columns if None) and only rows with $start <= date <= $end, whole years outside the range
+    are skipped without being read.
+    """
+    filters = []
+    if start is not None:
+        start = pd.to_datetime(start)
+        filters += [("year", ">=", start.year), ("date", ">=", start)]
+    if end is not None:
+        end = pd.to_datetime(end)
+        filters += [("year", "<=", end.year), ("date", "<=", end)]
+
+    if columns is not None:
+        columns = ["date"] + [column for column in columns if column != "date"]
+
+    dataset = pd.read_parquet(path, columns=columns, filters=filters or None)
+
+    if "year" in dataset.columns:
+        dataset = dataset.drop("year", axis=1)
+
+    return dataset.set_index("date")
+
+
+def get_feature_matrix(dataset: pd.DataFrame, columns: list=scaled_features) -> np.ndarray:
+    """
+    The $columns of $dataset as one contiguous float32 array, ready to be handed to a model.
+    """
+    return np.ascontiguousarray(dataset[columns].to_numpy(dtype=np.float32))
@@ -0,0 +1,203 @@
+"""
+Benchmark of the dataset pipeline on synthetic data (see synthetic_data.py), from extend_sep_for_sampling through
+finalize_dataset, at several numbers of tickers.
+
+Each run times every stage (the tasks of generate_sep_featured and generate_sf1_featured, and finalize_dataset) and is
+appended to a JSON file together with the git commit it ran on, so runs of different versions can be compared with
+compare_results.
+
+Run from dataset_development/, optionally with comma separated numbers of tickers and the number of years:
+    python benchmark_pipeline.py 100,1000,14000 10
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import datetime
+import platform
+import subprocess
+import pandas as pd
+import numpy as np
+
+from synthetic_data import write_synthetic_sharadar, get_synthetic_paths
+
+
+def get_version() -> str:
+    """
+    Git commit of the working directory (with "-dirty" if there are uncommitted changes), None outside of git.
+    """
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+        dirty = subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return commit + ("-dirty" if dirty else "")
+
+
+def get_max_rss_mb() -> float:
+    """
+    Peak resident memory of this process and of its (finished) worker processes, None where it is not available.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    # ru_maxrss is in kilobytes on Linux
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024
+
+
+def count_rows(csv_path: str) -> int:
+    with open(csv_path) as csv_file:
+        return sum(1 for _ in csv_file) - 1
+
+
+def run_benchmark(num_tickers: int, work_dir: str, years: int=10, num_processes: int=4, sampling: str="rebase", seed: int=0) -> dict:
+    """
+    Generates synthetic data for $num_tickers tickers and $years years in $work_dir (reused if it exists) and runs the
+    pipeline on it. Returns the run: the scale, the number of rows in and out and the seconds of each stage.
+    """
+    from generate_features import generate_sep_featured, generate_sf1_featured
+    from finalize_dataset import finalize_dataset
+
+    data_dir = os.path.join(work_dir, "data_{}_tickers_{}_years_{}".format(num_tickers, years, seed))
+    paths = get_synthetic_paths(data_dir)
+    if not all(os.path.isfile(path) for path in paths.values()):
+        print("Generating synthetic data in: ", data_dir)
+        write_synthetic_sharadar(data_dir, num_tickers, years=years, seed=seed)
+
+    cache_dir = os.path.join(work_dir, "molecules_cache")
+    if os.path.exists(cache_dir):
+        shutil.rmtree(cache_dir)
+    os.makedirs(cache_dir)
+
+    tb_rate = pd.read_csv(paths["tb_rate"], parse_dates=["date"], index_col="date")
+    metadata = pd.read_csv(paths["metadata"], parse_dates=["firstpricedate"])
+
+    sep_timings = []
+    sf1_timings = []
+    start_time = time.time()
+
+    sep_featured = generate_sep_featured(num_processes=num_processes, cache_dir=cache_dir, tb_rate=tb_rate, sep_path=paths["sep"], \
+        sf1_art_path=paths["sf1_art"], metadata_path=paths["metadata"], resume=False, sampling=sampling, timings=sep_timings)
+
+    sf1_featured = generate_sf1_featured(num_processes=num_processes, cache_dir=cache_dir, sf1_art_path=paths["sf1_art"], \
+        sf1_arq_path=paths["sf1_arq"], metadata_path=paths["metadata"], resume=False, timings=sf1_timings)
+
+    start_time_finalize = time.time()
+    dataset = finalize_dataset(metadata=metadata, sep_featured=sep_featured.reset_index(), sf1_featured=sf1_featured.reset_index(), \
+        num_processes=num_processes, seed=seed)
+    finalize_seconds = time.time() - start_time_finalize
+
+    stages = [{"stage": "SEP: " + timing["stage"], "seconds": timing["seconds"]} for timing in sep_timings] + \
+        [{"stage": "SF1: " + timing["stage"], "seconds": timing["seconds"]} for timing in sf1_timings] + \
+        [{"stage": "finalize_dataset", "seconds": finalize_seconds}]
+
+    shutil.rmtree(cache_dir)
+
+    return {
+        "num_tickers": num_tickers,
+        "years": years,
+        "sampling": sampling,
+        "num_processes": num_processes,
+        "seed": seed,
+        "rows": {
+            "sep": count_rows(paths["sep"]),
+            "sf1_art": count_rows(paths["sf1_art"]),
+            "sep_featured": len(sep_featured),
+            "sf1_featured": len(sf1_featured),
+            "dataset": len(dataset),
+        },
+        "stages": stages,
+        "total_seconds": time.time() - start_time,
+        "max_rss_mb": get_max_rss_mb(),
+    }
+
+
+def record_results(runs: list, path: str) -> dict:
+    """
+    Appends $runs to the JSON file $path (created if missing), with the version and environment they ran in.
+    Returns the contents of the file.
+    """
+    results = {"runs": []}
+    if os.path.isfile(path):
+        with open(path) as results_file:
+            results = json.load(results_file)
+
+    environment = {
+        "version": get_version(),
+        "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.node(),
+    }
+    for run in runs:
+        results["runs"].append(dict(environment, **run))
+
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(path, "w") as results_file:
+        json.dump(results, results_file, indent=2)
+
+    return results
+
+
+def compare_results(path: str, max_ratio: float=1.2) -> pd.DataFrame:
+    """
+    Compares the seconds of each stage in the latest run of each scale (tickers, years, sampling) in the JSON file $path
+    with the run before it of the same scale. Stages that got more than $max_ratio times slower are regressions.
+    """
+    with open(path) as results_file:
+        runs = json.load(results_file)["runs"]
+
+    comparisons = []
+    scales = []
+    for run in runs:
+        scale = (run["num_tickers"], run["years"], run["sampling"])
+        if scale not in scales:
+            scales.append(scale)
+
+    for scale in scales:
+        scale_runs = [run for run in runs if (run["num_tickers"], run["years"], run["sampling"]) == scale]
+        if len(scale_runs) < 2:
+            continue
+        previous, latest = scale_runs[-2], scale_runs[-1]
+        previous_seconds = {stage["stage"]: stage["seconds"] for stage in previous["stages"]}
+
+        for stage in latest["stages"] + [{"stage": "Total", "seconds": latest["total_seconds"]}]:
+            before = previous["total_seconds"] if stage["stage"] == "Total" else previous_seconds.get(stage["stage"], np.nan)
+            comparisons.append({
+                "num_tickers": scale[0], "years": scale[1], "sampling": scale[2], "stage": stage["stage"],
+                "previous_version": previous["version"], "latest_version": latest["version"],
+                "previous_seconds": before, "latest_seconds": stage["seconds"],
+            })
+
+    comparison = pd.DataFrame(comparisons, columns=["num_tickers", "years", "sampling", "stage", "previous_version", \
+        "latest_version", "previous_seconds", "latest_seconds"])
+    comparison["ratio"] = comparison["latest_seconds"] / comparison["previous_seconds"]
+    comparison["regression"] = comparison["ratio"] > max_ratio
+
+    return comparison
+
+
+if __name__ == "__main__":
+    scales = [int(num_tickers) for num_tickers in sys.argv[1].split(",")] if len(sys.argv) > 1 else [100, 1000, 14000]
+    years = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    results_path = "./datasets/benchmarks/pipeline_benchmarks.json"
+    work_dir = "./datasets/benchmarks/work"
+
+    for num_tickers in scales:
+        run = run_benchmark(num_tickers, work_dir, years=years, num_processes=32)
+        record_results([run], results_path) # One at a time, so finished runs are kept if a larger one fails
+
+        print("\n{} tickers, {} years: {} seconds".format(num_tickers, years, round(run["total_seconds"], 1)))
+        for stage in run["stages"]:
+            print("    {:<80} {:>10.1f}".format(stage["stage"], stage["seconds"]))
+
+    with pd.option_context('display.max_rows', None, 'display.max_columns', None, 'display.width', 200):
+        print(compare_results(results_path))
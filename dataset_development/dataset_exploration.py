@@ -1,5 +1,6 @@
 import pandas as pd
 import sys
+import time
 from dateutil.relativedelta import *
 from datetime import datetime, timedelta
 import numpy as np
@@ -118,6 +119,106 @@ def report_date_relationship(sf1):
     return report
 
 
+"""
+WHOLE UNIVERSE REPORTS
+The reports below are calculated with grouped operations over the full SF1 table at once (ticker and calendardate
+as columns), instead of running the per ticker functions above through the engine. One report frame per check.
+"""
+
+def report_all_gaps(sf1: pd.DataFrame) -> pd.DataFrame:
+    """
+    Number of gaps over 1 quarter (> 100 days) and over 4 quarters (> 370 days) between consecutive calendardates of
+    each ticker. Only tickers with gaps over 1 quarter are reported (columns: ticker, gaps over 1q, gaps over 4q).
+    NOTE: Rows are sorted by calendardate within each ticker first (detect_gaps meant to, but did not assign the result).
+    """
+    sf1 = sf1[["ticker", "calendardate"]].sort_values(by=["ticker", "calendardate"], kind="mergesort")
+
+    diff = sf1["calendardate"].diff().dt.days
+    diff = diff.where(sf1["ticker"] == sf1["ticker"].shift(1), 0) # First row of each ticker
+
+    report = pd.DataFrame({
+        "gaps over 1q": (diff > 100).groupby(sf1["ticker"]).sum(),
+        "gaps over 4q": (diff > 370).groupby(sf1["ticker"]).sum(),
+    })
+    report = report.loc[report["gaps over 1q"] > 0]
+    
+    return report.reset_index().rename(columns={"index": "ticker"})
+
+
+def report_all_updates(sf1: pd.DataFrame) -> pd.DataFrame:
+    """
+    Calendardates reported more than once for a ticker, with the number of rows (columns: calendardate, ticker, count).
+    """
+    counts = sf1.groupby(["ticker", "calendardate"]).size().rename("count").reset_index()
+    
+    return counts.loc[counts["count"] > 1, ["calendardate", "ticker", "count"]].reset_index(drop=True)
+
+
+def report_all_duplicate_datekeys(sf1: pd.DataFrame) -> pd.DataFrame:
+    """
+    Whether each ticker has more than one row with the same datekey (indexed by ticker).
+    """
+    duplicates = sf1.duplicated(subset=["ticker", "datekey"])
+    
+    return duplicates.groupby(sf1["ticker"]).any().to_frame(name=0)
+
+
+def report_all_date_relationships(sf1: pd.DataFrame) -> pd.DataFrame:
+    """
+    Whether datekey is after calendardate for all rows of each ticker (indexed by ticker).
+    """
+    datekey_after_caldate = sf1["datekey"] > sf1["calendardate"]
+    
+    return datekey_after_caldate.groupby(sf1["ticker"]).all().to_frame(name="datekey_after_caldate")
+
+
+def report_data_quality(sf1: pd.DataFrame) -> dict:
+    """
+    All whole universe reports for $sf1 (SF1 ART or ARQ with ticker, calendardate and datekey as columns), to be run on every
+    data refresh.
+    """
+    return {
+        "gap_report": report_all_gaps(sf1),
+        "update_report": report_all_updates(sf1),
+        "duplicates_report": report_all_duplicate_datekeys(sf1),
+        "date_relationship_report": report_all_date_relationships(sf1),
+    }
+
+
+def compare_report_runtimes(sf1: pd.DataFrame) -> pd.DataFrame:
+    """
+    Seconds used by the per ticker reports (applied to each ticker in one process, without the engine) and the whole
+    universe reports on $sf1.
+    """
+    per_ticker_reports = {
+        "gap_report": lambda sf1_ticker: report_gaps(sf1_ticker.set_index("calendardate")),
+        "update_report": lambda sf1_ticker: report_updates(sf1_ticker.set_index("calendardate")),
+        "duplicates_report": report_duplicate_datekeys,
+        "date_relationship_report": report_date_relationship,
+    }
+    whole_universe_reports = {
+        "gap_report": report_all_gaps,
+        "update_report": report_all_updates,
+        "duplicates_report": report_all_duplicate_datekeys,
+        "date_relationship_report": report_all_date_relationships,
+    }
+
+    runtimes = pd.DataFrame(columns=["per_ticker", "whole_universe"])
+    for name in per_ticker_reports:
+        start = time.time()
+        for _, sf1_ticker in sf1.groupby("ticker"):
+            per_ticker_reports[name](sf1_ticker.copy())
+        runtimes.at[name, "per_ticker"] = time.time() - start
+
+        start = time.time()
+        whole_universe_reports[name](sf1)
+        runtimes.at[name, "whole_universe"] = time.time() - start
+
+    runtimes["speedup"] = runtimes["per_ticker"] / runtimes["whole_universe"]
+
+    return runtimes
+
+
 if __name__ == "__main__":
     
     """
@@ -206,6 +307,15 @@ if __name__ == "__main__":
 
     dataset = pd.read_csv("./datasets/ml_ready_live/dataset_with_nans.csv", parse_dates=["date", "datekey", "timeout", "calendardate"], index_col="date")
 
+    # Whole universe data quality reports, one frame per check
+    for name, path in [("art", "./datasets/sharadar/SHARADAR_SF1_ART.csv"), ("arq", "./datasets/sharadar/SHARADAR_SF1_ARQ.csv")]:
+        sf1 = pd.read_csv(path, parse_dates=["datekey", "calendardate", "reportperiod"])
+
+        for report_name, report in report_data_quality(sf1).items():
+            report.to_csv("./datasets/testing/{}_{}.csv".format(report_name, name))
+
+        print(compare_report_runtimes(sf1))
+
 
 
 """
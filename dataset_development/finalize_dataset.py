@@ -3,8 +3,13 @@ import sys
 from dateutil.relativedelta import *
 import numpy as np
 import math
+import zlib
+import warnings
+import shutil
+import os
 
 from processing.engine import pandas_mp_engine
+from helpers.grouped_moments import GroupedMoments
 
 # The order sets the order of columns in the final dataset
 selected_sf1_features = [
@@ -161,6 +166,12 @@ labels = [
     "stop_loss_barrier",
 ]
 
+# Features kept as they are by scale_samples: binary flags and integer scores mean the same on every date, and age
+# (days since the filing) is compared to a fixed limit. A copy of each, named with scaled_copy_suffix, is scaled like the
+# other features for the models.
+unscaled_features = ["sin", "ipo", "ps", "ms", "nincr", "age"]
+scaled_copy_suffix = "_scaled"
+
 base_cols = ["ticker", "date", "calendardate", "datekey"]
 
 sizes = ["nano", "micro", "small", "mid", "large", "mega"]
@@ -178,80 +189,81 @@ def merge_datasets(sep_featured, sf1_featured, selected_features) -> pd.DataFram
 
     return dataset
 
+def get_block_seed(seed: int, *keys) -> list:
+    """
+    Seed for the random draws of one (industry, size) block. It depends only on $seed and the block's keys,
+    so the same values are drawn regardless of how the dataset is split between processes.
+    """
+    return [seed, zlib.crc32("|".join(str(key) for key in keys).encode("utf-8"))]
+
+
 """
 Notes:
 1. You need to filter out samples that rely on very old financial statements (see the age column)
 """
-def fix_nans_and_drop_rows(dataset: pd.DataFrame, metadata: pd.DataFrame, features: list, size_rvs: dict):
-    """
-    dataset and sep is given per industry. (might update to industry in the future. Depends on how nans should be amended)
-    Note that dataset must have a size column with 
-    """
+def drop_rows(dataset: pd.DataFrame) -> pd.DataFrame:
     # 1. Drop all with less than two years of sep history (this will fix a lot, as a lot of missing values is due to too little history)
     # 2. Drop all without a label
     dataset = dataset.dropna(axis=0, subset=["mom24m", "primary_label_tbm", "return_1m", "erp_1m"]) # NOTE: illiquidity does not seem to work... no time to look into it
 
     # 3. Drop rows with outdated labels
-    dataset = dataset.loc[dataset.age <= 180]
+    return dataset.loc[dataset.age <= 180]
 
-    """
-    drop_indexes = []
-    for index, row in dataset.iterrows(): 
-        if row["age"] > 180: # pd.Timedelta('180 days')
-            drop_indexes.append(index)
 
-    dataset = dataset.drop(drop_indexes, axis=0)
+def fix_nans_and_drop_rows(dataset: pd.DataFrame, metadata: pd.DataFrame, features: list, size_rvs: GroupedMoments, seed: int=0, \
+    size_ind_rvs: GroupedMoments=None):
     """
-    
+    dataset and sep is given per industry. (might update to industry in the future. Depends on how nans should be amended)
+    Note that dataset must have a size column with 
+    size_rvs has the moments of each feature per size for the whole market.
+    Missing values are drawn from a normal distribution with the mean and std of the feature for the row's industry and size,
+    falling back on the market's mean and std for the size, and then on a standard normal.
+    $size_ind_rvs has the moments per industry and size, calculated from the rows of dataset that are kept if None.
+    Draws are made once per (industry, size) block, and year if dataset has a year column, from an rng seeded with $seed
+    and the block's keys.
+    """
+    dataset = drop_rows(dataset)
+
     # Calculate random variables
     # Size classifications: Nano <$50m; 2 - Micro < $300m; 3 - Small < $2bn; 4 - Mid <$10bn; 5 - Large < $200bn; 6 - Mega >= $200b
-    nano_dataset = dataset.loc[dataset["size"] == "nano"]
-    micro_dataset = dataset.loc[dataset["size"] == "micro"]
-    small_dataset = dataset.loc[dataset["size"] == "small"]
-    mid_dataset = dataset.loc[dataset["size"] == "mid"]
-    large_dataset = dataset.loc[dataset["size"] == "large"]
-    mega_dataset = dataset.loc[dataset["size"] == "mega"]
-
-    size_ind_rvs = {}
-
-    for feature in features:
-        size_ind_rvs[feature] = {
-        "nano": (nano_dataset[feature].mean(), nano_dataset[feature].std()),
-        "micro": (micro_dataset[feature].mean(), micro_dataset[feature].std()),
-        "small": (small_dataset[feature].mean(), small_dataset[feature].std()),
-        "mid": (mid_dataset[feature].mean(), mid_dataset[feature].std()),
-        "large": (large_dataset[feature].mean(), large_dataset[feature].std()),
-        "mega": (mega_dataset[feature].mean(), mega_dataset[feature].std()),
-    }
+    block_keys = ["industry", "size"] if "industry" in dataset.columns else ["size"]
+    if size_ind_rvs is None:
+        size_ind_rvs = GroupedMoments.from_dataframe(dataset, features, block_keys)
+    size_ind_means, size_ind_stds = size_ind_rvs.means(), size_ind_rvs.stds()
+    size_means, size_stds = size_rvs.means(), size_rvs.stds()
 
+    values = dataset[features].values.astype(np.float64)
 
     # Fill nans from normal distributions
-    for index, row in dataset.iterrows():
-        size = row["size"]
-        for feature in features:            
-            if pd.isnull(row[feature]):
-                mean = size_ind_rvs[feature][size][0]
-                std = size_ind_rvs[feature][size][1]
-                # market = False
-                if pd.isnull(mean) or pd.isnull(std):
-                    # market = True
-                    mean = size_rvs[feature][size][0] # I guess this could also be null
-                    std = size_rvs[feature][size][1]
-                
-                if pd.isnull(mean) or pd.isnull(std):
-                    dataset.at[index, feature] = np.random.normal(0, 1) # Not optimal, but only a very small part of the data gets this treatment (ill)
-                else:
-                    dataset.at[index, feature] = np.random.normal(mean, std)
-                
-                """
-                if (row["ticker"] == "AAPL") and (feature == "bm") and (row["datekey"] == pd.to_datetime("2003-12-19")):
-                    print("AAPL mean and std: ", mean, std)
-                    print
-                    if market == True: 
-                        print("Used market mean and std")
-                    else:
-                        print("Used industry mean and std")
-                """
+    draw_keys = block_keys + ["year"] if "year" in dataset.columns else block_keys
+    for keys, positions in dataset.groupby(draw_keys).indices.items():
+        keys = keys if isinstance(keys, tuple) else (keys,)
+        moment_keys = keys[:len(block_keys)]
+        size = moment_keys[-1]
+
+        block = values[positions]
+        missing = np.isnan(block)
+        if not missing.any():
+            continue
+
+        mean = size_ind_means.loc[moment_keys if len(moment_keys) > 1 else size, features].values.astype(np.float64)
+        std = size_ind_stds.loc[moment_keys if len(moment_keys) > 1 else size, features].values.astype(np.float64)
+
+        use_market = np.isnan(mean) | np.isnan(std)
+        if size in size_means.index:
+            mean = np.where(use_market, size_means.loc[size, features].values.astype(np.float64), mean)
+            std = np.where(use_market, size_stds.loc[size, features].values.astype(np.float64), std)
+
+        # Not optimal, but only a very small part of the data gets this treatment (ill)
+        use_standard_normal = np.isnan(mean) | np.isnan(std)
+        mean = np.where(use_standard_normal, 0, mean)
+        std = np.where(use_standard_normal, 1, std)
+
+        rng = np.random.default_rng(get_block_seed(seed, *keys))
+        values[positions] = np.where(missing, rng.normal(mean, std, size=block.shape), block)
+
+    dataset = dataset.copy()
+    dataset[features] = values
 
 
     # 4. Drop remaining rows with nans so no nans get through
@@ -262,22 +274,154 @@ def fix_nans_and_drop_rows(dataset: pd.DataFrame, metadata: pd.DataFrame, featur
     return dataset
 
 
-# Maybe this belongs in the training scripts?
-def feature_scaling(dataset: pd.DataFrame()):
+def rank_columns(values: np.ndarray) -> np.ndarray:
+    """
+    Ranks (1 to number of values) of each column of the 2d array $values, ties get their average rank
+    and nans stay nan (same as pandas' rank).
+    """
+    # Work on one row per column, sorting along contiguous memory is a lot faster
+    columns = np.ascontiguousarray(values.T)
+    nr_of_values = columns.shape[1]
+
+    order = np.argsort(columns, axis=1) # nans are sorted last
+    sorted_columns = np.take_along_axis(columns, order, axis=1)
+
+    ends = np.ones((columns.shape[0], 1), dtype=bool)
+    changes = sorted_columns[:, 1:] != sorted_columns[:, :-1]
+    first_of_tie = np.concatenate([ends, changes], axis=1)
+    last_of_tie = np.concatenate([changes, ends], axis=1)
+
+    positions = np.arange(nr_of_values)
+    first = np.maximum.accumulate(np.where(first_of_tie, positions, 0), axis=1)
+    last = np.minimum.accumulate(np.where(last_of_tie, positions, nr_of_values)[:, ::-1], axis=1)[:, ::-1]
+
+    ranks = np.empty(columns.shape)
+    np.put_along_axis(ranks, order, (first + last) / 2 + 1, axis=1)
+    ranks[np.isnan(columns)] = np.nan
+
+    return ranks.T
+
+
+def quantile_columns(values: np.ndarray, quantiles) -> np.ndarray:
+    """
+    The $quantiles (linear interpolation, same as pandas' quantile) of each column of the 2d array $values, skipping nans.
+    Returns one row per quantile, nan for columns without values.
+    """
+    sorted_values = np.sort(values, axis=0) # nans are sorted last
+    counts = np.count_nonzero(~np.isnan(values), axis=0)
+
+    positions = (counts - 1) * np.asarray(quantiles, dtype=np.float64)[:, None]
+    below = np.floor(positions).astype(np.int64).clip(0, None)
+    above = np.minimum(below + 1, (counts - 1).clip(0, None))
+
+    lower_values = np.take_along_axis(sorted_values, below, axis=0)
+    upper_values = np.take_along_axis(sorted_values, above, axis=0)
+
+    return np.where(counts > 0, lower_values + (upper_values - lower_values) * (positions - below), np.nan)
+
+
+def feature_scaling(dataset: pd.DataFrame, features: list, method: str="rank", limits: tuple=(0.01, 0.99)):
     """
     To make the dataset suitable for machine learning, all features must be expressed as numbers (floats, ints) and be scaled
     to the same size (Size scaling, is probably not needed for decision trees...)
-    """    
-    
-    scaled_dataset = dataset
+    Features are scaled cross-sectionally, for each date separately, so the scaled values do not depend on later dates:
+        "rank":   the feature's rank among the stocks on the date, mapped to the interval [-1, 1]
+        "zscore": the feature is winsorized at the $limits quantiles of the date and then standardized
+    All features of a date are scaled at once as one 2d array and stored as float32.
+    """
+    if method not in ["rank", "zscore"]:
+        raise ValueError("method must be 'rank' or 'zscore', not {}".format(method))
+
+    values = dataset[features].values.astype(np.float64)
+    scaled = np.full(values.shape, np.nan, dtype=np.float32)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning) # Features without values on a date stay nan
+
+        for positions in dataset.groupby("date", sort=False).indices.values():
+            date_values = values[positions]
+            counts = np.count_nonzero(~np.isnan(date_values), axis=0)
 
-    return scaled_dataset
+            if method == "rank":
+                # A lone value is in the middle of the interval
+                date_scaled = (rank_columns(date_values) - 1) / np.where(counts > 1, counts - 1, np.nan) * 2 - 1
+                date_scaled = np.where(counts > 1, date_scaled, np.where(np.isnan(date_values), np.nan, 0))
+            else:
+                lower, upper = quantile_columns(date_values, limits)
+                date_values = np.clip(date_values, lower, upper)
+                std = np.nanstd(date_values, axis=0, ddof=1)
+                # No dispersion on the date gives 0
+                date_scaled = (date_values - np.nanmean(date_values, axis=0)) / np.where(std > 0, std, np.nan)
+                date_scaled = np.where(std > 0, date_scaled, np.where(np.isnan(date_values), np.nan, 0))
 
+            scaled[positions] = date_scaled
 
+    # Setting the columns one by one with a new dtype is very slow for wide datasets
+    scaled = pd.DataFrame(scaled, index=dataset.index, columns=features)
 
+    return pd.concat([dataset.drop(features, axis=1), scaled], axis=1)[dataset.columns]
 
-def finalize_dataset(metadata, sep_featured=None, sf1_featured=None, num_processes=6):
 
+def scale_samples(dataset: pd.DataFrame, features: list, method: str="rank") -> pd.DataFrame:
+    """
+    Drops the samples without a side (primary_label_tbm of 0) and scales the $features of the rest with feature_scaling.
+    unscaled_features are kept as they are, for filtering, and scaled copies of them are added (<feature>_scaled).
+    The samples are dropped first, so they are not part of the ranks and moments of their date.
+    """
+    dataset = dataset.loc[dataset.primary_label_tbm != 0]
+
+    copied = [feature for feature in features if feature in unscaled_features]
+    dataset = dataset.assign(**{feature + scaled_copy_suffix: dataset[feature] for feature in copied})
+
+    return feature_scaling(dataset, [feature for feature in features if feature not in unscaled_features] + \
+        [feature + scaled_copy_suffix for feature in copied], method=method)
+
+
+def write_partitioned_dataset(dataset: pd.DataFrame, path: str):
+    """
+    Writes $dataset as a parquet dataset (requires pyarrow) with one directory per year of the date column, replacing
+    anything at $path. Use dataset_columns.load_ml_dataset to read selected columns and date ranges back.
+    """
+    if os.path.exists(path):
+        shutil.rmtree(path)
+
+    dataset = dataset.sort_values(by=["date", "ticker"])
+    dataset["year"] = dataset["date"].dt.year
+
+    dataset.to_parquet(path, partition_cols=["year"], index=False)
+
+
+def upsert_partitioned_dataset(dataset: pd.DataFrame, path: str, start, end):
+    """
+    Replaces the rows dated from $start to $end in the partitioned dataset at $path with the rows of $dataset.
+    Only the year partitions overlapping the date range are read and rewritten.
+    """
+    start = pd.to_datetime(start)
+    end = pd.to_datetime(end)
+
+    for year in range(start.year, end.year + 1):
+        partition_path = os.path.join(path, "year={}".format(year))
+
+        if os.path.exists(partition_path):
+            partition = pd.read_parquet(partition_path)
+            partition = partition.loc[(partition["date"] < start) | (partition["date"] > end)]
+            shutil.rmtree(partition_path)
+        else:
+            partition = pd.DataFrame(columns=dataset.columns)
+
+        partition = pd.concat([partition, dataset.loc[dataset["date"].dt.year == year]], sort=False)
+
+        if len(partition) > 0:
+            partition = partition.sort_values(by=["date", "ticker"])
+            partition["year"] = year
+            partition.to_parquet(path, partition_cols=["year"], index=False)
+
+
+def prepare_dataset(sep_featured: pd.DataFrame, sf1_featured: pd.DataFrame) -> tuple:
+    """
+    Merges the featured datasets into the rows of the ml dataset, with numeric features, a size and a year column.
+    Returns the dataset and the (sorted) list of features to impute and scale.
+    """
     sf1_featured = sf1_featured.drop_duplicates(subset=["ticker", "datekey"], keep="last")
 
     # 2. Select features from SEP, SF1 etc.
@@ -307,9 +451,9 @@ def finalize_dataset(metadata, sep_featured=None, sf1_featured=None, num_process
 
     dataset = dataset.replace([np.inf, -np.inf], np.nan)
     
-    features = list(set(dataset.columns) - set(labels) - set(base_cols) - set(["industry"]))
+    features = sorted(set(dataset.columns) - set(labels) - set(base_cols) - set(["industry"]))
 
-    # 4. Calculate mean and var for each feature for each size category for the whole market
+    # 4. Size category of each row, the mean and var of each feature is calculated per size for the whole market
     # Size classifications: Nano <$50m; 2 - Micro < $300m; 3 - Small < $2bn; 4 - Mid <$10bn; 5 - Large < $200bn; 6 - Mega >= $200bn
     
     dataset = dataset.dropna(axis=0, subset=["mve"])
@@ -322,26 +466,33 @@ def finalize_dataset(metadata, sep_featured=None, sf1_featured=None, num_process
     dataset["size"].loc[(dataset.mve >= math.log(10e9)) & (dataset.mve < math.log(200e9))] = "large"
     dataset["size"].loc[dataset.mve >= math.log(200e9)] = "mega"
 
-    nano_dataset = dataset.loc[dataset["size"] == "nano"]
-    micro_dataset = dataset.loc[dataset["size"] == "micro"]
-    small_dataset = dataset.loc[dataset["size"] == "small"]
-    mid_dataset = dataset.loc[dataset["size"] == "mid"]
-    large_dataset = dataset.loc[dataset["size"] == "large"]
-    mega_dataset = dataset.loc[dataset["size"] == "mega"]
+    dataset["year"] = dataset["date"].dt.year
 
-    print(features)
-    size_rvs = {}
-    for feature in features:
-        size_rvs[feature] = {
-            "nano": (nano_dataset[feature].mean(), nano_dataset[feature].std()),
-            "micro": (micro_dataset[feature].mean(), micro_dataset[feature].std()),
-            "small": (small_dataset[feature].mean(), small_dataset[feature].std()),
-            "mid": (mid_dataset[feature].mean(), mid_dataset[feature].std()),
-            "large": (large_dataset[feature].mean(), large_dataset[feature].std()),
-            "mega": (mega_dataset[feature].mean(), mega_dataset[feature].std()),
-        }
+    return dataset, features
 
 
+def get_imputation_moments(dataset: pd.DataFrame, features: list) -> dict:
+    """
+    Moments used to fill missing values, per year so they can be updated a year at a time (see incremental_update.py):
+        "size":          per year and size for the whole market
+        "industry_size": per year, industry and size, of the rows fix_nans_and_drop_rows keeps
+    """
+    return {
+        "size": GroupedMoments.from_dataframe(dataset, features, ["year", "size"]),
+        "industry_size": GroupedMoments.from_dataframe(drop_rows(dataset), features, ["year", "industry", "size"]),
+    }
+
+
+def impute_and_scale(dataset: pd.DataFrame, metadata: pd.DataFrame, features: list, moments: dict, num_processes=6, seed=0, \
+    scaling_method="rank") -> pd.DataFrame:
+    """
+    Steps 5 and 6 of finalize_dataset on a prepared $dataset, with the imputation $moments of all years (see
+    get_imputation_moments). Draws are made per year and scaling is per date, so the rows of whole years can be
+    finalized on their own.
+    """
+    size_rvs = moments["size"].collapse(["size"])
+    size_ind_rvs = moments["industry_size"].collapse(["industry", "size"])
+
     # 5. Fix Nans and drop rows    
     dataset = pandas_mp_engine(
         callback=fix_nans_and_drop_rows, 
@@ -352,12 +503,33 @@ def finalize_dataset(metadata, sep_featured=None, sf1_featured=None, num_process
         num_processes=num_processes, 
         molecules_per_process=1, 
         features=features, 
-        size_rvs=size_rvs
+        size_rvs=size_rvs,
+        seed=seed,
+        size_ind_rvs=size_ind_rvs,
     )
     
+    # 6. Drop samples without a side and scale features, model scripts use them (and the scaled copies) as they are
+    dataset = scale_samples(dataset, features, method=scaling_method)
+
     dataset["erp_1m_direction"] = np.sign(dataset["erp_1m"])
 
-    dataset = dataset.loc[dataset.primary_label_tbm != 0]
+    return dataset.drop("year", axis=1)
+
+
+def finalize_dataset(metadata, sep_featured=None, sf1_featured=None, num_processes=6, seed=0, scaling_method="rank", moments_path=None):
+    """
+    $moments_path, if given, is where the imputation moments are saved for incremental updates of the dataset.
+    """
+    dataset, features = prepare_dataset(sep_featured, sf1_featured)
+
+    # 4. Calculate mean and var for each feature for each size category for the whole market
+    print(features)
+    moments = get_imputation_moments(dataset, features)
+    if moments_path is not None:
+        pd.to_pickle(moments, moments_path)
+
+    dataset = impute_and_scale(dataset, metadata, features, moments, num_processes=num_processes, seed=seed, \
+        scaling_method=scaling_method)
 
     """
     with pd.option_context('display.max_rows', None, 'display.max_columns', None):
@@ -382,9 +554,11 @@ if __name__ == "__main__":
         
     sf1_featured = pd.read_csv("./datasets/completed/sf1_featured.csv", parse_dates=["calendardate", "datekey"])
 
-    dataset = finalize_dataset(metadata=metadata, sep_featured=sep_featured, sf1_featured=sf1_featured)
+    dataset = finalize_dataset(metadata=metadata, sep_featured=sep_featured, sf1_featured=sf1_featured, \
+        moments_path="./datasets/completed/ml_dataset_moments.pickle")
 
     dataset.to_csv("./datasets/completed/ml_dataset.csv", index=False)
+    write_partitioned_dataset(dataset, "./datasets/completed/ml_dataset")
 
     # Report on final dataset
     with pd.option_context('display.max_rows', None, 'display.max_columns', None):
@@ -10,6 +10,7 @@ The most recent row from sep_featured.csv, and the most recent SF1 row based on
 
 import datetime
 import os
+import time
 import pandas as pd
 
 
@@ -17,9 +18,8 @@ from processing.engine import pandas_chaining_mp_engine
 from helpers.helpers import get_calendardate_x_quarters_later
 
 
-from sampling import extend_sep_for_sampling, rebase_at_each_filing_sampling
-from sep_features import add_sep_features, dividend_adjusting_prices_backwards, \
-    add_weekly_and_12m_stock_returns, add_equally_weighted_weekly_market_returns, add_indmom
+from sampling import extend_sep_for_sampling, rebase_at_each_filing_sampling, cusum_filter_sampling
+from sep_features import add_sep_features, dividend_adjusting_prices_backwards, add_sep_panel_features
 from sf1_features import add_sf1_features
 from sf1_industry_features import add_industry_sf1_features
 from labeling import add_labels_via_triple_barrier_method, equity_risk_premium_labeling
@@ -44,6 +44,36 @@ sf1_features = [
 
 industry_sf1_features = ["bm_ia", "cfp_ia", "chatoia", "mve_ia", "pchcapex_ia", "chpmia", "herf", "ms"]
 
+# Alternative sampling tasks of generate_sep_featured, chosen with its $sampling argument
+sampling_tasks = {
+    "rebase": { # sorted values, This is first needed when running add_sep_features
+        "name": "Sample observations using rebase_at_each_filing_sampling",
+        "callback": rebase_at_each_filing_sampling, # This returns samples...
+        "molecule_key": "observations",
+        "data": None,
+        "kwargs": {
+            "days_of_distance": 20
+        },
+        "split_strategy": "ticker",
+        "cache_result": True,
+        "columns": {"sf1_art": ["datekey"]},
+        "disk_name": "sep_sampled",
+    },
+    "cusum": { # Event based, fewer samples with less overlapping labels
+        "name": "Sample observations using cusum_filter_sampling",
+        "callback": cusum_filter_sampling,
+        "molecule_key": "observations",
+        "data": None,
+        "kwargs": {
+            "threshold_multiplier": 1.5 # Times ewmstd_2y_monthly, 1.5 gives about 2/3 of the samples of monthly sampling
+        },
+        "split_strategy": "ticker",
+        "cache_result": True,
+        "columns": {"sep": ["close", "dividends"], "sf1_art": ["datekey"]}, # Sampling starts at the first datekey
+        "disk_name": "sep_sampled_cusum",
+    },
+}
+
 """
 sf1_arq_cols = ticker,dimension,calendardate,datekey,reportperiod,lastupdated,accoci,assets,assetsavg,\
 assetsc,assetsnc,assetturnover,bvps,capex,cashneq,cashnequsd,cor,consolinc,currentratio,de,debt,\
@@ -58,8 +88,16 @@ assetsc,assetsnc,assetturnover,bvps,capex,cashneq,cashnequsd,cor,consolinc,curre
                                     taxassets,taxexp,taxliabilities,tbvps,workingcapital
 """
 
-def generate_sep_featured(num_processes, cache_dir, tb_rate, sep_path, sf1_art_path, metadata_path, resume):
+def generate_sep_featured(num_processes, cache_dir, tb_rate, sep_path, sf1_art_path, metadata_path, resume, date_range=None, \
+    tickers=None, sampling="rebase", timings=None):
     """
+    $timings, if a list, gets the seconds spent on each stage appended (see pandas_chaining_mp_engine).
+    $sampling is the key of the sampling task to use in sampling_tasks. The results of the tasks after sampling are
+    cached under names ending with the sampling key (except for "rebase"), so the samplers don't resume from each other.
+    $date_range (start, end) limits the SEP rows read, $tickers the tickers read from all files. Only the columns declared
+    by the tasks are read (see infer_atoms_columns in processing/engine.py).
+    NOTE: Features with lookbacks (up to 2 years) and labels (up to 3 months ahead) are nan close to the ends of $date_range.
+
     Wanted tickers length:  14138
     sf1_art length:  433417
     Purged sep length:  31971372
@@ -69,7 +107,7 @@ def generate_sep_featured(num_processes, cache_dir, tb_rate, sep_path, sf1_art_p
     atoms_configs = {
         "sep": { # atoms_info
             "disk_name": "sep",
-            "csv_path": sep_path, # "./datasets/sharadar/SEP_PURGED.csv", # These paths are relative to what?, I think the engine...
+            "csv_path": sep_path, # "./datasets/sharadar/SEP_PURGED.parquet", # These paths are relative to what?, I think the engine...
             # "csv_path": "./datasets/testing/sep.csv",
             "parse_dates": ["date"],
             "index_col": "date",
@@ -77,10 +115,13 @@ def generate_sep_featured(num_processes, cache_dir, tb_rate, sep_path, sf1_art_p
             "length": 31971372,
             "sort_by": ["ticker", "date"],
             "cache": True,
+            "columns": "infer",
+            "date_range": date_range,
+            "tickers": tickers,
         },
         "sf1_art": {
             "disk_name": "sf1_art",
-            "csv_path": sf1_art_path, # "./datasets/sharadar/SHARADAR_SF1_ART.csv",
+            "csv_path": sf1_art_path, # "./datasets/sharadar/SHARADAR_SF1_ART.parquet",
             # "csv_path": "./datasets/testing/sf1_art.csv",
             "parse_dates": ["calendardate", "datekey"],
             "index_col": "calendardate",
@@ -88,6 +129,8 @@ def generate_sep_featured(num_processes, cache_dir, tb_rate, sep_path, sf1_art_p
             "length": 433417,
             "sort_by": ["ticker", "calendardate", "datekey"],
             "cache": True,
+            "columns": "infer",
+            "tickers": tickers, # Filings before the date range are needed for the first samples
         },
         "metadata": {
             "disk_name": "metadata",
@@ -98,9 +141,13 @@ def generate_sep_featured(num_processes, cache_dir, tb_rate, sep_path, sf1_art_p
             "length": 14135,
             "sort_by": None,
             "cache": True,
+            "columns": "infer",
+            "tickers": tickers,
         },
     }
 
+    disk_name_suffix = "" if sampling == "rebase" else "_" + sampling
+
     # Output from each task is input to the next.
     sep_tasks = [
         { # sorted values ???
@@ -115,6 +162,7 @@ def generate_sep_featured(num_processes, cache_dir, tb_rate, sep_path, sf1_art_p
             "split_strategy": "ticker", # How the molecules needs to be split for this task
             "sort_by": ["ticker", "date"], # Sorting parameters, used both for molecules individually and when combined
             "cache_result": True,  # Whether to cache the resulting molecules, because they are needed later in the chain
+            "columns": {"sf1_art": ["datekey", "sharesbas"], "metadata": ["industry", "sector", "siccode"]}, # Columns of the atoms used
             "disk_name": "sep_extended", # Name of molecules saved as pickle in cache_dir or as one csv file in save_dir
         },
         # Dividend adjustment...
@@ -126,53 +174,25 @@ def generate_sep_featured(num_processes, cache_dir, tb_rate, sep_path, sf1_art_p
             "kwargs": {},
             "split_strategy": "ticker",
             "cache_result": True,
+            "columns": {"sep": ["close", "dividends"]},
             "disk_name": "sep_extended_divadj",
         },
+        # Momentum, return and industry/market features as array operations over the whole (date x ticker) panel,
+        # NOTE: need to add result to molecules dict for later tasks
         {
-            "name": "Add weekly and 12 month stock returns",
-            "callback": add_weekly_and_12m_stock_returns,
+            "name": "Add momentum and return features on the whole panel",
+            "callback": add_sep_panel_features,
             "molecule_key": "sep",
             "data": None,
             "kwargs": {},
-            "split_strategy": "ticker",
+            "split_strategy": "none",
             "cache_result": True,
-            "disk_name": "sep_extended_divadj_ret",
-        },
-        {
-            "name": "Add equally weighted weekly market returns",
-            "callback": add_equally_weighted_weekly_market_returns,
-            "molecule_key": "sep",
-            "data": None,
-            "kwargs": {},
-            "split_strategy": "date",
-            "cache_result": True,
-            "disk_name": "sep_extended_divadj_ret_market",
-        },
-        # NOTE: need to start here because of needing to add result to molecules dict for later tasks
-        {
-            "name": "Add industry momentum",
-            "callback": add_indmom,
-            "molecule_key": "sep", 
-            "data": None,
-            "kwargs": {},
-            "split_strategy": "industry",
-            "cache_result": True,
-            "add_to_molecules_dict": True, # But split the wrong way
+            "add_to_molecules_dict": True,
             "split_strategy_for_molecule_dict": "ticker",
+            "columns": {"sep": ["close", "dividends"], "metadata": ["industry"]},
             "disk_name": "sep_extended_divadj_ret_market_ind",
         },
-        { # sorted values, This is first needed when running add_sep_features
-            "name": "Sample observations using rebase_at_each_filing_sampling",
-            "callback": rebase_at_each_filing_sampling, # This returns samples...
-            "molecule_key": "observations",
-            "data": None,
-            "kwargs": {
-                "days_of_distance": 20
-            },
-            "split_strategy": "ticker",
-            "cache_result": True,
-            "disk_name": "sep_sampled",
-        },
+        sampling_tasks[sampling],
         { # Sorted values
             "name": "Add sep features",
             "callback": add_sep_features, # adj_close keyerror
@@ -181,10 +201,13 @@ def generate_sep_featured(num_processes, cache_dir, tb_rate, sep_path, sf1_art_p
                 "sep": "sep_extended_divadj_ret_market_ind", # I need to get the updated sep df
                 "sf1_art": "sf1_art"
             },
-            "kwargs": {},
+            "kwargs": {
+                "feature_cache_dir": os.path.join(cache_dir, "sep_features"), # Per feature cache, only changed features are recalculated
+            },
             "split_strategy": "ticker",
             "cache_result": True,
-            "disk_name": "sep_featured",
+            "columns": {"sep": ["open", "close", "volume", "dividends"], "sf1_art": ["datekey", "sharesbas", "sharefactor"]},
+            "disk_name": "sep_featured" + disk_name_suffix,
         },
         { # Labeling
             "name": "Label the dataset for side prediction using the tripple barrier method",
@@ -199,33 +222,32 @@ def generate_sep_featured(num_processes, cache_dir, tb_rate, sep_path, sf1_art_p
             },
             "split_strategy": "ticker",
             "cache_result": True,
-            "disk_name": "tbm_labeled_sep"
-        },
-        {
-            "name": "Label the dataset for regressions on monthly equity risk premums",
-            "callback": equity_risk_premium_labeling,
-            "molecule_key": "sep_featured",
-            "data": None,
-            "kwargs": {
-                "tb_rate": tb_rate, 
-            },
-            "split_strategy": "ticker",
-            "cache_result": True,
-            "disk_name": "erp_labeled_sep"
+            "columns": {"sep": ["close"]},
+            "disk_name": "tbm_labeled_sep" + disk_name_suffix
         }
     ]
 
     sep_featured = pandas_chaining_mp_engine(tasks=sep_tasks, primary_atoms="sep", atoms_configs=atoms_configs, \
         split_strategy="ticker", num_processes=num_processes, cache_dir=cache_dir, sort_by=["ticker", "date"], \
-            molecules_per_process=2, resume=resume)
+            molecules_per_process=2, resume=resume, timings=timings)
+
+    # Labeling for regressions on monthly equity risk premiums, done on the whole dataset so tb_rate is not sent to every job
+    start_time = time.time()
+    sep_featured = equity_risk_premium_labeling(sep_featured, tb_rate)
+    if timings is not None:
+        timings.append({"stage": "Equity risk premium labeling", "seconds": time.time() - start_time})
     
     return sep_featured
 
-def generate_sf1_featured(num_processes, cache_dir, sf1_art_path, sf1_arq_path, metadata_path, resume):
+def generate_sf1_featured(num_processes, cache_dir, sf1_art_path, sf1_arq_path, metadata_path, resume, tickers=None, timings=None):
+    """
+    $timings, if a list, gets the seconds spent on each stage appended (see pandas_chaining_mp_engine).
+    $tickers limits the tickers read. The SF1 features use most columns of SF1_ART and SF1_ARQ, so all columns are read.
+    """
     sf1_atoms_configs = {
         "sf1_art": {
             "disk_name": "sf1_art",
-            "csv_path": sf1_art_path,# "./datasets/sharadar/SHARADAR_SF1_ART.csv",
+            "csv_path": sf1_art_path,# "./datasets/sharadar/SHARADAR_SF1_ART.parquet",
             # "csv_path": "./datasets/testing/sf1_art_no_duplicates.csv",
             "parse_dates": ["calendardate", "datekey"],
             "index_col": "calendardate",
@@ -233,10 +255,11 @@ def generate_sf1_featured(num_processes, cache_dir, sf1_art_path, sf1_arq_path,
             "length": 433417,
             "sort_by": ["ticker", "calendardate", "datekey"],
             "cache": True,
+            "tickers": tickers,
         },
         "sf1_arq": {
             "disk_name": "sf1_arq",
-            "csv_path": sf1_arq_path, # "./datasets/sharadar/SHARADAR_SF1_ARQ.csv",
+            "csv_path": sf1_arq_path, # "./datasets/sharadar/SHARADAR_SF1_ARQ.parquet",
             # "csv_path": "./datasets/testing/sf1_arq_no_duplicates.csv",
             "parse_dates": ["calendardate", "datekey"],
             "index_col": "calendardate",
@@ -244,6 +267,7 @@ def generate_sf1_featured(num_processes, cache_dir, sf1_art_path, sf1_arq_path,
             "length": 433417,
             "sort_by": ["ticker", "calendardate", "datekey"],
             "cache": True,
+            "tickers": tickers,
         },
         "metadata": {
             "disk_name": "metadata",
@@ -254,6 +278,7 @@ def generate_sf1_featured(num_processes, cache_dir, sf1_art_path, sf1_arq_path,
             "length": 14135,
             "sort_by": None,
             "cache": True,
+            "tickers": tickers,
         },
     }
 
@@ -267,7 +292,9 @@ def generate_sf1_featured(num_processes, cache_dir, sf1_art_path, sf1_arq_path,
                 "sf1_arq": "sf1_arq", # kw name -> molecule_dict_name (also same as in cache in most cases)
                 "metadata": "metadata", 
             },
-            "kwargs": {}, # Key word arguments to the callback
+            "kwargs": { # Key word arguments to the callback
+                "feature_cache_dir": os.path.join(cache_dir, "sf1_features"), # Per feature cache, only changed features are recalculated
+            },
             "split_strategy": "ticker", # How the molecules needs to be split for this task
             "sort_by": ["ticker", "calendardate", "datekey"], # Sorting parameters, used both for molecules individually and when combined
             "cache_result": True,  # Whether to cache the resulting molecules, because they are needed later in the chain
@@ -290,7 +317,7 @@ def generate_sf1_featured(num_processes, cache_dir, sf1_art_path, sf1_arq_path,
 
     sf1_featured = pandas_chaining_mp_engine(tasks=sf1_tasks, primary_atoms="sf1_art", atoms_configs=sf1_atoms_configs, \
         split_strategy="ticker", num_processes=num_processes, cache_dir=cache_dir, sort_by=["ticker", "calendardate", "datekey"], \
-            molecules_per_process=5, resume=resume)
+            molecules_per_process=5, resume=resume, timings=timings)
 
     sf1_featured = sf1_featured.sort_values(by=["ticker", "calendardate", "datekey"])
 
@@ -308,6 +335,9 @@ if __name__ == "__main__":
     if not os.path.exists(cache_dir):
         os.makedirs(cache_dir)
 
+    # SEP and SF1 are read from the columnar stores utils/ingest_sharadar_export.py merges the exports into, the same
+    # inputs incremental_update.py reads.
+
 
     if False:
         
@@ -316,8 +346,8 @@ if __name__ == "__main__":
             num_processes=32,
             cache_dir=cache_dir,
             tb_rate=tb_rate, 
-            sep_path="./datasets/sharadar/SEP_PURGED.csv",
-            sf1_art_path="./datasets/sharadar/SHARADAR_SF1_ART.csv",
+            sep_path="./datasets/sharadar/SEP_PURGED.parquet",
+            sf1_art_path="./datasets/sharadar/SHARADAR_SF1_ART.parquet",
             metadata_path="./datasets/sharadar/METADATA_PURGED.csv",
             resume=True
         )
@@ -336,8 +366,8 @@ if __name__ == "__main__":
         sf1_featured = generate_sf1_featured(
             num_processes=32,
             cache_dir=cache_dir,
-            sf1_art_path="./datasets/sharadar/SHARADAR_SF1_ART.csv",
-            sf1_arq_path="./datasets/sharadar/SHARADAR_SF1_ARQ.csv",
+            sf1_art_path="./datasets/sharadar/SHARADAR_SF1_ART.parquet",
+            sf1_arq_path="./datasets/sharadar/SHARADAR_SF1_ARQ.parquet",
             metadata_path="./datasets/sharadar/METADATA_PURGED.csv",
             resume=True
         )
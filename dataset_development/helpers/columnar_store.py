@@ -0,0 +1,369 @@
+import os
+import json
+import shutil
+import datetime
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+"""
+Ticker sorted columnar (parquet) files with a per ticker row offset index, written from csv files of any size.
+
+The csv is streamed in chunks, so peak memory is bounded by $chunksize and $bucket_rows, not by the size of the file:
+    1. The ticker column is read to count the rows of each ticker. Tickers are sorted and split into buckets of
+       consecutive tickers with about $bucket_rows rows each.
+    2. Each chunk is filtered by ticker and its rows are spilled to the bucket they belong to (pickle files in a work dir).
+    3. One bucket at a time is loaded, sorted and appended to the parquet file as row groups.
+
+The index (<path>.index.csv) holds the first row (start) and the row after the last row (stop) of each ticker in the
+parquet file, so one ticker's history is read from the row groups that contain it only.
+
+New exports are merged into an existing file the same way (merge_csv_into_ticker_sorted_parquet), one bucket of the file
+and the export at a time. Every merge is numbered in the ingest log (<path>.ingests.json) and the keys of the rows it
+added or changed are kept (<path>.changes/<ingest>.csv), so incremental rebuilds can read what changed since the last
+ingest they processed (read_changes).
+"""
+
+
+def get_index_path(path: str) -> str:
+    return path + ".index.csv"
+
+
+def count_ticker_rows(csv_path: str, tickers: set=None, chunksize: int=1000000, **read_csv_kwargs) -> pd.Series:
+    """
+    Number of rows of each ticker in the csv (only the ticker column is read), sorted by ticker.
+    """
+    counts = pd.Series(dtype=np.int64)
+    na_kwargs = {key: value for key, value in read_csv_kwargs.items() if key in ["keep_default_na", "na_values", "na_filter"]}
+
+    for chunk in pd.read_csv(csv_path, usecols=["ticker"], chunksize=chunksize, **na_kwargs):
+        if tickers is not None:
+            chunk = chunk.loc[chunk["ticker"].isin(tickers)]
+        counts = counts.add(chunk["ticker"].value_counts(), fill_value=0)
+
+    return counts.astype(np.int64).sort_index()
+
+
+def get_ticker_buckets(counts: pd.Series, bucket_rows: int) -> pd.Series:
+    """
+    Bucket number of each ticker. Buckets hold consecutive (sorted) tickers and about $bucket_rows rows each.
+    """
+    return pd.Series((counts.cumsum().values - counts.values) // bucket_rows, index=counts.index)
+
+
+def csv_to_ticker_sorted_parquet(csv_path: str, path: str, tickers: set=None, sort_by: list=["ticker", "date"], \
+    chunksize: int=1000000, bucket_rows: int=5000000, row_group_size: int=100000, work_dir: str=None, **read_csv_kwargs) -> pd.DataFrame:
+    """
+    Writes the rows of $csv_path for $tickers (all if None) to the parquet file $path, sorted by $sort_by (ticker first),
+    and the row offset index of each ticker to <path>.index.csv. $read_csv_kwargs are passed to read_csv (e.g. parse_dates).
+    Returns the index.
+    """
+    work_dir = work_dir or path + ".work"
+    if os.path.exists(work_dir):
+        shutil.rmtree(work_dir)
+    os.makedirs(work_dir)
+
+    counts = count_ticker_rows(csv_path, tickers, chunksize, **read_csv_kwargs)
+    buckets = get_ticker_buckets(counts, bucket_rows)
+
+    spill_to_buckets(csv_path, buckets, work_dir, chunksize, **read_csv_kwargs)
+
+    writer = None
+    written = [] # Rows written of each ticker
+
+    try:
+        for bucket in np.unique(buckets.values):
+            rows = read_bucket(work_dir, bucket)
+            rows = rows.sort_values(by=sort_by, kind="mergesort")
+
+            if writer is None:
+                table = pa.Table.from_pandas(rows, preserve_index=False)
+                writer = pq.ParquetWriter(path, table.schema)
+            else:
+                table = pa.Table.from_pandas(rows, schema=writer.schema, preserve_index=False)
+
+            writer.write_table(table, row_group_size=row_group_size)
+            written.append(rows["ticker"].value_counts(sort=False).sort_index())
+    finally:
+        if writer is not None:
+            writer.close()
+        shutil.rmtree(work_dir)
+
+    index = get_row_offset_index(written)
+    index.to_csv(get_index_path(path))
+
+    return index
+
+
+def spill_to_buckets(csv_path: str, buckets: pd.Series, work_dir: str, chunksize: int, **read_csv_kwargs):
+    """
+    Writes the rows of each chunk of $csv_path to the bucket of their ticker ($buckets), as pickle files in $work_dir.
+    Rows of tickers without a bucket are dropped.
+    """
+    for chunk_number, chunk in enumerate(pd.read_csv(csv_path, chunksize=chunksize, **read_csv_kwargs)):
+        chunk = chunk.loc[chunk["ticker"].isin(buckets.index)]
+        for bucket, rows in chunk.groupby(buckets.reindex(chunk["ticker"]).values):
+            rows.to_pickle(os.path.join(work_dir, "{}_{}.pickle".format(int(bucket), chunk_number)))
+
+
+def read_bucket(work_dir: str, bucket: int) -> pd.DataFrame:
+    """
+    The rows spilled to $bucket, in the order of the csv. None if nothing was spilled to it.
+    """
+    parts = sorted([name for name in os.listdir(work_dir) if name.startswith("{}_".format(bucket))], \
+        key=lambda name: int(name.split("_")[1].split(".")[0]))
+    if len(parts) == 0:
+        return None
+
+    return pd.concat([pd.read_pickle(os.path.join(work_dir, name)) for name in parts])
+
+
+def get_row_offset_index(written: list) -> pd.DataFrame:
+    """
+    The row offset index of a parquet file from the rows written of each ticker (a list of counts by ticker, in file order).
+    """
+    written = pd.concat(written) if len(written) > 0 else pd.Series(dtype=np.int64)
+    index = pd.DataFrame({"start": written.cumsum().values - written.values, "stop": written.cumsum().values}, index=written.index)
+    index.index.name = "ticker"
+
+    return index
+
+
+def read_ticker_index(path: str) -> pd.DataFrame:
+    return pd.read_csv(get_index_path(path), index_col="ticker", keep_default_na=False)
+
+
+def read_tickers(path: str, tickers: list, columns: list=None, index: pd.DataFrame=None) -> pd.DataFrame:
+    """
+    Rows of $tickers (in the order given) from a ticker sorted parquet file, reading only the row groups holding them.
+    """
+    index = read_ticker_index(path) if index is None else index
+    parquet_file = pq.ParquetFile(path)
+    row_group_stops = get_row_group_stops(parquet_file)
+
+    histories = []
+    for ticker in tickers:
+        if ticker not in index.index:
+            continue
+        start, stop = index.at[ticker, "start"], index.at[ticker, "stop"]
+        if start == stop:
+            continue
+
+        histories.append(read_rows(parquet_file, start, stop, columns, row_group_stops))
+
+    if len(histories) == 0:
+        empty = parquet_file.schema_arrow.empty_table().to_pandas()
+        return empty[columns] if columns is not None else empty
+
+    return pd.concat(histories, ignore_index=True)
+
+
+def get_row_group_stops(parquet_file: pq.ParquetFile) -> np.ndarray:
+    """
+    The row after the last row of each row group of $parquet_file.
+    """
+    return np.cumsum([parquet_file.metadata.row_group(i).num_rows for i in range(parquet_file.num_row_groups)])
+
+
+def read_rows(parquet_file: pq.ParquetFile, start: int, stop: int, columns: list=None, row_group_stops: np.ndarray=None) -> pd.DataFrame:
+    """
+    Rows $start to $stop (exclusive) of $parquet_file, reading only the row groups holding them.
+    NOTE: When reading many ranges of the same file, pass $row_group_stops (see get_row_group_stops).
+    """
+    row_group_stops = get_row_group_stops(parquet_file) if row_group_stops is None else row_group_stops
+    row_group_starts = np.append(0, row_group_stops[:-1])
+
+    first = np.searchsorted(row_group_stops, start, side="right")
+    last = np.searchsorted(row_group_stops, stop - 1, side="right")
+    table = parquet_file.read_row_groups(list(range(first, last + 1)), columns=columns)
+
+    return table.slice(start - row_group_starts[first], stop - start).to_pandas()
+
+
+def get_ingest_log_path(path: str) -> str:
+    return path + ".ingests.json"
+
+
+def get_changes_path(path: str, ingest: int) -> str:
+    return os.path.join(path + ".changes", "{}.csv".format(ingest))
+
+
+def read_ingest_log(path: str) -> list:
+    """
+    The ingests merged into $path, oldest first (empty if nothing was merged into it).
+    """
+    if not os.path.isfile(get_ingest_log_path(path)):
+        return []
+
+    with open(get_ingest_log_path(path)) as log_file:
+        return json.load(log_file)["ingests"]
+
+
+def get_added_and_changed(stored: pd.DataFrame, export: pd.DataFrame, keys: list) -> tuple:
+    """
+    Boolean arrays telling which rows of $export have $keys that are not in $stored (added), and which have $keys that
+    are in $stored but a different value in any other column (changed). $export must have unique $keys, if several
+    rows of $stored have the same $keys the last one is compared.
+    """
+    if (stored is None) or (len(stored) == 0):
+        return np.ones(len(export), dtype=bool), np.zeros(len(export), dtype=bool)
+
+    stored = stored.drop_duplicates(subset=keys, keep="last")
+    columns = [column for column in export.columns if column not in keys]
+
+    merged = export.reset_index(drop=True).merge(stored, on=keys, how="left", suffixes=("", "_stored"), indicator=True)
+
+    added = (merged["_merge"] == "left_only").values
+    different = np.zeros(len(merged), dtype=bool)
+    for column in columns:
+        export_values = merged[column]
+        stored_values = merged[column + "_stored"]
+        different |= ~((export_values == stored_values) | (export_values.isnull() & stored_values.isnull())).values
+
+    return added, different & ~added
+
+
+def merge_csv_into_ticker_sorted_parquet(csv_path: str, path: str, keys: list, sort_by: list=None, date_column: str=None, \
+    tickers: set=None, chunksize: int=1000000, bucket_rows: int=5000000, row_group_size: int=100000, work_dir: str=None, \
+    **read_csv_kwargs) -> dict:
+    """
+    Merges the rows of the export $csv_path (a full export or a delta) for $tickers (all if None) into the ticker sorted
+    parquet file $path (created if it does not exist), sorted by $sort_by ($keys if None, ticker first):
+    - Rows with $keys that are not in $path are added.
+    - Rows with $keys that are in $path replace the stored rows if any value differs, otherwise they are skipped.
+    - Rows of $path that are not in the export are kept, nothing is deleted.
+    If several rows of the export have the same $keys, the last one is used.
+
+    The ingest is appended to the ingest log with its number, the rows added and changed, and the last $date_column
+    ($sort_by[-1] if None) in $path after the merge. The keys of the added and changed rows are written to
+    <path>.changes/<ingest>.csv. Returns the ingest log entry.
+    NOTE: The export must have the columns of $path, values are cast to its schema before they are compared.
+    NOTE: The merged file is written next to $path and replaces it when it is complete. The ingest log is written last,
+    if the merge is interrupted the ingest is not logged and can be run again.
+    """
+    sort_by = keys if sort_by is None else sort_by
+    date_column = sort_by[-1] if date_column is None else date_column
+
+    work_dir = work_dir or path + ".work"
+    if os.path.exists(work_dir):
+        shutil.rmtree(work_dir)
+    os.makedirs(work_dir)
+
+    exists = os.path.isfile(path)
+    index = read_ticker_index(path) if exists else pd.DataFrame({"start": [], "stop": []}, dtype=np.int64)
+    parquet_file = pq.ParquetFile(path) if exists else None
+    row_group_stops = get_row_group_stops(parquet_file) if exists else None
+    schema = parquet_file.schema_arrow if exists else None
+
+    # Buckets hold the stored and exported rows of consecutive tickers
+    export_counts = count_ticker_rows(csv_path, tickers, chunksize, **read_csv_kwargs)
+    counts = (index["stop"] - index["start"]).add(export_counts, fill_value=0).astype(np.int64).sort_index()
+    buckets = get_ticker_buckets(counts, bucket_rows)
+
+    spill_to_buckets(csv_path, buckets, work_dir, chunksize, **read_csv_kwargs)
+
+    merged_path = path + ".merged"
+    writer = None
+    written = [] # Rows written of each ticker
+    changes = [] # Keys of the rows added or changed
+    last_date = None
+
+    try:
+        for bucket in np.unique(buckets.values):
+            # The stored rows of the bucket are contiguous, its tickers are consecutive
+            stored = index.loc[index.index.isin(buckets.index[buckets.values == bucket])]
+            rows = read_rows(parquet_file, stored["start"].min(), stored["stop"].max(), \
+                row_group_stops=row_group_stops) if len(stored) > 0 else None
+
+            export = read_bucket(work_dir, bucket)
+            if export is not None:
+                if schema is None:
+                    schema = pa.Table.from_pandas(export, preserve_index=False).schema
+                if set(export.columns) != set(schema.names):
+                    raise ValueError("Columns of {} differ from {}: {}".format(csv_path, path, \
+                        sorted(set(export.columns).symmetric_difference(schema.names))))
+
+                export = pa.Table.from_pandas(export[schema.names], schema=schema, preserve_index=False).to_pandas()
+                export = export.drop_duplicates(subset=keys, keep="last")
+
+                added, changed = get_added_and_changed(rows, export, keys)
+                updates = export.loc[added | changed]
+                changes.append(updates[keys].assign(change=np.where(added[added | changed], "added", "changed")))
+
+                if rows is not None:
+                    replaced = pd.MultiIndex.from_frame(rows[keys]).isin(pd.MultiIndex.from_frame(updates[keys]))
+                    rows = pd.concat([rows.loc[~replaced], updates])
+                else:
+                    rows = updates
+                rows = rows.sort_values(by=sort_by, kind="mergesort")
+
+            if (rows is None) or (len(rows) == 0):
+                continue
+
+            table = pa.Table.from_pandas(rows, schema=schema, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(merged_path, schema)
+
+            writer.write_table(table, row_group_size=row_group_size)
+            written.append(rows["ticker"].value_counts(sort=False).sort_index())
+            last_date = rows[date_column].max() if last_date is None else max(last_date, rows[date_column].max())
+    finally:
+        if writer is not None:
+            writer.close()
+        shutil.rmtree(work_dir)
+
+    changes = pd.concat(changes, ignore_index=True) if len(changes) > 0 else pd.DataFrame(columns=keys + ["change"])
+    changes = changes.sort_values(by=[column for column in sort_by if column in keys], kind="mergesort")
+    ingests = read_ingest_log(path)
+
+    entry = {
+        "ingest": len(ingests) + 1,
+        "export": os.path.abspath(csv_path),
+        "ingested_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "rows_added": int((changes["change"] == "added").sum()),
+        "rows_changed": int((changes["change"] == "changed").sum()),
+        "rows": int(sum(ticker_rows.sum() for ticker_rows in written)),
+        "last_date": str(last_date) if last_date is not None else None,
+    }
+
+    if not os.path.exists(os.path.dirname(get_changes_path(path, entry["ingest"]))):
+        os.makedirs(os.path.dirname(get_changes_path(path, entry["ingest"])))
+    changes.to_csv(get_changes_path(path, entry["ingest"]), index=False)
+
+    # An export without new or changed rows leaves the file as it is
+    if len(changes) > 0:
+        os.replace(merged_path, path)
+        get_row_offset_index(written).to_csv(get_index_path(path))
+    elif os.path.exists(merged_path):
+        os.remove(merged_path)
+
+    with open(get_ingest_log_path(path), "w") as log_file:
+        json.dump({"ingests": ingests + [entry]}, log_file, indent=2)
+
+    return entry
+
+
+def read_changes(path: str, since: int=0) -> pd.DataFrame:
+    """
+    The keys of the rows added or changed by the ingests into $path after the ingest number $since (all if 0), with the
+    ingest number and the change ("added" or "changed"). A rebuild keeps the last ingest it processed and passes it as $since.
+    """
+    schema = pq.read_schema(path)
+    date_columns = [field.name for field in schema if pa.types.is_timestamp(field.type)]
+
+    changes = []
+    for entry in read_ingest_log(path):
+        if entry["ingest"] <= since:
+            continue
+        ingest_changes = pd.read_csv(get_changes_path(path, entry["ingest"]), keep_default_na=False, na_values=[""])
+        for column in ingest_changes.columns:
+            if column in date_columns:
+                ingest_changes[column] = pd.to_datetime(ingest_changes[column])
+        changes.append(ingest_changes.assign(ingest=entry["ingest"]))
+
+    if len(changes) == 0:
+        return pd.DataFrame(columns=["ingest", "change"])
+
+    return pd.concat(changes, ignore_index=True)
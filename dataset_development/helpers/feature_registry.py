@@ -0,0 +1,199 @@
+import hashlib
+import inspect
+import os
+import pandas as pd
+import numpy as np
+
+
+"""
+Registry of features that are calculated by individual functions with declared inputs and lookback windows.
+
+Each feature is cached on its own (one file per feature and key in cache_dir/<feature>/), keyed by a hash of the
+feature's source code, the input columns it declares and the keys of the features it depends on. Changing one feature
+therefore only recomputes that feature and the features depending on it, and the lineage of any feature can be looked up.
+Helper functions shared by the feature functions are added to the registry (helper, add_helpers), their source is part
+of the key of every feature, so changing a helper recomputes all features of the registry.
+
+Feature functions are called as function(samples, data, features):
+    samples:  dataframe with one row per sample to calculate the feature for
+    data:     dict of dataframes (and derived data) the features are calculated from
+    features: dataframe with the features calculated so far (including those the feature depends on)
+and return one value per sample.
+"""
+
+
+class Feature():
+    def __init__(self, name: str, function, inputs: dict, lookback, depends_on: list):
+        self.name = name
+        self.function = function
+        self.inputs = inputs
+        self.lookback = lookback
+        self.depends_on = depends_on
+        self.code_hash = get_source_hash(function)
+
+
+class FeatureRegistry():
+    def __init__(self):
+        self.features = {}
+        self.helpers = {} # Source hash of each shared helper function, by qualified name
+
+
+    def helper(self, function):
+        """
+        Decorator adding a helper function the feature functions use, directly or through other helpers (see add_helpers).
+        """
+        self.add_helpers(function)
+
+        return function
+
+
+    def add_helpers(self, *functions):
+        """
+        Adds helper functions the feature functions use, e.g. imported from other modules. The source of every helper is
+        part of the cache key of all features.
+        """
+        for function in functions:
+            self.helpers[function.__module__ + "." + function.__qualname__] = get_source_hash(function)
+
+
+    def get_helpers_hash(self) -> str:
+        key = hashlib.sha1()
+        for name in sorted(self.helpers):
+            key.update((name + self.helpers[name]).encode("utf-8"))
+
+        return key.hexdigest()
+
+
+    def register(self, name: str, inputs: dict=None, lookback=None, depends_on: list=None):
+        """
+        Decorator registering a feature function. $inputs maps names of dataframes (in data, or "samples") to the columns
+        the feature reads from them. $lookback is how far back in time the inputs are used (for lineage only) and
+        $depends_on lists features that must be calculated first.
+        """
+        def decorator(function):
+            if name in self.features:
+                raise ValueError("feature {} is already registered".format(name))
+
+            for dependency in (depends_on or []):
+                if dependency not in self.features:
+                    raise ValueError("feature {} depends on {}, which is not registered".format(name, dependency))
+
+            self.features[name] = Feature(name, function, inputs or {}, lookback, depends_on or [])
+
+            return function
+
+        return decorator
+
+
+    def get_order(self, names: list=None) -> list:
+        """
+        Features to calculate for $names (all if None), including what they depend on, in registration order.
+        Dependencies are always registered first, so this is a valid calculation order.
+        """
+        names = list(self.features) if names is None else names
+        needed = set()
+
+        def add(name):
+            if name not in needed:
+                needed.add(name)
+                for dependency in self.features[name].depends_on:
+                    add(dependency)
+
+        for name in names:
+            add(name)
+
+        return [name for name in self.features if name in needed]
+
+
+    def get_dependents(self, name: str) -> list:
+        """
+        Features that need to be recalculated if $name changes, $name included.
+        """
+        dependents = [name]
+        for other in self.features.values():
+            if any(dependency in dependents for dependency in other.depends_on):
+                dependents.append(other.name)
+
+        return dependents
+
+
+    def lineage(self, name: str) -> dict:
+        """
+        Inputs, lookback and code hash of the feature $name and, recursively, of the features it depends on, and the hash
+        of the helpers shared by all features.
+        """
+        feature = self.features[name]
+
+        return {
+            "inputs": feature.inputs,
+            "lookback": feature.lookback,
+            "code_hash": feature.code_hash,
+            "helpers_hash": self.get_helpers_hash(),
+            "depends_on": {dependency: self.lineage(dependency) for dependency in feature.depends_on},
+        }
+
+
+    def compute(self, samples: pd.DataFrame, data: dict, names: list=None, cache_dir: str=None) -> pd.DataFrame:
+        """
+        Calculates the features $names (all if None) for $samples. With a $cache_dir, each feature is read from the cache
+        if it was calculated before with the same code and inputs, and saved there otherwise.
+        Returns a dataframe with the $names columns and the index of $samples.
+        """
+        frames = dict(data, samples=samples)
+        input_hashes = {}
+        keys = {}
+        helpers_hash = self.get_helpers_hash()
+
+        features = pd.DataFrame(index=samples.index)
+
+        for name in self.get_order(names):
+            feature = self.features[name]
+
+            if cache_dir is None:
+                features[name] = feature.function(samples, data, features)
+                continue
+
+            key = hashlib.sha1(feature.code_hash.encode("utf-8"))
+            key.update(helpers_hash.encode("utf-8"))
+            key.update(get_input_hash(frames, "samples", [], input_hashes).encode("utf-8")) # The samples to calculate
+            for frame_name in sorted(feature.inputs):
+                key.update(get_input_hash(frames, frame_name, feature.inputs[frame_name], input_hashes).encode("utf-8"))
+            for dependency in feature.depends_on:
+                key.update(keys[dependency].encode("utf-8"))
+            keys[name] = key.hexdigest()
+
+            path = os.path.join(cache_dir, name, keys[name] + ".pickle")
+
+            if os.path.exists(path):
+                features[name] = pd.read_pickle(path).values
+            else:
+                features[name] = feature.function(samples, data, features)
+
+                # Worker processes of the same task race to create the directory and to write the same key, so a
+                # reader never sees a partially written file
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                temp_path = "{}.{}.tmp".format(path, os.getpid())
+                features[name].to_pickle(temp_path)
+                os.replace(temp_path, path)
+
+        return features[names] if names is not None else features
+
+
+def get_source_hash(function) -> str:
+    return hashlib.sha1(inspect.getsource(function).encode("utf-8")).hexdigest()
+
+
+def get_input_hash(frames: dict, frame_name: str, columns: list, input_hashes: dict) -> str:
+    """
+    Hash of the index and $columns of frames[$frame_name], memoized in $input_hashes.
+    """
+    if (frame_name, tuple(columns)) not in input_hashes:
+        frame = frames[frame_name]
+        values = pd.util.hash_pandas_object(frame[list(columns)], index=True).values if len(columns) > 0 \
+            else pd.util.hash_pandas_object(frame.index.to_series(), index=False).values
+
+        input_hash = hashlib.sha1(np.ascontiguousarray(values).tobytes())
+        input_hash.update("{}:{}".format(frame_name, ",".join(columns)).encode("utf-8"))
+        input_hashes[(frame_name, tuple(columns))] = input_hash.hexdigest()
+
+    return input_hashes[(frame_name, tuple(columns))]
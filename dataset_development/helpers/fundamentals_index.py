@@ -0,0 +1,135 @@
+import pandas as pd
+import numpy as np
+
+from .quarter_calendar import to_quarter_ids
+
+
+"""
+Point in time index over SF1 filings (SF1_ART or SF1_ARQ).
+
+Every filing is keyed by (ticker, quarter, datekey), where quarter is the calendardate (normalized report period) as an
+integer quarter id (year*4 + quarter - 1). The keys are combined into one sorted int64 array, so the question
+"what is the most recent filing for quarter q-k, known as of datekey d" is answered with a single binary search.
+"""
+
+
+def to_day_numbers(dates) -> np.ndarray:
+    """
+    Days since epoch of each date.
+    """
+    return pd.DatetimeIndex(dates).values.astype("datetime64[D]").astype(np.int64)
+
+
+class FundamentalsIndex():
+    """
+    Answers "the most recent filing for calendardate q-k, known as of datekey d" for one or many tickers.
+
+    sf1 must have a datekey column and calendardate as index or column. With by_ticker=True the ticker column
+    is part of the key and queries must give tickers, otherwise all filings are taken to belong to one ticker
+    (as for the per ticker molecules in sf1_features.py).
+    Filings with the same calendardate and datekey are resolved by keeping the last one in sf1.
+    """
+    def __init__(self, sf1: pd.DataFrame, by_ticker: bool=False):
+        self.sf1 = sf1
+        self.by_ticker = by_ticker
+
+        calendardates = sf1["calendardate"] if "calendardate" in sf1.columns else sf1.index.to_series()
+        calendardates = pd.to_datetime(calendardates)
+        datekeys = pd.to_datetime(sf1["datekey"])
+
+        # Filings without calendardate or datekey can never be returned
+        known = (calendardates.notnull() & datekeys.notnull()).values
+        positions = np.flatnonzero(known)
+
+        if by_ticker:
+            self.ticker_codes = pd.Index(pd.unique(sf1["ticker"].values[known]))
+            ticker_codes = self.ticker_codes.get_indexer(sf1["ticker"].values[known]).astype(np.int64)
+        else:
+            ticker_codes = np.zeros(len(positions), dtype=np.int64)
+
+        quarter_ids = to_quarter_ids(calendardates.values[known]) if len(positions) > 0 else np.zeros(0, dtype=np.int64)
+        days = to_day_numbers(datekeys.values[known])
+
+        self.min_quarter = quarter_ids.min() - 1 if len(positions) > 0 else 0
+        self.min_day = days.min() - 1 if len(positions) > 0 else 0
+        self.quarter_range = (quarter_ids.max() - self.min_quarter + 2) if len(positions) > 0 else 1
+        self.day_range = (days.max() - self.min_day + 2) if len(positions) > 0 else 1
+
+        keys = self._get_keys(ticker_codes, quarter_ids, days)
+
+        order = np.argsort(keys, kind="mergesort")
+        self.keys = keys[order]
+        self.positions = positions[order]
+
+
+    def _get_keys(self, ticker_codes: np.ndarray, quarter_ids: np.ndarray, days: np.ndarray) -> np.ndarray:
+        """
+        Composite key (ticker, quarter, day). Quarters and days outside the range of the index are clipped to just
+        outside it, so they sort before/after all filings of the ticker and never match a quarter.
+        """
+        quarters = np.clip(quarter_ids - self.min_quarter, 0, self.quarter_range - 1)
+        days = np.clip(days - self.min_day, 0, self.day_range - 1)
+
+        return (ticker_codes * self.quarter_range + quarters) * self.day_range + days
+
+
+    def get_positions(self, calendardates, datekeys, quarters: int=0, tickers=None) -> np.ndarray:
+        """
+        Returns the positions (in sf1) of the most recent filing with calendardate $quarters number of quarters
+        earlier than each of $calendardates, having a datekey on or before the corresponding datekey.
+        Positions are -1 where no such filing exists.
+        """
+        calendardates = pd.DatetimeIndex(calendardates)
+        datekeys = pd.DatetimeIndex(datekeys)
+        result = np.full(len(calendardates), -1, dtype=np.int64)
+
+        known = ~(calendardates.isnull() | datekeys.isnull())
+        if (len(self.keys) == 0) or (not known.any()):
+            return result
+
+        if self.by_ticker:
+            ticker_codes = self.ticker_codes.get_indexer(np.asarray(tickers)[known]).astype(np.int64)
+        else:
+            ticker_codes = np.zeros(known.sum(), dtype=np.int64)
+
+        quarter_ids = to_quarter_ids(calendardates[known]) - quarters
+        days = to_day_numbers(datekeys[known])
+
+        query_keys = self._get_keys(ticker_codes, quarter_ids, days)
+        candidates = np.searchsorted(self.keys, query_keys, side="right") - 1
+
+        # The candidate must be a filing for the same ticker and quarter
+        in_range = (quarter_ids > self.min_quarter) & (quarter_ids < self.min_quarter + self.quarter_range - 1) & (ticker_codes >= 0)
+        same_quarter = (candidates >= 0) & in_range & \
+            ((self.keys[np.maximum(candidates, 0)] // self.day_range) == (query_keys // self.day_range))
+
+        result[known] = np.where(same_quarter, self.positions[np.maximum(candidates, 0)], -1)
+
+        return result
+
+
+    def get_rows(self, calendardates, datekeys, quarters: int=0, tickers=None) -> pd.DataFrame:
+        """
+        Batch version of get_row. Returns a dataframe with one row per query (numerical index),
+        rows are all nan where no filing exists.
+        """
+        positions = self.get_positions(calendardates, datekeys, quarters, tickers)
+
+        rows = self.sf1.reset_index(drop=True).reindex(positions)
+        rows.index = pd.RangeIndex(len(positions))
+
+        return rows
+
+
+    def get_row(self, calendardate, datekey, quarters: int=0, ticker=None) -> pd.Series:
+        """
+        Returns the most recent filing with calendardate $quarters number of quarters earlier than $calendardate,
+        known at $datekey. Returns an empty series (all nan, indexed by the columns of sf1) if no such filing exists.
+        """
+        tickers = [ticker] if self.by_ticker else None
+        position = self.get_positions([calendardate], [datekey], quarters, tickers)[0]
+
+        if position < 0:
+            return pd.Series(index=self.sf1.columns, dtype=object)
+
+        return self.sf1.iloc[position]
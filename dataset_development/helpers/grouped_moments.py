@@ -0,0 +1,152 @@
+import pandas as pd
+import numpy as np
+
+
+"""
+Streaming per group statistics (count, mean and M2, the sum of squared deviations from the mean) for many features at once.
+
+Partial results, e.g. from the molecules of the multiprocessing engine or from the chunks of a csv file too large to read
+into memory, are combined with the parallel update of Chan et al., so the result is the same as computing the statistics
+over all the data at once. NaN values are skipped, like pandas' mean and std do.
+"""
+
+
+class GroupedMoments():
+    """
+    count, mean and m2 are dataframes indexed by the group keys with one column per feature.
+    """
+    def __init__(self, features: list, by: list, count: pd.DataFrame=None, mean: pd.DataFrame=None, m2: pd.DataFrame=None):
+        self.features = list(features)
+        self.by = list(by)
+
+        if count is None:
+            index = pd.MultiIndex.from_tuples([], names=self.by) if len(self.by) > 1 else pd.Index([], name=self.by[0])
+            count = pd.DataFrame(0, index=index, columns=self.features, dtype=np.int64)
+            mean = pd.DataFrame(np.nan, index=index, columns=self.features)
+            m2 = pd.DataFrame(np.nan, index=index, columns=self.features)
+
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+
+    @classmethod
+    def from_dataframe(cls, dataset: pd.DataFrame, features: list, by: list):
+        """
+        Statistics of $features for each group of $by in one grouped pass over $dataset.
+        """
+        grouped = dataset.groupby(by)[list(features)]
+
+        count = grouped.count()
+        mean = grouped.mean()
+        m2 = grouped.var(ddof=0) * count
+
+        return cls(features, by, count.astype(np.int64), mean, m2)
+
+
+    @classmethod
+    def from_csv(cls, path: str, features: list, by: list, chunksize: int=1000000, **read_csv_kwargs):
+        """
+        Statistics over a csv file, reading it $chunksize rows at a time.
+        """
+        moments = cls(features, by)
+
+        for chunk in pd.read_csv(path, usecols=list(by) + list(features), chunksize=chunksize, **read_csv_kwargs):
+            moments = moments.merge(cls.from_dataframe(chunk, features, by))
+
+        return moments
+
+
+    def update(self, dataset: pd.DataFrame):
+        """
+        Adds the rows of $dataset, returns the combined statistics.
+        """
+        return self.merge(GroupedMoments.from_dataframe(dataset, self.features, self.by))
+
+
+    def merge(self, other):
+        """
+        Combines the statistics of two disjoint parts of a dataset (Chan et al. parallel algorithm).
+        """
+        index = self.count.index.union(other.count.index)
+
+        count_a = self.count.reindex(index).fillna(0).values
+        count_b = other.count.reindex(index).fillna(0).values
+        mean_a = self.mean.reindex(index).fillna(0).values
+        mean_b = other.mean.reindex(index).fillna(0).values
+        m2_a = self.m2.reindex(index).fillna(0).values
+        m2_b = other.m2.reindex(index).fillna(0).values
+
+        count = count_a + count_b
+        delta = mean_b - mean_a
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = np.where(count > 0, mean_a + delta * (count_b / count), np.nan)
+            m2 = np.where(count > 0, m2_a + m2_b + (delta**2) * (count_a * count_b / count), np.nan)
+
+        return GroupedMoments(
+            self.features,
+            self.by,
+            pd.DataFrame(count.astype(np.int64), index=index, columns=self.features),
+            pd.DataFrame(mean, index=index, columns=self.features),
+            pd.DataFrame(m2, index=index, columns=self.features),
+        )
+
+
+    def drop(self, values, level: str):
+        """
+        Statistics without the groups whose $level key is in $values, e.g. the years of a dataset that are recalculated.
+        """
+        keep = ~self.count.index.get_level_values(level).isin(values)
+
+        return GroupedMoments(self.features, self.by, self.count.loc[keep], self.mean.loc[keep], self.m2.loc[keep])
+
+
+    def collapse(self, by: list):
+        """
+        Statistics for the coarser grouping $by (a subset of the current group keys), e.g. from (industry, size) to size.
+        """
+        by = list(by)
+        dropped_keys = [key for key in self.by if key not in by]
+
+        count = self.count.groupby(level=by).sum()
+        mean = (self.mean.fillna(0) * self.count).groupby(level=by).sum() / count.where(count > 0)
+
+        # Each group's deviation from the mean of the coarser group it belongs to
+        delta = self.mean.values - mean.reindex(self.count.index.droplevel(dropped_keys)).values
+        m2 = (self.m2.fillna(0) + self.count * np.nan_to_num(delta)**2).groupby(level=by).sum()
+
+        return GroupedMoments(self.features, by, count, mean, m2.where(count > 0))
+
+
+    def means(self) -> pd.DataFrame:
+        """
+        Mean of each feature for each group, nan for groups without values.
+        """
+        return self.mean.where(self.count > 0)
+
+
+    def variances(self, ddof: int=1) -> pd.DataFrame:
+        """
+        Variance of each feature for each group (sample variance by default, like pandas), nan for groups with $ddof or fewer values.
+        """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return (self.m2 / (self.count - ddof)).where(self.count > ddof)
+
+
+    def stds(self, ddof: int=1) -> pd.DataFrame:
+        """
+        Standard deviation of each feature for each group.
+        """
+        return np.sqrt(self.variances(ddof))
+
+
+def merge_grouped_moments(moments_list: list) -> GroupedMoments:
+    """
+    Combines the statistics computed for the molecules (disjoint parts) of a dataset.
+    """
+    moments = moments_list[0]
+    for other in moments_list[1:]:
+        moments = moments.merge(other)
+
+    return moments
@@ -1,11 +1,12 @@
 import os
 import sys
 from dateutil.relativedelta import *
-from datetime import datetime, timedelta
+from datetime import timedelta
 import pandas as pd
-import math
 import numpy as np
 
+from .fundamentals_index import FundamentalsIndex
+from .quarter_calendar import shift_calendardates, get_calendardate_range, to_quarter_ids, from_quarter_ids
 
 
 def print_exception_info(e):
@@ -31,91 +32,45 @@ def get_x_past_months_of_data(df, date, months):
 def get_calendardate_x_quarters_ago(date: pd.datetime, quarters: int):
     """
     Returns the normalized report period date (calendardate) $quarters number of quarters in the past.
+    NOTE: $date (and $quarters) can also be arrays, then a DatetimeIndex is returned.
     """
-    m_d_list = [[3,31],[6,30],[9, 30],[12, 31]]
-    valid = False
-    for m_d in m_d_list:
-        if (m_d[0] == date.month) and (m_d[1] == date.day):
-            valid = True
-
-    if valid == False:
-        raise ValueError("date must be a valid report period")
-
-    first_year = date.year - (math.ceil(quarters/4) + 1)
-    quarter_list = []
-    for year in range(first_year, date.year + 1):
-        for month_day in m_d_list:
-            quarter_list.append(datetime(year=year, month=month_day[0], day=month_day[1]))
-
-    cur_index = quarter_list.index(date)
-
-    return quarter_list[cur_index-quarters]
+    return shift_calendardates(date, -np.asarray(quarters))
 
 def get_calendardate_x_quarters_later(date: pd.datetime, quarters: int):
     """
     Returns the normalized report period date (calendardate) $quarters number of quarters in the future.
+    NOTE: $date (and $quarters) can also be arrays, then a DatetimeIndex is returned.
     """
-    m_d_list = [[3,31],[6,30],[9, 30],[12, 31]]
-    valid = False
-    for m_d in m_d_list:
-        if (m_d[0] == date.month) and (m_d[1] == date.day):
-            valid = True
-
-    if valid == False:
-        raise ValueError("date must be a valid report period")
-
-    last_year = date.year + (math.ceil(quarters/4) + 1)
-    quarter_list = []
-    for year in range(date.year, last_year):
-        for month_day in m_d_list:
-            quarter_list.append(datetime(year=year, month=month_day[0], day=month_day[1]))
-
-    cur_index = quarter_list.index(date)
+    return shift_calendardates(date, np.asarray(quarters))
 
-    return quarter_list[cur_index+quarters]
-
-def get_most_up_to_date_10k_filing(sf1_art, caldate_cur: pd.datetime, datekey_cur: pd.datetime, years):
+def get_most_up_to_date_10k_filing(sf1_art, caldate_cur: pd.datetime, datekey_cur: pd.datetime, years, index: FundamentalsIndex=None):
     """
     Returns the the most recent 10-K filing with calendardate (normalized report period) $years number of years 
     earliar than date.
 
-    NOTE: This function requires sf1_art to have a DateTimeIndex, only contain data for one ticker and is sorted on datekey.
+    NOTE: This function requires sf1_art to only contain data for one ticker.
     NOTE: sf1_art has a numerical index and calendardate column
+    NOTE: When calling this repeatedly for the same sf1_art, build a FundamentalsIndex once and pass it as $index.
     """
-    desired_calendardate = get_calendardate_x_quarters_ago(caldate_cur, 4*years)
-    candidates = sf1_art.loc[sf1_art.calendardate==desired_calendardate]
-
-
-    candidates = candidates.loc[candidates.datekey <= datekey_cur] # Ensure that no future information gets used
-
-    if len(candidates) == 0:
-        # raise KeyError("No 10K filing for report period {}".format(desired_calendardate))
-        return pd.Series(index=sf1_art.columns)
+    if index is None:
+        index = FundamentalsIndex(sf1_art)
 
-    candidates = candidates.sort_values(by="datekey", ascending=True)
+    return index.get_row(caldate_cur, datekey_cur, 4*years)
 
-    return candidates.iloc[-1]
 
-
-def get_most_up_to_date_10q_filing(sf1_arq: pd.DataFrame, caldate_cur: pd.datetime, datekey_cur: pd.datetime, quarters: int):
+def get_most_up_to_date_10q_filing(sf1_arq: pd.DataFrame, caldate_cur: pd.datetime, datekey_cur: pd.datetime, quarters: int, \
+    index: FundamentalsIndex=None):
     """
     Returns the most recnet 10-Q filing with calendardate (normalized report period) $quarters number 
     of quarters earlier than $date.
-    NOTE: This function requires sf1_arq to have a DateTimeIndex, only contain data for one ticker and is sorted on datekey.
+    NOTE: This function requires sf1_arq to only contain data for one ticker.
     NOTE: sf1_arq has a calendardate index
+    NOTE: When calling this repeatedly for the same sf1_arq, build a FundamentalsIndex once and pass it as $index.
     """
+    if index is None:
+        index = FundamentalsIndex(sf1_arq)
 
-    desired_calendardate = get_calendardate_x_quarters_ago(caldate_cur, quarters)
-    candidates = sf1_arq.loc[sf1_arq.index == desired_calendardate]
-    candidates = candidates.loc[candidates.datekey <= datekey_cur] # Ensure that no future information gets used
-
-    if len(candidates) == 0:
-        # raise KeyError("No 10K filing for ticker {} and report period {}".format(sf1_arq.iloc[0]["ticker"], desired_calendardate))
-        return pd.Series(index=sf1_arq.columns)
-
-    candidates = candidates.sort_values(by="datekey", ascending=True)
-
-    return candidates.iloc[-1]
+    return index.get_row(caldate_cur, datekey_cur, quarters)
 
 
 def get_calendardate_index(start: pd.datetime, end: pd.datetime):
@@ -123,44 +78,42 @@ def get_calendardate_index(start: pd.datetime, end: pd.datetime):
     Returns a DateTimeIndex containing the complete set of normalized report period dates (calendardates)
     from the date $start to the date $end.
     """
-    calendardate_index = []
-    m_d_list = [[3,31],[6,30],[9, 30],[12, 31]]
-    month_of_first_filing = start.month
-    for i, year in enumerate(range(start.year, end.year + 1)):
-        if i == 0:
-            index_of_first_filing_in_m_d_list = [3,6,9,12].index(month_of_first_filing)
-            for month_day in m_d_list[index_of_first_filing_in_m_d_list:]:
-                calendardate_index.append(datetime(year=year, month=month_day[0], day=month_day[1]))
-            continue
-        for month_day in m_d_list:
-            calendardate_index.append(datetime(year=year, month=month_day[0], day=month_day[1]))
-
-    # Need to drop dates after end
-    for j, date in enumerate(calendardate_index):
-        if date > end:
-            del calendardate_index[j]
-
-    return calendardate_index
+    return get_calendardate_range(start, end)
 
 def forward_fill_gaps(sf1, quarters):
     """
     Fill in missing data in $quarters number of quarters into the future.
+    Every missing report period (calendardate) in a ticker's range is filled with a copy of the most recent filing
+    before it (the last one for the previous calendardate), for at most $quarters consecutive missing quarters.
+    Rows are copied as a whole, so nan values in the filings are kept as they are and dtypes are unchanged.
     NOTE: this function require calendardate index.
+    NOTE: If sf1 has a ticker column, all tickers are filled in one pass and the result is sorted by ticker, calendardate and datekey.
     """
-    sf1 = sf1.fillna(value="IAMNAN")
-    sf1["calendardate_temp1"] = sf1.index # Don't know another awy to get the index value after selection
+    if len(sf1) == 0:
+        return sf1
 
-    calendardate_index = get_calendardate_index(sf1.iloc[0]["calendardate_temp1"], sf1.iloc[-1]["calendardate_temp1"])
+    tickers = sf1["ticker"].values if "ticker" in sf1.columns else np.zeros(len(sf1))
+    ticker_codes = pd.factorize(tickers, sort=True)[0]
+    quarter_ids = to_quarter_ids(sf1.index)
 
-    # sf1_reindexed = sf1.reindex(calendardate_index) # ValueError: cannot reindex from a duplicate axis
+    # Stable sort, filings with the same calendardate keep their order (missing datekeys last)
+    order = pd.DataFrame({"ticker": ticker_codes, "quarter": quarter_ids, "datekey": sf1["datekey"].values}) \
+        .sort_values(by=["ticker", "quarter", "datekey"]).index.values
 
-    sf1_reindexed = fill_in_missing_dates_in_calendardate_index(sf1)
+    ticker_codes = ticker_codes[order]
+    quarter_ids = quarter_ids[order]
 
-    sf1_filled = sf1_reindexed.fillna(method="ffill", limit=quarters)
-    
-    sf1_filled = sf1_filled.drop(columns=["calendardate_temp1"])
-    sf1_filled = sf1_filled.dropna(axis=0)
-    sf1_filled = sf1_filled.replace(to_replace="IAMNAN", value=np.nan)
+    # The last filing of each calendardate is copied into the missing quarters up to the next calendardate of the ticker
+    next_is_same_ticker = np.append(ticker_codes[1:] == ticker_codes[:-1], False)
+    next_quarter_ids = np.append(quarter_ids[1:], 0)
+    missing_quarters = np.where(next_is_same_ticker, next_quarter_ids - quarter_ids - 1, 0)
+    nr_of_copies = 1 + np.minimum(np.maximum(missing_quarters, 0), quarters)
+
+    run_starts = np.cumsum(nr_of_copies) - nr_of_copies
+    quarters_later = np.arange(nr_of_copies.sum()) - np.repeat(run_starts, nr_of_copies)
+
+    sf1_filled = sf1.iloc[np.repeat(order, nr_of_copies)]
+    sf1_filled.index = from_quarter_ids(np.repeat(quarter_ids, nr_of_copies) + quarters_later).rename(sf1.index.name)
 
     return sf1_filled
 
@@ -169,21 +122,39 @@ def fill_in_missing_dates_in_calendardate_index(sf1):
     """
     Fill inn missing dates into the calendardate index of the sf1 dataframe.
     """
-    sf1["calendardate_temp2"] = sf1.index # Don't know another awy to get the index value after selection
-    desired_index = get_calendardate_index(sf1.iloc[0]["calendardate_temp2"], sf1.iloc[-1]["calendardate_temp2"])
+    desired_index = get_calendardate_range(sf1.index[0], sf1.index[-1])
+    missing_index = desired_index.difference(sf1.index)
 
-    index_difference = list(set(desired_index).difference(set(sf1.index)))
-
-    for caldate_index in index_difference:
-        # sf1.index.insert(-1, caldate_index)
-        sf1.loc[caldate_index] = pd.Series()
-
-    sf1 = sf1.drop(columns=["calendardate_temp2"])
+    # The missing report periods are added as all nan rows (label -1 is never in the numerical index)
+    positions = np.concatenate([np.arange(len(sf1)), np.full(len(missing_index), -1)])
+    index = sf1.index.append(missing_index).rename(sf1.index.name)
+    sf1 = sf1.reset_index(drop=True).reindex(positions)
+    sf1.index = index
     sf1 = sf1.sort_values(by=["calendardate", "datekey"], ascending=True)
 
     return sf1
 
 
+def get_values_as_of(values: pd.Series, dates, days: int=0) -> np.ndarray:
+    """
+    Values of $values (one ticker, sorted date index of trading days) as of $days calendar days before each of $dates,
+    or after for negative $days. This is the last non nan value on or before the target date, nan before the first
+    date and past the last date of $values. Gives the same as reindexing to every calendar day, forward filling and
+    shifting by $days, without materializing the calendar day index.
+    """
+    target = pd.DatetimeIndex(dates).values - np.timedelta64(days, "D")
+    if len(values) == 0:
+        return np.full(len(target), np.nan)
+
+    filled = values.fillna(method="ffill").values.astype(np.float64)
+    index = values.index.values
+
+    positions = np.searchsorted(index, target, side="right") - 1
+    found = (positions >= 0) & (target <= index[-1])
+
+    return np.where(found, filled[np.maximum(positions, 0)], np.nan)
+
+
 
 #____________________________END_______________________________________
 
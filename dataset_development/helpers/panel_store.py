@@ -0,0 +1,106 @@
+import pandas as pd
+import numpy as np
+
+
+"""
+Panel (date x ticker) store of SEP fields.
+
+Each field is a dense 2-D array (float32 by default) over the trading day axis (every date any ticker has a row) and the
+ticker axis, with a validity mask of the cells that have a row in SEP. Calendar day lookbacks and lookaheads follow the
+rule of the forward filled, calendar day reindexed data used earlier: the value "k days before t" is the last valid
+value on or before t - k, nan before the ticker's first row. Looking ahead is nan past the ticker's last row.
+Positions of the last valid value are calculated once per field, so no calendar day reindexed data is materialized.
+"""
+
+
+class PanelStore():
+    def __init__(self, dates: pd.DatetimeIndex, tickers: pd.Index, fields: dict, valid: np.ndarray):
+        self.dates = dates
+        self.tickers = tickers
+        self.fields = fields
+        self.valid = valid
+        self.day_numbers = dates.values.astype("datetime64[D]").astype(np.int64)
+
+        # Last date of each ticker (day number), looking ahead past it is nan
+        last_positions = len(dates) - 1 - np.argmax(valid[::-1], axis=0)
+        self.last_day_numbers = np.where(valid.any(axis=0), self.day_numbers[last_positions], np.iinfo(np.int64).min)
+
+        self.last_valid_positions = {}
+
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame, fields: list, dtype=np.float32):
+        """
+        Panel of $fields from $frame, which has a date index and a ticker column (one row per date and ticker).
+        """
+        dates = pd.DatetimeIndex(np.unique(frame.index.values))
+        tickers = pd.Index(np.unique(frame["ticker"].values))
+
+        rows = dates.searchsorted(frame.index)
+        columns = tickers.searchsorted(frame["ticker"].values)
+
+        valid = np.zeros((len(dates), len(tickers)), dtype=bool)
+        valid[rows, columns] = True
+
+        panel_fields = {}
+        for field in fields:
+            panel_fields[field] = np.full((len(dates), len(tickers)), np.nan, dtype=dtype)
+            panel_fields[field][rows, columns] = frame[field].values
+
+        return cls(dates, tickers, panel_fields, valid)
+
+
+    def get_positions(self, frame: pd.DataFrame):
+        """
+        Row (date) and column (ticker) positions in the panel of the rows of $frame.
+        """
+        return self.dates.searchsorted(frame.index), self.tickers.searchsorted(frame["ticker"].values)
+
+
+    def get_last_valid_positions(self, field: str) -> np.ndarray:
+        """
+        For each cell, the date position of the last valid, non nan value of $field on or before it (-1 if there is none).
+        """
+        if field not in self.last_valid_positions:
+            values = self.fields[field]
+            positions = np.where(self.valid & ~np.isnan(values), np.arange(len(self.dates), dtype=np.int32)[:, None], np.int32(-1))
+            self.last_valid_positions[field] = np.maximum.accumulate(positions, axis=0)
+
+        return self.last_valid_positions[field]
+
+
+    def values_at(self, field: str, rows: np.ndarray, columns: np.ndarray, days: int=0) -> np.ndarray:
+        """
+        Values of $field as of $days calendar days before the cells at ($rows, $columns), after them for negative $days.
+        Returned as float64.
+        """
+        target_day_numbers = self.day_numbers[rows] - days
+        target_rows = np.searchsorted(self.day_numbers, target_day_numbers, side="right") - 1
+
+        positions = np.where(target_rows >= 0, self.get_last_valid_positions(field)[np.maximum(target_rows, 0), columns], -1)
+        values = np.where(positions >= 0, self.fields[field][np.maximum(positions, 0), columns], np.nan).astype(np.float64)
+
+        if days < 0:
+            values[target_day_numbers > self.last_day_numbers[columns]] = np.nan
+
+        return values
+
+
+def cross_sectional_mean(values: np.ndarray, rows: np.ndarray, groups: np.ndarray=None) -> np.ndarray:
+    """
+    Mean of $values over all cells on the same date (row), and in the same group if $groups (integer codes, -1 for none)
+    is given, for each cell. Nan values are skipped.
+    """
+    keys = rows.astype(np.int64) if groups is None else rows.astype(np.int64) * (groups.max() + 2) + (groups + 1)
+    has_value = ~np.isnan(values)
+
+    sums = np.bincount(keys, weights=np.where(has_value, values, 0))
+    counts = np.bincount(keys, weights=has_value)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = (sums / counts)[keys]
+
+    if groups is not None:
+        means[groups < 0] = np.nan
+
+    return means
@@ -0,0 +1,74 @@
+import pandas as pd
+import numpy as np
+
+
+"""
+Calendar of normalized report periods (calendardates: 03-31, 06-30, 09-30 and 12-31).
+
+A report period is represented by an integer quarter id (year*4 + quarter - 1), so moving x quarters back or forth
+is integer addition and a range of report periods is an np.arange. All conversions work on whole arrays.
+"""
+
+
+def is_calendardate(dates) -> np.ndarray:
+    """
+    Boolean array telling which of $dates are valid report periods (last day of March, June, September or December).
+    """
+    dates = pd.DatetimeIndex(dates)
+
+    return np.asarray((dates.month % 3 == 0) & dates.is_month_end)
+
+
+def to_quarter_ids(calendardates) -> np.ndarray:
+    """
+    Converts normalized report period dates (calendardates) to integer quarter ids (year*4 + quarter - 1).
+    Raises ValueError if any of the dates is not a valid report period.
+    """
+    calendardates = pd.DatetimeIndex(calendardates)
+
+    if not is_calendardate(calendardates).all():
+        raise ValueError("date must be a valid report period")
+
+    return (calendardates.year.values.astype(np.int64) * 4) + ((calendardates.month.values.astype(np.int64) - 1) // 3)
+
+
+def from_quarter_ids(quarter_ids) -> pd.DatetimeIndex:
+    """
+    Converts integer quarter ids back to normalized report period dates (calendardates).
+    """
+    quarter_ids = np.asarray(quarter_ids, dtype=np.int64)
+
+    # Month number (since year 0) of the month after the quarter end, the day before its first day is the calendardate.
+    months_after = (quarter_ids // 4) * 12 + (quarter_ids % 4) * 3 + 3
+    first_of_month_after = (months_after - 1970*12).astype("datetime64[M]").astype("datetime64[D]")
+
+    return pd.DatetimeIndex(first_of_month_after - np.timedelta64(1, "D"))
+
+
+def shift_calendardates(calendardates, quarters):
+    """
+    Returns the calendardates $quarters number of quarters later (earlier for negative $quarters).
+    $calendardates and $quarters can be scalars or arrays, two scalars give a Timestamp, otherwise a DatetimeIndex.
+    Raises ValueError if any of the dates is not a valid report period.
+    """
+    if (np.ndim(calendardates) == 0) and (np.ndim(quarters) == 0):
+        return from_quarter_ids(to_quarter_ids([calendardates]) + quarters)[0]
+
+    calendardates = pd.DatetimeIndex(np.atleast_1d(calendardates))
+
+    return from_quarter_ids(to_quarter_ids(calendardates) + np.asarray(quarters, dtype=np.int64))
+
+
+def get_calendardate_range(start, end) -> pd.DatetimeIndex:
+    """
+    All normalized report period dates (calendardates) from the report period $start falls in, to $end (inclusive).
+    """
+    start = pd.Timestamp(start)
+    end = pd.Timestamp(end)
+
+    first_quarter_id = start.year*4 + (start.month - 1) // 3
+    last_quarter_id = end.year*4 + (end.month - 1) // 3
+
+    calendardates = from_quarter_ids(np.arange(first_quarter_id, last_quarter_id + 1, dtype=np.int64))
+
+    return calendardates[calendardates <= end]
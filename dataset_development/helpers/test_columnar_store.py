@@ -0,0 +1,108 @@
+import pandas as pd
+import pytest
+import numpy as np
+
+pytest.importorskip("pyarrow")
+
+from .columnar_store import csv_to_ticker_sorted_parquet, read_ticker_index, read_tickers, merge_csv_into_ticker_sorted_parquet, \
+    read_ingest_log, read_changes
+
+
+@pytest.fixture
+def sep(tmp_path):
+    rng = np.random.RandomState(0)
+    tickers = ["AAPL", "FCX", "NTK", "MSFT", "NA", "A"]
+    sep = pd.concat([pd.DataFrame({
+        "ticker": ticker,
+        "date": pd.date_range("2010-01-01", periods=rng.randint(1, 200), freq="B"),
+    }) for ticker in tickers], ignore_index=True)
+    sep["close"] = rng.rand(len(sep))
+    sep = sep.sample(frac=1, random_state=0) # Not sorted by ticker or date
+
+    csv_path = str(tmp_path / "sep.csv")
+    sep.to_csv(csv_path, index=False)
+
+    return sep, csv_path
+
+
+def test_csv_to_ticker_sorted_parquet(sep, tmp_path):
+    sep, csv_path = sep
+    path = str(tmp_path / "sep.parquet")
+    wanted = {"AAPL", "NTK", "NA", "A"} # NA must not be read as nan
+
+    index = csv_to_ticker_sorted_parquet(csv_path, path, tickers=wanted, chunksize=50, bucket_rows=120, row_group_size=30, \
+        parse_dates=["date"], keep_default_na=False)
+
+    expected = sep.loc[sep["ticker"].isin(wanted)].sort_values(by=["ticker", "date"]).reset_index(drop=True)
+    pd.testing.assert_frame_equal(pd.read_parquet(path), expected)
+
+    pd.testing.assert_frame_equal(read_ticker_index(path), index)
+    assert list(index.index) == sorted(wanted)
+    assert (index["stop"] - index["start"]).tolist() == expected["ticker"].value_counts().sort_index().tolist()
+
+
+def test_read_tickers(sep, tmp_path):
+    sep, csv_path = sep
+    path = str(tmp_path / "sep.parquet")
+    csv_to_ticker_sorted_parquet(csv_path, path, chunksize=70, bucket_rows=100, row_group_size=25, parse_dates=["date"], \
+        keep_default_na=False)
+
+    history = read_tickers(path, ["NTK", "AAPL", "UNKNOWN"], columns=["ticker", "date", "close"])
+    expected = pd.concat([
+        sep.loc[sep["ticker"] == ticker].sort_values(by="date") for ticker in ["NTK", "AAPL"]
+    ]).reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(history, expected)
+    assert len(read_tickers(path, ["UNKNOWN"], columns=["date"])) == 0
+
+
+def test_merge_csv_into_ticker_sorted_parquet(sep, tmp_path):
+    sep, csv_path = sep
+    path = str(tmp_path / "sep.parquet")
+    read_csv_kwargs = {"parse_dates": ["date"], "keep_default_na": False, "na_values": [""], "float_precision": "round_trip"}
+
+    # The first ingest creates the file
+    first = merge_csv_into_ticker_sorted_parquet(csv_path, path, keys=["ticker", "date"], chunksize=70, bucket_rows=100, \
+        row_group_size=25, **read_csv_kwargs)
+    expected = sep.sort_values(by=["ticker", "date"]).reset_index(drop=True)
+    pd.testing.assert_frame_equal(pd.read_parquet(path), expected)
+    assert (first["ingest"], first["rows_added"], first["rows_changed"]) == (1, len(sep), 0)
+
+    # A delta with an unchanged row, a changed row (last one of its keys), a new date and a new ticker
+    first_aapl = expected.loc[expected["ticker"] == "AAPL"].iloc[0]
+    last_ntk = expected.loc[expected["ticker"] == "NTK"].iloc[-1]
+    delta = pd.DataFrame({
+        "ticker": ["AAPL", "NTK", "NTK", "NTK", "NA", "ZZZ"],
+        "date": [first_aapl["date"], last_ntk["date"], last_ntk["date"], last_ntk["date"] + pd.Timedelta(days=3), \
+            expected.loc[expected["ticker"] == "NA", "date"].iloc[0], pd.Timestamp("2012-01-02")],
+        "close": [first_aapl["close"], -1.0, -2.0, 0.5, np.nan, 0.25],
+    })
+    delta_path = str(tmp_path / "delta.csv")
+    delta.to_csv(delta_path, index=False)
+
+    second = merge_csv_into_ticker_sorted_parquet(delta_path, path, keys=["ticker", "date"], chunksize=4, bucket_rows=100, \
+        row_group_size=25, **read_csv_kwargs)
+
+    expected.loc[(expected["ticker"] == "NTK") & (expected["date"] == last_ntk["date"]), "close"] = -2.0
+    expected.loc[(expected["ticker"] == "NA") & (expected["date"] == delta["date"].iloc[4]), "close"] = np.nan
+    expected = pd.concat([expected, delta.iloc[[3, 5]]]).sort_values(by=["ticker", "date"]).reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(pd.read_parquet(path), expected)
+    pd.testing.assert_frame_equal(read_tickers(path, ["ZZZ", "NTK"]), \
+        pd.concat([expected.loc[expected["ticker"] == ticker] for ticker in ["ZZZ", "NTK"]]).reset_index(drop=True))
+    assert (second["ingest"], second["rows_added"], second["rows_changed"], second["rows"]) == (2, 2, 2, len(expected))
+    assert second["last_date"] == str(expected["date"].max())
+
+    # Downstream reads what changed after the last ingest it processed
+    changes = read_changes(path, since=1)
+    assert changes[["ticker", "change"]].values.tolist() == [["NA", "changed"], ["NTK", "changed"], ["NTK", "added"], ["ZZZ", "added"]]
+    assert changes["date"].tolist() == delta["date"].iloc[[4, 1, 3, 5]].tolist()
+    assert (changes["ingest"] == 2).all()
+    assert len(read_changes(path)) == len(sep) + 4
+
+    # The same delta again changes nothing
+    third = merge_csv_into_ticker_sorted_parquet(delta_path, path, keys=["ticker", "date"], **read_csv_kwargs)
+    assert (third["rows_added"], third["rows_changed"]) == (0, 0)
+    pd.testing.assert_frame_equal(pd.read_parquet(path), expected)
+    assert [ingest["ingest"] for ingest in read_ingest_log(path)] == [1, 2, 3]
+    assert len(read_changes(path, since=2)) == 0
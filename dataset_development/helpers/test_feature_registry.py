@@ -0,0 +1,105 @@
+import pandas as pd
+import pytest
+import numpy as np
+from .feature_registry import FeatureRegistry
+
+
+calls = []
+
+def make_registry():
+    registry = FeatureRegistry()
+
+    @registry.register("mom", inputs={"sep": ["close"]}, lookback=pd.Timedelta(days=1))
+    def mom(samples, data, features):
+        calls.append("mom")
+        return (data["sep"]["close"] / data["sep"]["close"].shift(1) - 1).loc[samples.index].values
+
+    @registry.register("dolvol", inputs={"sep": ["close", "volume"]})
+    def dolvol(samples, data, features):
+        calls.append("dolvol")
+        return (data["sep"]["close"] * data["sep"]["volume"]).loc[samples.index].values
+
+    @registry.register("momsq", depends_on=["mom"])
+    def momsq(samples, data, features):
+        calls.append("momsq")
+        return features["mom"].values**2
+
+    return registry
+
+
+@pytest.fixture
+def data():
+    index = pd.date_range("2010-01-01", periods=10)
+    sep = pd.DataFrame({"close": np.arange(10, 20, dtype=float), "volume": np.arange(100, 110, dtype=float)}, index=index)
+    samples = pd.DataFrame(index=index[[2, 5, 8]])
+
+    return samples, {"sep": sep}
+
+
+def test_order_dependents_and_lineage():
+    registry = make_registry()
+
+    assert registry.get_order(["momsq"]) == ["mom", "momsq"]
+    assert registry.get_dependents("mom") == ["mom", "momsq"]
+    assert registry.get_dependents("dolvol") == ["dolvol"]
+    assert registry.lineage("momsq")["depends_on"]["mom"]["inputs"] == {"sep": ["close"]}
+
+    with pytest.raises(ValueError):
+        registry.register("other", depends_on=["not_registered"])(lambda samples, data, features: None)
+    with pytest.raises(ValueError):
+        registry.register("mom")(lambda samples, data, features: None)
+
+
+def test_compute(data):
+    samples, data = data
+    features = make_registry().compute(samples, data, names=["momsq", "dolvol"])
+
+    assert list(features.columns) == ["momsq", "dolvol"]
+    np.testing.assert_allclose(features["momsq"].values, [(12/11 - 1)**2, (15/14 - 1)**2, (18/17 - 1)**2])
+    np.testing.assert_allclose(features["dolvol"].values, [12*102, 15*105, 18*108])
+
+
+def test_only_changed_features_are_recalculated(data, tmp_path):
+    samples, data = data
+    registry = make_registry()
+
+    calls.clear()
+    first = registry.compute(samples, data, cache_dir=str(tmp_path))
+    assert calls == ["mom", "dolvol", "momsq"]
+
+    calls.clear()
+    cached = registry.compute(samples, data, cache_dir=str(tmp_path))
+    assert calls == []
+    pd.testing.assert_frame_equal(first, cached)
+
+    # A changed input column only recalculates the features reading it
+    calls.clear()
+    data["sep"].loc[data["sep"].index[5], "volume"] = 0
+    registry.compute(samples, data, cache_dir=str(tmp_path))
+    assert calls == ["dolvol"]
+
+    # Changed code recalculates the feature and its dependents
+    calls.clear()
+    registry.features["mom"].code_hash = "changed"
+    registry.compute(samples, data, cache_dir=str(tmp_path))
+    assert calls == ["mom", "momsq"]
+
+    # Changed helpers recalculate all features
+    calls.clear()
+    registry.add_helpers(make_registry)
+    registry.compute(samples, data, cache_dir=str(tmp_path))
+    assert calls == ["mom", "dolvol", "momsq"]
+    assert registry.lineage("momsq")["helpers_hash"] == registry.get_helpers_hash()
+
+
+def test_cache_directory_may_exist(data, tmp_path):
+    samples, data = data
+    registry = make_registry()
+
+    # Another worker process created the feature directories first
+    for name in registry.features:
+        (tmp_path / name).mkdir()
+
+    features = registry.compute(samples, data, cache_dir=str(tmp_path))
+    pd.testing.assert_frame_equal(features, registry.compute(samples, data, cache_dir=str(tmp_path)))
+    assert all(len(list((tmp_path / name).iterdir())) == 1 for name in registry.features) # No temporary files left
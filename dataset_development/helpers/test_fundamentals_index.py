@@ -0,0 +1,58 @@
+import pandas as pd
+import pytest
+from .fundamentals_index import FundamentalsIndex
+from .helpers import get_most_up_to_date_10q_filing
+
+sf1_arq = None
+
+@pytest.fixture(scope='module', autouse=True)
+def setup():
+    global sf1_arq
+    sf1_arq = pd.read_csv("../../datasets/testing/sf1_arq.csv", parse_dates=["datekey", \
+        "calendardate", "reportperiod"], index_col="calendardate")
+
+    sf1_arq = sf1_arq.sort_values(by=["calendardate", "datekey"], ascending=True)
+
+    yield
+
+
+def test_get_row():
+    sf1_arq_ntk = sf1_arq.loc[sf1_arq.ticker=="NTK"]
+    index = FundamentalsIndex(sf1_arq_ntk)
+
+    caldate_2012_06_30 = pd.to_datetime("2012-06-30")
+    datekey_2012_08_09 = pd.to_datetime("2012-08-09")
+
+    # (10Q one year earlier has a correction released 2011-11-14)
+    filing_correction = index.get_row(caldate_2012_06_30, datekey_2012_08_09, 4)
+    assert filing_correction["datekey"] == pd.to_datetime("2011-11-14")
+
+    # The correction is not known before it is released
+    filing = index.get_row(caldate_2012_06_30, pd.to_datetime("2011-11-13"), 4)
+    assert filing["datekey"] < pd.to_datetime("2011-11-14")
+
+    # No filing for the quarter known at the time
+    assert index.get_row(caldate_2012_06_30, pd.to_datetime("2011-06-30"), 4).dropna().empty == True
+    assert index.get_row(pd.to_datetime("1990-03-31"), datekey_2012_08_09, 0).dropna().empty == True
+
+
+def test_get_positions_matches_single_lookups():
+    index = FundamentalsIndex(sf1_arq.reset_index(), by_ticker=True)
+
+    rows = sf1_arq.reset_index()
+
+    for quarters in [0, 1, 4, 7]:
+        positions = index.get_positions(rows["calendardate"], rows["datekey"], quarters, tickers=rows["ticker"])
+        batch = index.get_rows(rows["calendardate"], rows["datekey"], quarters, tickers=rows["ticker"])
+
+        for i, row in rows.iloc[::7].iterrows():
+            sf1_arq_ticker = sf1_arq.loc[sf1_arq.ticker == row["ticker"]]
+            expected = get_most_up_to_date_10q_filing(sf1_arq_ticker, row["calendardate"], row["datekey"], quarters)
+
+            if expected.dropna().empty:
+                assert positions[i] == -1
+                assert batch.loc[i].dropna().empty
+            else:
+                assert rows.iloc[positions[i]]["datekey"] == expected["datekey"]
+                assert batch.loc[i]["datekey"] == expected["datekey"]
+                assert batch.loc[i]["ticker"] == row["ticker"]
@@ -0,0 +1,63 @@
+import pandas as pd
+import pytest
+import numpy as np
+from .grouped_moments import GroupedMoments, merge_grouped_moments
+
+
+@pytest.fixture
+def dataset():
+    rng = np.random.RandomState(0)
+    dataset = pd.DataFrame({
+        "industry": rng.choice(["Tobacco", "Copper", "Banks"], size=500),
+        "size": rng.choice(["Micro", "Small", "Large"], size=500),
+        "f1": rng.normal(10, 3, size=500),
+        "f2": rng.normal(-5, 0.5, size=500),
+    })
+    dataset.loc[rng.rand(500) < 0.2, "f1"] = np.nan
+    dataset.loc[dataset["industry"] == "Banks", "f2"] = np.nan
+
+    return dataset
+
+
+def test_merge_matches_pandas(dataset):
+    moments = merge_grouped_moments([
+        GroupedMoments.from_dataframe(chunk, ["f1", "f2"], ["industry", "size"]) for chunk in np.array_split(dataset, 7)
+    ])
+    grouped = dataset.groupby(["industry", "size"])[["f1", "f2"]]
+
+    pd.testing.assert_frame_equal(moments.means(), grouped.mean(), check_exact=False, rtol=1e-10)
+    pd.testing.assert_frame_equal(moments.stds(), grouped.std(), check_exact=False, rtol=1e-10)
+
+
+def test_collapse(dataset):
+    moments = GroupedMoments.from_dataframe(dataset, ["f1", "f2"], ["industry", "size"]).collapse(["size"])
+    grouped = dataset.groupby("size")[["f1", "f2"]]
+
+    pd.testing.assert_frame_equal(moments.means(), grouped.mean(), check_exact=False, rtol=1e-10)
+    pd.testing.assert_frame_equal(moments.stds(), grouped.std(), check_exact=False, rtol=1e-10)
+
+
+def test_from_csv(dataset, tmp_path):
+    path = tmp_path / "dataset.csv"
+    dataset.to_csv(path, index=False)
+
+    moments = GroupedMoments.from_csv(path, ["f1"], ["size"], chunksize=64)
+    grouped = dataset.groupby("size")[["f1"]]
+
+    pd.testing.assert_frame_equal(moments.means(), grouped.mean(), check_exact=False, rtol=1e-10)
+    pd.testing.assert_frame_equal(moments.stds(), grouped.std(), check_exact=False, rtol=1e-10)
+    assert moments.count.loc["Small", "f1"] == dataset.loc[dataset["size"] == "Small", "f1"].count()
+
+
+def test_drop_and_merge_replaces_groups(dataset):
+    # Recalculating the moments of one industry, as when a part of a dataset is updated
+    moments = GroupedMoments.from_dataframe(dataset, ["f1", "f2"], ["industry", "size"])
+    updated = dataset.copy()
+    updated.loc[updated["industry"] == "Copper", "f1"] += 1
+
+    moments = moments.drop(["Copper"], "industry").merge(
+        GroupedMoments.from_dataframe(updated.loc[updated["industry"] == "Copper"], ["f1", "f2"], ["industry", "size"]))
+    grouped = updated.groupby(["industry", "size"])[["f1", "f2"]]
+
+    pd.testing.assert_frame_equal(moments.means(), grouped.mean(), check_exact=False, rtol=1e-10)
+    pd.testing.assert_frame_equal(moments.stds(), grouped.std(), check_exact=False, rtol=1e-10)
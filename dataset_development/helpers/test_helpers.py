@@ -7,7 +7,7 @@ import pytest
 from .helpers import get_acceptable_dates, select_row_closes_to_date, get_row_with_closest_date
 from .helpers import get_most_up_to_date_10k_filing, get_most_up_to_date_10q_filing,\
     get_calendardate_x_quarters_ago, get_calendardate_index, forward_fill_gaps, \
-        fill_in_missing_dates_in_calendardate_index, get_calendardate_x_quarters_later
+        fill_in_missing_dates_in_calendardate_index, get_calendardate_x_quarters_later, get_values_as_of
 
 sf1_art = None
 sf1_arq = None
@@ -152,6 +152,51 @@ def test_forward_fill_gaps():
     assert math.isnan(sf1_filled.loc["1998-06-30"]["capex"]) == True
 
 
+def test_forward_fill_gaps_all_tickers():
+    sf1_lacking = pd.read_csv("../../datasets/testing/lacking_sf1_art.csv", parse_dates=["datekey", "calendardate", "reportperiod"], index_col="calendardate")
+    sf1_lacking = sf1_lacking.sort_values(by=["calendardate", "datekey"])
+
+    sf1_filled = forward_fill_gaps(sf1_lacking, 3)
+
+    # Same as filling each ticker separately
+    for ticker in list(sf1_lacking.ticker.unique()):
+        sf1_filled_ticker = forward_fill_gaps(sf1_lacking.loc[sf1_lacking.ticker == ticker], 3)
+        assert sf1_filled.loc[sf1_filled.ticker == ticker].equals(sf1_filled_ticker)
+
+    # Numeric columns stay numeric and filled rows are copies of the last filing before the gap
+    assert sf1_filled["capex"].dtype == np.float64
+    assert sf1_filled["datekey"].dtype == sf1_lacking["datekey"].dtype
+
+    sf1_filled_aapl = sf1_filled.loc[sf1_filled.ticker == "AAPL"]
+    assert sf1_filled_aapl.loc["2000-09-30"].equals(sf1_filled_aapl.loc["1999-12-31"].rename(pd.to_datetime("2000-09-30")))
+
+
+def test_forward_fill_gaps_ends_at_last_calendardate():
+    # The last filing of each ticker is in a different quarter of the year. Nothing is filled after it (the row by row
+    # version added a copy of the last filing two quarters later when it was in Q1 or Q2).
+    last_calendardates = {"Q1": "2019-03-31", "Q2": "2019-06-30", "Q3": "2019-09-30", "Q4": "2019-12-31"}
+    sf1 = pd.concat([pd.DataFrame({
+        "ticker": ticker,
+        "calendardate": pd.to_datetime(["2018-03-31", "2018-09-30", last_calendardate]),
+        "revenue": [1.0, np.nan, 3.0],
+    }) for ticker, last_calendardate in last_calendardates.items()], ignore_index=True)
+    sf1["datekey"] = sf1["calendardate"] + pd.Timedelta(days=40)
+    sf1 = sf1.set_index("calendardate")
+
+    sf1_filled = forward_fill_gaps(sf1, 3)
+
+    assert list(sf1_filled.loc[sf1_filled.ticker == "Q1"].index.strftime("%Y-%m")) == \
+        ["2018-03", "2018-06", "2018-09", "2018-12", "2019-03"]
+    assert list(sf1_filled.loc[sf1_filled.ticker == "Q2"].index.strftime("%Y-%m")) == \
+        ["2018-03", "2018-06", "2018-09", "2018-12", "2019-03", "2019-06"]
+    # At most 3 of the 4 missing quarters before 2019-12-31 are filled
+    assert list(sf1_filled.loc[sf1_filled.ticker == "Q4"].index.strftime("%Y-%m")) == \
+        ["2018-03", "2018-06", "2018-09", "2018-12", "2019-03", "2019-06", "2019-12"]
+
+    for ticker, last_calendardate in last_calendardates.items():
+        assert sf1_filled.loc[sf1_filled.ticker == ticker].index.max() == pd.Timestamp(last_calendardate)
+
+
 def test_fill_in_missing_dates_in_calendardate_index():
     sf1_lacking = pd.read_csv("../../datasets/testing/lacking_sf1_art.csv", parse_dates=["datekey", "calendardate", "reportperiod"], index_col="calendardate")
     sf1_lacking_aapl = sf1_lacking.loc[sf1_lacking.ticker=="AAPL"]
@@ -231,6 +276,18 @@ def test_select_row_closes_to_date():
     pass
 
 
+def test_get_values_as_of():
+    dates = pd.to_datetime(["2020-01-02", "2020-01-03", "2020-01-06", "2020-01-08"])
+    values = pd.Series([1.0, np.nan, 3.0, 4.0], index=dates)
+
+    # Same as reindexing to every calendar day, forward filling and shifting
+    filled = values.reindex(pd.date_range(dates.min(), dates.max())).fillna(method="ffill")
+    for days in [0, 1, 3, 5, -2, -6]:
+        np.testing.assert_array_equal(get_values_as_of(values, dates, days), filled.shift(days).loc[dates].values)
+
+    np.testing.assert_array_equal(get_values_as_of(values, pd.to_datetime(["2020-01-05", "2020-01-09"]), 0), [1.0, np.nan])
+
+
 
 
 """
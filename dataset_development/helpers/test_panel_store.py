@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+import numpy as np
+from .panel_store import PanelStore, cross_sectional_mean
+
+
+@pytest.fixture
+def sep():
+    sep = pd.DataFrame({
+        "date": pd.to_datetime(["2020-01-01", "2020-01-02", "2020-01-06", "2020-01-10", "2020-01-02", "2020-01-03", "2020-01-06"]),
+        "ticker": ["AAPL", "AAPL", "AAPL", "AAPL", "NTK", "NTK", "NTK"],
+        "close": [10.0, 11.0, np.nan, 13.0, 20.0, 21.0, 22.0],
+    }).set_index("date")
+
+    return sep
+
+
+def test_values_at(sep):
+    panel = PanelStore.from_frame(sep, ["close"], dtype=np.float64)
+    rows, columns = panel.get_positions(sep)
+
+    assert list(panel.dates.strftime("%m-%d")) == ["01-01", "01-02", "01-03", "01-06", "01-10"]
+    assert panel.valid.sum() == len(sep)
+
+    # Current value, forward filled over nan values
+    np.testing.assert_array_equal(panel.values_at("close", rows, columns, 0), [10, 11, 11, 13, 20, 21, 22])
+    # Last value on or before 3 days ago, nan before the first row of the ticker
+    np.testing.assert_array_equal(panel.values_at("close", rows, columns, 3), [np.nan, np.nan, 11, 11, np.nan, np.nan, 21])
+    # Last value on or before 4 days ahead, nan past the last row of the ticker
+    np.testing.assert_array_equal(panel.values_at("close", rows, columns, -4), [11, 11, 13, np.nan, 22, np.nan, np.nan])
+
+
+def test_cross_sectional_mean():
+    rows = np.array([0, 0, 0, 1, 1, 1])
+    values = np.array([1.0, 2.0, np.nan, 4.0, 5.0, 6.0])
+    groups = np.array([0, 1, 1, 0, 0, -1])
+
+    np.testing.assert_array_equal(cross_sectional_mean(values, rows), [1.5, 1.5, 1.5, 5, 5, 5])
+    np.testing.assert_array_equal(cross_sectional_mean(values, rows, groups), [1, 2, 2, 4.5, 4.5, np.nan])
@@ -0,0 +1,45 @@
+import pandas as pd
+import pytest
+from .quarter_calendar import to_quarter_ids, from_quarter_ids, shift_calendardates, get_calendardate_range, is_calendardate
+
+
+def test_to_quarter_ids():
+    quarter_ids = to_quarter_ids(pd.to_datetime(["2011-12-31", "2012-03-31", "2012-06-30", "2012-09-30"]))
+
+    assert list(quarter_ids) == [2011*4 + 3, 2012*4, 2012*4 + 1, 2012*4 + 2]
+
+    with pytest.raises(ValueError):
+        to_quarter_ids(pd.to_datetime(["2012-03-30"]))
+
+
+def test_from_quarter_ids():
+    calendardates = pd.date_range("1969-03-31", "2030-12-31", freq="Q")
+
+    assert from_quarter_ids(to_quarter_ids(calendardates)).equals(calendardates)
+    assert is_calendardate(calendardates).all()
+    assert not is_calendardate(pd.to_datetime(["2012-02-29", "2012-06-29"])).any()
+
+
+def test_shift_calendardates():
+    cur_calendardate = pd.to_datetime("2003-03-31")
+
+    assert shift_calendardates(cur_calendardate, -5) == pd.to_datetime("2001-12-31")
+    assert shift_calendardates(cur_calendardate, 7) == pd.to_datetime("2004-12-31")
+
+    shifted = shift_calendardates(pd.to_datetime(["2003-03-31", "2004-12-31"]), [-4, 1])
+    assert list(shifted) == [pd.to_datetime("2002-03-31"), pd.to_datetime("2005-03-31")]
+
+    with pytest.raises(ValueError):
+        shift_calendardates(pd.to_datetime("2003-03-30"), 1)
+
+
+def test_get_calendardate_range():
+    calendardates = get_calendardate_range(pd.to_datetime("2012-06-30"), pd.to_datetime("2013-09-30"))
+
+    assert list(calendardates) == list(pd.to_datetime(["2012-06-30", "2012-09-30", "2012-12-31", "2013-03-31", \
+        "2013-06-30", "2013-09-30"]))
+
+    # No report periods after end, also when end is not the last quarter of a year
+    calendardates = get_calendardate_range(pd.to_datetime("2015-12-31"), pd.to_datetime("2016-06-30"))
+
+    assert list(calendardates) == list(pd.to_datetime(["2015-12-31", "2016-03-31", "2016-06-30"]))
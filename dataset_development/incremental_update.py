@@ -0,0 +1,407 @@
+"""
+Incremental updates of sep_featured, sf1_featured and the partitioned ml dataset.
+
+Instead of rebuilding everything when new SEP prices or SF1 filings arrive, the input rows changed since the last build
+are read from the columnar stores the exports are ingested into (helpers.columnar_store.read_changes, or compared with
+get_changed_rows and get_sf1_changes), and only rows that can depend on them are recomputed and upserted:
+- SF1: a filing is used by the rows of its ticker up to sf1_rows_affected_quarters after its calendardate. The industry
+  features of all companies in the same industry and calendardate as a recomputed row are recomputed as well.
+- SEP: the market and industry returns (mom1w_ewa_market, indmom) are averages over all tickers of a date, so a change
+  affects every ticker. All rows from label_horizon before the first changed date, to the longest feature lookback
+  after the last changed date, are recomputed.
+  SF1_ART filings are read by the SEP tasks for the datekeys (sampling) and shares (mve, turn, dy, ...) of a ticker, so
+  a changed filing only affects that ticker. Its rows from sf1_sampling_margin before the first changed datekey on are
+  recomputed.
+- ml dataset: only the years with affected dates are finalized. Missing values are drawn per year from moments over all
+  years, the moments of the other years are read from what the last build saved (see finalize_dataset), and scaling is
+  per date. Only the rows in the affected date range are written to the partitioned dataset.
+
+check_parity compares an incremental update with a full rebuild.
+"""
+import os
+import json
+import pandas as pd
+import numpy as np
+from dateutil.relativedelta import *
+
+from helpers.quarter_calendar import shift_calendardates
+from sf1_features import add_sf1_features_for_all_tickers
+from sf1_industry_features import add_industry_sf1_features
+from sep_features import sep_feature_registry
+
+
+# How far back SEP data is used to calculate each feature of a sample, as declared in the feature registry
+sep_feature_lookbacks = {name: feature.lookback for name, feature in sep_feature_registry.features.items() \
+    if feature.lookback is not None}
+
+# How far ahead of a sample SEP data is used for its labels (return_3m is the longest)
+label_horizon = relativedelta(days=90)
+
+# SF1_ART columns read by the SEP tasks, besides the datekey
+sep_sf1_art_columns = ["sharesbas", "sharefactor"]
+
+# rebase_at_each_filing_sampling drops samples less than days_of_distance (20) days before a new filing
+sf1_sampling_margin = relativedelta(months=1)
+
+# A filing is used by rows up to 7 quarters after its calendardate (10Qs of the last 8 quarters), and forward_fill_gaps
+# repeats a filing into at most 3 missing quarters.
+sf1_rows_affected_quarters = 7 + 3
+
+# Filings needed before the first recomputed calendardate, features are only calculated from one year after the
+# first calendardate of a ticker.
+sf1_input_quarters = sf1_rows_affected_quarters + 4
+
+
+def get_changed_rows(old: pd.DataFrame, new: pd.DataFrame, keys: list) -> pd.DataFrame:
+    """
+    Returns the $keys of rows that were added to, removed from or changed between $old and $new. Both dataframes are
+    expected to have the $keys as columns. If several rows have the same keys, the last one is compared.
+    """
+    old = old.drop_duplicates(subset=keys, keep="last")
+    new = new.drop_duplicates(subset=keys, keep="last")
+    columns = [column for column in new.columns if (column in old.columns) and (column not in keys)]
+
+    merged = old[keys + columns].merge(new[keys + columns], on=keys, how="outer", suffixes=("_old", ""), indicator=True)
+
+    changed = (merged["_merge"] != "both").values
+    for column in columns:
+        old_values = merged[column + "_old"]
+        new_values = merged[column]
+        changed |= ~((old_values == new_values) | (old_values.isnull() & new_values.isnull())).values
+
+    return merged.loc[changed, keys].reset_index(drop=True)
+
+
+def get_sf1_windows(changed: pd.DataFrame) -> pd.DataFrame:
+    """
+    The calendardates to recompute for each ticker with changed filings (ticker, calendardate columns), from the first
+    changed calendardate (start) to sf1_rows_affected_quarters after the last one (end). input_start is the first
+    calendardate of the filings needed to recompute them.
+    """
+    windows = changed.groupby("ticker")["calendardate"].agg(["min", "max"])
+
+    return pd.DataFrame({
+        "start": windows["min"].values,
+        "end": shift_calendardates(windows["max"].values, sf1_rows_affected_quarters),
+        "input_start": shift_calendardates(windows["min"].values, -sf1_input_quarters),
+    }, index=windows.index)
+
+
+def in_windows(tickers: pd.Series, dates: pd.Series, windows: pd.DataFrame, start: str="start") -> np.ndarray:
+    """
+    Boolean array telling which rows (given by $tickers and $dates) are in their ticker's window, from the $start
+    column to the end column of $windows.
+    """
+    starts = windows[start].reindex(tickers).values
+    ends = windows["end"].reindex(tickers).values
+    dates = np.asarray(dates, dtype="datetime64[ns]")
+
+    return ~pd.isnull(starts) & (dates >= starts) & (dates <= ends)
+
+
+def get_sf1_changes(sf1_old: pd.DataFrame, sf1: pd.DataFrame, columns: list=None) -> pd.DataFrame:
+    """
+    The keys (ticker, calendardate, datekey) of the filings added to, removed from or changed (in $columns, all if None)
+    between $sf1_old and $sf1, which have a calendardate index.
+    """
+    keys = ["ticker", "calendardate", "datekey"]
+    sf1_old = sf1_old.reset_index()
+    sf1 = sf1.reset_index()
+
+    if columns is not None:
+        sf1_old = sf1_old[keys + columns]
+        sf1 = sf1[keys + columns]
+
+    return get_changed_rows(sf1_old, sf1, keys)
+
+
+def update_sf1_featured(sf1_featured: pd.DataFrame, changed: pd.DataFrame, sf1_art: pd.DataFrame, sf1_arq: pd.DataFrame, \
+    metadata: pd.DataFrame) -> pd.DataFrame:
+    """
+    Updates $sf1_featured to what generate_sf1_featured would give for $sf1_art and $sf1_arq, recomputing only the rows
+    of tickers with changed filings and the industry features of their peers. $changed has the ticker and calendardate
+    of the filings in SF1_ART or SF1_ARQ that changed since $sf1_featured was built (see get_sf1_changes and
+    columnar_store.read_changes). All sf1 dataframes have a calendardate index, as in generate_sf1_featured.
+    """
+    keys = ["ticker", "calendardate", "datekey"]
+
+    if len(changed) == 0:
+        return sf1_featured
+
+    windows = get_sf1_windows(changed)
+
+    # 1. Recompute the features of each ticker in its window, from the filings the window depends on
+    sf1_art = sf1_art.reset_index()
+    sf1_arq = sf1_arq.reset_index()
+    art_input = sf1_art.loc[in_windows(sf1_art["ticker"], sf1_art["calendardate"], windows, start="input_start")].set_index("calendardate")
+    arq_input = sf1_arq.loc[in_windows(sf1_arq["ticker"], sf1_arq["calendardate"], windows, start="input_start")].set_index("calendardate")
+
+    recomputed = add_sf1_features_for_all_tickers(art_input, arq_input, metadata).reset_index()
+    recomputed = recomputed.loc[in_windows(recomputed["ticker"], recomputed["calendardate"], windows)]
+
+    sf1_featured = sf1_featured.reset_index()
+    replaced = in_windows(sf1_featured["ticker"], sf1_featured["calendardate"], windows)
+
+    # 2. Industry features of every (industry, calendardate) with a recomputed or removed row
+    industry_dates = pd.concat([recomputed, sf1_featured.loc[replaced]])[["industry", "calendardate"]].drop_duplicates()
+
+    sf1_featured = pd.concat([sf1_featured.loc[~replaced], recomputed], sort=False)
+    in_industry_dates = pd.MultiIndex.from_frame(sf1_featured[["industry", "calendardate"]]) \
+        .isin(pd.MultiIndex.from_frame(industry_dates))
+
+    industry_rows = add_industry_sf1_features(sf1_featured.loc[in_industry_dates].set_index("calendardate"), metadata).reset_index()
+
+    sf1_featured = pd.concat([sf1_featured.loc[~in_industry_dates], industry_rows], sort=False)
+
+    return sf1_featured.sort_values(by=keys, kind="mergesort").set_index("calendardate")
+
+
+def get_sep_window(changed: pd.DataFrame, last_date) -> tuple:
+    """
+    The dates of samples to recompute when the SEP rows in $changed (ticker, date columns) changed: from label_horizon
+    before the first changed date, to the longest feature lookback after the last changed date (at most $last_date).
+    Also returns the first date of SEP data needed to recompute them.
+    """
+    first_changed = changed["date"].min()
+    last_changed = changed["date"].max()
+
+    start = first_changed - label_horizon
+    end = min(max(last_changed + lookback for lookback in sep_feature_lookbacks.values()), pd.Timestamp(last_date))
+    input_start = min(start - lookback for lookback in sep_feature_lookbacks.values())
+
+    return start, end, input_start
+
+
+def get_sep_windows(changed_sep: pd.DataFrame, changed_sf1_art: pd.DataFrame, tickers, last_date) -> pd.DataFrame:
+    """
+    The sample dates to recompute for each ticker (start to end) and the first date of SEP data needed (input_start):
+    - for changed SEP rows ($changed_sep, ticker and date columns) the window of get_sep_window, for all $tickers
+    - for changed SF1_ART filings ($changed_sf1_art, ticker and datekey columns) the rows of the ticker from
+      sf1_sampling_margin before the first changed datekey to $last_date
+    Tickers with both get the dates from the first start to the last end.
+    """
+    windows = []
+
+    if len(changed_sep) > 0:
+        start, end, input_start = get_sep_window(changed_sep, last_date)
+        windows.append(pd.DataFrame({"start": start, "end": end, "input_start": input_start}, \
+            index=pd.Index(tickers, name="ticker")))
+
+    if len(changed_sf1_art) > 0:
+        first_changed = changed_sf1_art.groupby("ticker")["datekey"].min()
+        starts = [datekey - sf1_sampling_margin for datekey in first_changed]
+        windows.append(pd.DataFrame({
+            "start": starts,
+            "end": pd.Timestamp(last_date),
+            "input_start": [min(start - lookback for lookback in sep_feature_lookbacks.values()) for start in starts],
+        }, index=first_changed.index))
+
+    if len(windows) == 0:
+        return pd.DataFrame(columns=["start", "end", "input_start"], index=pd.Index([], name="ticker"))
+
+    return pd.concat(windows).groupby(level="ticker").agg({"start": "min", "end": "max", "input_start": "min"})
+
+
+def get_dividend_adjustments(sep: pd.DataFrame, dates: pd.Series) -> pd.Series:
+    """
+    For each ticker of $dates, the factor dividend_adjusting_prices_backwards divides the close price of the ticker on
+    dates[ticker] by, from the dividends after it.
+    """
+    sep = sep.loc[sep["ticker"].isin(dates.index)]
+    sep = sep.loc[sep.index.values > dates.reindex(sep["ticker"]).values]
+    adjustments = ((sep["close"] + sep["dividends"]) / sep["close"]).groupby(sep["ticker"]).prod()
+
+    return adjustments.reindex(dates.index).fillna(1)
+
+
+def update_sep_featured(sep_featured: pd.DataFrame, changed_sep: pd.DataFrame, changed_sf1_art: pd.DataFrame, sep: pd.DataFrame, \
+    sf1_art: pd.DataFrame, metadata: pd.DataFrame, tb_rate: pd.DataFrame, num_processes: int, work_dir: str) -> pd.DataFrame:
+    """
+    Updates $sep_featured to what generate_sep_featured would give for $sep and $sf1_art, by running
+    generate_sep_featured on the SEP rows the affected samples depend on (see get_sep_windows). $changed_sep has the
+    ticker and date of the SEP rows, and $changed_sf1_art the ticker and datekey of the SF1_ART filings, that changed
+    since $sep_featured was built (see get_changed_rows, get_sf1_changes with sep_sf1_art_columns, and
+    columnar_store.read_changes). The run reads all tickers, as add_sep_panel_features needs the whole panel, and only
+    the rows in the windows are kept. $work_dir is used for the input csv files and the molecule cache of that run.
+    sep and sep_featured have a date index and sf1_art a calendardate index, as in generate_sep_featured.
+    NOTE: ewmstd_2y_monthly (and the barriers derived from it) only sees sep_feature_lookbacks["ewmstd_2y_monthly"] of
+    history before the window, so it is approximately (less than 1%) equal to a full rebuild. The rows before the windows
+    of tickers with new dividends get the rescaled adj_close of a full rebuild, but keep the returns calculated from the
+    old prices (equal up to the float32 rounding of add_sep_panel_features).
+    """
+    from generate_features import generate_sep_featured
+
+    tickers = np.union1d(sep["ticker"].unique(), sep_featured["ticker"].unique())
+    windows = get_sep_windows(changed_sep, changed_sf1_art, tickers, sep.index.max())
+
+    if len(windows) == 0:
+        return sep_featured
+
+    # Prices are dividend adjusted backwards from the last date, so all later rows are read
+    sep_input = sep.loc[sep.index >= windows["input_start"].min()]
+
+    cache_dir = os.path.join(work_dir, "molecules_cache")
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+
+    sep_input.to_csv(os.path.join(work_dir, "sep.csv"))
+    sf1_art.to_csv(os.path.join(work_dir, "sf1_art.csv"))
+    metadata.to_csv(os.path.join(work_dir, "metadata.csv"), index=False)
+
+    recomputed = generate_sep_featured(
+        num_processes=num_processes,
+        cache_dir=cache_dir,
+        tb_rate=tb_rate,
+        sep_path=os.path.join(work_dir, "sep.csv"),
+        sf1_art_path=os.path.join(work_dir, "sf1_art.csv"),
+        metadata_path=os.path.join(work_dir, "metadata.csv"),
+        resume=False,
+    )
+    recomputed = recomputed.loc[in_windows(recomputed["ticker"], recomputed.index, windows)]
+
+    sep_featured = sep_featured.loc[~in_windows(sep_featured["ticker"], sep_featured.index, windows)]
+
+    # New or changed dividends in a window change the adjusted prices of all earlier rows of the ticker by the same
+    # factor, the old factor of the last row before the window is its close divided by its adj_close
+    before_window = sep_featured.index.values < windows["start"].reindex(sep_featured["ticker"]).values
+    last_before = sep_featured.loc[before_window].reset_index().groupby("ticker").last()
+    rescale = get_dividend_adjustments(sep, last_before["date"]) * last_before["adj_close"] / last_before["close"]
+
+    sep_featured = sep_featured.copy()
+    sep_featured["adj_close"] = np.where(before_window, \
+        sep_featured["adj_close"].values / rescale.reindex(sep_featured["ticker"]).fillna(1).values, sep_featured["adj_close"].values)
+
+    sep_featured = pd.concat([sep_featured, recomputed], sort=False)
+
+    return sep_featured.sort_values(by=["ticker", "date"], kind="mergesort")
+
+
+def update_ml_dataset(sep_featured: pd.DataFrame, sf1_featured: pd.DataFrame, metadata: pd.DataFrame, start, end, \
+    path: str, moments_path: str, num_processes: int=6, seed: int=0) -> pd.DataFrame:
+    """
+    Finalizes the rows of the years from $start to $end of the updated featured datasets and upserts the rows dated from
+    $start to $end into the partitioned ml dataset at $path. The imputation moments of the other years are read from
+    $moments_path (saved by finalize_dataset), where the moments of the finalized years are replaced afterwards.
+    Returns the upserted rows.
+    """
+    from finalize_dataset import prepare_dataset, get_imputation_moments, impute_and_scale, upsert_partitioned_dataset
+
+    start = pd.Timestamp(start)
+    end = pd.Timestamp(end)
+    years = list(range(start.year, end.year + 1))
+
+    sep_featured = sep_featured.reset_index()
+    dataset, features = prepare_dataset(sep_featured.loc[sep_featured["date"].dt.year.isin(years)], sf1_featured.reset_index())
+
+    moments = pd.read_pickle(moments_path)
+    years_moments = get_imputation_moments(dataset, features)
+    moments = {name: moments[name].drop(years, "year").merge(years_moments[name]) for name in moments}
+
+    dataset = impute_and_scale(dataset, metadata, features, moments, num_processes=num_processes, seed=seed)
+    dataset = dataset.loc[(dataset["date"] >= start) & (dataset["date"] <= end)]
+
+    upsert_partitioned_dataset(dataset, path, start, end)
+    pd.to_pickle(moments, moments_path)
+
+    return dataset
+
+
+def check_parity(incremental: pd.DataFrame, full: pd.DataFrame, keys: list, rtol: float=1e-9, atol: float=1e-12) -> pd.Series:
+    """
+    Compares an incrementally updated dataset with a full rebuild. Returns the number of mismatching rows per column
+    (empty if they are equal). Rows are matched on $keys, rows only in one of them count as mismatches in "rows".
+    """
+    incremental = incremental.reset_index().drop_duplicates(subset=keys, keep="last").set_index(keys).sort_index()
+    full = full.reset_index().drop_duplicates(subset=keys, keep="last").set_index(keys).sort_index()
+
+    mismatches = {}
+    nr_of_missing_rows = len(incremental.index.symmetric_difference(full.index))
+    if nr_of_missing_rows > 0:
+        mismatches["rows"] = nr_of_missing_rows
+
+    index = incremental.index.intersection(full.index)
+    incremental = incremental.loc[index]
+    full = full.loc[index]
+
+    for column in full.columns:
+        if column not in incremental.columns:
+            mismatches[column] = len(index)
+            continue
+
+        incremental_values = incremental[column]
+        full_values = full[column]
+
+        if pd.api.types.is_numeric_dtype(full_values) and pd.api.types.is_numeric_dtype(incremental_values):
+            equal = np.isclose(incremental_values.values.astype(np.float64), full_values.values.astype(np.float64), \
+                rtol=rtol, atol=atol, equal_nan=True)
+        else:
+            equal = ((incremental_values == full_values) | (incremental_values.isnull() & full_values.isnull())).values
+
+        if not equal.all():
+            mismatches[column] = int((~equal).sum())
+
+    return pd.Series(mismatches, dtype=np.int64)
+
+
+if __name__ == "__main__":
+    from helpers.columnar_store import read_changes, read_ingest_log
+
+    # The inputs are the columnar stores utils/ingest_sharadar_export.py merges the exports into. The last ingest of each
+    # store this update processed is kept in last_build_dir/ingests.json, only the rows changed after it are recomputed.
+    last_build_dir = "./datasets/last_build"
+    completed_dir = "./datasets/completed"
+    stores = {
+        "SEP": "./datasets/sharadar/SEP_PURGED.parquet",
+        "SF1_ART": "./datasets/sharadar/SHARADAR_SF1_ART.parquet",
+        "SF1_ARQ": "./datasets/sharadar/SHARADAR_SF1_ARQ.parquet",
+    }
+
+    metadata = pd.read_csv("./datasets/sharadar/METADATA_PURGED.csv", parse_dates=["firstpricedate"])
+    tb_rate = pd.read_csv("./datasets/macro/t_bill_rate_3m.csv", parse_dates=["date"], index_col="date")
+
+    sf1_art = pd.read_parquet(stores["SF1_ART"]).set_index("calendardate")
+    sf1_arq = pd.read_parquet(stores["SF1_ARQ"]).set_index("calendardate")
+    sep = pd.read_parquet(stores["SEP"]).set_index("date")
+
+    processed = {name: 0 for name in stores}
+    if os.path.isfile(last_build_dir + "/ingests.json"):
+        with open(last_build_dir + "/ingests.json") as ingests_file:
+            processed.update(json.load(ingests_file))
+
+    # The changes of SF1_ART include all columns, a superset of what the SEP tasks read (see get_sf1_changes)
+    changes = {name: read_changes(path, since=processed[name]) for name, path in stores.items()}
+    changed_sf1 = pd.concat([changes["SF1_ART"], changes["SF1_ARQ"]], sort=False)
+
+    sf1_featured = pd.read_csv(completed_dir + "/sf1_featured.csv", parse_dates=["calendardate", "datekey"], index_col="calendardate")
+    sep_featured = pd.read_csv(completed_dir + "/sep_featured.csv", parse_dates=["date", "datekey", "timeout"], index_col="date")
+
+    sf1_featured_old = sf1_featured
+    sep_featured_old = sep_featured
+
+    sf1_featured = update_sf1_featured(sf1_featured, changed_sf1, sf1_art, sf1_arq, metadata)
+    sep_featured = update_sep_featured(sep_featured, changes["SEP"], changes["SF1_ART"], sep, sf1_art, metadata, tb_rate, \
+        num_processes=32, work_dir="./datasets/incremental_update")
+
+    # The first affected sample of the ml dataset is the first changed row of sep_featured, or the first datekey of a
+    # changed row of sf1_featured (from filings in SF1_ART or SF1_ARQ, and the industry features of their peers).
+    changed_sep_featured = get_changed_rows(sep_featured_old.reset_index(), sep_featured.reset_index(), ["ticker", "date"])
+    changed_sf1_featured = get_changed_rows(sf1_featured_old.reset_index(), sf1_featured.reset_index(), \
+        ["ticker", "calendardate", "datekey"])
+    start_dates = [changed_sep_featured["date"].min()] if len(changed_sep_featured) > 0 else []
+    start_dates += [changed_sf1_featured["datekey"].min()] if len(changed_sf1_featured) > 0 else []
+
+    if len(start_dates) > 0:
+        update_ml_dataset(sep_featured, sf1_featured, metadata, min(start_dates), sep.index.max(), completed_dir + "/ml_dataset", \
+            completed_dir + "/ml_dataset_moments.pickle")
+
+    sf1_featured.to_csv(completed_dir + "/sf1_featured.csv")
+    sep_featured.to_csv(completed_dir + "/sep_featured.csv")
+
+    for name, path in stores.items():
+        ingests = read_ingest_log(path)
+        processed[name] = ingests[-1]["ingest"] if len(ingests) > 0 else 0
+
+    if not os.path.exists(last_build_dir):
+        os.makedirs(last_build_dir)
+    with open(last_build_dir + "/ingests.json", "w") as ingests_file:
+        json.dump(processed, ingests_file, indent=2)
@@ -28,105 +28,473 @@ def meta_labeling_via_triple_barrier_method(dataset: pd.DataFrame, sep: pd.DataF
     if ("ewmstd_2y_monthly" not in dataset.columns) or ("timeout" not in dataset.columns):
         return dataset
 
-    ewmstd = dataset[["ewmstd_2y_monthly"]]
+    events = pd.DataFrame(index=dataset.index)
+    events["timeout"] = pd.to_datetime(dataset["timeout"])
+    events["ewmstd"] = dataset["ewmstd_2y_monthly"]
+    events["side"] = dataset["side_prediction"] # NOTE: Requires side_prediction to be set by the primary ML model
 
-    # I only consider the case where there is a timeout
-    timeout = dataset[["timeout"]]
+    touches = get_barrier_touches(events, sep, ptSl)
 
-    side_long = pd.DataFrame(index=ewmstd.index)
-    side_long["side"] = dataset["side_prediction"] # NOTE: Requires side_prediction to be set by the primary ML model
+    # events["primary_label"] = np.sign(events["return"]) # {0, 1}
+    touches.loc[touches["return"] <= 0, "primary_label"] = 0
+    touches.loc[touches["return"] > 0, "primary_label"] = 1
 
-    events = pd.concat({'timeout': timeout["timeout"], 'ewmstd': ewmstd["ewmstd_2y_monthly"], 'side': side_long["side"]}, axis=1) # .dropna(subset=["trgt"])
+    dataset["m_return_tbm"] = touches["return"]
+    dataset["m_primary_label_tbm"] = touches["primary_label"]
+    dataset["m_date_of_touch"] = touches["earliest_touch"]
+    dataset["m_take_profit_barrier"] = touches["take_profit_barrier"]
+    dataset["m_stop_loss_barrier"] = touches["stop_loss_barrier"]
 
-    barrier_touch_dates = events[["timeout"]].copy(deep=True)
+    return dataset
 
-    take_profit_barriers = ptSl[0] * events["ewmstd"] # I only consider the case where there is both horizontal barriers
-    stop_loss_barriers = ptSl[1] * events["ewmstd"]
 
-    for date, timeout in events["timeout"].fillna(sep.index[-1]).iteritems(): # If timeout is missing for an event (this should not be the case), we use the last date in sep (for the ticker) as timeout.
-        path_of_prices = sep.loc[(sep.index >= date) & (sep.index <= timeout)][["adj_close"]]
-        path_of_returns = ((path_of_prices["adj_close"] / path_of_prices.iloc[0]["adj_close"]) - 1) * events.loc[events.index == date].iloc[0]["side"] # side affects how the return series is calculated
-        barrier_touch_dates.loc[date, "earliest_take_profit_touch"] = path_of_returns[path_of_returns > take_profit_barriers[date]].index.min()
-        barrier_touch_dates.loc[date, "earliest_stop_loss_touch"] = path_of_returns[path_of_returns < stop_loss_barriers[date]].index.min()
-        
-    # drop those where none of the barrieres where touched (should be extremly rare, if not at all I think)
-    events["earliest_touch"] = barrier_touch_dates.dropna(how='all').min(axis=1) # pd.min ignores nan, here events["t1"] becomes the timesamp of the earliest barrier touch
+def add_labels_via_triple_barrier_method(sep_featured: pd.DataFrame, sep: pd.DataFrame, ptSl: tuple, min_ret):
+    
+    if ("ewmstd_2y_monthly" not in sep_featured.columns) or ("timeout" not in sep_featured.columns):
+        return sep_featured
 
-    events["return"] = sep.loc[events["earliest_touch"]]["adj_close"].values / sep.loc[events.index]["adj_close"].values - 1
-    # events["primary_label"] = np.sign(events["return"]) # {0, 1}
-    events.loc[events["return"] <= 0, "primary_label"] = 0
-    events.loc[events["return"] > 0, "primary_label"] = 1
+    events = pd.DataFrame(index=sep_featured.index)
+    events["timeout"] = pd.to_datetime(sep_featured["timeout"])
+    events["ewmstd"] = sep_featured["ewmstd_2y_monthly"]
+    events["side"] = 1.0 # remember we are still allways long
 
+    touches = get_barrier_touches(events, sep, ptSl)
 
-    dataset[["m_return_tbm", "m_primary_label_tbm"]] = events[["return", "primary_label"]]
-    dataset["m_date_of_touch"] = events["earliest_touch"]
-    dataset["m_take_profit_barrier"] = take_profit_barriers
-    dataset["m_stop_loss_barrier"] = stop_loss_barriers
+    sep_featured["return_tbm"] = touches["return"]
+    sep_featured["primary_label_tbm"] = np.sign(touches["return"])
+    sep_featured["date_of_touch"] = touches["earliest_touch"]
+    sep_featured["take_profit_barrier"] = touches["take_profit_barrier"]
+    sep_featured["stop_loss_barrier"] = touches["stop_loss_barrier"]
 
-    return dataset
+    return sep_featured
 
 
-def add_labels_via_triple_barrier_method(sep_featured: pd.DataFrame, sep: pd.DataFrame, ptSl: tuple, min_ret):
+def get_event_positions(dates: pd.DatetimeIndex, event_dates, timeouts):
+    """
+    Maps events to integer positions in $dates (sorted).
+    Returns (starts, ends), such that the path of an event is dates[starts[i]:ends[i]], this 
+    is all dates from the event date up to and including the timeout.
+    """
+    dates = np.asarray(dates, dtype="datetime64[ns]")
+    starts = np.searchsorted(dates, np.asarray(event_dates, dtype="datetime64[ns]"), side="left")
+    ends = np.searchsorted(dates, np.asarray(timeouts, dtype="datetime64[ns]"), side="right")
     
-    if ("ewmstd_2y_monthly" not in sep_featured.columns) or ("timeout" not in sep_featured.columns):
-        return sep_featured
+    return starts.astype(np.int64), ends.astype(np.int64)
 
-    ewmstd = sep_featured[["ewmstd_2y_monthly"]]
 
-    # I only consider the case there there is a timeout
-    timeout = sep_featured[["timeout"]]
+def iter_path_blocks(close: np.ndarray, starts: np.ndarray, ends: np.ndarray, block_size: int=100000):
+    """
+    Yields the paths of returns of events in blocks. For each block a tuple (block, offsets, in_path, path_of_returns) 
+    is yielded, where block is a slice into the events, path_of_returns is a (events x longest path) matrix of 
+    close[starts + offset] / close[starts] - 1 and in_path masks the cells that belong to each event's path.
+    Each block holds about $block_size path-cells.
+    """
+    lengths = np.maximum(ends - starts, 0)
+    if (len(starts) == 0) or (lengths.max() == 0):
+        return
 
-    side_long = pd.DataFrame(index=ewmstd.index)
-    side_long["side"] = 1.0
+    events_per_block = max(1, block_size // int(lengths.max()))
 
+    for block_start in range(0, len(starts), events_per_block):
+        block = slice(block_start, block_start + events_per_block)
+        block_starts = starts[block]
+        block_lengths = lengths[block]
+        width = int(block_lengths.max())
+        if width == 0:
+            continue
 
-    events = pd.concat({'timeout': timeout["timeout"], 'ewmstd': ewmstd["ewmstd_2y_monthly"], 'side': side_long["side"]}, axis=1) # .dropna(subset=["trgt"])
-    # print(events)
-    barrier_touch_dates = events[["timeout"]].copy(deep=True)
+        offsets = np.arange(width)
+        in_path = offsets[None, :] < block_lengths[:, None]
+        path_positions = np.minimum(block_starts[:, None] + offsets[None, :], len(close) - 1)
+        base_price = close[np.minimum(block_starts, len(close) - 1)]
 
-    take_profit_barriers = ptSl[0] * events["ewmstd"] # I only consider the case where there is both horizontal barriers
-    stop_loss_barriers = ptSl[1] * events["ewmstd"]
-    # print(stop_loss_barriers)
+        path_of_returns = (close[path_positions] / base_price[:, None]) - 1
 
-    for date, timeout in events["timeout"].fillna(sep.index[-1]).iteritems(): # If timeout is missing for an event (this should not be the case), we use the last date in sep (for the ticker) as timeout.
-        path_of_prices = sep.loc[(sep.index >= date) & (sep.index <= timeout)][["adj_close"]]
-        path_of_returns = ((path_of_prices["adj_close"] / path_of_prices.iloc[0]["adj_close"]) - 1) * events.loc[events.index == date].iloc[0]["side"] # events.loc[date]["side"] # remember we are still allways long
-        barrier_touch_dates.loc[date, "earliest_take_profit_touch"] = path_of_returns[path_of_returns > take_profit_barriers[date]].index.min()
-        barrier_touch_dates.loc[date, "earliest_stop_loss_touch"] = path_of_returns[path_of_returns < stop_loss_barriers[date]].index.min()
-        
+        yield block, offsets, in_path, path_of_returns
 
-    # drop those where none of the barrieres where touched (should be extremly rare, if not at all I think)
-    events["earliest_touch"] = barrier_touch_dates.dropna(how='all').min(axis=1) # pd.min ignores nan, here events["t1"] becomes the timesamp of the earliest barrier touch
 
-    events["return"] = sep.loc[events["earliest_touch"]]["adj_close"].values / sep.loc[events.index]["adj_close"].values - 1
-    events["primary_label"] = np.sign(events["return"])
+def first_touch(hits: np.ndarray, block_starts: np.ndarray) -> np.ndarray:
+    """
+    Position of the first True in each row of $hits, offset by $block_starts. -1 for rows without any True.
+    """
+    return np.where(hits.any(axis=1), block_starts + hits.argmax(axis=1), -1)
+
+
+def get_first_touch_positions(close: np.ndarray, starts: np.ndarray, ends: np.ndarray, take_profit: np.ndarray, \
+    stop_loss: np.ndarray, side: np.ndarray, block_size: int=100000):
+    """
+    Finds the position (in $close) of the first take profit touch and the first stop loss touch for all events.
+    The path of returns of an event is (close[starts:ends] / close[starts] - 1) * side. A take profit touch is a return 
+    above $take_profit and a stop loss touch is a return below $stop_loss. Positions are -1 when there is no touch.
+
+    Paths are scanned in blocks (see iter_path_blocks) and the first touch is found with argmax.
+    """
+    close = np.asarray(close, dtype=np.float64)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    take_profit = np.asarray(take_profit, dtype=np.float64)
+    stop_loss = np.asarray(stop_loss, dtype=np.float64)
+    side = np.asarray(side, dtype=np.float64)
+
+    take_profit_positions = np.full(len(starts), -1, dtype=np.int64)
+    stop_loss_positions = np.full(len(starts), -1, dtype=np.int64)
+
+    for block, offsets, in_path, path_of_returns in iter_path_blocks(close, starts, ends, block_size):
+        path_of_returns = path_of_returns * side[block][:, None] # side affects how the return series is calculated
+
+        take_profit_hits = in_path & (path_of_returns > take_profit[block][:, None])
+        stop_loss_hits = in_path & (path_of_returns < stop_loss[block][:, None])
+
+        take_profit_positions[block] = first_touch(take_profit_hits, starts[block])
+        stop_loss_positions[block] = first_touch(stop_loss_hits, starts[block])
 
-    sep_featured[["return_tbm", "primary_label_tbm"]] = events[["return", "primary_label"]]
-    sep_featured["date_of_touch"] = events["earliest_touch"]
-    sep_featured["take_profit_barrier"] = take_profit_barriers
-    sep_featured["stop_loss_barrier"] = stop_loss_barriers
+    return take_profit_positions, stop_loss_positions
+
+
+def get_earliest_touches(sep_dates: np.ndarray, close: np.ndarray, starts: np.ndarray, timeouts: np.ndarray, \
+    take_profit_positions: np.ndarray, stop_loss_positions: np.ndarray):
+    """
+    Combines the vertical barrier ($timeouts) with the first touches of the horizontal barriers.
+    Returns (earliest_touch, return), where the return is measured from the event's start price to the last 
+    price on or before the earliest touch. Both are NaT/NaN when no barrier was touched and timeout is missing.
+    """
+    nat = np.datetime64("NaT", "ns")
+    take_profit_dates = np.where(take_profit_positions >= 0, sep_dates[np.maximum(take_profit_positions, 0)], nat)
+    stop_loss_dates = np.where(stop_loss_positions >= 0, sep_dates[np.maximum(stop_loss_positions, 0)], nat)
+
+    barrier_touch_dates = pd.DataFrame({
+        "timeout": np.asarray(timeouts, dtype="datetime64[ns]"),
+        "earliest_take_profit_touch": take_profit_dates,
+        "earliest_stop_loss_touch": stop_loss_dates,
+    })
+
+    earliest_touch = barrier_touch_dates.min(axis=1).values # pd.min ignores nan, NaT if none of the barrieres where touched
+
+    # The price at the earliest touch is the last price on or before that date
+    touch_positions = np.searchsorted(sep_dates, earliest_touch, side="right") - 1
+    has_touch = ~pd.isnull(earliest_touch) & (touch_positions >= 0) & (starts < len(close))
+    
+    returns = np.where(has_touch, close[np.maximum(touch_positions, 0)] / close[np.minimum(starts, len(close) - 1)] - 1, np.nan)
+
+    return earliest_touch, returns
+
+
+def get_barrier_touches(events: pd.DataFrame, sep: pd.DataFrame, ptSl: tuple) -> pd.DataFrame:
+    """
+    Triple barrier search for all events at once.
+    events has an event date index and the columns "timeout", "ewmstd" and "side". sep is sorted on date and has an adj_close column.
+    Returns a dataframe (same index as events) with the columns "earliest_touch", "return", "take_profit_barrier" 
+    and "stop_loss_barrier". The earliest touch is the earliest of the timeout and the first touch of each horizontal barrier.
+    """
+    touches = pd.DataFrame(index=events.index)
+    touches["take_profit_barrier"] = ptSl[0] * events["ewmstd"] # I only consider the case where there is both horizontal barriers
+    touches["stop_loss_barrier"] = ptSl[1] * events["ewmstd"]
+
+    sep_dates = sep.index.values
+    close = sep["adj_close"].values
+    timeouts = events["timeout"]
+
+    # If timeout is missing for an event (this should not be the case), we use the last date in sep (for the ticker) as timeout.
+    starts, ends = get_event_positions(sep_dates, events.index.values, timeouts.fillna(sep.index[-1]).values)
+
+    take_profit_positions, stop_loss_positions = get_first_touch_positions(close, starts, ends, \
+        touches["take_profit_barrier"].values, touches["stop_loss_barrier"].values, events["side"].values)
+
+    earliest_touch, returns = get_earliest_touches(sep_dates, close, starts, timeouts.values, take_profit_positions, stop_loss_positions)
+
+    touches["earliest_touch"] = earliest_touch
+    touches["return"] = returns
+
+    return touches
+
+
+def get_timeouts(sep_dates: np.ndarray, event_dates: np.ndarray, days: int) -> np.ndarray:
+    """
+    Vertical barriers $days calendar days after each event: the last date in sep_dates before event date + $days.
+    This is the same rule add_sep_features uses for the "timeout" column (days=30).
+    """
+    sep_dates = np.asarray(sep_dates, dtype="datetime64[ns]")
+    event_dates = np.asarray(event_dates, dtype="datetime64[ns]")
+    positions = np.searchsorted(sep_dates, event_dates + np.timedelta64(days, "D"), side="left") - 1
+
+    return np.where(positions >= 0, sep_dates[np.maximum(positions, 0)], np.datetime64("NaT", "ns"))
+
+
+def triple_barrier_sweep(sep_featured: pd.DataFrame, sep: pd.DataFrame, barrier_grid: list, long_format: bool=True):
+    """
+    Labels the samples in sep_featured for every barrier configuration in $barrier_grid in a single pass over the price paths.
+
+    barrier_grid is a list of (take profit, stop loss, timeout) multipliers, like [(1, -1, 1), (1, -0.8, 1), (2, -2, 3)].
+    The horizontal barriers are the multipliers times ewmstd_2y_monthly (same as ptSl). The vertical barrier is the 
+    timeout multiplier times 30 days, a multiplier of 1 uses the sample's "timeout" column, so the configuration (pt, sl, 1)
+    gives the same labels as add_labels_via_triple_barrier_method with ptSl=[pt, sl].
+
+    The path of returns of each sample is built once, up to the longest timeout in the grid, and all configurations are
+    evaluated on it.
+
+    Returns a long-format table (one row per sample and configuration, date index) with the columns: ticker, take_profit,
+    stop_loss, timeout_multiplier, timeout, date_of_touch, return_tbm and primary_label_tbm. With long_format=False, 
+    sep_featured is returned with date_of_touch, return_tbm and primary_label_tbm columns added for each configuration, 
+    suffixed with _pt{take profit}_sl{stop loss}_t{timeout multiplier}.
+    """
+    if ("ewmstd_2y_monthly" not in sep_featured.columns) or ("timeout" not in sep_featured.columns) or (len(sep) == 0):
+        return pd.DataFrame() if long_format else sep_featured
+
+    sep_dates = sep.index.values
+    close = sep["adj_close"].values.astype(np.float64)
+    event_dates = sep_featured.index.values
+    ewmstd = sep_featured["ewmstd_2y_monthly"].values.astype(np.float64)
+
+    timeouts = {}
+    for _, _, timeout_multiplier in barrier_grid:
+        if timeout_multiplier in timeouts:
+            continue
+        if timeout_multiplier == 1:
+            timeouts[timeout_multiplier] = pd.to_datetime(sep_featured["timeout"]).values
+        else:
+            timeouts[timeout_multiplier] = get_timeouts(sep_dates, event_dates, 30*timeout_multiplier)
+
+    # If timeout is missing for an event, we use the last date in sep (for the ticker) as timeout.
+    last_date = sep_dates[-1]
+    ends = {}
+    for timeout_multiplier, timeout in timeouts.items():
+        _, ends[timeout_multiplier] = get_event_positions(sep_dates, event_dates, np.where(pd.isnull(timeout), last_date, timeout))
+
+    starts, _ = get_event_positions(sep_dates, event_dates, event_dates)
+    longest_ends = np.max(np.stack(list(ends.values())), axis=0)
+
+    take_profit_positions = np.full((len(barrier_grid), len(starts)), -1, dtype=np.int64)
+    stop_loss_positions = np.full((len(barrier_grid), len(starts)), -1, dtype=np.int64)
+
+    for block, offsets, in_path, path_of_returns in iter_path_blocks(close, starts, longest_ends):
+        block_starts = starts[block]
+        for i, (take_profit, stop_loss, timeout_multiplier) in enumerate(barrier_grid):
+            in_config_path = offsets[None, :] < (ends[timeout_multiplier][block] - block_starts)[:, None]
+            take_profit_hits = in_config_path & (path_of_returns > (take_profit * ewmstd[block])[:, None])
+            stop_loss_hits = in_config_path & (path_of_returns < (stop_loss * ewmstd[block])[:, None])
+
+            take_profit_positions[i, block] = first_touch(take_profit_hits, block_starts)
+            stop_loss_positions[i, block] = first_touch(stop_loss_hits, block_starts)
+
+    labels = []
+    for i, (take_profit, stop_loss, timeout_multiplier) in enumerate(barrier_grid):
+        earliest_touch, returns = get_earliest_touches(sep_dates, close, starts, timeouts[timeout_multiplier], \
+            take_profit_positions[i], stop_loss_positions[i])
+
+        if long_format:
+            config_labels = pd.DataFrame(index=sep_featured.index)
+            if "ticker" in sep_featured.columns:
+                config_labels["ticker"] = sep_featured["ticker"]
+            config_labels["take_profit"] = take_profit
+            config_labels["stop_loss"] = stop_loss
+            config_labels["timeout_multiplier"] = timeout_multiplier
+            config_labels["timeout"] = timeouts[timeout_multiplier]
+            config_labels["date_of_touch"] = earliest_touch
+            config_labels["return_tbm"] = returns
+            config_labels["primary_label_tbm"] = np.sign(returns)
+            labels.append(config_labels)
+        else:
+            suffix = "_pt{}_sl{}_t{}".format(take_profit, stop_loss, timeout_multiplier)
+            sep_featured["date_of_touch" + suffix] = earliest_touch
+            sep_featured["return_tbm" + suffix] = returns
+            sep_featured["primary_label_tbm" + suffix] = np.sign(returns)
+
+    if long_format:
+        return pd.concat(labels)
 
     return sep_featured
 
 
 
+class BarrierPathCache():
+    """
+    Per event statistics of the path of returns, so the dataset can be meta labeled for any side vector without
+    going back to sep. The side only flips the sign of the path of returns, so the first touch of both horizontal
+    barriers, for either side, can be found from the running max and running min of the (long) returns.
+
+    Events are keyed by (ticker, event date, timeout). For each event the cache holds the running max and min of 
+    returns up to the timeout (padded with the last value, so rows stay monotone), the position of the event in 
+    the concatenated sep dates (to find touch dates) and the return at the timeout.
+    """
+    def __init__(self, dataset: pd.DataFrame, sep: pd.DataFrame, block_size: int=100000):
+        """
+        dataset has a date index and the columns "ticker" and "timeout". sep must be dividend adjusted and have
+        the columns "ticker" and "adj_close".
+        """
+        events = pd.DataFrame({
+            "ticker": dataset["ticker"].values,
+            "date": dataset.index.values,
+            "timeout": pd.to_datetime(dataset["timeout"]).values,
+        })
+        events = events.drop_duplicates().sort_values(by=["ticker", "date"], kind="mergesort").reset_index(drop=True)
+
+        sep = sep.loc[sep.ticker.isin(events["ticker"].unique())]
+        sep = sep.reset_index().sort_values(by=["ticker", "date"], kind="mergesort")
+
+        self.dates = sep["date"].values
+        close = sep["adj_close"].values.astype(np.float64)
+        sep_tickers = sep["ticker"].values
+
+        event_tickers = events["ticker"].values
+        ticker_bounds = np.flatnonzero(np.r_[True, event_tickers[1:] != event_tickers[:-1], True])
+
+        starts = np.zeros(len(events), dtype=np.int64)
+        ends = np.zeros(len(events), dtype=np.int64)
+        sep_offsets = np.zeros(len(events), dtype=np.int64)
+        self.timeout_returns = np.full(len(events), np.nan)
+
+        for first, last in zip(ticker_bounds[:-1], ticker_bounds[1:]):
+            ticker = event_tickers[first]
+            sep_first = np.searchsorted(sep_tickers, ticker, side="left")
+            sep_last = np.searchsorted(sep_tickers, ticker, side="right")
+            if sep_first == sep_last:
+                continue
+            ticker_dates = self.dates[sep_first:sep_last]
+            ticker_close = close[sep_first:sep_last]
+            timeouts = events["timeout"].values[first:last]
+
+            # If timeout is missing for an event, we use the last date in sep (for the ticker) as timeout.
+            starts[first:last], ends[first:last] = get_event_positions(ticker_dates, events["date"].values[first:last], \
+                np.where(pd.isnull(timeouts), ticker_dates[-1], timeouts))
+            sep_offsets[first:last] = sep_first
+
+            no_touches = np.full(last - first, -1)
+            _, self.timeout_returns[first:last] = get_earliest_touches(ticker_dates, ticker_close, starts[first:last], timeouts, \
+                no_touches, no_touches)
+
+        self.lengths = np.maximum(ends - starts, 0)
+        self.sep_starts = sep_offsets + starts
+        width = max(int(self.lengths.max()) if len(events) > 0 else 0, 1)
+
+        self.running_max = np.full((len(events), width), -np.inf)
+        self.running_min = np.full((len(events), width), np.inf)
+
+        for first, last in zip(ticker_bounds[:-1], ticker_bounds[1:]):
+            sep_first = sep_offsets[first]
+            ticker_close = close[sep_first:]
+            for block, offsets, in_path, path_of_returns in iter_path_blocks(ticker_close, starts[first:last], ends[first:last], block_size):
+                rows = np.arange(first, last)[block]
+                block_max = np.maximum.accumulate(np.where(in_path, path_of_returns, -np.inf), axis=1)
+                block_min = np.minimum.accumulate(np.where(in_path, path_of_returns, np.inf), axis=1)
+                self.running_max[rows, :len(offsets)] = block_max
+                self.running_max[rows, len(offsets):] = block_max[:, -1:]
+                self.running_min[rows, :len(offsets)] = block_min
+                self.running_min[rows, len(offsets):] = block_min[:, -1:]
+
+        self.timeouts = events["timeout"].values
+        self.index = pd.MultiIndex.from_arrays([events["ticker"].values, events["date"].values.astype(np.int64), \
+            self.timeouts.astype("datetime64[ns]").astype(np.int64)])
+
+
+    def get_rows(self, dataset: pd.DataFrame) -> np.ndarray:
+        """
+        Row in the cache of each sample in dataset. Raises KeyError if a sample was not in the dataset the cache was built from.
+        """
+        rows = self.index.get_indexer(pd.MultiIndex.from_arrays([dataset["ticker"].values, dataset.index.values.astype("datetime64[ns]").astype(np.int64), \
+            pd.to_datetime(dataset["timeout"]).values.astype("datetime64[ns]").astype(np.int64)]))
+        if (rows < 0).any():
+            raise KeyError("{} samples are not in the barrier path cache".format(int((rows < 0).sum())))
+        
+        return rows
+
+
+    def get_barrier_touches(self, dataset: pd.DataFrame, ptSl: tuple, side: np.ndarray) -> pd.DataFrame:
+        """
+        Same output as get_barrier_touches, for the samples in dataset with the given side (1 or -1 per sample). 
+        Samples with any other side (0 or nan) never touch the horizontal barriers.
+        """
+        rows = self.get_rows(dataset)
+        side = np.asarray(side, dtype=np.float64)
+
+        touches = pd.DataFrame(index=dataset.index)
+        touches["take_profit_barrier"] = ptSl[0] * dataset["ewmstd_2y_monthly"]
+        touches["stop_loss_barrier"] = ptSl[1] * dataset["ewmstd_2y_monthly"]
+
+        take_profit = touches["take_profit_barrier"].values[:, None]
+        stop_loss = touches["stop_loss_barrier"].values[:, None]
+        running_max = self.running_max[rows]
+        running_min = self.running_min[rows]
+        long = (side == 1)[:, None]
+        short = (side == -1)[:, None]
+
+        # long: return > take_profit / return < stop_loss, short: -return > take_profit / -return < stop_loss
+        take_profit_hits = (long & (running_max > take_profit)) | (short & (-running_min > take_profit))
+        stop_loss_hits = (long & (running_min < stop_loss)) | (short & (-running_max < stop_loss))
+
+        take_profit_offsets = first_touch(take_profit_hits, 0)
+        stop_loss_offsets = first_touch(stop_loss_hits, 0)
+
+        # The long return at the first touch is the running max (or min) at that offset
+        events = np.arange(len(rows))
+        take_profit_offsets_ = np.maximum(take_profit_offsets, 0)
+        stop_loss_offsets_ = np.maximum(stop_loss_offsets, 0)
+        take_profit_returns = np.where(side == 1, running_max[events, take_profit_offsets_], running_min[events, take_profit_offsets_])
+        stop_loss_returns = np.where(side == 1, running_min[events, stop_loss_offsets_], running_max[events, stop_loss_offsets_])
+
+        nat = np.datetime64("NaT", "ns")
+        sep_starts = self.sep_starts[rows]
+        take_profit_dates = np.where(take_profit_offsets >= 0, self.dates[np.minimum(sep_starts + take_profit_offsets_, len(self.dates) - 1)], nat)
+        stop_loss_dates = np.where(stop_loss_offsets >= 0, self.dates[np.minimum(sep_starts + stop_loss_offsets_, len(self.dates) - 1)], nat)
+
+        barrier_touch_dates = pd.DataFrame({
+            "timeout": self.timeouts[rows],
+            "earliest_take_profit_touch": take_profit_dates,
+            "earliest_stop_loss_touch": stop_loss_dates,
+        })
+        earliest_touch = barrier_touch_dates.min(axis=1).values
+
+        returns = self.timeout_returns[rows]
+        returns = np.where(earliest_touch == stop_loss_dates, stop_loss_returns, returns)
+        returns = np.where(earliest_touch == take_profit_dates, take_profit_returns, returns)
+
+        touches["earliest_touch"] = earliest_touch
+        touches["return"] = returns
+
+        return touches
+
+
+    def meta_labels(self, dataset: pd.DataFrame, ptSl: tuple) -> pd.DataFrame:
+        """
+        Same as meta_labeling_via_triple_barrier_method, but without touching sep. Requires side_prediction to be set.
+        """
+        touches = self.get_barrier_touches(dataset, ptSl, dataset["side_prediction"].values)
+
+        touches.loc[touches["return"] <= 0, "primary_label"] = 0
+        touches.loc[touches["return"] > 0, "primary_label"] = 1
+
+        dataset["m_return_tbm"] = touches["return"]
+        dataset["m_primary_label_tbm"] = touches["primary_label"]
+        dataset["m_date_of_touch"] = touches["earliest_touch"]
+        dataset["m_take_profit_barrier"] = touches["take_profit_barrier"]
+        dataset["m_stop_loss_barrier"] = touches["stop_loss_barrier"]
+
+        return dataset
+
+
+
 def equity_risk_premium_labeling(sep_featured, tb_rate):
     """
     To get the risk free rate over the month, take the most recent 3-month t-bill rate and make 
     it into a decimal number and divide it by 3 to get the monthly rate
     Subtract the risk free rate from the return
+
+    The most recent rate is found with an as-of join (last rate on or before the sample date), so this 
+    runs once over the whole dataset and dates missing from tb_rate get the previous rate.
     """
+    tb_rate = tb_rate.sort_index()
+    tb_rate_dates = tb_rate.index.values
+    sample_dates = pd.to_datetime(sep_featured.index).values
 
-    for date, row in sep_featured.iterrows():
-        tb_rate_3m = tb_rate.loc[date]["rate"]
+    positions = np.searchsorted(tb_rate_dates, sample_dates, side="right") - 1
+    tb_rate_3m = np.where(positions >= 0, tb_rate["rate"].values[np.maximum(positions, 0)], np.nan)
 
-        rf_rate_1m = tb_rate_3m / 3
-        rf_rate_2m = (tb_rate_3m / 3) * 2
-        rf_rate_3m = tb_rate_3m
+    rf_rate_1m = tb_rate_3m / 3
+    rf_rate_2m = (tb_rate_3m / 3) * 2
+    rf_rate_3m = tb_rate_3m
 
-        sep_featured.at[date, "erp_1m"] = row["return_1m"] - rf_rate_1m
-        sep_featured.at[date, "erp_2m"] = row["return_2m"] - rf_rate_2m
-        sep_featured.at[date, "erp_3m"] = row["return_3m"] - rf_rate_3m
+    sep_featured["erp_1m"] = sep_featured["return_1m"] - rf_rate_1m
+    sep_featured["erp_2m"] = sep_featured["return_2m"] - rf_rate_2m
+    sep_featured["erp_3m"] = sep_featured["return_3m"] - rf_rate_3m
 
     return sep_featured
 
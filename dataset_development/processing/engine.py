@@ -12,6 +12,7 @@ import pickle
 from io import StringIO
 import math
 import re
+import hashlib
 from dateutil.parser import parse
 
 def is_date(string, fuzzy=False):
@@ -346,6 +347,12 @@ def process_jobs_fast(jobs, task=None, num_processes=8, sort_by=[]):
     """
     if task is None:
         task = jobs[0]['callback'].__name__
+
+        if len(jobs) == 1:
+            # Nothing to parallelize, avoid sending the molecule to another process and back
+            job_key, out_ = expandCall_fast(jobs[0])
+            report_progress(1, 1, time.time(), task)
+            return {job_key: out_.sort_values(by=sort_by)}
         
         pool = mp.Pool(processes=num_processes)
         outputs = pool.imap_unordered(expandCall_fast, jobs)
@@ -409,8 +416,11 @@ def split_df_into_molecules(atoms, split_strategy, num_molecules):
         grouped_molecules = atoms.groupby("ticker")
         for ticker, molecule in grouped_molecules:
             dfs[ticker] = molecule
+    elif split_strategy == 'none':
+        # For tasks working on all atoms at once (e.g. whole panel array operations)
+        dfs["all"] = atoms
     else:
-        raise ValueError("split_strategy cannot be " + split_strategy + ". Only 'ticker', 'industry' and 'date' are supported.")
+        raise ValueError("split_strategy cannot be " + split_strategy + ". Only 'ticker', 'industry', 'date' and 'none' are supported.")
 
     return dfs
 
@@ -448,11 +458,116 @@ def combine_molecules(molecules):
     return result
 
 
+def infer_atoms_columns(tasks: list, disk_name: str, atoms_config: dict):
+    """
+    Columns of the atoms $disk_name needed by the $tasks, from the "columns" each task declares, e.g.
+    "columns": {"sep": ["close", "dividends"], "sf1_art": ["datekey"]}, listing the columns of the atoms (as read from disk)
+    the task uses directly or through the output of earlier tasks.
+    The index column, sort columns, date column and ticker are always included. Returns None (all columns) if some task
+    does not declare its columns.
+    """
+    columns = ["ticker"]
+    columns += [atoms_config["index_col"]] if atoms_config["index_col"] is not None else []
+    columns += atoms_config["sort_by"] or []
+    columns += [atoms_config["date_column"]] if atoms_config.get("date_column") is not None else []
+
+    for task in tasks:
+        if "columns" not in task:
+            return None
+        columns += task["columns"].get(disk_name, [])
+
+    return list(dict.fromkeys(columns)) # Unique, in order
+
+
+def filter_atoms(atoms: pd.DataFrame, atoms_config: dict):
+    """
+    Rows of $atoms within the optional "date_range" (start, end, both inclusive, None for open ended) on "date_column"
+    (the index column by default) and for the optional "tickers" of $atoms_config.
+    """
+    date_range = atoms_config.get("date_range")
+    if date_range is not None:
+        date_column = atoms_config.get("date_column", atoms_config["index_col"])
+        dates = atoms.index if date_column == atoms_config["index_col"] else atoms[date_column]
+        if date_range[0] is not None:
+            atoms = atoms.loc[dates >= pd.to_datetime(date_range[0])]
+            dates = atoms.index if date_column == atoms_config["index_col"] else atoms[date_column]
+        if date_range[1] is not None:
+            atoms = atoms.loc[dates <= pd.to_datetime(date_range[1])]
+
+    if atoms_config.get("tickers") is not None:
+        atoms = atoms.loc[atoms["ticker"].isin(atoms_config["tickers"])]
+
+    return atoms
+
+
+def read_atoms(atoms_config: dict, columns: list=None, chunksize: int=1000000):
+    """
+    Reads the atoms of $atoms_config, only $columns (all if None) and only the rows selected by its optional "date_range" and
+    "tickers" (see filter_atoms). The selection is applied at read time:
+    - Parquet files are read with the columns and filters pushed down to the reader. Ticker sorted parquet files with a
+      row offset index (see helpers/columnar_store.py) only read the row groups of the selected tickers.
+    - Csv files are parsed for $columns only, in chunks of $chunksize rows that are filtered before they are combined.
+    """
+    path = atoms_config["csv_path"]
+    date_range = atoms_config.get("date_range")
+    tickers = atoms_config.get("tickers")
+    index_col = atoms_config["index_col"]
+
+    if path.endswith(".parquet"):
+        if (tickers is not None) and os.path.isfile(path + ".index.csv"):
+            from helpers.columnar_store import read_tickers
+            atoms = read_tickers(path, list(tickers), columns=columns)
+        else:
+            filters = [("ticker", "in", list(tickers))] if tickers is not None else []
+            date_column = atoms_config.get("date_column", index_col)
+            if (date_range is not None) and (date_range[0] is not None):
+                filters.append((date_column, ">=", pd.to_datetime(date_range[0])))
+            if (date_range is not None) and (date_range[1] is not None):
+                filters.append((date_column, "<=", pd.to_datetime(date_range[1])))
+            atoms = pd.read_parquet(path, columns=columns, filters=filters if len(filters) > 0 else None)
+
+        if index_col is not None:
+            atoms = atoms.set_index(index_col)
+
+        return filter_atoms(atoms, atoms_config)
+
+    parse_dates = [column for column in atoms_config["parse_dates"] if (columns is None) or (column in columns)]
+
+    if (date_range is None) and (tickers is None):
+        return pd.read_csv(path, usecols=columns, parse_dates=parse_dates, index_col=index_col, low_memory=False)
+
+    chunks = pd.read_csv(path, usecols=columns, parse_dates=parse_dates, index_col=index_col, low_memory=False, chunksize=chunksize)
+    
+    return pd.concat([filter_atoms(chunk, atoms_config) for chunk in chunks])
+
+
+def get_atoms_cache_name(disk_name: str, atoms_config: dict, columns: list):
+    """
+    Name of the cached atoms. Atoms read with a selection of columns or rows are cached under a name including a hash of
+    the selection, so a changed selection is not loaded from an old cache.
+    """
+    selection = (columns, atoms_config.get("date_range"), atoms_config.get("tickers"))
+    if selection == (None, None, None):
+        return disk_name
+
+    return disk_name + "_" + hashlib.sha1(repr(selection).encode("utf-8")).hexdigest()[:10]
+
+
 def pandas_chaining_mp_engine(tasks, primary_atoms, atoms_configs, split_strategy, num_processes, cache_dir, \
-    sort_by=None, molecules_per_process=5, resume=False):
+    sort_by=None, molecules_per_process=5, resume=False, timings=None):
     """
     Multiprocessing engine that is able to process a chain of tasks. Usefull for more complex dataprocessing pipelines.
+    If $timings is a list, the seconds spent reading the atoms and on each task are appended to it as
+    {"stage": name, "seconds": seconds}.
     """
+    start_time = time.time()
+
+    # Columns of each atoms needed by the tasks, for atoms configs with "columns": "infer" (before tasks are skipped when resuming)
+    atoms_columns = {}
+    for disk_name, atoms_config in atoms_configs.items():
+        columns = atoms_config.get("columns")
+        atoms_columns[disk_name] = infer_atoms_columns(tasks, disk_name, atoms_config) if columns == "infer" else columns
+
     split_strategy_changed = False
     primary_molecules = None # Might resume from cache, or set from parsed atoms found in molecules_dict
     # You might want to resume at a later task, if that is the case set primary_molecules from the cache and skip/ foregoing tasks
@@ -491,7 +606,7 @@ def pandas_chaining_mp_engine(tasks, primary_atoms, atoms_configs, split_strateg
     molecules_dict = {} # { "AAPL": [df1, df2, ...], ...
 
     for disk_name, atoms_config in atoms_configs.items():
-        pickle_path = cache_dir + '/' + disk_name + '.pickle'
+        pickle_path = cache_dir + '/' + get_atoms_cache_name(disk_name, atoms_config, atoms_columns[disk_name]) + '.pickle'
 
         if os.path.isfile(pickle_path):
             print("Loading pickle: " + pickle_path)
@@ -507,7 +622,7 @@ def pandas_chaining_mp_engine(tasks, primary_atoms, atoms_configs, split_strateg
                     molecules_dict[molecules_dict_name] = split_df_into_molecules(atoms, new_first_task["split_strategy"], num_processes*molecules_per_process)
         else:
             print("Reading and parsing: ", atoms_config["csv_path"])
-            atoms = pd.read_csv(atoms_config["csv_path"], parse_dates=atoms_config["parse_dates"], index_col=atoms_config["index_col"], low_memory=False)
+            atoms = read_atoms(atoms_config, atoms_columns[disk_name])
             if atoms_config["sort_by"] is not None:
                 atoms = atoms.sort_values(by=atoms_config["sort_by"])
             molecules_dict[disk_name] = split_df_into_molecules(atoms, split_strategy, num_processes*molecules_per_process) # Split strategy here might have changed
@@ -525,10 +640,14 @@ def pandas_chaining_mp_engine(tasks, primary_atoms, atoms_configs, split_strateg
         primary_molecules = molecules_dict[primary_atoms]
     
 
+    if timings is not None:
+        timings.append({"stage": "Read atoms", "seconds": time.time() - start_time})
+
     # Loop over tasks and pass output from each task as input to the next.
     last_index = len(tasks) - 1
     start_time_tasks = time.time()
     for index, task in enumerate(tasks):
+        start_time_task = time.time()
         """ 
         NOTE: For each iteration of the loop primary_molecules and required parts of molecules_dict must
         be split correctly before starting.
@@ -592,6 +711,9 @@ def pandas_chaining_mp_engine(tasks, primary_atoms, atoms_configs, split_strateg
 
             molecules_dict[task["disk_name"]] = molecules_to_add_to_molecules_dict
 
+        if timings is not None:
+            timings.append({"stage": task["name"], "seconds": time.time() - start_time_task})
+
 
     print("TASKS COMPLETED SUCCESSFULLY")
 
@@ -608,7 +730,9 @@ def infer_split_strategy(molecule_dict: dict):
     Detect what split strategy was used to create $molecule_dict.
     """
     first_key: str = list(molecule_dict.keys())[0]
-    if first_key.capitalize() == first_key:
+    if (first_key == "all") and (len(molecule_dict) == 1):
+        return "none"
+    elif first_key.capitalize() == first_key:
         return "ticker"
     elif is_date(first_key):
         return "date"
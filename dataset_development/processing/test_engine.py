@@ -9,7 +9,7 @@ import time
 import pandas as pd
 
 
-from .engine import pandas_mp_engine, split_df_into_molecules
+from .engine import pandas_mp_engine, split_df_into_molecules, read_atoms, infer_atoms_columns, get_atoms_cache_name
 
 
 def heavy_task(process_length=1000, nr_processes=10000):
@@ -86,3 +86,31 @@ def test_split_df_into_molecules():
     assert len(dfs) == 3
 
 
+def test_infer_atoms_columns():
+    atoms_config = {"index_col": "date", "sort_by": ["ticker", "date"]}
+    tasks = [
+        {"columns": {"sep": ["close", "dividends"]}},
+        {"columns": {"sep": ["open", "close"], "sf1_art": ["datekey"]}},
+    ]
+
+    assert infer_atoms_columns(tasks, "sep", atoms_config) == ["ticker", "date", "close", "dividends", "open"]
+    assert infer_atoms_columns(tasks + [{"name": "undeclared"}], "sep", atoms_config) is None
+
+
+def test_read_atoms():
+    atoms_config = {
+        "csv_path": "../datasets/testing/sep.csv",
+        "parse_dates": ["date"],
+        "index_col": "date",
+        "sort_by": ["ticker", "date"],
+        "date_range": ("2000-01-01", "2001-12-31"),
+        "tickers": ["AAPL", "NTK"],
+    }
+    sep = pd.read_csv("../datasets/testing/sep.csv", parse_dates=["date"], index_col="date")
+    expected = sep.loc[(sep.index >= "2000-01-01") & (sep.index <= "2001-12-31") & sep["ticker"].isin(["AAPL", "NTK"]), ["ticker", "close"]]
+
+    atoms = read_atoms(atoms_config, columns=["ticker", "date", "close"], chunksize=100)
+
+    pd.testing.assert_frame_equal(atoms, expected)
+    assert get_atoms_cache_name("sep", atoms_config, ["ticker", "date", "close"]) != get_atoms_cache_name("sep", atoms_config, None)
+    assert get_atoms_cache_name("sep", {"index_col": "date"}, None) == "sep"
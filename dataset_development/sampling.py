@@ -1,10 +1,13 @@
 import pandas as pd
+import numpy as np
 import sys
+from datetime import datetime, timedelta
 from dateutil.relativedelta import *
 from os import listdir
 from os.path import isfile, join
 
 from helpers.helpers import print_exception_info
+from sep_features import get_monthly_ewmstd
 
 
 def extend_sep_for_sampling(sep, sf1_art, metadata):
@@ -81,8 +84,11 @@ def rebase_at_each_filing_sampling(observations, days_of_distance):
     reports for the current period or a new period shows up as a new datekey when iterating over the 
     observations. New datekeys is therefore allways grounds to rebase the sampling process.
 
+    The sampling itself is done by get_rebase_sample_positions on int64 day numbers. If observations contains
+    a ticker column, it may hold many tickers, as long as it is sorted by ticker and date.
+
     NOTE: This function assumes that all observations have a datekey. In other words: SEP dates before
-    the first datekey in SF1 has been removed. This function also assumes that indexes are reset.
+    the first datekey in SF1 has been removed. This function also assumes that observations has a date index.
     """
 
     # It could be that the dataframe is empty or that it is missing
@@ -92,81 +98,228 @@ def rebase_at_each_filing_sampling(observations, days_of_distance):
         return observations
 
     observations["datekey"] = pd.to_datetime(observations["datekey"])
-    sample_indexes = list()
 
-    # Variable initiation
-    first_date = observations.index[0]
-    base_date = None
-    desired_date = None
-    previous_date = None
-    last_sample_date = None
-    most_recent_filing = None
+    dates = to_day_numbers(observations.index.values)
+    datekeys = to_day_numbers(observations["datekey"].values)
+
+    segment_starts = None
+    if "ticker" in observations.columns:
+        tickers = observations["ticker"].values
+        segment_starts = np.flatnonzero(tickers[1:] != tickers[:-1]) + 1
+
+    sample_positions = get_rebase_sample_positions(dates, datekeys, days_of_distance, segment_starts)
+
+    samples = observations.iloc[sample_positions]
+
+    return samples
+
 
+def to_day_numbers(dates) -> np.ndarray:
     """
-    sample relative to cur_date and reset on every new datekey seen when iterating over the observations (sep rows).
+    Convert an array of datetimes into int64 day numbers (days since 1970-01-01). NaT becomes NAT_DAY.
     """
+    return np.asarray(dates, dtype="datetime64[ns]").astype("datetime64[D]").astype(np.int64)
 
-    for cur_date, row in observations.iterrows():
-        cur_datekey = row["datekey"]
-        # Initialize at the first iteration.
-        if cur_date == first_date:
-            base_date = cur_date
-            most_recent_filing = cur_datekey
-            sample_indexes.append(cur_date)
-            desired_date = base_date + relativedelta(months=1)
-            previous_date = cur_date
-            continue
+
+NAT_DAY = np.datetime64("NaT").astype(np.int64)
+EPOCH = datetime(1970, 1, 1)
+
+
+def add_one_month(day: int) -> int:
+    """
+    Add one month to a day number, with the same day-of-month clipping as relativedelta(months=+1).
+    """
+    return ((EPOCH + timedelta(days=int(day)) + relativedelta(months=+1)) - EPOCH).days
 
 
-        # We have to have sampled once for the current ticker before we get this far
-        if cur_datekey != most_recent_filing: 
-            # New filing!
+def get_rebase_sample_positions(dates: np.ndarray, datekeys: np.ndarray, days_of_distance: int, segment_starts=None) -> np.ndarray:
+    """
+    Returns the (sorted) row positions sampled by rebase_at_each_filing_sampling.
+
+    dates and datekeys are int64 day numbers (see to_day_numbers), dates must be increasing within each segment.
+    segment_starts are the positions where a new ticker starts (position 0 is implied). Each segment is sampled
+    independently.
+
+    Rather than visiting every row, the function jumps between the only rows where something can happen: 
+    the datekey change points (new filings) and the first row on or after the next desired date (found with searchsorted).
+    The number of iterations is therefore proportional to the number of samples, not the number of observations.
+    """
+    dates = np.asarray(dates, dtype=np.int64)
+    datekeys = np.asarray(datekeys, dtype=np.int64)
+
+    if segment_starts is None:
+        segment_starts = []
+    bounds = [0] + [int(start) for start in segment_starts if 0 < start < len(dates)] + [len(dates)]
+
+    sample_positions = []
+    for i in range(1, len(bounds)):
+        offset = bounds[i-1]
+        segment_positions = _rebase_segment(dates[offset:bounds[i]], datekeys[offset:bounds[i]], days_of_distance)
+        sample_positions.append(segment_positions + offset)
+
+    if len(sample_positions) == 0:
+        return np.array([], dtype=np.int64)
+
+    return np.concatenate(sample_positions)
+
+
+def _rebase_segment(dates: np.ndarray, datekeys: np.ndarray, days_of_distance: int) -> np.ndarray:
+    """
+    Sample one ticker. Mirrors the row by row rules of the original implementation:
+    - The first observation is sampled and the sampling is based of its date.
+    - A new datekey (NaT never equals anything) is sampled immediately and rebases the sampling. The preceding
+      sample is dropped if it is less than $days_of_distance days old.
+    - Otherwise the first observation on or after the desired date is sampled, or the observation before it
+      if that one is closer (ties go to the preceding observation). The desired date is then moved one month.
+    
+    The "preceding observation" is the last observation that was not a new filing, like in the original loop.
+    """
+    n = len(dates)
+    if n == 0:
+        return np.array([], dtype=np.int64)
+
+    new_filing = (datekeys[1:] != datekeys[:-1]) | (datekeys[1:] == NAT_DAY) | (datekeys[:-1] == NAT_DAY)
+    filing_positions = np.flatnonzero(new_filing) + 1
+
+    sample_indexes = [0]
+    desired_date = add_one_month(dates[0])
+    previous = 0 # Position of the previous observation
+    cur = 0 # Position of the last observation processed
+    next_filing = 0 # Index into filing_positions
+
+    while True:
+        filing_position = filing_positions[next_filing] if (next_filing < len(filing_positions)) else n
+        desired_position = max(int(np.searchsorted(dates, desired_date, side="left")), cur + 1)
+
+        if min(filing_position, desired_position) >= n:
+            break
+
+        if filing_position <= desired_position:
+            # New filing! Observations skipped over were neither filings nor samples.
+            if filing_position - 1 > cur:
+                previous = filing_position - 1
             
             # I need to drop the last sample if the overlap is too great. 
-            if len(sample_indexes) > 0:
-                last_sample_date = sample_indexes[-1]
-                if last_sample_date > (cur_date - relativedelta(days=days_of_distance)):
-                    # It is less than 20 days since last sample, so drop the old sample.
-                    sample_indexes.pop(-1)
-
-            # I want so sample immediately and base future samples of this sample
-            sample_indexes.append(cur_date)
-            base_date = cur_date 
-            desired_date = base_date + relativedelta(months=+1)
-            most_recent_filing = cur_datekey
-            continue
+            if dates[sample_indexes[-1]] > (dates[filing_position] - days_of_distance):
+                sample_indexes.pop(-1)
 
-        if cur_date == desired_date: # We might not have data for the exact desired date, it could be a saturday...
-            sample_indexes.append(cur_date)
-            desired_date = desired_date + relativedelta(months=+1)
-        elif cur_date > desired_date:
-            """
-            # It could be that SEP data is available from a data much later than SF1. In this case cur_date does not get to be
-            # greater than desired_date before this code in this block runs. Therefore we need to take into account the case
-            # where previous_date is None. When previous_data is None, we want only to increment desired_date and not sample.
-            # We increment desired date
-            if previous_date is None: # This should only trigger the very first iteration if cur_date is greater than desired_date from the beginning.
-                sample_indexes.append(cur_date)
-                previous_date = cur_date
-                desired_date = cur_date + relativedelta(months=+1) # Shifts the base_date to the first sep date
-                continue
-            """
+            sample_indexes.append(filing_position)
+            desired_date = add_one_month(dates[filing_position])
+            cur = filing_position
+            next_filing += 1
+            continue
 
+        if desired_position - 1 > cur:
+            previous = desired_position - 1
+        
+        if dates[desired_position] == desired_date:
+            sample_indexes.append(desired_position)
+        else:
             # We need to deside wether to sample the previous date or the current date.
-            distance_preceding = abs((desired_date - previous_date).total_seconds())
-            distance_cur = abs((desired_date - cur_date).total_seconds())
-            
+            distance_preceding = abs(desired_date - dates[previous])
+            distance_cur = abs(desired_date - dates[desired_position])
             if distance_preceding <= distance_cur:
-                sample_indexes.append(previous_date)
+                sample_indexes.append(previous)
             else:
-                sample_indexes.append(cur_date)
-                
-            desired_date = desired_date + relativedelta(months=+1)
+                sample_indexes.append(desired_position)
+
+        desired_date = add_one_month(desired_date)
+        previous = desired_position
+        cur = desired_position
 
-        previous_date = cur_date
+    # The same observation may have been sampled more than once, the set of sampled observations is what counts.
+    return np.unique(np.array(sample_indexes, dtype=np.int64))
 
 
-    drop_indexes = list(set(observations.index).difference(set(sample_indexes)))
-    samples = observations.drop(drop_indexes)
+def cusum_filter_sampling(observations, threshold_multiplier=1.0):
+    """
+    Event based sampling with the symmetric CUSUM filter (Lopez de Prado, Advances in Financial Machine Learning, 2.5.2.1).
+    Positive and negative runs of the dividend adjusted log returns (from adj_close) are accumulated, and an observation
+    is sampled when either run exceeds the threshold, which resets both. The threshold at each observation is
+    $threshold_multiplier times ewmstd_2y_monthly (see sep_features.py), so no samples are made before there are two
+    months of returns. Compared to rebase_at_each_filing_sampling this gives fewer, less overlapping samples at the
+    times something happens to the price.
+
+    Like rebase_at_each_filing_sampling, observations may hold many tickers if it is sorted by ticker and date, and
+    sampling starts at the first datekey of each ticker (observations before it have no SF1 data to calculate features from).
+
+    NOTE: observations needs adj_close, so this must run after dividend_adjusting_prices_backwards, and datekey (see
+    extend_sep_for_sampling).
+    """
+    observations_empty = True if (len(observations) == 0) else False
+    if observations_empty == True:
+        print("got empty dataframe 'observations' in cusum_filter_sampling. Don't know why.")
+        return observations
+
+    bounds = [0, len(observations)]
+    if "ticker" in observations.columns:
+        tickers = observations["ticker"].values
+        bounds = [0] + list(np.flatnonzero(tickers[1:] != tickers[:-1]) + 1) + [len(observations)]
+
+    sample_positions = []
+    for i in range(1, len(bounds)):
+        adj_close = observations["adj_close"].iloc[bounds[i-1]:bounds[i]].astype(np.float64)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_prices = np.log(adj_close.fillna(method="ffill").values)
+        thresholds = threshold_multiplier * get_monthly_ewmstd(adj_close, adj_close.index)
+
+        # The runs start at the first filing, prices before it only go into the thresholds
+        has_datekey = observations["datekey"].iloc[bounds[i-1]:bounds[i]].notnull().values
+        log_prices[:np.argmax(has_datekey) if has_datekey.any() else len(log_prices)] = np.nan
+
+        sample_positions.append(get_cusum_event_positions(log_prices, thresholds) + bounds[i-1])
+
+    samples = observations.iloc[np.concatenate(sample_positions)]
 
     return samples
+
+
+def get_cusum_event_positions(values: np.ndarray, thresholds: np.ndarray, window: int=64) -> np.ndarray:
+    """
+    Positions of the events of the symmetric CUSUM filter on the increments of $values (e.g. log prices), with the
+    threshold $thresholds at each position (nan thresholds never trigger an event).
+
+    Since the last event (or the first non nan value) at position p, the positive run at t is values[t] - min(values[p:t+1])
+    and the negative run is values[t] - max(values[p:t+1]), the same as the usual recursion
+    s_t = max(0, s_t-1 + values[t] - values[t-1]). The running minimum and maximum are calculated with numpy over windows of
+    $window positions, doubled while there are no events, so each position is visited about once and the number of python
+    iterations grows with the number of events, not the number of positions.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    n = len(values)
+
+    valid_positions = np.flatnonzero(~np.isnan(values))
+    if len(valid_positions) == 0:
+        return np.array([], dtype=np.int64)
+
+    event_positions = []
+    last_event = valid_positions[0]
+    low = high = values[last_event]
+    start = last_event + 1
+    size = window
+
+    while start < n:
+        stop = min(n, start + size)
+        window_values = values[start:stop]
+        running_min = np.fmin(np.fmin.accumulate(window_values), low)
+        running_max = np.fmax(np.fmax.accumulate(window_values), high)
+        window_thresholds = thresholds[start:stop]
+
+        with np.errstate(invalid="ignore"):
+            events = np.flatnonzero(((window_values - running_min) > window_thresholds) | ((window_values - running_max) < -window_thresholds))
+
+        if len(events) == 0:
+            low, high = running_min[-1], running_max[-1]
+            start = stop
+            size *= 2
+            continue
+
+        last_event = start + events[0]
+        event_positions.append(last_event)
+        low = high = values[last_event]
+        start = last_event + 1
+        size = window
+
+    return np.array(event_positions, dtype=np.int64)
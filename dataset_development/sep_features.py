@@ -1,16 +1,43 @@
 import pandas as pd
+import numpy as np
 import math
 from dateutil.relativedelta import *
 from datetime import datetime
 
+from helpers.feature_registry import FeatureRegistry
+from helpers.helpers import get_values_as_of
+from helpers.panel_store import PanelStore, cross_sectional_mean
 
-def add_sep_features(sep_sampled, sep, sf1_art):
+
+"""
+The features of add_sep_features are registered in sep_feature_registry, one function per feature, so that each
+feature can be cached and recalculated on its own (see helpers/feature_registry.py).
+
+Data given to the feature functions (all for one ticker):
+    sep:        daily SEP data, with the basic and market wide features added in sep_preparation.py
+    sf1_rows:   the most recent SF1 (ART) row for each sample, by the sample's datekey
+
+Calendar day lookbacks ("the value 30 days ago") are looked up on the trading days of sep with get_values_as_of, which
+gives the same values as reindexing sep to every calendar day and forward filling, without materializing that frame.
+The features calculated from them are equal to those of the calendar day frame within floating point tolerance (about
+1e-15), as some windows are aggregated in a different order.
+"""
+sep_feature_registry = FeatureRegistry()
+
+register = sep_feature_registry.register
+helper = sep_feature_registry.helper # Functions used by the feature functions, part of the cache key of all features
+
+sep_feature_registry.add_helpers(get_values_as_of)
+
+
+def add_sep_features(sep_sampled, sep, sf1_art, feature_cache_dir=None):
     """
     This calculates price, volume and dividend related features for the project's dataset. This function operates on
     a single company at a time.
 
     sep_sampled and sep contains data for one ticker
     sep contains basic and market wide features added in sep_preparation.py
+    Features are cached per feature in $feature_cache_dir if given, so only changed features are recalculated.
     """
 
     sep_empty = True if (len(sep) == 0) else False
@@ -22,217 +49,377 @@ def add_sep_features(sep_sampled, sep, sf1_art):
 
     pd.options.mode.chained_assignment = None  # default='warn'
 
-    date_index = pd.date_range(sep.index.min(), sep.index.max())
-    sep_filled = sep.reindex(date_index)
-    
-    sep_filled = sep_filled.fillna(method="ffill")
+    data = {
+        "sep": sep,
+        "sf1_art": sf1_art,
+        "sf1_rows": get_sf1_rows(sep_sampled, sf1_art),
+        "windows": {}, # Memoized windows of sep, shared by the features using the same windows
+    }
 
+    if (len(sf1_art) == 0) or (len(sep_sampled) == 0):
+        if len(sep_sampled) > 0:
+            print("No sf1_art data for ticker {} in add_sep_features".format(sep_sampled.iloc[0]["ticker"]))
+        names = daily_features
+    else:
+        names = sample_features + daily_features
 
-    sep_filled_1m_ahead = sep_filled.shift(periods=-30)
-    sep_filled_2m_ahead = sep_filled.shift(periods=-60)
-    sep_filled_3m_ahead = sep_filled.shift(periods=-90)
-    
-    sep_filled_1m_ago = sep_filled.shift(periods=30)
-    sep_filled_6m_ago = sep_filled.shift(periods=182)
-    sep_filled_12m_ago = sep_filled.shift(periods=365)
-    sep_filled_24m_ago = sep_filled.shift(periods=2*365)
-    
+    # Features already calculated for every row of sep by add_sep_panel_features are taken from sep
+    panel_names = [name for name in sep_panel_features if name in sep.columns]
+    for name in panel_names:
+        sep_sampled[name] = sep[name].loc[sep_sampled.index].values
 
-    """ CALCULATE FEATURES IN NEED OF SEP_FILLED """
-    # Labels
-    sep_filled["return_1m"] = (sep_filled_1m_ahead["adj_close"] / sep_filled["adj_close"]) - 1
-    sep_filled["return_2m"] = (sep_filled_2m_ahead["adj_close"] / sep_filled["adj_close"]) - 1
-    sep_filled["return_3m"] = (sep_filled_3m_ahead["adj_close"] / sep_filled["adj_close"]) - 1
-    
+    names = [name for name in names if name not in panel_names]
+    features = sep_feature_registry.compute(sep_sampled, data, names=names, cache_dir=feature_cache_dir)
 
-    # Momentum features
-    sep_filled["mom1m"] = (sep_filled["adj_close"] / sep_filled_1m_ago["adj_close"]) - 1
-    sep_filled["mom6m"] = (sep_filled_1m_ago["adj_close"] / sep_filled_6m_ago["adj_close"]) - 1 # 5-month cumulative returns ending one month before month end.
-    sep_filled["mom12m"] = (sep_filled_1m_ago["adj_close"] / sep_filled_12m_ago["adj_close"]) - 1 # 11-month cumulative returns ending one month before month end.
-    sep_filled["mom24m"] = (sep_filled["adj_close"] / sep_filled_24m_ago["adj_close"]) - 1 # MY OWN ...
-    
-    # In preparation for chmom --> Cumulative returns from months t-6 to t-1 (mom6m) minus months t-12 to t-7
-    sep_filled_7m_ago = sep_filled.shift(periods=182+30)
-    sep_filled["mom12m_to_7m"] = (sep_filled_7m_ago["adj_close"] / sep_filled_12m_ago["adj_close"]) - 1
-    
-    # Change in 6 month momentum (chmom): ((SEP[adj_close]u-1 / SEP[adj_close]u-6) - 1) - ((SEP[adj_close]u-7 / SEP[adj_close]u-12) -1) --> Cumulative returns from months t-6 to t-1 minus months t-12 to t-7
-    sep_filled["chmom"] = sep_filled["mom6m"] - sep_filled["mom12m_to_7m"]
+    for name in names:
+        sep_sampled[name] = features[name].values
 
+    return sep_sampled
 
-    # EWMSTD for use in labeling
-    sampled_return = sep_filled.resample("M").apply(lambda arr: arr[-1])[["mom1m"]]
-    ewmstd = {"ewmstd": sampled_return["mom1m"].ewm(span=24).std()}
-    ewmstd = pd.DataFrame(data=ewmstd, index=sampled_return.index)
-    
+
+@helper
+def get_sf1_rows(sep_sampled: pd.DataFrame, sf1_art: pd.DataFrame) -> pd.DataFrame:
+    """
+    The most recent SF1 row (last row with the same datekey) for each sample, all nan if there is none.
+    """
+    sf1_art = sf1_art.drop_duplicates(subset="datekey", keep="last").set_index("datekey")
+
+    return sf1_art.reindex(sep_sampled["datekey"].values) if "datekey" in sep_sampled.columns else sf1_art.iloc[0:0]
+
+
+@helper
+def get_first_date(samples: pd.DataFrame):
+    # Features with a lookback are only calculated for samples at least the lookback after the first sample
+    return samples.index[0]
+
+
+@helper
+def get_window(data: dict, frame_name: str, date, lookback, end_lookback=None) -> pd.DataFrame:
+    """
+    Rows of data[$frame_name] from $lookback before $date to $date (both inclusive), or if $end_lookback is given,
+    to before $end_lookback before $date.
+    """
+    key = (frame_name, date, lookback, end_lookback)
+
+    if key not in data["windows"]:
+        frame = data[frame_name]
+        if end_lookback is None:
+            data["windows"][key] = frame.loc[(frame.index <= date) & (frame.index >= date - lookback)]
+        else:
+            data["windows"][key] = frame.loc[(frame.index < date - end_lookback) & (frame.index >= date - lookback)]
+
+    return data["windows"][key]
+
+
+@helper
+def get_marketcap(samples: pd.DataFrame, data: dict) -> np.ndarray:
+    sf1_rows = data["sf1_rows"]
+
+    return sf1_rows["sharesbas"].values * sf1_rows["sharefactor"].values * samples["close"].values
+
+
+@helper
+def iter_samples(samples: pd.DataFrame, lookback):
+    """
+    Positions and dates of the samples at least $lookback after the first sample.
+    """
+    first_date = get_first_date(samples)
+
+    for i, date in enumerate(samples.index):
+        if date >= (first_date + lookback):
+            yield i, date
+
+
+""" FEATURES FOR EACH SAMPLE """
+
+@register("timeout", inputs={"sep": []})
+def get_timeout(samples, data, features):
+    # Add 1m timeout to sep_sampled
+    sep = data["sep"]
     indexes_1m_ahead = sep.index.searchsorted(sep.index + pd.Timedelta(days=30))
     indexes_1m_ahead = indexes_1m_ahead[indexes_1m_ahead>0] - 1
 
     dates_1m_ahead = pd.Series(sep.index[indexes_1m_ahead], index=sep.index)
 
-    def custom_resample(array_like):
-        return array_like[0]
+    return dates_1m_ahead.loc[samples.index].values
 
-    # Flags to enable printing of the first good results from the below loop. Used during testing and debugging.
-    print_first_good_result_1 = False
-    print_first_good_result_2 = False
-    print_first_good_result_3 = True
 
-    first_date = None
+@register("mve", inputs={"samples": ["datekey", "close"], "sf1_art": ["datekey", "sharesbas", "sharefactor"]})
+def get_mve(samples, data, features):
+    # Size: (mve or mvel1): ln(SEP[close]m-1 * SF1[sharefactor]t-1 * SF1[sharesbas]t-1)
+    marketcap = get_marketcap(samples, data)
 
-    sf1_art_empty = True if (len(sf1_art) == 0) else False
+    return np.array([math.log(value) if value != 0 else np.nan for value in marketcap])
 
-    """ CALCULATE FEATURES ONLY FOR SAMPLES """
-    for date, row in sep_sampled.iterrows():
-        if first_date is None:
-            first_date = date
-        
-        if sf1_art_empty == True:
-            print("No sf1_art data for ticker {} in add_sep_features".format(row["ticker"]))
-            break
-
-        sf1_row = sf1_art.loc[sf1_art.datekey == row["datekey"]].iloc[-1]
-        sharesbas = sf1_row["sharesbas"]
-        sharefactor = sf1_row["sharefactor"]
-        price = row["close"]
-        marketcap = sharesbas*sharefactor*price
-
-        date_2y_ago = date - relativedelta(years=2)
-        date_1y_ago = date - relativedelta(years=1)
-        date_3m_ago = date - relativedelta(months=3)
-        date_2m_ago = date - relativedelta(months=2)
-        date_1m_ago = date - relativedelta(months=1)
-        
-        # Using sep_filled
-        sep_past_2years = sep_filled.loc[(sep_filled.index <= date) & (sep_filled.index >= date_2y_ago)]
-        
-        # Using sep / sep_prepared
-        sep_past_year = sep.loc[(sep.index <= date) & (sep.index >= date_1y_ago)]
-        sep_past_2months = sep.loc[(sep.index <= date) & (sep.index >= date_2m_ago)]
-        sep_past_1month = sep.loc[(sep.index <= date) & (sep.index >= date_1m_ago)]
 
-        
-        # Add ewmstd to sep_sampled (get most recent value from ewmstd)
-        ewmstd_selected = ewmstd.loc[ewmstd.index < date]
-        if not ewmstd_selected.empty:
-            # print(ewmstd_selected.iloc[-1]["ewmstd"])
-            sep_sampled.at[date, "ewmstd_2y_monthly"] = ewmstd_selected.iloc[-1]["ewmstd"]
-            # break
-            # sep_sampled.at[date, "ewmstd_2y_monthly"] = ewmstd_selected.iloc[-1]
-
-        # Add 1m timeout to sep_sampled
-        sep_sampled.at[date, "timeout"] = dates_1m_ahead.loc[date]
-
-
-        # Size: (mve or mvel1): ln(SEP[close]m-1 * SF1[sharefactor]t-1 * SF1[sharesbas]t-1)
-        if marketcap != 0:
-            sep_sampled.at[date, "mve"] = math.log(marketcap)
-
-        # Take Weekly Samples every monday
-        if date >= (first_date + relativedelta(years=2)):
-            # NOTE: sep_past_2years is forward-filled!
-            sep_past_2years_reduced = sep_past_2years[["mom1w", "mom1w_ewa_market"]]
-            weekly_samples = sep_past_2years_reduced.resample("W-MON").apply(custom_resample)
-            weekly_samples = weekly_samples.loc[weekly_samples.index <= date]
-        
-            # Beta (beta): Cov(Ri, Rm)/Var(Rm), where Ri, Rm is weekly measurements and Rm is equial weighted market returns. 52 weeks to 3 years of data is used.        
-            covariance = weekly_samples.cov().iloc[0][1]
-            variance_market = weekly_samples["mom1w_ewa_market"].var()
-            if variance_market != 0:
-                beta = covariance / variance_market
-                sep_sampled.at[date, "beta"] = beta
-            
-            # Beta Squared (betasq): beta^2
-            sep_sampled.at[date, "betasq"] = beta**2
-
-            # Idiosyncratinc return vol (idiovol): std(SEP[weekly_return], Equal weighted weekly market returns) using minimum 1 year, maximum 3 years of data
-            # Standard deviation of residuals of weekly returns on weekly equal weighted market returns for 3 years prior to month end
-            weekly_samples["diff"] = weekly_samples["mom1w"] - weekly_samples["mom1w_ewa_market"]
-            std_stock_less_market_return = weekly_samples["diff"].std()
-            sep_sampled.at[date, "idiovol"] = std_stock_less_market_return
+# Exponentially weighted over all history with a 24 month span, months older than 5 years weigh less than 1%
+@register("ewmstd_2y_monthly", inputs={"sep": ["adj_close"]}, lookback=relativedelta(years=5))
+def get_ewmstd_2y_monthly(samples, data, features):
+    # EWMSTD for use in labeling (and CUSUM sampling thresholds), the most recent monthly value before each sample
+    return get_monthly_ewmstd(data["sep"]["adj_close"], samples.index)
 
-        
-        if date >= (first_date + relativedelta(years=1)):
-            # NOTE: sep_past_year is not forward-filled
-
-            # NOTE: NOT WORKING, DROPPING DUE TO LACK OF TIME IN THE FINAL DATASET
-            # Illiquidity (ill): avg(SEP[close]-SEP[open] / ( (SEP[close]+SEP[open]) / 2 )*SEP[volume]) for the past year
-            # Average of daily (absolute return / dollar volume).
-            illiquidity_df = pd.DataFrame(index=sep_past_year.index)
-            illiquidity_df["return"] = (sep_past_year["close"] / sep_past_year["open"] - 1) # daily return
-            illiquidity_df["return"] = illiquidity_df["return"].abs() # Absolute value of daily returns
-            illiquidity_df["dollar_vol"] = (((sep_past_year["open"] + sep_past_year["close"]) / 2)*sep_past_year["volume"]) # Avg stock price each day * volume of each day
-            illiquidity_df["return_over_dollar_vol"] = illiquidity_df["return"] / illiquidity_df["dollar_vol"] # daily return / daily volume
-            illiquidity = illiquidity_df["return_over_dollar_vol"].mean()
-            sep_sampled.at[date, "ill"] = illiquidity
-            
-            # Dividend to price (dy): (sum(SEP[dividend]) the past year at t-1) / SF1[marketcap]t-1
-            if marketcap != 0:
-                sep_sampled.at[date, "dy"] = sep_past_year["dividends"].sum() / marketcap
-
-        if date >= (first_date + relativedelta(months=3)):
-            # ONLY DO FOR SAMPLES, NEED TO RUN SEP_PREPARATION
-            # Share turnover (turn): avg(SEP[volume)m-1, SEP[volume]m-2, SEP[volume]m-3) / SF1[sharesbas]t-1
-            # Average monthly trading volume for most recent 3 months scaled by number of shares outstanding in current month.
-            sep_2m_ago_to_1m_ago = sep.loc[(sep.index < date_1m_ago) & (sep.index >= date_2m_ago)]
-            sep_3m_ago_to_2m_ago = sep.loc[(sep.index < date_2m_ago) & (sep.index >= date_3m_ago)]
-
-            volume_past_1m = sep_past_1month["volume"].sum()
-            volume_2m_ago_to_1m_ago = sep_2m_ago_to_1m_ago["volume"].sum()
-            volume_3m_ago_to_2m_ago = sep_3m_ago_to_2m_ago["volume"].sum()
-            avg_monthly_volume = (volume_past_1m + volume_2m_ago_to_1m_ago + volume_3m_ago_to_2m_ago) / 3
-            if sharesbas != 0:
-                turn = avg_monthly_volume / sharesbas
-                sep_sampled.at[date, "turn"] = turn
-
-
-        if date >= (first_date + relativedelta(months=2)):
-            # Dollar trading volume (dolvol): ln(sum(SEP[close]*SEP[volume]) for all days the past two months)
-            sum_close_volume = (sep_past_2months["close"]*sep_past_2months["volume"]).sum()
-            if sum_close_volume != 0:
-                dolvol = math.log(sum_close_volume)
-                sep_sampled.at[date, "dolvol"] = dolvol
-                
-    
-        if date >= (first_date + relativedelta(months=1)):
-            sep_past_1month_daily_returns = (sep_past_1month["close"]/sep_past_1month["open"]) - 1
-
-            # Maximum daily return (maxret): max(SEP[open]d - SEP[close]d) last 1 month
-            sep_sampled.at[date, "maxret"] = sep_past_1month_daily_returns.max()
-
-            # Return volatility (retvol): std(SEP[open]d/sep[close]d - 1) the last 1 month
-            sep_sampled.at[date, "retvol"] = sep_past_1month_daily_returns.std()
-
-            # Volatility of liquidity (dollar trading volume) (sdt_dolvol): 
-            # std((SEP[open]d - SEP[close]d)/2 * SEP[volume]d) using 1 month of data * sqrt(22)
-            sep_sampled.at[date, "std_dolvol"] = (((sep_past_1month["close"]+sep_past_1month["open"]) / 2) * \
-                sep_past_1month["volume"]).std() * math.sqrt(22)
-
-
-            # Volatility of liquidity (share turnover) (std_turn): std([daily_turnover]d) using 1 month of data * sqrt(22)
-            # share turnover = shares traded over the period / avg number of outstanding shares
-            sep_sampled.at[date, "std_turn"] = (sep_past_1month["volume"] / sep_past_1month["sharesbas"]).std() * math.sqrt(22)
-
-            # Zero trading days (zerotrade): count(SEP[volume]d == 0) for 1 month of data / [monthly_turnover]m-1
-            # Turnover weighted number of zero trading days for most recent 1 month.
-            num_zero_trading_days_the_past_month = len(sep_past_1month.loc[sep_past_1month["volume"] == 0])
-            total_volume_past_month = sep_past_1month["volume"].sum()
-            avg_number_of_shares_outstanding = sep_past_1month["sharesbas"].mean()
-            monthly_turnover = total_volume_past_month / avg_number_of_shares_outstanding # avg_number_of_shares_outstanding may be zero...
-            deflator = 11000/12 # Liu selected deflator of 11000 for 12-month zerotrade in 2006, might not be optimal for todays market.
-            number_of_trading_days_past_month = len(sep_past_1month)
-            if (number_of_trading_days_past_month != 0) and (monthly_turnover != 0):
-                sep_sampled.at[date, "zerotrade"] = (num_zero_trading_days_the_past_month + (1/monthly_turnover)/deflator) * 21/number_of_trading_days_past_month
-            
-    # Downsample and move values over to sep_sampled (which is what gets returned in the end)
-    sep_filled = sep_filled.loc[sep_sampled.index]
-    # Remember to copy over any features added in sep_industry_features.py
-    sep_sampled[["return_1m", "return_2m", "return_3m", "mom1m", "mom6m", "mom12m", "mom24m", "chmom", "indmom"]] = \
-         sep_filled[["return_1m", "return_2m", "return_3m", "mom1m", "mom6m", "mom12m", "mom24m", "chmom", "indmom"]]
 
+@helper
+def get_monthly_ewmstd(adj_close: pd.Series, dates) -> np.ndarray:
+    """
+    EWMSTD (span of 24 months) of the 1 month returns at each month end of $adj_close (one ticker, at its last date in the
+    last month), the most recent monthly value before each of $dates.
+    """
+    month_ends = pd.period_range(adj_close.index.min(), adj_close.index.max(), freq="M").to_timestamp(how="end").normalize()
+    month_end_dates = np.minimum(month_ends.values, adj_close.index.max().to_datetime64())
 
-    return sep_sampled
+    sampled_return = pd.Series(get_values_as_of(adj_close, month_end_dates, 0) / get_values_as_of(adj_close, month_end_dates, 30) - 1, \
+        index=month_ends)
+    ewmstd = sampled_return.ewm(span=24).std()
+
+    positions = ewmstd.index.searchsorted(dates, side="left") - 1
+
+    return np.where(positions >= 0, ewmstd.values[np.maximum(positions, 0)], np.nan)
+
+
+@register("maxret", inputs={"sep": ["open", "close"]}, lookback=relativedelta(months=1))
+def get_maxret(samples, data, features):
+    values = np.full(len(samples), np.nan)
+    for i, date in iter_samples(samples, relativedelta(months=1)):
+        sep_past_1month = get_window(data, "sep", date, relativedelta(months=1))
+        sep_past_1month_daily_returns = (sep_past_1month["close"]/sep_past_1month["open"]) - 1
+        values[i] = sep_past_1month_daily_returns.max()
+
+    return values
+
+
+@register("retvol", inputs={"sep": ["open", "close"]}, lookback=relativedelta(months=1))
+def get_retvol(samples, data, features):
+    values = np.full(len(samples), np.nan)
+    for i, date in iter_samples(samples, relativedelta(months=1)):
+        sep_past_1month = get_window(data, "sep", date, relativedelta(months=1))
+        sep_past_1month_daily_returns = (sep_past_1month["close"]/sep_past_1month["open"]) - 1
+        values[i] = sep_past_1month_daily_returns.std()
+
+    return values
+
+
+@register("std_dolvol", inputs={"sep": ["open", "close", "volume"]}, lookback=relativedelta(months=1))
+def get_std_dolvol(samples, data, features):
+    values = np.full(len(samples), np.nan)
+    for i, date in iter_samples(samples, relativedelta(months=1)):
+        sep_past_1month = get_window(data, "sep", date, relativedelta(months=1))
+        values[i] = (((sep_past_1month["close"]+sep_past_1month["open"]) / 2) * sep_past_1month["volume"]).std() * math.sqrt(22)
+
+    return values
+
+
+@register("std_turn", inputs={"sep": ["volume", "sharesbas"]}, lookback=relativedelta(months=1))
+def get_std_turn(samples, data, features):
+    values = np.full(len(samples), np.nan)
+    for i, date in iter_samples(samples, relativedelta(months=1)):
+        sep_past_1month = get_window(data, "sep", date, relativedelta(months=1))
+        values[i] = (sep_past_1month["volume"] / sep_past_1month["sharesbas"]).std() * math.sqrt(22)
+
+    return values
+
+
+@register("zerotrade", inputs={"sep": ["volume", "sharesbas"]}, lookback=relativedelta(months=1))
+def get_zerotrade(samples, data, features):
+    # Number of zero trading days the past month, adjusted for turnover (Liu 2006)
+    values = np.full(len(samples), np.nan)
+    for i, date in iter_samples(samples, relativedelta(months=1)):
+        sep_past_1month = get_window(data, "sep", date, relativedelta(months=1))
+
+        num_zero_trading_days_the_past_month = len(sep_past_1month.loc[sep_past_1month["volume"] == 0])
+        total_volume_past_month = sep_past_1month["volume"].sum()
+        avg_number_of_shares_outstanding = sep_past_1month["sharesbas"].mean()
+        monthly_turnover = total_volume_past_month / avg_number_of_shares_outstanding # avg_number_of_shares_outstanding may be zero...
+        deflator = 11000/12 # Liu selected deflator of 11000 for 12-month zerotrade in 2006, might not be optimal for todays market.
+        number_of_trading_days_past_month = len(sep_past_1month)
+
+        if (number_of_trading_days_past_month != 0) and (monthly_turnover != 0):
+            values[i] = (num_zero_trading_days_the_past_month + (1/monthly_turnover)/deflator) * 21/number_of_trading_days_past_month
+
+    return values
+
+
+@register("dolvol", inputs={"sep": ["close", "volume"]}, lookback=relativedelta(months=2))
+def get_dolvol(samples, data, features):
+    # Natural log of trading volume times price per share, summed over the past 2 months
+    values = np.full(len(samples), np.nan)
+    for i, date in iter_samples(samples, relativedelta(months=2)):
+        sep_past_2months = get_window(data, "sep", date, relativedelta(months=2))
+        sum_close_volume = (sep_past_2months["close"]*sep_past_2months["volume"]).sum()
+        if sum_close_volume != 0:
+            values[i] = math.log(sum_close_volume)
+
+    return values
 
 
+@register("turn", inputs={"samples": ["datekey"], "sep": ["volume"], "sf1_art": ["datekey", "sharesbas"]}, lookback=relativedelta(months=3))
+def get_turn(samples, data, features):
+    # Average monthly trading volume for most recent 3 months scaled by number of shares outstanding in current month.
+    sharesbas = data["sf1_rows"]["sharesbas"].values
+    values = np.full(len(samples), np.nan)
+    for i, date in iter_samples(samples, relativedelta(months=3)):
+        volume_past_1m = get_window(data, "sep", date, relativedelta(months=1))["volume"].sum()
+        volume_2m_ago_to_1m_ago = get_window(data, "sep", date, relativedelta(months=2), relativedelta(months=1))["volume"].sum()
+        volume_3m_ago_to_2m_ago = get_window(data, "sep", date, relativedelta(months=3), relativedelta(months=2))["volume"].sum()
+        avg_monthly_volume = (volume_past_1m + volume_2m_ago_to_1m_ago + volume_3m_ago_to_2m_ago) / 3
+
+        if sharesbas[i] != 0:
+            values[i] = avg_monthly_volume / sharesbas[i]
+
+    return values
+
+
+@register("ill", inputs={"sep": ["open", "close", "volume"]}, lookback=relativedelta(years=1))
+def get_ill(samples, data, features):
+    # Illiquidity: average of daily (absolute return / dollar volume) over the past year
+    values = np.full(len(samples), np.nan)
+    for i, date in iter_samples(samples, relativedelta(years=1)):
+        sep_past_year = get_window(data, "sep", date, relativedelta(years=1))
+
+        illiquidity_df = pd.DataFrame(index=sep_past_year.index)
+        illiquidity_df["return"] = (sep_past_year["close"] / sep_past_year["open"] - 1) # daily return
+        illiquidity_df["return"] = illiquidity_df["return"].abs() # Absolute value of daily returns
+        illiquidity_df["dollar_vol"] = (((sep_past_year["open"] + sep_past_year["close"]) / 2)*sep_past_year["volume"]) # Avg stock price each day * volume of each day
+        illiquidity_df["return_over_dollar_vol"] = illiquidity_df["return"] / illiquidity_df["dollar_vol"] # daily return / daily volume
+        values[i] = illiquidity_df["return_over_dollar_vol"].mean()
+
+    return values
+
+
+@register("dy", inputs={"samples": ["datekey", "close"], "sep": ["dividends"], "sf1_art": ["datekey", "sharesbas", "sharefactor"]}, \
+    lookback=relativedelta(years=1))
+def get_dy(samples, data, features):
+    # Dividend yield: dividends paid over the past year divided by market capitalization
+    marketcap = get_marketcap(samples, data)
+    values = np.full(len(samples), np.nan)
+    for i, date in iter_samples(samples, relativedelta(years=1)):
+        if marketcap[i] != 0:
+            values[i] = get_window(data, "sep", date, relativedelta(years=1))["dividends"].sum() / marketcap[i]
+
+    return values
+
+
+@helper
+def get_weekly_samples(data: dict, date) -> pd.DataFrame:
+    """
+    Weekly (mondays) stock and market returns of the past 2 years, memoized as beta and idiovol use the same.
+    Each week (tuesday to monday, labeled by the monday) takes the values as of its first day within the 2 years.
+    """
+    key = ("weekly_samples", date)
+
+    if key not in data["windows"]:
+        sep = data["sep"]
+        start = max(date - relativedelta(years=2), sep.index.min())
+        mondays = pd.date_range(start, date, freq="W-MON")
+        first_days = np.maximum(mondays.values - np.timedelta64(6, "D"), start.to_datetime64())
+
+        data["windows"][key] = pd.DataFrame({
+            "mom1w": get_values_as_of(sep["mom1w"], first_days),
+            "mom1w_ewa_market": get_values_as_of(sep["mom1w_ewa_market"], first_days),
+        }, index=mondays)
+
+    return data["windows"][key]
+
+
+@register("beta", inputs={"sep": ["mom1w", "mom1w_ewa_market"]}, lookback=relativedelta(years=2))
+def get_beta(samples, data, features):
+    # Beta of weekly returns against the equally weighted weekly market returns over the past 2 years
+    values = np.full(len(samples), np.nan)
+    for i, date in iter_samples(samples, relativedelta(years=2)):
+        weekly_samples = get_weekly_samples(data, date)
+        covariance = weekly_samples.cov().iloc[0][1]
+        variance_market = weekly_samples["mom1w_ewa_market"].var()
+        if variance_market != 0:
+            values[i] = covariance / variance_market
+
+    return values
+
+
+@register("betasq", depends_on=["beta"], lookback=relativedelta(years=2))
+def get_betasq(samples, data, features):
+    return features["beta"].values**2
+
+
+@register("idiovol", inputs={"sep": ["mom1w", "mom1w_ewa_market"]}, lookback=relativedelta(years=2))
+def get_idiovol(samples, data, features):
+    # Standard deviation of weekly stock returns less market returns over the past 2 years
+    values = np.full(len(samples), np.nan)
+    for i, date in iter_samples(samples, relativedelta(years=2)):
+        weekly_samples = get_weekly_samples(data, date)
+        values[i] = (weekly_samples["mom1w"] - weekly_samples["mom1w_ewa_market"]).std()
+
+    return values
+
+
+""" FEATURES FROM DAILY VALUES (as of calendar day lookbacks from the samples dates) """
+
+@helper
+def get_adj_close(samples: pd.DataFrame, data: dict, days: int) -> np.ndarray:
+    return get_values_as_of(data["sep"]["adj_close"], samples.index, days)
+
+
+@register("return_1m", inputs={"sep": ["adj_close"]})
+def get_return_1m(samples, data, features):
+    return (get_adj_close(samples, data, -30) / get_adj_close(samples, data, 0)) - 1
+
+
+@register("return_2m", inputs={"sep": ["adj_close"]})
+def get_return_2m(samples, data, features):
+    return (get_adj_close(samples, data, -60) / get_adj_close(samples, data, 0)) - 1
+
+
+@register("return_3m", inputs={"sep": ["adj_close"]})
+def get_return_3m(samples, data, features):
+    return (get_adj_close(samples, data, -90) / get_adj_close(samples, data, 0)) - 1
+
+
+@register("mom1m", inputs={"sep": ["adj_close"]}, lookback=relativedelta(days=30))
+def get_mom1m(samples, data, features):
+    return (get_adj_close(samples, data, 0) / get_adj_close(samples, data, 30)) - 1
+
+
+@register("mom6m", inputs={"sep": ["adj_close"]}, lookback=relativedelta(days=182))
+def get_mom6m(samples, data, features):
+    # 5-month cumulative returns ending one month before month end.
+    return (get_adj_close(samples, data, 30) / get_adj_close(samples, data, 182)) - 1
+
+
+@register("mom12m", inputs={"sep": ["adj_close"]}, lookback=relativedelta(days=365))
+def get_mom12m(samples, data, features):
+    # 11-month cumulative returns ending one month before month end.
+    return (get_adj_close(samples, data, 30) / get_adj_close(samples, data, 365)) - 1
+
+
+@register("mom24m", inputs={"sep": ["adj_close"]}, lookback=relativedelta(days=2*365))
+def get_mom24m(samples, data, features):
+    return (get_adj_close(samples, data, 0) / get_adj_close(samples, data, 2*365)) - 1
+
+
+@register("mom12m_to_7m", inputs={"sep": ["adj_close"]}, lookback=relativedelta(days=365))
+def get_mom12m_to_7m(samples, data, features):
+    return (get_adj_close(samples, data, 182+30) / get_adj_close(samples, data, 365)) - 1
+
+
+@register("chmom", depends_on=["mom6m", "mom12m_to_7m"], lookback=relativedelta(days=365))
+def get_chmom(samples, data, features):
+    # Change in 6 month momentum (chmom): ((SEP[adj_close]u-1 / SEP[adj_close]u-6) - 1) - ((SEP[adj_close]u-7 / SEP[adj_close]u-12) -1) --> Cumulative returns from months t-6 to t-1 minus months t-12 to t-7
+    return features["mom6m"].values - features["mom12m_to_7m"].values
+
+
+@register("indmom", inputs={"sep": ["indmom"]}, lookback=relativedelta(days=365)) # Mean 12 month momentum of the industry
+def get_indmom(samples, data, features):
+    # Added to sep in sep_industry_features.py
+    return get_values_as_of(data["sep"]["indmom"], samples.index)
+
+
+# Features set by add_sep_features, in the order they are added
+sample_features = ["timeout", "mve", "ewmstd_2y_monthly", "maxret", "retvol", "std_dolvol", "std_turn", "zerotrade", "dolvol", \
+    "turn", "ill", "dy", "beta", "betasq", "idiovol"]
+daily_features = ["return_1m", "return_2m", "return_3m", "mom1m", "mom6m", "mom12m", "mom24m", "chmom", "indmom"]
+
+# Features of daily_features that add_sep_panel_features calculates for all tickers at once
+sep_panel_features = ["return_1m", "return_2m", "return_3m", "mom1m", "mom6m", "mom12m", "mom24m", "chmom"]
+
 
 def add_indmom(sep: pd.DataFrame) -> pd.DataFrame:
     """
@@ -273,6 +460,49 @@ def dividend_adjusting_prices_backwards(sep: pd.DataFrame) -> pd.DataFrame:
     return sep
 
 
+def add_sep_panel_features(sep: pd.DataFrame) -> pd.DataFrame:
+    """
+    Split strategy: none (sep contains all tickers)
+    Calculates the momentum and return features as whole panel (date x ticker) array operations, see helpers/panel_store.py.
+    Adds the same values as add_weekly_and_12m_stock_returns (mom1w, mom12m_actual), add_equally_weighted_weekly_market_returns
+    (mom1w_ewa_market) and add_indmom (indmom), and sep_panel_features (used by add_sep_features) for every row of sep.
+    NOTE: Prices are stored as float32 in the panel, returns are calculated in float64 from them.
+    """
+    if len(sep) == 0:
+        print("Got empty sep in add_sep_panel_features, don't know why")
+        return sep
+
+    pd.options.mode.chained_assignment = None  # default='warn'
+
+    panel = PanelStore.from_frame(sep, ["adj_close"])
+    rows, columns = panel.get_positions(sep)
+
+    def adj_close(days):
+        return panel.values_at("adj_close", rows, columns, days)
+
+    adj_close_now = adj_close(0)
+    adj_close_1m_ago = adj_close(30)
+    adj_close_12m_ago = adj_close(365)
+
+    sep["mom1w"] = (adj_close_now / adj_close(7)) - 1
+    sep["mom12m_actual"] = (adj_close_now / adj_close_12m_ago) - 1
+
+    sep["mom1w_ewa_market"] = cross_sectional_mean(sep["mom1w"].values, rows)
+    industries = pd.factorize(sep["industry"])[0] # -1 for missing industry
+    sep["indmom"] = cross_sectional_mean(sep["mom12m_actual"].values, rows, industries)
+
+    sep["return_1m"] = (adj_close(-30) / adj_close_now) - 1
+    sep["return_2m"] = (adj_close(-60) / adj_close_now) - 1
+    sep["return_3m"] = (adj_close(-90) / adj_close_now) - 1
+    sep["mom1m"] = (adj_close_now / adj_close_1m_ago) - 1
+    sep["mom6m"] = (adj_close_1m_ago / adj_close(182)) - 1
+    sep["mom12m"] = (adj_close_1m_ago / adj_close_12m_ago) - 1
+    sep["mom24m"] = (adj_close_now / adj_close(2*365)) - 1
+    sep["chmom"] = sep["mom6m"] - ((adj_close(182+30) / adj_close_12m_ago) - 1)
+
+    return sep
+
+
 def add_weekly_and_12m_stock_returns(sep):
     """ sep only contains one ticker """
     sep_empty = True if (len(sep) == 0) else False
@@ -282,24 +512,13 @@ def add_weekly_and_12m_stock_returns(sep):
         return sep
 
     pd.options.mode.chained_assignment = None  # default='warn'
-    # Reindex, forward fill and shift
-    date_index = pd.date_range(sep.index.min(), sep.index.max()) # [0], [1]
-    
-    sep_filled = sep.reindex(date_index)
-    sep_filled["adj_close"] = sep_filled["adj_close"].fillna(method="ffill")
-    sep_filled_1w_behind = sep_filled.shift(periods=7)
+    adj_close = get_values_as_of(sep["adj_close"], sep.index, 0)
 
     # Calculate weekly momentum/return
-    sep_filled["mom1w"] = (sep_filled["adj_close"] / sep_filled_1w_behind["adj_close"]) - 1
+    sep["mom1w"] = (adj_close / get_values_as_of(sep["adj_close"], sep.index, 7)) - 1
     
     # Calculate 12 month momentum (mom12m_actual) for indmom in sep_industry_features.py
-    sep_filled_12m_behind = sep_filled.shift(periods=365)
-    sep_filled["mom12m_actual"] = (sep_filled["adj_close"] / sep_filled_12m_behind["adj_close"]) - 1
-
-    # Downsample and set values
-    sep_filled = sep_filled.loc[sep.index]
-
-    sep[["mom1w", "mom12m_actual"]] = sep_filled[["mom1w", "mom12m_actual"]]
+    sep["mom12m_actual"] = (adj_close / get_values_as_of(sep["adj_close"], sep.index, 365)) - 1
 
     return sep
 
@@ -4,17 +4,36 @@ from dateutil.relativedelta import *
 from datetime import datetime, timedelta
 import numpy as np
 
-from helpers.helpers import print_exception_info, get_most_up_to_date_10k_filing,\
-    get_most_up_to_date_10q_filing, get_calendardate_index, forward_fill_gaps, \
+from helpers.helpers import print_exception_info, get_calendardate_index, forward_fill_gaps, \
         get_calendardate_x_quarters_ago, get_calendardate_x_quarters_later
+from helpers.feature_registry import FeatureRegistry
+from helpers.fundamentals_index import FundamentalsIndex
 from processing.engine import pandas_mp_engine
 
 
-def add_sf1_features(sf1_art: pd.DataFrame, sf1_arq: pd.DataFrame, metadata: pd.DataFrame):
+"""
+The features of add_sf1_features are registered in sf1_feature_registry, one function per feature, so that each
+feature can be cached and recalculated on its own (see helpers/feature_registry.py).
+
+The samples are the forward filled SF1_ART rows (numerical index), data given to the feature functions:
+    art_1y:         the 10K one year before each row, as known at the row's datekey
+    arq_0 - arq_7:  the 10Q 0 to 7 quarters before each row, as known at the row's datekey (only if there are 10Qs)
+    row_info:       per row flags telling which rows to calculate and which filings are available, and the industry and
+                    firstpricedate of the row's ticker
+The filing frames are aligned with the samples, with all nan rows where no filing was available.
+"""
+sf1_feature_registry = FeatureRegistry()
+
+register = sf1_feature_registry.register
+helper = sf1_feature_registry.helper # Functions used by the feature functions, part of the cache key of all features
+
+
+def add_sf1_features(sf1_art: pd.DataFrame, sf1_arq: pd.DataFrame, metadata: pd.DataFrame, feature_cache_dir=None):
     """
     This function takes in SF1_ART and SF1_ARQ datasets from Sharadar and computed various features based on the
     10K/10Q filing data within.
-    NOTE: The function requries that sf1_arq and sf1_art have a calendardate index. 
+    NOTE: The function requries that sf1_arq and sf1_art have a calendardate index.
+    Features are cached per feature in $feature_cache_dir if given, so only changed features are recalculated.
     """
 
     metadata_empty = True if (len(metadata) == 0) else False
@@ -27,9 +46,6 @@ def add_sf1_features(sf1_art: pd.DataFrame, sf1_arq: pd.DataFrame, metadata: pd.
 
     ticker = metadata["ticker"]
 
-    first_calendardate = None
-    calendardate_1y_after_first_calendardate = None
-
     # SF1_ART PREPARATION_____________________________________________________________
     # All new filings added by the forward_fill_gaps function will be dates other than the once contained in the current index.
     # This means that when later downsampling according to this index, all the ones added by forwad_fill_gaps will be dropped.
@@ -45,504 +61,997 @@ def add_sf1_features(sf1_art: pd.DataFrame, sf1_arq: pd.DataFrame, metadata: pd.
     # This gives the forward filled dataframe a numerical index and sets the old index as a column.
     sf1_art = sf1_art.reset_index()
 
-    for index_cur, art_row_cur in sf1_art.iterrows():
-        caldate_cur = art_row_cur["calendardate"]
-        datekey_cur = art_row_cur["datekey"]
-        # The row might be an update of a earlier report. But this is ok, because I simply
-        # want to calculate the most up to date features for the given datekey. It is up to 
-        # the extend_sep_for_sampling function to find the appropriate datekey (filing or update)
-        # for each sample.
-        
-        if first_calendardate is None:
-            first_calendardate = art_row_cur["calendardate"]
-            calendardate_1y_after_first_calendardate = get_calendardate_x_quarters_later(first_calendardate, 4)
-
+    if len(sf1_art) > 0:
         # Skip if not two 10K filings are available, being 1 year appart.
-        if art_row_cur["calendardate"] < calendardate_1y_after_first_calendardate:
-            # print("CONTINUE", art_row_cur["calendardate"], calendardate_1y_after_first_calendardate)
-            continue
-
-        #What to do when a 10K is missing?
-        art_row_1y_ago = get_most_up_to_date_10k_filing(sf1_art, caldate_cur, datekey_cur, 1) # How is this working as I am comparing a data to a numerical index????
-        
-        art_row_1y_ago_empty = art_row_1y_ago.dropna().empty # dont know if this is working
+        first_calendardate = sf1_art.iloc[0]["calendardate"]
+        calendardate_1y_after_first_calendardate = get_calendardate_x_quarters_later(first_calendardate, 4)
+        calculate = (sf1_art["calendardate"] >= calendardate_1y_after_first_calendardate).values
 
-         # _____________________QUARTER FILING BASED FEATURES START_______________________
+        # The 10K one year ago and the 10Qs for the last 8 quarters, as known at each row's datekey.
+        # Each is a dataframe aligned with sf1_art (same numerical index), rows are all nan where no filing exists.
+        art_rows_1y_ago = FundamentalsIndex(sf1_art).get_rows(sf1_art["calendardate"], sf1_art["datekey"], 4)
 
         if sf1_arq_empty == False:
-            """
-            At this point up to tree quarters have been forward filled. Any greater gaps is not acceptable, so
-            being strict in requiring arq_row_xq_ago to be aviable is warranted when calculating features below.
-            """
-            arq_row_cur = get_most_up_to_date_10q_filing(sf1_arq, caldate_cur, datekey_cur, 0)
-            arq_row_1q_ago = get_most_up_to_date_10q_filing(sf1_arq, caldate_cur, datekey_cur, 1)
-            arq_row_2q_ago = get_most_up_to_date_10q_filing(sf1_arq, caldate_cur, datekey_cur, 2) 
-            arq_row_3q_ago = get_most_up_to_date_10q_filing(sf1_arq, caldate_cur, datekey_cur, 3)
-            arq_row_4q_ago = get_most_up_to_date_10q_filing(sf1_arq, caldate_cur, datekey_cur, 4)
-            arq_row_5q_ago = get_most_up_to_date_10q_filing(sf1_arq, caldate_cur, datekey_cur, 5)
-            arq_row_6q_ago = get_most_up_to_date_10q_filing(sf1_arq, caldate_cur, datekey_cur, 6)
-            arq_row_7q_ago = get_most_up_to_date_10q_filing(sf1_arq, caldate_cur, datekey_cur, 7)
-            
-            arq_rows = [arq_row_cur, arq_row_1q_ago, arq_row_2q_ago, arq_row_3q_ago, arq_row_4q_ago, \
-                arq_row_5q_ago, arq_row_6q_ago, arq_row_7q_ago]
-
-            arq_row_cur_empty = arq_row_cur.dropna().empty
-            arq_row_1q_ago_empty = arq_row_1q_ago.dropna().empty
-            arq_row_2q_ago_empty = arq_row_2q_ago.dropna().empty
-            arq_row_3q_ago_empty = arq_row_3q_ago.dropna().empty
-            arq_row_4q_ago_empty = arq_row_4q_ago.dropna().empty
-            arq_row_5q_ago_empty = arq_row_5q_ago.dropna().empty
-            arq_row_6q_ago_empty = arq_row_6q_ago.dropna().empty
-            arq_row_7q_ago_empty = arq_row_7q_ago.dropna().empty
-            
-
-            # I might want to implement approximations for those companies that do not have quarterly statements
-            if (not arq_row_cur_empty) and (not arq_row_1q_ago_empty):
-                
-                # Return on assets (roaq), Formula: SF1[netinc]q-1 / SF1[assets]q-2
-                if arq_row_1q_ago["assets"] != 0:
-                    sf1_art.at[index_cur, "roaq"] = arq_row_cur["netinc"] / arq_row_1q_ago["assets"]
-
-            if (not arq_row_cur_empty) and (not arq_row_4q_ago_empty):
-                # CALCULATE FEATURES BASED ON THE SAME QUARTER FOR THAT LAST TWO YEARS
-                
-                # Change in tax expense (chtx), Formula: (SF1[taxexp]q-1 / SF1[taxexp]q-5) - 1
-                if arq_row_4q_ago["taxexp"] != 0:
-                    sf1_art.at[index_cur, "chtx"] = (arq_row_cur["taxexp"] / arq_row_4q_ago["taxexp"]) - 1
-
-                # Revenue surprise (rsup), Formula: ( SF1[revenueusd]q-1 - SF1[revenueusd]q-5 ) / SF1[marketcap]q-1
-                if arq_row_cur["marketcap"] != 0:
-                    sf1_art.at[index_cur, "rsup"] = (arq_row_cur["revenueusd"] - arq_row_4q_ago["revenueusd"]) / arq_row_cur["marketcap"]
-
-                # Earnings Surprise (sue), Formula: (SF1[netinc]q-1 - SF1[netinc]q-5) / SF1[marketcap]q-1
-                if arq_row_cur["marketcap"] != 0:
-                    sf1_art.at[index_cur, "sue"] = (arq_row_cur["netinc"] - arq_row_4q_ago["netinc"]) / arq_row_cur["marketcap"]
-                
-
-            #____MORE ADVANCED MULTI-QUARTER CALCULATIONS____
-
-            # Corporate investment (cinvest), 
-            # "Change over one quarter in net PP&E (ppentq) divided by sales (saleq) - average of this variable for prior 3 quarters; if saleq = 0, then scale by 0.01."
-            # Formula: (SF1[ppnenet]q-1 - SF1[ppnenet]q-2) / SF1[revenueusd]q-1 - avg((SF1[ppnenet]q-i - SF1[ppnenet]q-i-1) / SF1[revenueusd]q-i, i=[2,3,4]) NB: if sales is zero scale change in ppenet by 0.01
-            if (not arq_row_cur_empty) and (not arq_row_1q_ago_empty) and (not arq_row_2q_ago_empty) and \
-                (not arq_row_3q_ago_empty) and (not arq_row_4q_ago_empty):
-                
-                # Most recent quarter's chppne/sales
-                if arq_row_cur["revenueusd"] != 0:
-                    chppne_sales_cur = (arq_row_cur["ppnenet"] - arq_row_1q_ago["ppnenet"]) / arq_row_cur["revenueusd"]
-                else:
-                    chppne_sales_cur = (arq_row_cur["ppnenet"] - arq_row_1q_ago["ppnenet"]) * 0.01
-                
-                # Previous three quarters of chppne/sales
-                if arq_row_1q_ago["revenueusd"] != 0:
-                    chppne_sales_q_1 = (arq_row_1q_ago["ppnenet"] - arq_row_2q_ago["ppnenet"]) / arq_row_1q_ago["revenueusd"]
-                else:
-                    chppne_sales_q_1 = (arq_row_1q_ago["ppnenet"] - arq_row_2q_ago["ppnenet"]) * 0.01
-
-                if arq_row_2q_ago["revenueusd"] != 0:
-                    chppne_sales_q_2 = (arq_row_2q_ago["ppnenet"] - arq_row_3q_ago["ppnenet"]) / arq_row_2q_ago["revenueusd"]
-                else:
-                    chppne_sales_q_2 = (arq_row_2q_ago["ppnenet"] - arq_row_3q_ago["ppnenet"]) * 0.01
-
-                if arq_row_3q_ago["revenueusd"] != 0:
-                    chppne_sales_q_3 = (arq_row_3q_ago["ppnenet"] - arq_row_4q_ago["ppnenet"]) / arq_row_3q_ago["revenueusd"]
-                else:
-                    chppne_sales_q_3 = (arq_row_3q_ago["ppnenet"] - arq_row_4q_ago["ppnenet"]) * 0.01
-                
-                sf1_art.at[index_cur, "cinvest"] = chppne_sales_cur - ( (chppne_sales_q_1 + chppne_sales_q_2 + chppne_sales_q_3) / 3 )
-            
-            
-            # Number of earnings increases (nincr)	Barth, Elliott & Finn 	1999, JAR 	"Number of consecutive quarters (up to eight quarters) with an increase in earnings
-            # (ibq) over same quarter in the prior year."	for (i = 1, i++, i<=8) { if(SF1[netinc]q-i > SF1[netinc]q-i-4): counter++; else: break }
-            
-            # What if one is missing...
-            nr_of_earnings_increases = 0
-            for i in range(4):
-                cur_row = arq_rows[i]
-                prev_row = arq_rows[i+4]
-                cur_row_empty = cur_row.dropna().empty
-                prev_row_empty = prev_row.dropna().empty
-                if (not cur_row_empty) and (not prev_row_empty):
-                    cur_netinc = cur_row["netinc"]
-                    prev_netinc = prev_row["netinc"]
-                    if cur_netinc > prev_netinc:
-                        nr_of_earnings_increases += 1
-                    else:
-                        break
-                else:
-                    break
-
-            sf1_art.at[index_cur, "nincr"] = nr_of_earnings_increases
-
-            # Earnings volatility (roavol)	Francis, LaFond, Olsson & Schipper 	2004, TAR 	
-            # "Standard deviaiton for 16 quarters of income before extraordinary items (ibq) divided by average total assets (atq)."	
-            # Formula: std(SF1[netinc]q) / avg(SF1[assets]q) for 8 - 16 quarters
-            # Here I simplify by restricting the calculation to 2 years of data (quarter 0 to -7)
-            """
-            if (not arq_row_cur.empty) and (not arq_row_1q_ago.empty) and (not arq_row_2q_ago.empty) \
-                and (not arq_row_3q_ago.empty) and (not arq_row_4q_ago.empty) and (not arq_row_5q_ago.empty) \
-                and (not arq_row_6q_ago.empty) and (not arq_row_7q_ago.empty):
-            """
-            netinc_assets_list = []
-            for row in arq_rows:
-                row_empty = row.dropna().empty
-                if (row["assets"] != 0) and (not row_empty):
-                    netinc_assets_list.append(row["netinc"] / row["assets"])
-
-            std_netinc_assets = np.std(netinc_assets_list)
-            
-            sf1_art.at[index_cur, "roavol"] = std_netinc_assets
-
-        # _____________________QUARTER FILING BASED FEATURES END_______________________
-
-
-        # _______________________FEATURES USING LAST TWO YEARS OF DATA START_________________________
-
-        # ____CALCULATIONS USING ONLY CURRENT SF1_ART ROW____
-        # Cash productivity (cashpr), Formula: (SF1[marketcap]t-1 + SF1[debtnc]t-1 - SF1[assets]t-1) / SF1[cashneq]t-1
-        if art_row_cur["cashneq"] != 0:
-            sf1_art.at[index_cur, "cashpr"] = (art_row_cur["marketcap"] + art_row_cur["debtnc"] - art_row_cur["assets"]) / art_row_cur["cashneq"]
-
-        # Cash (cash), Formula: SF1[cashnequsd]t-1 / SF1[assetsavg]t-1
-        if art_row_cur["assetsavg"] != 0:
-            sf1_art.at[index_cur, "cash"] = art_row_cur["cashnequsd"] / art_row_cur["assetsavg"]
-
-        # Book to market (bm), Formula: SF1[equityusd]t-1 / SF1[marketcap]t-1
-        if art_row_cur["marketcap"] != 0:
-            sf1_art.at[index_cur, "bm"] = art_row_cur["equityusd"] / art_row_cur["marketcap"]
-
-        # Cash flow to price ratio (cfp), Formula: SF1[ncfo]t-1 / SF1[marketcap]t-1
-        if art_row_cur["marketcap"] != 0:
-            sf1_art.at[index_cur, "cfp"] = art_row_cur["ncfo"] / art_row_cur["marketcap"]
-
-        # Current ratio (currat), Formula: SF1[assetsc]t-1 / SF1[liabilitiesc]t-1
-        if art_row_cur["liabilitiesc"] != 0:
-            sf1_art.at[index_cur, "currat"] = art_row_cur["assetsc"] / art_row_cur["liabilitiesc"]
-
-        # Depreciation over PP&E (depr), Formula: SF1[depamor]t-1 / SF1[ppnenet]t-1
-        if art_row_cur["ppnenet"] != 0:
-            sf1_art.at[index_cur, "depr"] = art_row_cur["depamor"] / art_row_cur["ppnenet"]
-
-        # Earnings to price (ep), Formula: SF1[netinc]t-1 / SF1[marketcap]t-1 
-        if art_row_cur["marketcap"] != 0:
-            sf1_art.at[index_cur, "ep"] = art_row_cur["netinc"] / art_row_cur["marketcap"]
-
-        # Leverage (lev), Formula: SF1[liabilities]t-1 / SF1[marketcap]t-1
-        if art_row_cur["marketcap"] != 0:
-            sf1_art.at[index_cur, "lev"] = art_row_cur["liabilities"] / art_row_cur["marketcap"]
-
-
-        # Quick ratio (quick), Formula: (SF1[assetsc]t-1 - SF1[inventory]t-1) / SF1[liabilitiesc]t-1
-        if (art_row_cur["liabilitiesc"] != 0):
-            sf1_art.at[index_cur, "quick"] = (art_row_cur["assetsc"] - art_row_cur["inventory"]) / art_row_cur["liabilitiesc"]
-
-        # R&D to market capitalization (rd_mve), Formula: SF1[rnd]t-1 / SF1[marketcap]t-1
-        if art_row_cur["marketcap"] != 0:
-            sf1_art.at[index_cur, "rd_mve"] = art_row_cur["rnd"] / art_row_cur["marketcap"]
-        
-        # R&D to sales (rd_sale), Formula: SF1[rnd]t-1 / SF1[revenueusd]t-1
-        if art_row_cur["revenueusd"] != 0:
-            sf1_art.at[index_cur, "rd_sale"] = art_row_cur["rnd"] / art_row_cur["revenueusd"]
+            sf1_arq_index = FundamentalsIndex(sf1_arq)
+            arq_rows_x_q_ago = [sf1_arq_index.get_rows(sf1_art["calendardate"], sf1_art["datekey"], quarters) for quarters in range(8)]
+        else:
+            arq_rows_x_q_ago = None
 
+        calculate_sf1_features(sf1_art, art_rows_1y_ago, arq_rows_x_q_ago, calculate, \
+            np.full(len(sf1_art), not sf1_arq_empty), metadata["industry"], metadata["firstpricedate"], feature_cache_dir)
 
-        # Return on invested capital (roic), Formula: (SF1[ebit]t-1 - [nopinc]t-1) / (SF1[equity]t-1 + SF1[liabilities]t-1 + SF1[cashneq]t-1 - SF1[investmentsc]t-1)
-        if (art_row_cur["equity"] + art_row_cur["liabilities"] + art_row_cur["cashneq"] - art_row_cur["investmentsc"]) != 0:
-            # Non-iperating income = SF1[revenueusd]t-1 - art_row_cur["cor"] - SF1[opinc]t-1
-            nopic_t_1 = art_row_cur["revenueusd"] - art_row_cur["cor"] - art_row_cur["opinc"]
-            sf1_art.at[index_cur, "roic"] = (art_row_cur["ebit"] - nopic_t_1) / (art_row_cur["equity"] + art_row_cur["liabilities"] + art_row_cur["cashneq"] - art_row_cur["investmentsc"])
+    # Drop forward filled rows by selecting based on index snapshot: sf1_art_index_snapshot.
+    sf1_art = sf1_art.set_index("calendardate")
 
-        # Sales to cash (salecash), Formula: SF1[revenueusd]t-1 / SF1[cashneq]t-1
-        if art_row_cur["cashneq"] != 0:
-            sf1_art.at[index_cur, "salecash"] = art_row_cur["revenueusd"] / art_row_cur["cashneq"]
+    # sf1_art = sf1_art.loc[sf1_art_index_snapshot]
 
-        # Sales to inventory (saleinv), Formula: SF1[revenueusd]t-1 / SF1[inventory]t-1
-        if art_row_cur["inventory"] != 0:
-            sf1_art.at[index_cur, "saleinv"] = art_row_cur["revenueusd"] / art_row_cur["inventory"]
+    sf1_art["industry"] = metadata["industry"]
 
+    """
+    At this point as many features as possible have beeen calculated. Due to some missing values in the 10K and 10Q
+    reports, some features for some companies will be have a NAN value.
+    Before having an ML ready datasets, rows with missing values must be removed or amended. This is
+    however not the job of this function. Selecing features and final preperation of the dataset will be conducted
+    in the final_dataset_generation.py script.
+    """
+    return sf1_art # This are forward filled, sf1_art has calendardate index, sf1_arq is not needed any more
 
-        # Sales to receivables (salerec), Formula: SF1[revenueusd]t-1 / SF1[receivables]t-1
-        if art_row_cur["receivables"] != 0:
-            sf1_art.at[index_cur, "salerec"] = art_row_cur["revenueusd"] / art_row_cur["receivables"]
 
-        # Sales to price (sp)	SF1[revenueusd]t-1 / SF1[marketcap]t-1
-        if art_row_cur["marketcap"] != 0:
-            sf1_art.at[index_cur, "sp"] = art_row_cur["revenueusd"] / art_row_cur["marketcap"]
+def add_sf1_features_for_all_tickers(sf1_art: pd.DataFrame, sf1_arq: pd.DataFrame, metadata: pd.DataFrame, \
+    feature_cache_dir=None):
+    """
+    Same result as running add_sf1_features on every ticker (split_strategy="ticker") and concatenating, but the
+    filing lookups and features are computed in one pass over the whole universe.
+    NOTE: sf1_art and sf1_arq have a calendardate index, metadata has a ticker column (first row per ticker is used).
+    """
+    metadata = metadata.drop_duplicates(subset="ticker", keep="first").set_index("ticker")
 
-        # Tax income to book income (tb), Formula: (SF1[taxexp]t-1 / 0.21) / SF1[netinc]t-1
-        if art_row_cur["netinc"] != 0:
-            sf1_art.at[index_cur, "tb"] = art_row_cur["taxexp"] / art_row_cur["netinc"]
-        
-        # Sin stocks (sin)	if TICKER[industry].isin(["Beverages - Brewers", "Beverages - Wineries & Distilleries", "Electronic Gaming & Multimedia", "Gambling", "Tobacco"]): 1; else: 0
-        industry_cur = metadata["industry"]
-        if industry_cur in ["Beverages - Brewers", "Beverages - Wineries & Distilleries", "Gambling", "Tobacco"]: # "Electronic Gaming & Multimedia"
-            sf1_art.at[index_cur, "sin"] = 1
-        else:
-            sf1_art.at[index_cur, "sin"] = 0
+    has_metadata = sf1_art["ticker"].isin(metadata.index)
+    sf1_art_without_metadata = sf1_art.loc[~has_metadata]
 
-        # Debt capacity/firm tangibility (tang), Formula: SF1[cashnequsd]t-1 + 0.715*SF1[recievables]t-1 + 0.547*SF1[inventory]t-1 + 0.535*(SF1[ppnenet]t-1 / SF1[assets]t-1)
-        if art_row_cur["assets"] != 0:
-            sf1_art.at[index_cur, "tang"] = (art_row_cur["cashnequsd"] + 0.715*art_row_cur["receivables"] + 0.547*art_row_cur["inventory"] + 0.535*art_row_cur["ppnenet"]) / art_row_cur["assets"]
+    if not has_metadata.any():
+        return sf1_art_without_metadata
 
+    # Gaps are filled for all tickers at once, the results are sorted by ticker
+    sf1_art = forward_fill_gaps(sf1_art.loc[has_metadata], 3).reset_index()
+    sf1_arq = forward_fill_gaps(sf1_arq, 3)
 
-        # DLC/SALE  (debtc_sale), Formula: SF1[debtc]t-1 / SF1[revenueusd]t-1
-        if art_row_cur["revenueusd"] != 0:
-            sf1_art.at[index_cur, "debtc_sale"] = art_row_cur["debtc"] / art_row_cur["revenueusd"]
+    # Skip if not two 10K filings are available, being 1 year appart (per ticker).
+    first_calendardates = sf1_art.groupby("ticker", sort=False)["calendardate"].first()
+    first_calendardates_plus_1y = pd.Series(get_calendardate_x_quarters_later(first_calendardates.values, 4), index=first_calendardates.index)
+    calculate = (sf1_art["calendardate"].values >= first_calendardates_plus_1y.reindex(sf1_art["ticker"]).values)
 
-        # CEQT/MKTCAP (eqt_marketcap), Formula: (SF1[equity]t-1 - SF1[intangibles]t-1) / SF1[marketcap]t-1
-        if art_row_cur["marketcap"] != 0:
-            sf1_art.at[index_cur, "eqt_marketcap"] = ( art_row_cur["equityusd"] - art_row_cur["intangibles"]) / art_row_cur["marketcap"]
+    art_rows_1y_ago = FundamentalsIndex(sf1_art, by_ticker=True).get_rows(sf1_art["calendardate"], sf1_art["datekey"], 4, \
+        tickers=sf1_art["ticker"])
 
-        # DPACT/PPENT	(dep_ppne), Formula: SF1[depamor]t-1 / sf1[ppnenet]t-1
-        if art_row_cur["ppnenet"] != 0:
-            sf1_art.at[index_cur, "dep_ppne"] = art_row_cur["depamor"] / art_row_cur["ppnenet"]
+    if len(sf1_arq) > 0:
+        sf1_arq_index = FundamentalsIndex(sf1_arq, by_ticker=True)
+        arq_rows_x_q_ago = [sf1_arq_index.get_rows(sf1_art["calendardate"], sf1_art["datekey"], quarters, tickers=sf1_art["ticker"]) \
+            for quarters in range(8)]
+    else:
+        arq_rows_x_q_ago = None
 
+    has_arq = sf1_art["ticker"].isin(sf1_arq["ticker"]).values if len(sf1_arq) > 0 else np.full(len(sf1_art), False)
+    metadata_rows = metadata.reindex(sf1_art["ticker"])
 
-        # CEQL/MKTCAP	(tangibles_marketcap), Formula: SF1[tangibles]t-1 / SF1[marketcap]t-1
-        if art_row_cur["marketcap"] != 0:
-            sf1_art.at[index_cur, "tangibles_marketcap"] = art_row_cur["tangibles"] / art_row_cur["marketcap"]
+    calculate_sf1_features(sf1_art, art_rows_1y_ago, arq_rows_x_q_ago, calculate, has_arq, \
+        metadata_rows["industry"].values, metadata_rows["firstpricedate"].values, feature_cache_dir)
 
+    sf1_art = sf1_art.set_index("calendardate")
+    sf1_art["industry"] = metadata_rows["industry"].values
 
+    return pd.concat([sf1_art, sf1_art_without_metadata], sort=False)
 
-         #____Calculate regular year over year SF1 features____
-        if not art_row_1y_ago_empty:
-            
-            # Asset Growth (arg), Formula: (SF1[assets]t-1 / SF1[assets]t-2) - 1
-            if art_row_1y_ago["assets"] != 0:
-                sf1_art.at[index_cur, "agr"] = (art_row_cur["assets"] / art_row_1y_ago["assets"] ) - 1
 
-            # Cash flow to debt (cashdebt), Formula: (SF1[revenueusd]t-1+SF1[depamor]t-1) / ((SF1[liabilities]t-1 - SF1[liabilities]t-2) / 2)
-            if (art_row_cur["liabilities"] - art_row_1y_ago["liabilities"]) != 0:
-                sf1_art.at[index_cur, "cashdebt"] = (art_row_cur["revenueusd"] + art_row_cur["depamor"]) /  ((art_row_cur["liabilities"] - art_row_1y_ago["liabilities"]) / 2)
+@helper
+def get_values(df: pd.DataFrame, column: str) -> np.ndarray:
+    """
+    Values of $column as float64 (forward filled frames have object columns).
+    """
+    return df[column].values.astype(np.float64)
 
-            # Change in shared outstanding (chcsho), Formula: (SF1[sharesbas]t-1 - SF1[sharesbas]t-2) - 1
-            if art_row_1y_ago["sharesbas"] != 0:
-                sf1_art.at[index_cur, "chcsho"] = (art_row_cur["sharesbas"] / art_row_1y_ago["sharesbas"]) - 1
 
-            # Change in inventory (chinv), Formula: (SF1[inventory]t-1 - SF1[inventory]t-2) / SF1[assetsavg]t-1
-            if art_row_cur["assetsavg"] != 0:
-                sf1_art.at[index_cur, "chinv"] = ( art_row_cur["inventory"] - art_row_1y_ago["inventory"] ) / art_row_cur["assetsavg"]
+def set_feature(sf1_art: pd.DataFrame, column: str, mask: np.ndarray, values):
+    """
+    Sets $column to $values for the rows in $mask, other rows are left as they are (nan if the column is new).
+    """
+    if not mask.any():
+        return
 
-            # Growth in common shareholder equity (egr), Formula: (SF1[equityusd]t-1 / SF1[equityusd]t-2) - 1
-            if art_row_1y_ago["equityusd"] != 0:
-                sf1_art.at[index_cur, "egr"] = (art_row_cur["equityusd"] / art_row_1y_ago["equityusd"]) - 1
+    if column not in sf1_art.columns:
+        sf1_art[column] = np.nan
 
-            # Gross profitability (gma), Formula: (SF1[revenueusd]t-1 - SF1[cor]t-1) / SF1[assets]t-2
-            if art_row_1y_ago["assets"] != 0:
-                sf1_art.at[index_cur, "gma"] = (art_row_cur["revenueusd"] - art_row_cur["cor"]) / art_row_1y_ago["assets"]
+    sf1_art.loc[mask, column] = np.broadcast_to(values, mask.shape)[mask]
 
 
-            # Capital expenditures and inventory (invest), Formula: ((SF1[ppnenet]t-1 - SF1[ppnenet]t-2) + (SF1[inventory]t-1 - SF1[inventory]t-2)) / SF1[assets]t-2
-            if art_row_1y_ago["assets"] != 0:
-                sf1_art.at[index_cur, "invest"] = ((art_row_cur["ppnenet"] - art_row_1y_ago["ppnenet"]) + (art_row_cur["inventory"] - art_row_1y_ago["inventory"])) / art_row_1y_ago["assets"]
+@helper
+def sequential_std(values: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """
+    Population standard deviation (ddof=0) of the valid entries of each row (at most 8), nan for rows without valid entries.
+    The sums are accumulated in the same order as np.std does (one running sum for less than 8 values, a pairwise sum for 8),
+    so results are identical to calling np.std on each row's list of valid values.
+    """
+    counts = valid.sum(axis=1)
 
-            # Growth in long-term debt (lgr), Formula: (SF1[liabilities]t-1 / SF1[liabilities]t-2) - 1
-            if art_row_1y_ago["liabilities"] != 0:
-                sf1_art.at[index_cur, "lgr"] = ( art_row_cur["liabilities"] / art_row_1y_ago["liabilities"] ) - 1
-            
-            # Operating profitability (operprof), Formula: (SF1[revenueusd]t-1 - SF1[cor]t-1 - SF1[sgna]t-1 - SF1[intexp]t-1) / SF1[equityusd]t-2 
-            if art_row_1y_ago["equityusd"] != 0:
-                sf1_art.at[index_cur, "operprof"] = ( art_row_cur["revenueusd"] - art_row_cur["cor"] - art_row_cur["sgna"] - art_row_cur["intexp"] ) / art_row_1y_ago["equityusd"]
+    # Move the valid values to the front of each row, keeping their order, and pad with zeros
+    order = np.argsort(~valid, axis=1, kind="stable")
+    compact = np.take_along_axis(np.where(valid, values, 0.0), order, axis=1)
+    in_row = np.arange(values.shape[1])[None, :] < counts[:, None]
 
+    def row_sums(x):
+        running_sum = np.zeros(len(x))
+        for j in range(x.shape[1]):
+            running_sum = running_sum + x[:, j]
+        pairwise_sum = ((x[:, 0] + x[:, 1]) + (x[:, 2] + x[:, 3])) + ((x[:, 4] + x[:, 5]) + (x[:, 6] + x[:, 7]))
+        return np.where(counts == 8, pairwise_sum, running_sum)
 
-            # Percent change in current ratio (pchcurrat), Formula: (SF1[assetsc]t-1 / SF1[liabilitiesc]t-1) / (SF1[assetsc]t-2 / SF1[liabilitiesc]t-2) - 1
-            if (art_row_cur["liabilitiesc"] != 0) and (art_row_1y_ago["liabilitiesc"] != 0) and (art_row_1y_ago["assetsc"] != 0):
-                sf1_art.at[index_cur, "pchcurrat"] = ( (art_row_cur["assetsc"] / art_row_cur["liabilitiesc"]) / (art_row_1y_ago["assetsc"] / art_row_1y_ago["liabilitiesc"]) ) - 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = row_sums(compact) / counts
+        deviations = np.where(in_row, compact - mean[:, None], 0.0)
+        variance = row_sums(deviations * deviations) / counts
 
-            # Percent chang ein depreciation (pchdepr), Formula: (SF1[depamor]t-1 / SF1[ppnenet]t-1) / (SF1[depamor]t-2 / SF1[ppnenet]t-2) - 1
-            if (art_row_cur["ppnenet"] != 0) and (art_row_1y_ago["ppnenet"] != 0) and (art_row_1y_ago["depamor"] != 0):
-                sf1_art.at[index_cur, "pchdepr"] = ( (art_row_cur["depamor"]/ art_row_cur["ppnenet"]) / (art_row_1y_ago["depamor"] / art_row_1y_ago["ppnenet"]) ) - 1
+    return np.sqrt(variance)
 
 
-            # Percent change in gross margin - Percent change in sales (pchgm_pchsale), Formula: ( ([gross_margin]t-1 / [gross_margin]t-2) - 1 ) - ( (SF1[revenueusd]t-1 / SF1[revenueusd]t-2) - 1 ) 
-            # gross_margin = (SF1[revenueusd]t-1 - SF1[cor]t-1) / SF1[revenueusd]t-1
-            if (art_row_cur["revenueusd"] != 0) and (art_row_1y_ago["revenueusd"] != 0):
-                gross_margin_t_1 = (art_row_cur["revenueusd"] - art_row_cur["cor"]) / art_row_cur["revenueusd"]
-                gross_margin_t_2 = (art_row_1y_ago["revenueusd"] - art_row_1y_ago["cor"]) / art_row_1y_ago["revenueusd"]
-                if gross_margin_t_2 != 0:
-                    sf1_art.at[index_cur, "pchgm_pchsale"] = ((gross_margin_t_1 / gross_margin_t_2) - 1) - ((art_row_cur["revenueusd"] / art_row_1y_ago["revenueusd"]) - 1)
+@helper
+def get_accessors(samples: pd.DataFrame, data: dict):
+    """
+    Functions returning the float64 values of a column of the current rows (cur), of the 10K one year ago (art_1y) and of
+    the 10Q $quarters ago (arq), and the values of a column of data["row_info"] (row_info).
+    """
+    cur = lambda column: get_values(samples, column)
+    art_1y = lambda column: get_values(data["art_1y"], column)
+    arq = lambda quarters, column: get_values(data["arq_{}".format(quarters)], column)
+    row_info = lambda column: data["row_info"][column].values
 
+    return cur, art_1y, arq, row_info
 
-            # Percent change in quick ratio (pchquick), Formula: ([quick_ratio]t-1 / [quick_ratio]t-2) - 1
-            # Quick ratio = (SF1[assetsc]t-1 - SF1[inventory]t-1) / SF1[liabilitiesc]t-1
-            if (art_row_cur["liabilitiesc"] != 0) and (art_row_1y_ago["liabilitiesc"] != 0):
-                quick_ratio_cur = ( art_row_cur["assetsc"] - art_row_cur["inventory"] ) / art_row_cur["liabilitiesc"]
-                quick_ratio_1y_ago = ( art_row_1y_ago["assetsc"] - art_row_1y_ago["inventory"] ) / art_row_1y_ago["liabilitiesc"]
-                if quick_ratio_1y_ago != 0:
-                    sf1_art.at[index_cur, "pchquick"] = (quick_ratio_cur / quick_ratio_1y_ago) - 1
 
-            # Percent change in sales - percent change in inventory (pchsale_pchinvt), Formula: ((SF1[revenueusd]t-1 / SF1[revenueusd]t-2) - 1) - ((SF1[inventory]t-1 / SF1[inventory]t-2) - 1)
-            if (art_row_1y_ago["revenueusd"] != 0) and (art_row_1y_ago["inventory"] != 0):
-                sf1_art.at[index_cur, "pchsale_pchinvt"] = ((art_row_cur["revenueusd"] / art_row_1y_ago["revenueusd"]) - 1) - ((art_row_cur["inventory"] / art_row_1y_ago["inventory"]) - 1)
+@helper
+def where_guarded(samples: pd.DataFrame, name: str, mask: np.ndarray, values) -> np.ndarray:
+    """
+    $values for the rows in $mask. Other rows keep the value they have in samples[$name] (nan if there is no such column),
+    like set_feature does.
+    """
+    previous = get_values(samples, name) if name in samples.columns else np.full(len(samples), np.nan)
 
-            # % change in sales - % change in A/R (pchsale_pchrect), Formula: ((SF1[revenueusd]t-1 / SF1[revenueusd]t-2) - 1) - ((SF1[receivables]t-1 / SF1[receivables]t-2) - 1)
-            if (art_row_1y_ago["revenueusd"] != 0) and (art_row_1y_ago["receivables"] != 0):
-                sf1_art.at[index_cur, "pchsale_pchrect"] = ((art_row_cur["revenueusd"] / art_row_1y_ago["revenueusd"]) - 1) - ((art_row_cur["receivables"] / art_row_1y_ago["receivables"]) - 1)
+    return np.where(mask, np.broadcast_to(values, mask.shape), previous)
 
-            # % change in sales - % change in SG&A (pchsale_pchxsga ), Formula: ((SF1[revenueusd]t-1 / SF1[revenueusd]t-2) - 1) - ((SF1[sgna]t-1 / SF1[sgna]t-2) - 1)
-            if (art_row_1y_ago["revenueusd"] != 0) and (art_row_1y_ago["sgna"] != 0):
-                sf1_art.at[index_cur, "pchsale_pchxsga"] = ((art_row_cur["revenueusd"] / art_row_1y_ago["revenueusd"]) - 1) - ((art_row_cur["sgna"] / art_row_1y_ago["sgna"]) - 1)
-            
-            # % change sales-to-inventory (pchsaleinv), Formula: ((SF1[revenueusd]t-1 / SF1[inventory]t-1) / (SF1[revenueusd]t-2 / SF1[inventory]t-2)) - 1
-            if (art_row_cur["inventory"] != 0) and (art_row_1y_ago["inventory"] != 0) and (art_row_1y_ago["revenueusd"] != 0):
-                sf1_art.at[index_cur, "pchsaleinv"] = ((art_row_cur["revenueusd"] / art_row_cur["inventory"]) / (art_row_1y_ago["revenueusd"] / art_row_1y_ago["inventory"])) - 1
 
-            # R&D increase (rd), Formula: if (((SF1[rnd]t-1 / SF1[assets]t-1) - 1) - ((SF1[rnd]t-2 / SF1[assets]t-2) - 1)) > 0.05: 1; else: 0;
-            if (art_row_cur["assets"] != 0) and (art_row_1y_ago["assets"] != 0) and (art_row_1y_ago["rnd"] != 0):
-                rd_cur = (art_row_cur["rnd"] / art_row_cur["assets"])
-                rd_1y_ago = (art_row_1y_ago["rnd"] / art_row_1y_ago["assets"])
-                pch_rd = rd_cur/rd_1y_ago - 1
-                if pch_rd > 0.05:
-                    sf1_art.at[index_cur, "rd"] = 1
-                else:
-                    sf1_art.at[index_cur, "rd"] = 0
+def calculate_sf1_features(sf1_art: pd.DataFrame, art_rows_1y_ago: pd.DataFrame, arq_rows_x_q_ago: list, calculate: np.ndarray, \
+    has_arq: np.ndarray, industry, firstpricedate, feature_cache_dir=None):
+    """
+    Computes the SF1 features for all rows of sf1_art at once (column arithmetic) and adds them to sf1_art in place.
 
-            # Return on equity (roeq), Formula: SF1[netinc]t-1 / SF1[equity]t-2
-            if art_row_1y_ago["equityusd"] != 0:
-                sf1_art.at[index_cur, "roeq"] = art_row_cur["netinc"] / art_row_1y_ago["equityusd"]
+    sf1_art has a numerical index and calendardate column. art_rows_1y_ago and each of arq_rows_x_q_ago (10Qs 0 to 7 quarters ago)
+    are aligned with sf1_art, with all nan rows where no filing was available. Features are only calculated for rows in $calculate,
+    quarterly features only for rows in $has_arq. industry and firstpricedate are scalars or one value per row.
 
+    A feature is only set where its guard holds (non-zero denominators, filings available), like in a row by row calculation,
+    so rows failing the guard keep the value they had (nan for new columns).
+    Features are cached per feature in $feature_cache_dir if given, so only changed features are recalculated.
+    """
+    row_info = pd.DataFrame({
+        "calculate": calculate,
+        "industry": np.broadcast_to(np.asarray(industry, dtype=object), len(sf1_art)),
+        "firstpricedate": np.broadcast_to(np.asarray(firstpricedate, dtype="datetime64[ns]"), len(sf1_art)),
+        # Row by row, an empty row is one where row.dropna().empty
+        "art_1y_available": calculate & art_rows_1y_ago.notnull().any(axis=1).values,
+    }, index=sf1_art.index)
+
+    data = {
+        "art_1y": art_rows_1y_ago,
+        "row_info": row_info,
+    }
+
+    if arq_rows_x_q_ago is not None:
+        """
+        At this point up to tree quarters have been forward filled. Any greater gaps is not acceptable, so
+        being strict in requiring arq_row_xq_ago to be aviable is warranted when calculating features below.
+        """
+        row_info["calculate_arq"] = calculate & has_arq
+        for quarters, arq_rows in enumerate(arq_rows_x_q_ago):
+            data["arq_{}".format(quarters)] = arq_rows
+            row_info["arq_{}_available".format(quarters)] = row_info["calculate_arq"].values & arq_rows.notnull().any(axis=1).values
+
+        names = list(sf1_feature_registry.features)
+    else:
+        names = [name for name in sf1_feature_registry.features if name not in quarterly_features]
 
-            # Sales growth (sgr), Formula: (SF1[revenueusd]t-1 / SF1[revenueusd]t-2) - 1
-            if art_row_1y_ago["revenueusd"] != 0:
-                sf1_art.at[index_cur, "sgr"] = (art_row_cur["revenueusd"] / art_row_1y_ago["revenueusd"]) - 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        features = sf1_feature_registry.compute(sf1_art, data, names=names, cache_dir=feature_cache_dir)
 
-            
-            # Growth in capital expenditure (grcapx), Formula: (SF1[capex]t-1 / SF1[capex]t-2) - 1
-            if art_row_1y_ago["capex"] != 0:
-                sf1_art.at[index_cur, "grcapx"] = (art_row_cur["capex"] / art_row_1y_ago["capex"]) - 1
+    for name in names:
+        sf1_art[name] = features[name].values
 
+    return sf1_art
 
-            # ΔLT/LAGAT (chtl_lagat), Formula: (SF1[liabilities]t-1 - SF1[liabilities]t-2) / SF1[assets]t-2
-            if art_row_1y_ago["assets"] != 0:
-                sf1_art.at[index_cur, "chtl_lagat"] = (art_row_cur["liabilities"] - art_row_1y_ago["liabilities"]) / art_row_1y_ago["assets"]
 
-            # ΔLT/LAGICAPT (chlt_laginvcap), Formula: (SF1[liabilities]t-1 - SF1[liabilities]t-2) / SF1[invcap]t-2
-            if art_row_1y_ago["invcap"] != 0:
-                sf1_art.at[index_cur, "chlt_laginvcap"] = (art_row_cur["liabilities"] - art_row_1y_ago["liabilities"]) / art_row_1y_ago["invcap"]
+def get_arq_inputs(quarters, columns: list, row_info: list=None) -> dict:
+    """
+    Inputs of a feature using $columns of the 10Qs $quarters ago, and the flags of data["row_info"] telling for which rows
+    these 10Qs are available (see calculate_sf1_features).
+    """
+    inputs = {"arq_{}".format(quarter): columns for quarter in quarters}
+    inputs["row_info"] = (row_info or []) + ["arq_{}_available".format(quarter) for quarter in quarters]
 
-            # ΔLCT/LAGAT (chlct_lagat), Formula: (SF1[liabilitiesc]t-1 - SF1[liabilitiesc]t-2) / SF1[assets]t-2
-            if art_row_1y_ago["assets"] != 0:
-                sf1_art.at[index_cur, "chlct_lagat"] = (art_row_cur["liabilitiesc"] - art_row_1y_ago["liabilitiesc"]) / art_row_1y_ago["assets"]
+    return inputs
 
 
-            # ΔXINT/LAGAT	(chint_lagat), Formula: (SF1[intexp]t-1  - SF1[intexp]t-2)/SF1[assets]t-2
-            if art_row_1y_ago["assets"] != 0:
-                sf1_art.at[index_cur, "chint_lagat"] = (art_row_cur["intexp"] - art_row_1y_ago["intexp"]) / art_row_1y_ago["assets"]
+""" QUARTER FILING BASED FEATURES """
 
+quarterly_features = ["roaq", "chtx", "rsup", "sue", "cinvest", "nincr", "roavol"]
 
-            # ΔINVT/LAGSALE (chinvt_lagsale), Formula: (SF1[inventory]t-1 - SF1[inventory]t-2) / SF1[revenueusd]t-2
-            if art_row_1y_ago["revenueusd"] != 0:
-                sf1_art.at[index_cur, "chinvt_lagsale"] = (art_row_cur["inventory"] - art_row_1y_ago["inventory"]) / art_row_1y_ago["revenueusd"]
+@register("roaq", inputs=get_arq_inputs([0, 1], ["netinc", "assets"]), lookback=relativedelta(months=3))
+def get_roaq(samples, data, features):
+    # Return on assets (roaq), Formula: SF1[netinc]q-1 / SF1[assets]q-2
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+    mask = row_info("arq_0_available") & row_info("arq_1_available") & (arq(1, "assets") != 0)
 
-            # ΔXINT/LAGXSGA (chint_lagsgna), Formula: (SF1[intexp]t-1  - SF1[intexp]t-2) / SF1[sgna]t-2
-            if art_row_1y_ago["sgna"] != 0:
-                sf1_art.at[index_cur, "chint_lagsgna"] = (art_row_cur["intexp"] - art_row_1y_ago["intexp"]) / art_row_1y_ago["sgna"]
+    return where_guarded(samples, "roaq", mask, arq(0, "netinc") / arq(1, "assets"))
 
 
-            # ΔLCT/LAGICAPT (chltc_laginvcap), Formula: (SF1[liabilitiesc]t-1 - SF1[liabilitiesc]t-2) / SF1[invcap]t-2
-            if art_row_1y_ago["invcap"] != 0:
-                sf1_art.at[index_cur, "chltc_laginvcap"] = (art_row_cur["liabilitiesc"] - art_row_1y_ago["liabilitiesc"]) / art_row_1y_ago["invcap"]
+# CALCULATE FEATURES BASED ON THE SAME QUARTER FOR THAT LAST TWO YEARS
 
-            # ΔXINT/LAGLT	(chint_laglt), Formula: (SF1[intexp]t-1  - SF1[intexp]t-2) / SF1[liabilities]t-2
-            if art_row_1y_ago["liabilities"] != 0:
-                sf1_art.at[index_cur, "chint_laglt"] = (art_row_cur["intexp"] - art_row_1y_ago["intexp"]) / art_row_1y_ago["liabilities"]
+@register("chtx", inputs=get_arq_inputs([0, 4], ["taxexp"]), lookback=relativedelta(years=1))
+def get_chtx(samples, data, features):
+    # Change in tax expense (chtx), Formula: (SF1[taxexp]q-1 / SF1[taxexp]q-5) - 1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+    mask = row_info("arq_0_available") & row_info("arq_4_available") & (arq(4, "taxexp") != 0)
 
-            # ΔDLTT/LAGAT (chdebtnc_lagat), Formula: (SF1[debtnc]t-1 - SF1[debtnc]t-2) / SF1[assets]t-2
-            if art_row_1y_ago["assets"] != 0:
-                sf1_art.at[index_cur, "chdebtnc_lagat"] = (art_row_cur["debtnc"] - art_row_1y_ago["debtnc"]) / art_row_1y_ago["assets"]
+    return where_guarded(samples, "chtx", mask, (arq(0, "taxexp") / arq(4, "taxexp")) - 1)
 
 
-            # ΔINVT/LAGCOGS (chinvt_lagcor), Formula:	(SF1[inventory]t-1 - SF1[inventory]t-2) / SF1[cor]t-2
-            if art_row_1y_ago["cor"] != 0:
-                sf1_art.at[index_cur, "chinvt_lagcor"] = (art_row_cur["inventory"] - art_row_1y_ago["inventory"]) / art_row_1y_ago["cor"]
+@register("rsup", inputs=get_arq_inputs([0, 4], ["revenueusd", "marketcap"]), lookback=relativedelta(years=1))
+def get_rsup(samples, data, features):
+    # Revenue surprise (rsup), Formula: ( SF1[revenueusd]q-1 - SF1[revenueusd]q-5 ) / SF1[marketcap]q-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+    mask = row_info("arq_0_available") & row_info("arq_4_available") & (arq(0, "marketcap") != 0)
 
-            # ΔPPENT/LAGLT (chppne_laglt), Formula: (SF1[ppnenet]t-1 - SF1[ppnenet]t-2) / SF1[liabilities]t-2
-            if art_row_1y_ago["liabilities"] != 0:
-                sf1_art.at[index_cur, "chppne_laglt"] = (art_row_cur["ppnenet"] - art_row_1y_ago["ppnenet"]) / art_row_1y_ago["liabilities"]
+    return where_guarded(samples, "rsup", mask, (arq(0, "revenueusd") - arq(4, "revenueusd")) / arq(0, "marketcap"))
 
-            # ΔAP/LAGACT (chpay_lagact), Formula: (SF1[payables]t-1 - SF1[payables]t-2) / SF1[assetsc]t-2
-            if art_row_1y_ago["assetsc"] != 0:
-                sf1_art.at[index_cur, "chpay_lagact"] = (art_row_cur["payables"] - art_row_1y_ago["payables"]) / art_row_1y_ago["assetsc"]
-            
-            
-            # ΔXINT/LAGICAPT (chint_laginvcap), Formula: (SF1[intexp]t-1 - SF1[intexp]t-2) / SF1[invcap]t-2
-            if art_row_1y_ago["invcap"] != 0:
-                sf1_art.at[index_cur, "chint_laginvcap"] = (art_row_cur["intexp"] - art_row_1y_ago["intexp"]) / art_row_1y_ago["invcap"]
 
-            #  ΔINVT/LAGACT (chinvt_lagact), Formula:	(SF1[inventory]t-1 - SF1[inventory]t-2) / SF1[assetsc]t-2
-            if art_row_1y_ago["assetsc"] != 0:
-                sf1_art.at[index_cur, "chinvt_lagact"] = (art_row_cur["inventory"] - art_row_1y_ago["inventory"]) / art_row_1y_ago["assetsc"]
+@register("sue", inputs=get_arq_inputs([0, 4], ["netinc", "marketcap"]), lookback=relativedelta(years=1))
+def get_sue(samples, data, features):
+    # Earnings Surprise (sue), Formula: (SF1[netinc]q-1 - SF1[netinc]q-5) / SF1[marketcap]q-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+    mask = row_info("arq_0_available") & row_info("arq_4_available") & (arq(0, "marketcap") != 0)
 
-            # %Δ in PPENT	(pchppne), Formula: (SF1[ppnenet]t-1 / SF1[ppnenet]t-2) - 1
-            if art_row_1y_ago["ppnenet"] != 0:
-                sf1_art.at[index_cur, "pchppne"] = (art_row_cur["ppnenet"] / art_row_1y_ago["ppnenet"]) - 1
+    return where_guarded(samples, "sue", mask, (arq(0, "netinc") - arq(4, "netinc")) / arq(0, "marketcap"))
 
 
-            # %Δ in LT (pchlt), Formula: (SF1[liabilities]t-1 / SF1[liabilities]t-2) - 1
-            if art_row_1y_ago["liabilities"] != 0:
-                sf1_art.at[index_cur, "pchlt"] = (art_row_cur["liabilities"] / art_row_1y_ago["liabilities"]) - 1
+#____MORE ADVANCED MULTI-QUARTER CALCULATIONS____
 
-            # %Δ in XINT (pchint), Formula: (SF1[intexp]t-1 - SF1[intexp]t-2) - 1
-            if art_row_1y_ago["intexp"] != 0:
-                sf1_art.at[index_cur, "pchint"] = (art_row_cur["intexp"] / art_row_1y_ago["intexp"]) - 1
+@register("cinvest", inputs=get_arq_inputs(range(5), ["ppnenet", "revenueusd"]), lookback=relativedelta(years=1))
+def get_cinvest(samples, data, features):
+    # Corporate investment (cinvest),
+    # "Change over one quarter in net PP&E (ppentq) divided by sales (saleq) - average of this variable for prior 3 quarters; if saleq = 0, then scale by 0.01."
+    # Formula: (SF1[ppnenet]q-1 - SF1[ppnenet]q-2) / SF1[revenueusd]q-1 - avg((SF1[ppnenet]q-i - SF1[ppnenet]q-i-1) / SF1[revenueusd]q-i, i=[2,3,4]) NB: if sales is zero scale change in ppenet by 0.01
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
 
-            # DLTIS/PPENT	(chdebtnc_ppne), Formula: (SF1[debtnc]t-1 - SF1[debtnc]t-2) / SF1[ppnenet]t-1
-            if art_row_cur["ppnenet"] != 0:
-                sf1_art.at[index_cur, "chdebtnc_ppne"] = (art_row_cur["debtnc"] - art_row_1y_ago["debtnc"]) / art_row_cur["ppnenet"]
-            
-            # NP/SALE	(chdebtc_sale), Formula: (SF1[debtc]t-1 - SF1[debtc]t-2) / SF1[revenueusd]t-1
-            if art_row_cur["revenueusd"] != 0:
-                sf1_art.at[index_cur, "chdebtc_sale"] = (art_row_cur["debtc"] - art_row_1y_ago["debtc"]) / art_row_cur["revenueusd"]
+    chppne_sales = []
+    for quarters in range(4):
+        chppne = arq(quarters, "ppnenet") - arq(quarters + 1, "ppnenet")
+        chppne_sales.append(np.where(arq(quarters, "revenueusd") != 0, chppne / arq(quarters, "revenueusd"), chppne * 0.01))
 
+    mask = np.logical_and.reduce([row_info("arq_{}_available".format(quarters)) for quarters in range(5)])
 
-            # Financial statements score (ps): Piotroski 	2000, JAR 	Sum of 9 indicator variables to form fundamental health score.	See link in notes
-            ps = get_ps(art_row_cur, art_row_1y_ago)
-            sf1_art.at[index_cur, "ps"] = ps
-            
-        # _______________________ FEATURES USING LAST TWO YEARS OF DATA END_________________________
+    return where_guarded(samples, "cinvest", mask, chppne_sales[0] - ( (chppne_sales[1] + chppne_sales[2] + chppne_sales[3]) / 3 ))
 
-    
-        # _________________________________OTHER_______________________________________
-        # Age (age): Formula: SF1[datekey]t-1 - TICKERS[firstpricedate]
-        sf1_art.at[index_cur, "age"] = round((art_row_cur["datekey"] - metadata["firstpricedate"]).days / 365)
-
-        # Initial public offering (ipo), Formula: if (SF1[datekey]t-1 - TICKERS[firstpricedate]) <= 1 year: 1; else: 0
-        days_since_ipo = (art_row_cur["datekey"] - metadata["firstpricedate"]).days
-        if days_since_ipo <= 365:
-            sf1_art.at[index_cur, "ipo"] = 1
-        else:
-            sf1_art.at[index_cur, "ipo"] = 0
 
+@register("nincr", inputs=get_arq_inputs(range(8), ["netinc"], row_info=["calculate_arq"]), lookback=relativedelta(months=21))
+def get_nincr(samples, data, features):
+    # Number of earnings increases (nincr)	Barth, Elliott & Finn 	1999, JAR 	"Number of consecutive quarters (up to eight quarters) with an increase in earnings
+    # (ibq) over same quarter in the prior year."	for (i = 1, i++, i<=8) { if(SF1[netinc]q-i > SF1[netinc]q-i-4): counter++; else: break }
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
 
-        #_________________IN PREPARATION FOR INDUSTRY ADJUSTED VALUES___________________ ?????
+    nr_of_earnings_increases = np.zeros(len(samples))
+    still_increasing = np.full(len(samples), True)
+    for i in range(4):
+        still_increasing = still_increasing & row_info("arq_{}_available".format(i)) & row_info("arq_{}_available".format(i+4)) \
+            & (arq(i, "netinc") > arq(i+4, "netinc"))
+        nr_of_earnings_increases += still_increasing
 
-        # Profit margin (profitmargin), Formula: SF1[netinc]t-1 / SF1[revenueusd]t-1
-        if art_row_cur["revenueusd"] != 0:
-            sf1_art.at[index_cur, "profitmargin"] = art_row_cur["netinc"] / art_row_cur["revenueusd"]
-            
-        if not art_row_1y_ago_empty:
-            # Change in profit margin (chprofitmargin), Formula: SF1[netinc]t-1 - SF1[netinc]t-2) / SF1[revenueusd]t-1
-            if (art_row_cur["revenueusd"] != 0) and (art_row_1y_ago["revenueusd"] != 0):
-                sf1_art.at[index_cur, "chprofitmargin"] = (art_row_cur["netinc"] - art_row_cur["revenueusd"]) - (art_row_1y_ago["netinc"] / art_row_1y_ago["revenueusd"])
+    return where_guarded(samples, "nincr", row_info("calculate_arq"), nr_of_earnings_increases)
 
-            # change in sales (revenueusd) used in industry related feature calculations
-            sf1_art.at[index_cur, "change_sales"] = art_row_cur["revenueusd"] - art_row_1y_ago["revenueusd"]
 
+@register("roavol", inputs=get_arq_inputs(range(8), ["netinc", "assets"], row_info=["calculate_arq"]), \
+    lookback=relativedelta(months=21))
+def get_roavol(samples, data, features):
+    # Earnings volatility (roavol)	Francis, LaFond, Olsson & Schipper 	2004, TAR
+    # "Standard deviaiton for 16 quarters of income before extraordinary items (ibq) divided by average total assets (atq)."
+    # Formula: std(SF1[netinc]q) / avg(SF1[assets]q) for 8 - 16 quarters
+    # Here I simplify by restricting the calculation to 2 years of data (quarter 0 to -7)
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
 
-    # Drop forward filled rows by selecting based on index snapshot: sf1_art_index_snapshot.
-    sf1_art = sf1_art.set_index("calendardate")
-    
-    # sf1_art = sf1_art.loc[sf1_art_index_snapshot]
+    netinc_assets = np.column_stack([arq(quarters, "netinc") / arq(quarters, "assets") for quarters in range(8)])
+    netinc_assets_valid = np.column_stack([row_info("arq_{}_available".format(quarters)) & (arq(quarters, "assets") != 0) \
+        for quarters in range(8)])
 
-    sf1_art["industry"] = metadata["industry"]
+    return where_guarded(samples, "roavol", row_info("calculate_arq"), sequential_std(netinc_assets, netinc_assets_valid))
 
-    """
-    At this point as many features as possible have beeen calculated. Due to some missing values in the 10K and 10Q 
-    reports, some features for some companies will be have a NAN value.
-    Before having an ML ready datasets, rows with missing values must be removed or amended. This is 
-    however not the job of this function. Selecing features and final preperation of the dataset will be conducted
-    in the final_dataset_generation.py script.
-    """   
-    return sf1_art # This are forward filled, sf1_art has calendardate index, sf1_arq is not needed any more
+
+""" CALCULATIONS USING ONLY CURRENT SF1_ART ROW """
+
+@register("cashpr", inputs={"samples": ["cashneq", "marketcap", "debtnc", "assets"], "row_info": ["calculate"]})
+def get_cashpr(samples, data, features):
+    # Cash productivity (cashpr), Formula: (SF1[marketcap]t-1 + SF1[debtnc]t-1 - SF1[assets]t-1) / SF1[cashneq]t-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "cashpr", row_info("calculate") & (cur("cashneq") != 0), \
+        (cur("marketcap") + cur("debtnc") - cur("assets")) / cur("cashneq"))
+
+
+@register("cash", inputs={"samples": ["assetsavg", "cashnequsd"], "row_info": ["calculate"]})
+def get_cash(samples, data, features):
+    # Cash (cash), Formula: SF1[cashnequsd]t-1 / SF1[assetsavg]t-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "cash", row_info("calculate") & (cur("assetsavg") != 0), cur("cashnequsd") / cur("assetsavg"))
+
+
+@register("bm", inputs={"samples": ["marketcap", "equityusd"], "row_info": ["calculate"]})
+def get_bm(samples, data, features):
+    # Book to market (bm), Formula: SF1[equityusd]t-1 / SF1[marketcap]t-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "bm", row_info("calculate") & (cur("marketcap") != 0), cur("equityusd") / cur("marketcap"))
+
+
+@register("cfp", inputs={"samples": ["marketcap", "ncfo"], "row_info": ["calculate"]})
+def get_cfp(samples, data, features):
+    # Cash flow to price ratio (cfp), Formula: SF1[ncfo]t-1 / SF1[marketcap]t-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "cfp", row_info("calculate") & (cur("marketcap") != 0), cur("ncfo") / cur("marketcap"))
+
+
+@register("currat", inputs={"samples": ["liabilitiesc", "assetsc"], "row_info": ["calculate"]})
+def get_currat(samples, data, features):
+    # Current ratio (currat), Formula: SF1[assetsc]t-1 / SF1[liabilitiesc]t-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "currat", row_info("calculate") & (cur("liabilitiesc") != 0), \
+        cur("assetsc") / cur("liabilitiesc"))
+
+
+@register("depr", inputs={"samples": ["ppnenet", "depamor"], "row_info": ["calculate"]})
+def get_depr(samples, data, features):
+    # Depreciation over PP&E (depr), Formula: SF1[depamor]t-1 / SF1[ppnenet]t-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "depr", row_info("calculate") & (cur("ppnenet") != 0), cur("depamor") / cur("ppnenet"))
+
+
+@register("ep", inputs={"samples": ["marketcap", "netinc"], "row_info": ["calculate"]})
+def get_ep(samples, data, features):
+    # Earnings to price (ep), Formula: SF1[netinc]t-1 / SF1[marketcap]t-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "ep", row_info("calculate") & (cur("marketcap") != 0), cur("netinc") / cur("marketcap"))
+
+
+@register("lev", inputs={"samples": ["marketcap", "liabilities"], "row_info": ["calculate"]})
+def get_lev(samples, data, features):
+    # Leverage (lev), Formula: SF1[liabilities]t-1 / SF1[marketcap]t-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "lev", row_info("calculate") & (cur("marketcap") != 0), cur("liabilities") / cur("marketcap"))
+
+
+@register("quick", inputs={"samples": ["liabilitiesc", "assetsc", "inventory"], "row_info": ["calculate"]})
+def get_quick(samples, data, features):
+    # Quick ratio (quick), Formula: (SF1[assetsc]t-1 - SF1[inventory]t-1) / SF1[liabilitiesc]t-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "quick", row_info("calculate") & (cur("liabilitiesc") != 0), \
+        (cur("assetsc") - cur("inventory")) / cur("liabilitiesc"))
+
+
+@register("rd_mve", inputs={"samples": ["marketcap", "rnd"], "row_info": ["calculate"]})
+def get_rd_mve(samples, data, features):
+    # R&D to market capitalization (rd_mve), Formula: SF1[rnd]t-1 / SF1[marketcap]t-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "rd_mve", row_info("calculate") & (cur("marketcap") != 0), cur("rnd") / cur("marketcap"))
+
+
+@register("rd_sale", inputs={"samples": ["revenueusd", "rnd"], "row_info": ["calculate"]})
+def get_rd_sale(samples, data, features):
+    # R&D to sales (rd_sale), Formula: SF1[rnd]t-1 / SF1[revenueusd]t-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "rd_sale", row_info("calculate") & (cur("revenueusd") != 0), cur("rnd") / cur("revenueusd"))
+
+
+@register("roic", inputs={"samples": ["equity", "liabilities", "cashneq", "investmentsc", "revenueusd", "cor", "opinc", "ebit", \
+    "roic"], "row_info": ["calculate"]})
+def get_roic(samples, data, features):
+    # Return on invested capital (roic), Formula: (SF1[ebit]t-1 - [nopinc]t-1) / (SF1[equity]t-1 + SF1[liabilities]t-1 + SF1[cashneq]t-1 - SF1[investmentsc]t-1)
+    # Non-iperating income = SF1[revenueusd]t-1 - art_row_cur["cor"] - SF1[opinc]t-1
+    # NOTE: SF1 has a roic column, rows failing the guard keep its value
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    invested_capital = cur("equity") + cur("liabilities") + cur("cashneq") - cur("investmentsc")
+    nopic_t_1 = cur("revenueusd") - cur("cor") - cur("opinc")
+
+    return where_guarded(samples, "roic", row_info("calculate") & (invested_capital != 0), (cur("ebit") - nopic_t_1) / invested_capital)
+
+
+@register("salecash", inputs={"samples": ["cashneq", "revenueusd"], "row_info": ["calculate"]})
+def get_salecash(samples, data, features):
+    # Sales to cash (salecash), Formula: SF1[revenueusd]t-1 / SF1[cashneq]t-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "salecash", row_info("calculate") & (cur("cashneq") != 0), cur("revenueusd") / cur("cashneq"))
+
+
+@register("saleinv", inputs={"samples": ["inventory", "revenueusd"], "row_info": ["calculate"]})
+def get_saleinv(samples, data, features):
+    # Sales to inventory (saleinv), Formula: SF1[revenueusd]t-1 / SF1[inventory]t-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "saleinv", row_info("calculate") & (cur("inventory") != 0), \
+        cur("revenueusd") / cur("inventory"))
+
+
+@register("salerec", inputs={"samples": ["receivables", "revenueusd"], "row_info": ["calculate"]})
+def get_salerec(samples, data, features):
+    # Sales to receivables (salerec), Formula: SF1[revenueusd]t-1 / SF1[receivables]t-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "salerec", row_info("calculate") & (cur("receivables") != 0), \
+        cur("revenueusd") / cur("receivables"))
+
+
+@register("sp", inputs={"samples": ["marketcap", "revenueusd"], "row_info": ["calculate"]})
+def get_sp(samples, data, features):
+    # Sales to price (sp)	SF1[revenueusd]t-1 / SF1[marketcap]t-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "sp", row_info("calculate") & (cur("marketcap") != 0), cur("revenueusd") / cur("marketcap"))
+
+
+@register("tb", inputs={"samples": ["netinc", "taxexp"], "row_info": ["calculate"]})
+def get_tb(samples, data, features):
+    # Tax income to book income (tb), Formula: (SF1[taxexp]t-1 / 0.21) / SF1[netinc]t-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "tb", row_info("calculate") & (cur("netinc") != 0), cur("taxexp") / cur("netinc"))
+
+
+@register("sin", inputs={"row_info": ["calculate", "industry"]})
+def get_sin(samples, data, features):
+    # Sin stocks (sin)	if TICKER[industry].isin(["Beverages - Brewers", "Beverages - Wineries & Distilleries", "Electronic Gaming & Multimedia", "Gambling", "Tobacco"]): 1; else: 0
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    sin_industry = np.isin(row_info("industry"), ["Beverages - Brewers", "Beverages - Wineries & Distilleries", "Gambling", "Tobacco"]) # "Electronic Gaming & Multimedia"
+
+    return where_guarded(samples, "sin", row_info("calculate"), np.where(sin_industry, 1, 0))
+
+
+@register("tang", inputs={"samples": ["assets", "cashnequsd", "receivables", "inventory", "ppnenet"], "row_info": ["calculate"]})
+def get_tang(samples, data, features):
+    # Debt capacity/firm tangibility (tang), Formula: SF1[cashnequsd]t-1 + 0.715*SF1[recievables]t-1 + 0.547*SF1[inventory]t-1 + 0.535*(SF1[ppnenet]t-1 / SF1[assets]t-1)
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "tang", row_info("calculate") & (cur("assets") != 0), \
+        (cur("cashnequsd") + 0.715*cur("receivables") + 0.547*cur("inventory") + 0.535*cur("ppnenet")) / cur("assets"))
+
+
+@register("debtc_sale", inputs={"samples": ["revenueusd", "debtc"], "row_info": ["calculate"]})
+def get_debtc_sale(samples, data, features):
+    # DLC/SALE  (debtc_sale), Formula: SF1[debtc]t-1 / SF1[revenueusd]t-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "debtc_sale", row_info("calculate") & (cur("revenueusd") != 0), \
+        cur("debtc") / cur("revenueusd"))
+
+
+@register("eqt_marketcap", inputs={"samples": ["marketcap", "equityusd", "intangibles"], "row_info": ["calculate"]})
+def get_eqt_marketcap(samples, data, features):
+    # CEQT/MKTCAP (eqt_marketcap), Formula: (SF1[equity]t-1 - SF1[intangibles]t-1) / SF1[marketcap]t-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "eqt_marketcap", row_info("calculate") & (cur("marketcap") != 0), \
+        (cur("equityusd") - cur("intangibles")) / cur("marketcap"))
+
+
+@register("dep_ppne", inputs={"samples": ["ppnenet", "depamor"], "row_info": ["calculate"]})
+def get_dep_ppne(samples, data, features):
+    # DPACT/PPENT	(dep_ppne), Formula: SF1[depamor]t-1 / sf1[ppnenet]t-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "dep_ppne", row_info("calculate") & (cur("ppnenet") != 0), cur("depamor") / cur("ppnenet"))
+
+
+@register("tangibles_marketcap", inputs={"samples": ["marketcap", "tangibles"], "row_info": ["calculate"]})
+def get_tangibles_marketcap(samples, data, features):
+    # CEQL/MKTCAP	(tangibles_marketcap), Formula: SF1[tangibles]t-1 / SF1[marketcap]t-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "tangibles_marketcap", row_info("calculate") & (cur("marketcap") != 0), \
+        cur("tangibles") / cur("marketcap"))
+
+
+""" YEAR OVER YEAR FEATURES """
+
+@register("agr", inputs={"samples": ["assets"], \
+    "art_1y": ["assets"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_agr(samples, data, features):
+    # Asset Growth (arg), Formula: (SF1[assets]t-1 / SF1[assets]t-2) - 1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "agr", row_info("art_1y_available") & (art_1y("assets") != 0), \
+        (cur("assets") / art_1y("assets")) - 1)
+
+
+@register("cashdebt", inputs={"samples": ["liabilities", "revenueusd", "depamor"], "art_1y": ["liabilities"], \
+    "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_cashdebt(samples, data, features):
+    # Cash flow to debt (cashdebt), Formula: (SF1[revenueusd]t-1+SF1[depamor]t-1) / ((SF1[liabilities]t-1 - SF1[liabilities]t-2) / 2)
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    change_liabilities = cur("liabilities") - art_1y("liabilities")
+
+    return where_guarded(samples, "cashdebt", row_info("art_1y_available") & (change_liabilities != 0), \
+        (cur("revenueusd") + cur("depamor")) / (change_liabilities / 2))
+
+
+@register("chcsho", inputs={"samples": ["sharesbas"], \
+    "art_1y": ["sharesbas"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_chcsho(samples, data, features):
+    # Change in shared outstanding (chcsho), Formula: (SF1[sharesbas]t-1 - SF1[sharesbas]t-2) - 1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "chcsho", row_info("art_1y_available") & (art_1y("sharesbas") != 0), \
+        (cur("sharesbas") / art_1y("sharesbas")) - 1)
+
+
+@register("chinv", inputs={"samples": ["assetsavg", "inventory"], \
+    "art_1y": ["inventory"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_chinv(samples, data, features):
+    # Change in inventory (chinv), Formula: (SF1[inventory]t-1 - SF1[inventory]t-2) / SF1[assetsavg]t-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "chinv", row_info("art_1y_available") & (cur("assetsavg") != 0), \
+        (cur("inventory") - art_1y("inventory")) / cur("assetsavg"))
+
+
+@register("egr", inputs={"samples": ["equityusd"], \
+    "art_1y": ["equityusd"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_egr(samples, data, features):
+    # Growth in common shareholder equity (egr), Formula: (SF1[equityusd]t-1 / SF1[equityusd]t-2) - 1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "egr", row_info("art_1y_available") & (art_1y("equityusd") != 0), \
+        (cur("equityusd") / art_1y("equityusd")) - 1)
+
+
+@register("gma", inputs={"samples": ["revenueusd", "cor"], \
+    "art_1y": ["assets"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_gma(samples, data, features):
+    # Gross profitability (gma), Formula: (SF1[revenueusd]t-1 - SF1[cor]t-1) / SF1[assets]t-2
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "gma", row_info("art_1y_available") & (art_1y("assets") != 0), \
+        (cur("revenueusd") - cur("cor")) / art_1y("assets"))
+
+
+@register("invest", inputs={"samples": ["ppnenet", "inventory"], \
+    "art_1y": ["assets", "ppnenet", "inventory"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_invest(samples, data, features):
+    # Capital expenditures and inventory (invest), Formula: ((SF1[ppnenet]t-1 - SF1[ppnenet]t-2) + (SF1[inventory]t-1 - SF1[inventory]t-2)) / SF1[assets]t-2
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "invest", row_info("art_1y_available") & (art_1y("assets") != 0), \
+        ((cur("ppnenet") - art_1y("ppnenet")) + (cur("inventory") - art_1y("inventory"))) / art_1y("assets"))
+
+
+@register("lgr", inputs={"samples": ["liabilities"], \
+    "art_1y": ["liabilities"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_lgr(samples, data, features):
+    # Growth in long-term debt (lgr), Formula: (SF1[liabilities]t-1 / SF1[liabilities]t-2) - 1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "lgr", row_info("art_1y_available") & (art_1y("liabilities") != 0), \
+        (cur("liabilities") / art_1y("liabilities")) - 1)
+
+
+@register("operprof", inputs={"samples": ["revenueusd", "cor", "sgna", "intexp"], \
+    "art_1y": ["equityusd"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_operprof(samples, data, features):
+    # Operating profitability (operprof), Formula: (SF1[revenueusd]t-1 - SF1[cor]t-1 - SF1[sgna]t-1 - SF1[intexp]t-1) / SF1[equityusd]t-2
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "operprof", row_info("art_1y_available") & (art_1y("equityusd") != 0), \
+        (cur("revenueusd") - cur("cor") - cur("sgna") - cur("intexp")) / art_1y("equityusd"))
+
+
+@register("pchcurrat", inputs={"samples": ["liabilitiesc", "assetsc"], \
+    "art_1y": ["liabilitiesc", "assetsc"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_pchcurrat(samples, data, features):
+    # Percent change in current ratio (pchcurrat), Formula: (SF1[assetsc]t-1 / SF1[liabilitiesc]t-1) / (SF1[assetsc]t-2 / SF1[liabilitiesc]t-2) - 1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "pchcurrat", row_info("art_1y_available") & (cur("liabilitiesc") != 0) & (art_1y("liabilitiesc") != 0) & (art_1y("assetsc") != 0), \
+        ((cur("assetsc") / cur("liabilitiesc")) / (art_1y("assetsc") / art_1y("liabilitiesc"))) - 1)
+
+
+@register("pchdepr", inputs={"samples": ["ppnenet", "depamor"], \
+    "art_1y": ["ppnenet", "depamor"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_pchdepr(samples, data, features):
+    # Percent chang ein depreciation (pchdepr), Formula: (SF1[depamor]t-1 / SF1[ppnenet]t-1) / (SF1[depamor]t-2 / SF1[ppnenet]t-2) - 1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "pchdepr", row_info("art_1y_available") & (cur("ppnenet") != 0) & (art_1y("ppnenet") != 0) & (art_1y("depamor") != 0), \
+        ((cur("depamor") / cur("ppnenet")) / (art_1y("depamor") / art_1y("ppnenet"))) - 1)
+
+
+@register("pchgm_pchsale", inputs={"samples": ["revenueusd", "cor"], "art_1y": ["revenueusd", "cor"], \
+    "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_pchgm_pchsale(samples, data, features):
+    # Percent change in gross margin - Percent change in sales (pchgm_pchsale), Formula: ( ([gross_margin]t-1 / [gross_margin]t-2) - 1 ) - ( (SF1[revenueusd]t-1 / SF1[revenueusd]t-2) - 1 )
+    # gross_margin = (SF1[revenueusd]t-1 - SF1[cor]t-1) / SF1[revenueusd]t-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    gross_margin_t_1 = (cur("revenueusd") - cur("cor")) / cur("revenueusd")
+    gross_margin_t_2 = (art_1y("revenueusd") - art_1y("cor")) / art_1y("revenueusd")
+    mask = row_info("art_1y_available") & (cur("revenueusd") != 0) & (art_1y("revenueusd") != 0) & (gross_margin_t_2 != 0)
+
+    return where_guarded(samples, "pchgm_pchsale", mask, \
+        ((gross_margin_t_1 / gross_margin_t_2) - 1) - ((cur("revenueusd") / art_1y("revenueusd")) - 1))
+
+
+@register("pchquick", inputs={"samples": ["assetsc", "inventory", "liabilitiesc"], "art_1y": ["assetsc", "inventory", "liabilitiesc"], \
+    "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_pchquick(samples, data, features):
+    # Percent change in quick ratio (pchquick), Formula: ([quick_ratio]t-1 / [quick_ratio]t-2) - 1
+    # Quick ratio = (SF1[assetsc]t-1 - SF1[inventory]t-1) / SF1[liabilitiesc]t-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    quick_ratio_cur = (cur("assetsc") - cur("inventory")) / cur("liabilitiesc")
+    quick_ratio_1y_ago = (art_1y("assetsc") - art_1y("inventory")) / art_1y("liabilitiesc")
+    mask = row_info("art_1y_available") & (cur("liabilitiesc") != 0) & (art_1y("liabilitiesc") != 0) & (quick_ratio_1y_ago != 0)
+
+    return where_guarded(samples, "pchquick", mask, (quick_ratio_cur / quick_ratio_1y_ago) - 1)
+
+
+@register("pchsale_pchinvt", inputs={"samples": ["revenueusd", "inventory"], \
+    "art_1y": ["revenueusd", "inventory"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_pchsale_pchinvt(samples, data, features):
+    # Percent change in sales - percent change in inventory (pchsale_pchinvt), Formula: ((SF1[revenueusd]t-1 / SF1[revenueusd]t-2) - 1) - ((SF1[inventory]t-1 / SF1[inventory]t-2) - 1)
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "pchsale_pchinvt", row_info("art_1y_available") & (art_1y("revenueusd") != 0) & (art_1y("inventory") != 0), \
+        ((cur("revenueusd") / art_1y("revenueusd")) - 1) - ((cur("inventory") / art_1y("inventory")) - 1))
+
+
+@register("pchsale_pchrect", inputs={"samples": ["revenueusd", "receivables"], \
+    "art_1y": ["revenueusd", "receivables"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_pchsale_pchrect(samples, data, features):
+    # % change in sales - % change in A/R (pchsale_pchrect), Formula: ((SF1[revenueusd]t-1 / SF1[revenueusd]t-2) - 1) - ((SF1[receivables]t-1 / SF1[receivables]t-2) - 1)
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "pchsale_pchrect", row_info("art_1y_available") & (art_1y("revenueusd") != 0) & (art_1y("receivables") != 0), \
+        ((cur("revenueusd") / art_1y("revenueusd")) - 1) - ((cur("receivables") / art_1y("receivables")) - 1))
+
+
+@register("pchsale_pchxsga", inputs={"samples": ["revenueusd", "sgna"], \
+    "art_1y": ["revenueusd", "sgna"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_pchsale_pchxsga(samples, data, features):
+    # % change in sales - % change in SG&A (pchsale_pchxsga ), Formula: ((SF1[revenueusd]t-1 / SF1[revenueusd]t-2) - 1) - ((SF1[sgna]t-1 / SF1[sgna]t-2) - 1)
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "pchsale_pchxsga", row_info("art_1y_available") & (art_1y("revenueusd") != 0) & (art_1y("sgna") != 0), \
+        ((cur("revenueusd") / art_1y("revenueusd")) - 1) - ((cur("sgna") / art_1y("sgna")) - 1))
+
+
+@register("pchsaleinv", inputs={"samples": ["inventory", "revenueusd"], \
+    "art_1y": ["inventory", "revenueusd"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_pchsaleinv(samples, data, features):
+    # % change sales-to-inventory (pchsaleinv), Formula: ((SF1[revenueusd]t-1 / SF1[inventory]t-1) / (SF1[revenueusd]t-2 / SF1[inventory]t-2)) - 1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "pchsaleinv", row_info("art_1y_available") & (cur("inventory") != 0) & (art_1y("inventory") != 0) & (art_1y("revenueusd") != 0), \
+        ((cur("revenueusd") / cur("inventory")) / (art_1y("revenueusd") / art_1y("inventory"))) - 1)
+
+
+@register("rd", inputs={"samples": ["rnd", "assets"], "art_1y": ["rnd", "assets"], "row_info": ["art_1y_available"]}, \
+    lookback=relativedelta(years=1))
+def get_rd(samples, data, features):
+    # R&D increase (rd), Formula: if (((SF1[rnd]t-1 / SF1[assets]t-1) - 1) - ((SF1[rnd]t-2 / SF1[assets]t-2) - 1)) > 0.05: 1; else: 0;
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    rd_cur = (cur("rnd") / cur("assets"))
+    rd_1y_ago = (art_1y("rnd") / art_1y("assets"))
+    pch_rd = rd_cur/rd_1y_ago - 1
+    mask = row_info("art_1y_available") & (cur("assets") != 0) & (art_1y("assets") != 0) & (art_1y("rnd") != 0)
+
+    return where_guarded(samples, "rd", mask, np.where(pch_rd > 0.05, 1, 0))
+
+
+@register("roeq", inputs={"samples": ["netinc"], \
+    "art_1y": ["equityusd"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_roeq(samples, data, features):
+    # Return on equity (roeq), Formula: SF1[netinc]t-1 / SF1[equity]t-2
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "roeq", row_info("art_1y_available") & (art_1y("equityusd") != 0), \
+        cur("netinc") / art_1y("equityusd"))
+
+
+@register("sgr", inputs={"samples": ["revenueusd"], \
+    "art_1y": ["revenueusd"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_sgr(samples, data, features):
+    # Sales growth (sgr), Formula: (SF1[revenueusd]t-1 / SF1[revenueusd]t-2) - 1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "sgr", row_info("art_1y_available") & (art_1y("revenueusd") != 0), \
+        (cur("revenueusd") / art_1y("revenueusd")) - 1)
+
+
+@register("grcapx", inputs={"samples": ["capex"], \
+    "art_1y": ["capex"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_grcapx(samples, data, features):
+    # Growth in capital expenditure (grcapx), Formula: (SF1[capex]t-1 / SF1[capex]t-2) - 1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "grcapx", row_info("art_1y_available") & (art_1y("capex") != 0), \
+        (cur("capex") / art_1y("capex")) - 1)
+
+
+@register("chtl_lagat", inputs={"samples": ["liabilities"], \
+    "art_1y": ["assets", "liabilities"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_chtl_lagat(samples, data, features):
+    # ΔLT/LAGAT (chtl_lagat), Formula: (SF1[liabilities]t-1 - SF1[liabilities]t-2) / SF1[assets]t-2
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "chtl_lagat", row_info("art_1y_available") & (art_1y("assets") != 0), \
+        (cur("liabilities") - art_1y("liabilities")) / art_1y("assets"))
+
+
+@register("chlt_laginvcap", inputs={"samples": ["liabilities"], \
+    "art_1y": ["invcap", "liabilities"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_chlt_laginvcap(samples, data, features):
+    # ΔLT/LAGICAPT (chlt_laginvcap), Formula: (SF1[liabilities]t-1 - SF1[liabilities]t-2) / SF1[invcap]t-2
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "chlt_laginvcap", row_info("art_1y_available") & (art_1y("invcap") != 0), \
+        (cur("liabilities") - art_1y("liabilities")) / art_1y("invcap"))
+
+
+@register("chlct_lagat", inputs={"samples": ["liabilitiesc"], \
+    "art_1y": ["assets", "liabilitiesc"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_chlct_lagat(samples, data, features):
+    # ΔLCT/LAGAT (chlct_lagat), Formula: (SF1[liabilitiesc]t-1 - SF1[liabilitiesc]t-2) / SF1[assets]t-2
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "chlct_lagat", row_info("art_1y_available") & (art_1y("assets") != 0), \
+        (cur("liabilitiesc") - art_1y("liabilitiesc")) / art_1y("assets"))
+
+
+@register("chint_lagat", inputs={"samples": ["intexp"], \
+    "art_1y": ["assets", "intexp"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_chint_lagat(samples, data, features):
+    # ΔXINT/LAGAT	(chint_lagat), Formula: (SF1[intexp]t-1  - SF1[intexp]t-2)/SF1[assets]t-2
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "chint_lagat", row_info("art_1y_available") & (art_1y("assets") != 0), \
+        (cur("intexp") - art_1y("intexp")) / art_1y("assets"))
+
+
+@register("chinvt_lagsale", inputs={"samples": ["inventory"], \
+    "art_1y": ["revenueusd", "inventory"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_chinvt_lagsale(samples, data, features):
+    # ΔINVT/LAGSALE (chinvt_lagsale), Formula: (SF1[inventory]t-1 - SF1[inventory]t-2) / SF1[revenueusd]t-2
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "chinvt_lagsale", row_info("art_1y_available") & (art_1y("revenueusd") != 0), \
+        (cur("inventory") - art_1y("inventory")) / art_1y("revenueusd"))
+
+
+@register("chint_lagsgna", inputs={"samples": ["intexp"], \
+    "art_1y": ["sgna", "intexp"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_chint_lagsgna(samples, data, features):
+    # ΔXINT/LAGXSGA (chint_lagsgna), Formula: (SF1[intexp]t-1  - SF1[intexp]t-2) / SF1[sgna]t-2
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "chint_lagsgna", row_info("art_1y_available") & (art_1y("sgna") != 0), \
+        (cur("intexp") - art_1y("intexp")) / art_1y("sgna"))
+
+
+@register("chltc_laginvcap", inputs={"samples": ["liabilitiesc"], \
+    "art_1y": ["invcap", "liabilitiesc"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_chltc_laginvcap(samples, data, features):
+    # ΔLCT/LAGICAPT (chltc_laginvcap), Formula: (SF1[liabilitiesc]t-1 - SF1[liabilitiesc]t-2) / SF1[invcap]t-2
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "chltc_laginvcap", row_info("art_1y_available") & (art_1y("invcap") != 0), \
+        (cur("liabilitiesc") - art_1y("liabilitiesc")) / art_1y("invcap"))
+
+
+@register("chint_laglt", inputs={"samples": ["intexp"], \
+    "art_1y": ["liabilities", "intexp"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_chint_laglt(samples, data, features):
+    # ΔXINT/LAGLT	(chint_laglt), Formula: (SF1[intexp]t-1  - SF1[intexp]t-2) / SF1[liabilities]t-2
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "chint_laglt", row_info("art_1y_available") & (art_1y("liabilities") != 0), \
+        (cur("intexp") - art_1y("intexp")) / art_1y("liabilities"))
+
+
+@register("chdebtnc_lagat", inputs={"samples": ["debtnc"], \
+    "art_1y": ["assets", "debtnc"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_chdebtnc_lagat(samples, data, features):
+    # ΔDLTT/LAGAT (chdebtnc_lagat), Formula: (SF1[debtnc]t-1 - SF1[debtnc]t-2) / SF1[assets]t-2
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "chdebtnc_lagat", row_info("art_1y_available") & (art_1y("assets") != 0), \
+        (cur("debtnc") - art_1y("debtnc")) / art_1y("assets"))
+
+
+@register("chinvt_lagcor", inputs={"samples": ["inventory"], \
+    "art_1y": ["cor", "inventory"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_chinvt_lagcor(samples, data, features):
+    # ΔINVT/LAGCOGS (chinvt_lagcor), Formula:	(SF1[inventory]t-1 - SF1[inventory]t-2) / SF1[cor]t-2
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "chinvt_lagcor", row_info("art_1y_available") & (art_1y("cor") != 0), \
+        (cur("inventory") - art_1y("inventory")) / art_1y("cor"))
+
+
+@register("chppne_laglt", inputs={"samples": ["ppnenet"], \
+    "art_1y": ["liabilities", "ppnenet"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_chppne_laglt(samples, data, features):
+    # ΔPPENT/LAGLT (chppne_laglt), Formula: (SF1[ppnenet]t-1 - SF1[ppnenet]t-2) / SF1[liabilities]t-2
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "chppne_laglt", row_info("art_1y_available") & (art_1y("liabilities") != 0), \
+        (cur("ppnenet") - art_1y("ppnenet")) / art_1y("liabilities"))
+
+
+@register("chpay_lagact", inputs={"samples": ["payables"], \
+    "art_1y": ["assetsc", "payables"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_chpay_lagact(samples, data, features):
+    # ΔAP/LAGACT (chpay_lagact), Formula: (SF1[payables]t-1 - SF1[payables]t-2) / SF1[assetsc]t-2
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "chpay_lagact", row_info("art_1y_available") & (art_1y("assetsc") != 0), \
+        (cur("payables") - art_1y("payables")) / art_1y("assetsc"))
+
+
+@register("chint_laginvcap", inputs={"samples": ["intexp"], \
+    "art_1y": ["invcap", "intexp"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_chint_laginvcap(samples, data, features):
+    # ΔXINT/LAGICAPT (chint_laginvcap), Formula: (SF1[intexp]t-1 - SF1[intexp]t-2) / SF1[invcap]t-2
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "chint_laginvcap", row_info("art_1y_available") & (art_1y("invcap") != 0), \
+        (cur("intexp") - art_1y("intexp")) / art_1y("invcap"))
+
+
+@register("chinvt_lagact", inputs={"samples": ["inventory"], \
+    "art_1y": ["assetsc", "inventory"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_chinvt_lagact(samples, data, features):
+    #  ΔINVT/LAGACT (chinvt_lagact), Formula:	(SF1[inventory]t-1 - SF1[inventory]t-2) / SF1[assetsc]t-2
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "chinvt_lagact", row_info("art_1y_available") & (art_1y("assetsc") != 0), \
+        (cur("inventory") - art_1y("inventory")) / art_1y("assetsc"))
+
+
+@register("pchppne", inputs={"samples": ["ppnenet"], \
+    "art_1y": ["ppnenet"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_pchppne(samples, data, features):
+    # %Δ in PPENT	(pchppne), Formula: (SF1[ppnenet]t-1 / SF1[ppnenet]t-2) - 1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "pchppne", row_info("art_1y_available") & (art_1y("ppnenet") != 0), \
+        (cur("ppnenet") / art_1y("ppnenet")) - 1)
+
+
+@register("pchlt", inputs={"samples": ["liabilities"], \
+    "art_1y": ["liabilities"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_pchlt(samples, data, features):
+    # %Δ in LT (pchlt), Formula: (SF1[liabilities]t-1 / SF1[liabilities]t-2) - 1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "pchlt", row_info("art_1y_available") & (art_1y("liabilities") != 0), \
+        (cur("liabilities") / art_1y("liabilities")) - 1)
+
+
+@register("pchint", inputs={"samples": ["intexp"], \
+    "art_1y": ["intexp"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_pchint(samples, data, features):
+    # %Δ in XINT (pchint), Formula: (SF1[intexp]t-1 - SF1[intexp]t-2) - 1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "pchint", row_info("art_1y_available") & (art_1y("intexp") != 0), \
+        (cur("intexp") / art_1y("intexp")) - 1)
+
+
+@register("chdebtnc_ppne", inputs={"samples": ["ppnenet", "debtnc"], \
+    "art_1y": ["debtnc"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_chdebtnc_ppne(samples, data, features):
+    # DLTIS/PPENT	(chdebtnc_ppne), Formula: (SF1[debtnc]t-1 - SF1[debtnc]t-2) / SF1[ppnenet]t-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "chdebtnc_ppne", row_info("art_1y_available") & (cur("ppnenet") != 0), \
+        (cur("debtnc") - art_1y("debtnc")) / cur("ppnenet"))
+
+
+@register("chdebtc_sale", inputs={"samples": ["revenueusd", "debtc"], \
+    "art_1y": ["debtc"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_chdebtc_sale(samples, data, features):
+    # NP/SALE	(chdebtc_sale), Formula: (SF1[debtc]t-1 - SF1[debtc]t-2) / SF1[revenueusd]t-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "chdebtc_sale", row_info("art_1y_available") & (cur("revenueusd") != 0), \
+        (cur("debtc") - art_1y("debtc")) / cur("revenueusd"))
+
+
+@register("ps", inputs={"samples": ["assetsavg", "liabilitiesc", "revenueusd", "netinc", "ncfo", "debtnc", "assetsc", "sharesbas", \
+    "cor", "ps"], "art_1y": ["assetsavg", "liabilitiesc", "revenueusd", "debtnc", "assetsc", "sharesbas", "cor"], \
+    "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_piotroski_score(samples, data, features):
+    # Financial statements score (ps): Piotroski 	2000, JAR 	Sum of 9 indicator variables to form fundamental health score.	See link in notes
+    # NOTE: SF1 has a ps (price to sales) column, rows failing the guard keep its value
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "ps", row_info("art_1y_available"), get_ps_batch(samples, data["art_1y"]))
+
+
+# _________________________________OTHER_______________________________________
+
+@helper
+def get_days_since_ipo(samples: pd.DataFrame, data: dict) -> np.ndarray:
+    return np.floor((samples["datekey"].values - data["row_info"]["firstpricedate"].values) / np.timedelta64(1, "D"))
+
+@register("age", inputs={"samples": ["datekey"], "row_info": ["calculate", "firstpricedate"]})
+def get_age(samples, data, features):
+    # Age (age): Formula: SF1[datekey]t-1 - TICKERS[firstpricedate]
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "age", row_info("calculate"), np.round(get_days_since_ipo(samples, data) / 365))
+
+
+@register("ipo", inputs={"samples": ["datekey"], "row_info": ["calculate", "firstpricedate"]})
+def get_ipo(samples, data, features):
+    # Initial public offering (ipo), Formula: if (SF1[datekey]t-1 - TICKERS[firstpricedate]) <= 1 year: 1; else: 0
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "ipo", row_info("calculate"), np.where(get_days_since_ipo(samples, data) <= 365, 1, 0))
+
+
+#_________________IN PREPARATION FOR INDUSTRY ADJUSTED VALUES___________________ ?????
+
+@register("profitmargin", inputs={"samples": ["revenueusd", "netinc"], "row_info": ["calculate"]})
+def get_profitmargin(samples, data, features):
+    # Profit margin (profitmargin), Formula: SF1[netinc]t-1 / SF1[revenueusd]t-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "profitmargin", row_info("calculate") & (cur("revenueusd") != 0), \
+        cur("netinc") / cur("revenueusd"))
+
+
+@register("chprofitmargin", inputs={"samples": ["revenueusd", "netinc"], \
+    "art_1y": ["revenueusd", "netinc"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_chprofitmargin(samples, data, features):
+    # Change in profit margin (chprofitmargin), Formula: SF1[netinc]t-1 - SF1[netinc]t-2) / SF1[revenueusd]t-1
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "chprofitmargin", row_info("art_1y_available") & (cur("revenueusd") != 0) & (art_1y("revenueusd") != 0), \
+        (cur("netinc") - cur("revenueusd")) - (art_1y("netinc") / art_1y("revenueusd")))
+
+
+@register("change_sales", inputs={"samples": ["revenueusd"], \
+    "art_1y": ["revenueusd"], "row_info": ["art_1y_available"]}, lookback=relativedelta(years=1))
+def get_change_sales(samples, data, features):
+    # change in sales (revenueusd) used in industry related feature calculations
+    cur, art_1y, arq, row_info = get_accessors(samples, data)
+
+    return where_guarded(samples, "change_sales", row_info("art_1y_available"), cur("revenueusd") - art_1y("revenueusd"))
 
 
 # Maybe best to have preperation in sf1_features.py
@@ -581,6 +1090,36 @@ def get_ps(art_row_cur, art_row_1y_ago):
         return np.nan
 
 
+@helper
+def get_ps_batch(sf1_art_cur: pd.DataFrame, sf1_art_1y_ago: pd.DataFrame) -> np.ndarray:
+    """
+    get_ps for all rows at once, sf1_art_1y_ago is aligned with sf1_art_cur (the 10K one year before each row).
+    Returns the score for each row, nan where get_ps would return nan (zero denominators).
+    """
+    cur = lambda column: get_values(sf1_art_cur, column)
+    art_1y = lambda column: get_values(sf1_art_1y_ago, column)
+
+    valid = (cur("assetsavg") != 0) & (art_1y("assetsavg") != 0) & (cur("liabilitiesc") != 0) \
+        & (art_1y("liabilitiesc") != 0) & (cur("revenueusd") != 0) & (art_1y("revenueusd") != 0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        indicators = [
+            cur("netinc") > 0, # i1_positive_netinc
+            (cur("netinc") / cur("assetsavg")) > 0, # i2_positive_roa
+            cur("ncfo") > 0, # i3_positive_operating_cash_flow
+            cur("ncfo") > cur("netinc"), # i4_ncfo_exceeds_netinc
+            (cur("debtnc") / cur("assetsavg")) < (art_1y("debtnc") / art_1y("assetsavg")), # i5_lower_long_term_debt_to_assets
+            (cur("assetsc") / cur("liabilitiesc")) > (art_1y("assetsc") / art_1y("liabilitiesc")), # i6_higher_current_ratio
+            cur("sharesbas") <= art_1y("sharesbas"), # i7_no_new_shares
+            ((cur("revenueusd") - cur("cor")) / cur("revenueusd")) > ((art_1y("revenueusd") - art_1y("cor")) / art_1y("revenueusd")), # i8_higher_gross_margin
+            (cur("revenueusd") / cur("assetsavg")) > (art_1y("revenueusd") / art_1y("assetsavg")), # i9_higher_asset_turnover_ratio
+        ]
+
+    ps = np.sum(indicators, axis=0)
+
+    return np.where(valid, ps, np.nan)
+
+
 
 
 
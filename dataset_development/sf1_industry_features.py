@@ -6,7 +6,8 @@ import numpy as np
 
 
 from processing.engine import pandas_mp_engine
-from helpers.helpers import get_most_up_to_date_10k_filing, get_calendardate_x_quarters_ago
+from helpers.helpers import get_calendardate_x_quarters_ago
+from sf1_features import get_values, set_feature
 
 
 def add_industry_sf1_features(sf1_art, metadata):
@@ -16,117 +17,67 @@ def add_industry_sf1_features(sf1_art, metadata):
 
     NOTE: sf1_art is forward filled and has a calendardate index
     NOTE: Requires sf1_features.py to be executed first, and that its output is given to this function.
+    NOTE: Industry statistics are calculated once per (industry, calendardate), so sf1_art may contain several industries.
     """
 
     if isinstance(metadata, pd.DataFrame) == True:
         metadata = metadata.iloc[0]
 
     sf1_art = sf1_art.reset_index() # I need this, because there are several companies in sf1_art (duplicate calendardates in index)
-    
-    industry_means = pd.DataFrame()
 
-    for index_cur, art_row_cur in sf1_art.iterrows():
-        """ Iterating over multiple tickers ! """
-        caldate_cur = art_row_cur["calendardate"] 
-        datekey_cur = art_row_cur["datekey"]
-        ticker = art_row_cur["ticker"]
-        
-        # profitmargin, chprofitmargin are not used... maybe I will end up needing them...
-        sf1_art_for_date = sf1_art.loc[sf1_art["calendardate"] == caldate_cur]
-        sf1_art_for_date = sf1_art_for_date.sort_values(by=["datekey"])
+    # ____________________________ CALCULATE INDUSTRY MEANS _____________________________
+    group_by = ["industry", "calendardate"] if "industry" in sf1_art.columns else ["calendardate"]
 
-        # If not filtering out duplicate filings for the same company, on this calendardate, some companies will be dispropotianally weighted.
-        sf1_art_for_date = sf1_art_for_date.drop_duplicates(subset="ticker", keep="first") # Keeping the first gets out of any lookahead bias
+    industry_means = sf1_art.groupby(group_by, sort=False, dropna=False).apply(get_industry_statistics)
 
-        # ____________________________ CALCULATE INDUSTRY MEANS _____________________________
-        
-        if caldate_cur not in industry_means.index:
-            
-            industry_mean_bm = (sf1_art_for_date["equityusd"] / sf1_art_for_date["marketcap"]).mean() # I think it automatically excludes rows which leads to zero in the denominator.
-            industry_mean_cfp = (sf1_art_for_date["ncfo"] / sf1_art_for_date["marketcap"]).mean() # I think it automatically excludes rows which leads to zero in the denominator.
-            industry_mean_asset_turnover = (sf1_art_for_date["change_sales"] / sf1_art_for_date["assetsavg"]).mean() # I think it automatically excludes rows which leads to zero in the denominator.
-            industry_mean_marketcap = sf1_art_for_date["marketcap"].mean()
-            industry_mean_percent_change_capex = sf1_art_for_date["grcapx"].mean()
-            industry_mean_change_profit_margin = sf1_art_for_date["chprofitmargin"].mean()
-
-
-            industry_mean_return_on_assets = (sf1_art_for_date["netinc"] / sf1_art_for_date["assetsavg"]).mean()
-            industry_mean_cash_flow_return_on_assets = (sf1_art_for_date["ncfo"] / sf1_art_for_date["assetsavg"]).mean()
-            industry_mean_rnd_intensity = (sf1_art_for_date["rnd"] / sf1_art_for_date["assetsavg"]).mean()
-            industry_mean_capex_intensity = (sf1_art_for_date["capex"] / sf1_art_for_date["assetsavg"]).mean()
-            industry_mean_advertising_intensity = (sf1_art_for_date["sgna"] / sf1_art_for_date["assetsavg"]).mean()
-
-
-
-            industry_means.at[caldate_cur, "industry_mean_bm"] = industry_mean_bm
-            industry_means.at[caldate_cur, "industry_mean_cfp"] = industry_mean_cfp
-            industry_means.at[caldate_cur, "industry_mean_asset_turnover"] = industry_mean_asset_turnover
-            industry_means.at[caldate_cur, "industry_mean_marketcap"] = industry_mean_marketcap
-            industry_means.at[caldate_cur, "industry_mean_percent_change_capex"] = industry_mean_percent_change_capex
-            industry_means.at[caldate_cur, "industry_mean_change_profit_margin"] = industry_mean_change_profit_margin
-        
+    # Broadcast the statistics of each row's industry and calendardate back onto the row
+    industry_means = industry_means.reindex(pd.MultiIndex.from_frame(sf1_art[group_by]) if len(group_by) > 1 else sf1_art["calendardate"])
+    industry_mean = lambda column: industry_means[column].values.astype(np.float64)
 
-            industry_means.at[caldate_cur, "industry_mean_return_on_assets"] = industry_mean_return_on_assets
-            industry_means.at[caldate_cur, "industry_mean_cash_flow_return_on_assets"] = industry_mean_cash_flow_return_on_assets
-            industry_means.at[caldate_cur, "industry_mean_rnd_intensity"] = industry_mean_rnd_intensity
-            industry_means.at[caldate_cur, "industry_mean_capex_intensity"] = industry_mean_capex_intensity
-            industry_means.at[caldate_cur, "industry_mean_advertising_intensity"] = industry_mean_advertising_intensity
+    #____________________________ DONE CALCULATE INDUSTRY MEANS _____________________________
 
 
-        #____________________________ DONE CALCULATE INDUSTRY MEANS _____________________________
+    #__________________________CALCULATE INDUSTRY ADJUSTED FEATURES__________________________
+    cur = lambda column: get_values(sf1_art, column)
+    all_rows = np.full(len(sf1_art), True)
 
-
-        #__________________________CALCULATE INDUSTRY ADJUSTED FEATURES__________________________
-       
-    
-        sf1_art_ticker = sf1_art.loc[sf1_art["ticker"] == ticker] # Not very efficient...
-        sf1_art_for_ticker = sf1_art.loc[sf1_art.ticker == ticker]
-        art_row_1y_ago = get_most_up_to_date_10k_filing(sf1_art_for_ticker, caldate_cur, datekey_cur, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
 
         #______________________________REQUIRING ONLY CURRENT ROW___________________________
 
         # Industry-adjusted book-to-market (bm_ia), Formula: bm - industry_mean(bm)
         # Industry adjusted book-to-market ratio.
-        if art_row_cur["marketcap"] != 0:
-            sf1_art.at[index_cur, "bm_ia"] = (art_row_cur["equityusd"] / art_row_cur["marketcap"]) - industry_means.at[caldate_cur, "industry_mean_bm"]
+        set_feature(sf1_art, "bm_ia", cur("marketcap") != 0, (cur("equityusd") / cur("marketcap")) - industry_mean("industry_mean_bm"))
 
         # Industry-adjusted cash flow to price ratio (cfp_ia), Formula: cfp - indutry_mean(cfp)
         # cfp = SF1[ncfo]t-1 / SF1[marketcap]t-1
         # Industry adjusted cfp.
-        if art_row_cur["marketcap"] != 0:
-            sf1_art.at[index_cur, "cfp_ia"] = (art_row_cur["ncfo"] / art_row_cur["marketcap"]) - industry_means.at[caldate_cur, "industry_mean_cfp"]
+        set_feature(sf1_art, "cfp_ia", cur("marketcap") != 0, (cur("ncfo") / cur("marketcap")) - industry_mean("industry_mean_cfp"))
 
-        # Industyr-adjusted change in asset turnover (chatoia), 
+        # Industyr-adjusted change in asset turnover (chatoia),
         # Formula: ((SF1[revenueusd]t-1 - SF1[revenueusd]t-2) / SF1[assetsavg]t-1) - industry_mean((SF1[revenueusd]t-1 - SF1[revenueusd]t-2) / SF1[assetsavg]t-1))
         # 2-digit SIC - fiscal-year mean adjusted change in sales (sale) divided by average total assets (at)
-        if art_row_cur["assetsavg"] != 0:
-            sf1_art.at[index_cur, "chatoia"] = (art_row_cur["change_sales"]  / art_row_cur["assetsavg"]) - industry_means.at[caldate_cur, "industry_mean_asset_turnover"]
-
+        set_feature(sf1_art, "chatoia", cur("assetsavg") != 0, \
+            (cur("change_sales") / cur("assetsavg")) - industry_mean("industry_mean_asset_turnover"))
 
         # Industry-adjusted size (mve_ia), Formula: SF1[marketcap]t-1 - industry_mean(SF1[marketcap]t-1)
         # 2-digit SIC industry-adjusted fiscal year-end market capitalization.
-        if art_row_cur["marketcap"] != 0:
-            sf1_art.at[index_cur, "mve_ia"] = art_row_cur["marketcap"] - industry_means.at[caldate_cur, "industry_mean_marketcap"]
-
+        set_feature(sf1_art, "mve_ia", cur("marketcap") != 0, cur("marketcap") - industry_mean("industry_mean_marketcap"))
 
         # Industry-adjusted % change in capital expenditure (pchcapex_ia), Formula: ((SF1[capex]t-1 / SF1[capex]2-1) - 1) - industry_mean((SF1[capex]t-1 / SF1[capex]2-1))
         # 2-digit SIC - fiscal-year mean adjusted percent change in capital expenditures (capex).
-        sf1_art.at[index_cur, "pchcapex_ia"] = art_row_cur["grcapx"]- industry_means.at[caldate_cur, "industry_mean_percent_change_capex"]
-        
-        # Industry-adjusted change in profit margin	Soliman (chpmia), 
+        set_feature(sf1_art, "pchcapex_ia", all_rows, cur("grcapx") - industry_mean("industry_mean_percent_change_capex"))
+
+        # Industry-adjusted change in profit margin	Soliman (chpmia),
         # Formula: (SF1[netinc]t-1 / SF1[revenueusd]t-1) - (SF1[netinc]t-2 / SF1[revenueusd]t-2) - industry_mean((SF1[netinc]t-1 / SF1[revenueusd]t-1) - (SF1[netinc]t-2 / SF1[revenueusd]t-2))  --> [chprofitmargin]t-1 - industry_mean([chprofitmargin]t-1)
         # 2-digit SIC - fiscal-year mean adjusted change in income before extraordinary items (ib) divided by sales (sale).
-        sf1_art.at[index_cur, "chpmia"] = art_row_cur["chprofitmargin"] - industry_means.at[caldate_cur, "industry_mean_change_profit_margin"]
-
+        set_feature(sf1_art, "chpmia", all_rows, cur("chprofitmargin") - industry_mean("industry_mean_change_profit_margin"))
 
         # Industry sales concentration (herf), Formula: SF1[revenueusd] is used to proxy market share
-        herf = get_herf(sf1_art_for_date) # CACHE IT MAYBE
-        sf1_art.at[index_cur, "herf"] = herf
-
+        set_feature(sf1_art, "herf", all_rows, industry_mean("herf"))
 
         # Finantial statement score (ms): Fromula: Sum of 8 (6) indicator variables for fundamental performance. (My own type, excluding too demanding indicators)
-        ms = get_ms(art_row_cur, industry_means, caldate_cur)
-        sf1_art.at[index_cur, "ms"] = ms        
+        set_feature(sf1_art, "ms", all_rows, get_ms_batch(sf1_art, industry_means))
 
     # Reset index
     sf1_art = sf1_art.set_index("calendardate")
@@ -134,6 +85,34 @@ def add_industry_sf1_features(sf1_art, metadata):
     return sf1_art # This is still forward filled, but its ok, When i merge this with sep_sampled, I only take out the correct rows
 
 
+def get_industry_statistics(sf1_art_for_date: pd.DataFrame) -> pd.Series:
+    """
+    Industry means (and herf) for one industry and calendardate.
+    """
+    # profitmargin, chprofitmargin are not used... maybe I will end up needing them...
+    sf1_art_for_date = sf1_art_for_date.sort_values(by=["datekey"])
+
+    # If not filtering out duplicate filings for the same company, on this calendardate, some companies will be dispropotianally weighted.
+    sf1_art_for_date = sf1_art_for_date.drop_duplicates(subset="ticker", keep="first") # Keeping the first gets out of any lookahead bias
+
+    return pd.Series({
+        "industry_mean_bm": (sf1_art_for_date["equityusd"] / sf1_art_for_date["marketcap"]).mean(), # I think it automatically excludes rows which leads to zero in the denominator.
+        "industry_mean_cfp": (sf1_art_for_date["ncfo"] / sf1_art_for_date["marketcap"]).mean(), # I think it automatically excludes rows which leads to zero in the denominator.
+        "industry_mean_asset_turnover": (sf1_art_for_date["change_sales"] / sf1_art_for_date["assetsavg"]).mean(), # I think it automatically excludes rows which leads to zero in the denominator.
+        "industry_mean_marketcap": sf1_art_for_date["marketcap"].mean(),
+        "industry_mean_percent_change_capex": sf1_art_for_date["grcapx"].mean(),
+        "industry_mean_change_profit_margin": sf1_art_for_date["chprofitmargin"].mean(),
+
+        "industry_mean_return_on_assets": (sf1_art_for_date["netinc"] / sf1_art_for_date["assetsavg"]).mean(),
+        "industry_mean_cash_flow_return_on_assets": (sf1_art_for_date["ncfo"] / sf1_art_for_date["assetsavg"]).mean(),
+        "industry_mean_rnd_intensity": (sf1_art_for_date["rnd"] / sf1_art_for_date["assetsavg"]).mean(),
+        "industry_mean_capex_intensity": (sf1_art_for_date["capex"] / sf1_art_for_date["assetsavg"]).mean(),
+        "industry_mean_advertising_intensity": (sf1_art_for_date["sgna"] / sf1_art_for_date["assetsavg"]).mean(),
+
+        "herf": get_herf(sf1_art_for_date),
+    })
+
+
 def get_herf(sf1_art_for_date):
     # Industry sales concentration (herf), Formula: SF1[revenueusd] is used to proxy market share
     # 2-digit SIC - fiscal-year sales concentration (sum of squared percent of sales in industry for each company)
@@ -141,13 +120,31 @@ def get_herf(sf1_art_for_date):
 
     sum_industry_revenue = sf1_art_for_date["revenueusd"].sum()
 
-    sum_sqrd_percent_of_revenue = 0
+    # cumsum adds the companies one at a time, in order, like a running sum
+    sqrd_percent_of_revenue = np.square(sf1_art_for_date["revenueusd"].values.astype(np.float64) / sum_industry_revenue)
 
-    for i, company_row in sf1_art_for_date.iterrows():
-        sum_sqrd_percent_of_revenue += (company_row["revenueusd"] / sum_industry_revenue)**2
-    
-    return sum_sqrd_percent_of_revenue
+    return np.cumsum(sqrd_percent_of_revenue)[-1] if len(sqrd_percent_of_revenue) > 0 else 0
+
+
+def get_ms_batch(sf1_art: pd.DataFrame, industry_means: pd.DataFrame) -> np.ndarray:
+    """
+    get_ms for all rows at once, industry_means is aligned with sf1_art (the industry means of each row's calendardate).
+    """
+    cur = lambda column: get_values(sf1_art, column)
+    industry_mean = lambda column: industry_means[column].values.astype(np.float64)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        i1_roa_above_avg = (cur("netinc") / cur("assetsavg")) > industry_mean("industry_mean_return_on_assets")
+        i2_cf_roa_above_avg = (cur("ncfo") / cur("assetsavg")) > industry_mean("industry_mean_cash_flow_return_on_assets")
+        i3_ncfo_exceeds_netinc = cur("ncfo") > cur("netinc")
+        i6_rnd_intensity = (cur("rnd") / cur("assetsavg")) > industry_mean("industry_mean_rnd_intensity")
+        i7_capex_indensity = (cur("capex") / cur("assetsavg")) > industry_mean("industry_mean_capex_intensity")
+        i8_advertising_intensity = (cur("sgna") / cur("assetsavg")) > industry_mean("industry_mean_advertising_intensity")
+
+    ms = i1_roa_above_avg.astype(int) + i2_cf_roa_above_avg + i3_ncfo_exceeds_netinc + i6_rnd_intensity + i7_capex_indensity + \
+        i8_advertising_intensity
 
+    return np.where((cur("assetsavg") != 0) & (cur("netinc") != 0), ms, np.nan)
 
 
 def get_ms(art_row_cur: pd.Series, industry_means: pd.DataFrame, caldate_cur: pd.datetime) -> int:
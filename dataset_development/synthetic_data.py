@@ -0,0 +1,334 @@
+"""
+Synthetic Sharadar-like datasets, for measuring how the pipeline scales without the real (licensed) data.
+
+write_synthetic_sharadar writes SEP, SF1 (ART and ARQ), metadata and 3 month T-bill rate csv files with the same
+columns as the Sharadar exports (and ./datasets/macro/t_bill_rate_3m.csv), so they can be given to
+generate_sep_featured, generate_sf1_featured and finalize_dataset as they are. The shapes are meant to be realistic,
+the values only plausible:
+- Prices follow market, industry and company specific random walks. Some tickers are listed after the first date and
+  some are delisted before the last date. Dividend payers pay $dividend_frequency times a year.
+- Each ticker files quarterly (ARQ) with a delay of 30 to 90 days, ART is the trailing four quarters of ARQ.
+  Quarters are missing with $gap_probability and are restated (a second row for the same calendardate with a later
+  datekey) with $restatement_probability.
+
+Tickers are generated and written in batches of $batch_tickers, so memory use does not grow with the number of tickers.
+"""
+import os
+import pandas as pd
+import numpy as np
+
+
+sep_columns = ["ticker", "date", "open", "high", "low", "close", "volume", "dividends", "closeunadj", "lastupdated"]
+
+sf1_columns = ["ticker", "dimension", "calendardate", "datekey", "reportperiod", "lastupdated", "accoci", "assets", "assetsavg",
+    "assetsc", "assetsnc", "assetturnover", "bvps", "capex", "cashneq", "cashnequsd", "cor", "consolinc", "currentratio", "de",
+    "debt", "debtc", "debtnc", "debtusd", "deferredrev", "depamor", "deposits", "divyield", "dps", "ebit", "ebitda",
+    "ebitdamargin", "ebitdausd", "ebitusd", "ebt", "eps", "epsdil", "epsusd", "equity", "equityavg", "equityusd", "ev",
+    "evebit", "evebitda", "fcf", "fcfps", "fxusd", "gp", "grossmargin", "intangibles", "intexp", "invcap", "invcapavg",
+    "inventory", "investments", "investmentsc", "investmentsnc", "liabilities", "liabilitiesc", "liabilitiesnc", "marketcap",
+    "ncf", "ncfbus", "ncfcommon", "ncfdebt", "ncfdiv", "ncff", "ncfi", "ncfinv", "ncfo", "ncfx", "netinc", "netinccmn",
+    "netinccmnusd", "netincdis", "netincnci", "netmargin", "opex", "opinc", "payables", "payoutratio", "pb", "pe", "pe1",
+    "ppnenet", "prefdivis", "price", "ps", "ps1", "receivables", "retearn", "revenue", "revenueusd", "rnd", "roa", "roe",
+    "roic", "ros", "sbcomp", "sgna", "sharefactor", "sharesbas", "shareswa", "shareswadil", "sps", "tangibles", "taxassets",
+    "taxexp", "taxliabilities", "tbvps", "workingcapital"]
+
+metadata_columns = ["ticker", "name", "industry", "sector", "siccode", "firstpricedate", "lastpricedate", "isdelisted", "table"]
+
+# Income and cash flow statement items as fractions of revenue (low, high), summed over four quarters in ART
+flow_fractions = {
+    "cor": (0.4, 0.8), "sgna": (0.05, 0.25), "rnd": (0.0, 0.1), "depamor": (0.01, 0.06), "intexp": (0.0, 0.03),
+    "capex": (-0.1, -0.01), "ncfinv": (-0.05, 0.05), "ncfdebt": (-0.05, 0.05), "ncfcommon": (-0.03, 0.01),
+    "ncfbus": (-0.02, 0.0), "ncfx": (-0.005, 0.005), "sbcomp": (0.0, 0.03),
+}
+
+# Balance sheet items as fractions of assets (low, high)
+stock_fractions = {
+    "cashneq": (0.02, 0.2), "receivables": (0.02, 0.15), "inventory": (0.0, 0.2), "investmentsc": (0.0, 0.1),
+    "investmentsnc": (0.0, 0.15), "ppnenet": (0.05, 0.5), "intangibles": (0.0, 0.2), "taxassets": (0.0, 0.03),
+    "payables": (0.02, 0.1), "deferredrev": (0.0, 0.05), "debtc": (0.0, 0.1), "debtnc": (0.0, 0.35),
+    "taxliabilities": (0.0, 0.03), "retearn": (-0.1, 0.5), "accoci": (-0.02, 0.02),
+}
+
+
+def get_trading_days(start, end) -> pd.DatetimeIndex:
+    return pd.bdate_range(start, end)
+
+
+def generate_metadata(num_tickers: int, num_industries: int, dates: pd.DatetimeIndex, rng: np.random.RandomState) -> pd.DataFrame:
+    """
+    One row per ticker. About 30% of the tickers are listed after the first date and 10% are delisted before the last.
+    """
+    tickers = ["T{:05d}".format(i) for i in range(num_tickers)]
+    industries = rng.randint(0, num_industries, size=num_tickers)
+
+    first_positions = np.where(rng.rand(num_tickers) < 0.3, rng.randint(0, int(len(dates) * 0.6) + 1, size=num_tickers), 0)
+    delisted = rng.rand(num_tickers) < 0.1
+    last_positions = np.where(delisted, first_positions + ((len(dates) - 1 - first_positions) * rng.uniform(0.5, 1, size=num_tickers)).astype(int), \
+        len(dates) - 1)
+
+    return pd.DataFrame({
+        "ticker": tickers,
+        "name": ["Synthetic company {}".format(i) for i in range(num_tickers)],
+        "industry": ["Industry {}".format(industry) for industry in industries],
+        "sector": ["Sector {}".format(industry % max(1, num_industries // 5)) for industry in industries],
+        "siccode": 1000 + industries * 80 + rng.randint(0, 80, size=num_tickers),
+        "firstpricedate": dates[first_positions],
+        "lastpricedate": dates[last_positions],
+        "isdelisted": np.where(delisted, "Y", "N"),
+        "table": "SF1",
+    }, columns=metadata_columns)
+
+
+def generate_factor_returns(num_industries: int, dates: pd.DatetimeIndex, rng: np.random.RandomState) -> tuple:
+    """
+    Daily log returns of the market and of each industry (num_industries x dates).
+    """
+    market = rng.normal(0.0003, 0.01, size=len(dates))
+    industries = rng.normal(0, 0.006, size=(num_industries, len(dates)))
+
+    return market, industries
+
+
+def generate_sep(company: pd.Series, dates: pd.DatetimeIndex, market: np.ndarray, industries: np.ndarray, \
+    dividend_frequency: int, rng: np.random.RandomState) -> pd.DataFrame:
+    """
+    Daily prices, volume and dividends of one ticker ($company is its metadata row).
+    """
+    in_range = (dates >= company["firstpricedate"]) & (dates <= company["lastpricedate"])
+    ticker_dates = dates[in_range]
+    industry = int(company["industry"].split(" ")[1])
+
+    log_returns = market[in_range] * rng.uniform(0.5, 1.5) + industries[industry][in_range] + rng.normal(0, rng.uniform(0.01, 0.03), size=len(ticker_dates))
+    close = np.round(rng.uniform(5, 200) * np.exp(np.cumsum(log_returns)), 4)
+    spread = np.abs(rng.normal(0, 0.01, size=(3, len(ticker_dates))))
+
+    dividends = np.zeros(len(ticker_dates))
+    if (dividend_frequency > 0) and (rng.rand() < 0.6):
+        every = int(252 / dividend_frequency)
+        payment_positions = np.arange(rng.randint(0, every), len(ticker_dates), every)
+        dividends[payment_positions] = np.round(close[payment_positions] * rng.uniform(0.005, 0.03) / dividend_frequency, 4)
+
+    sep = pd.DataFrame({
+        "ticker": company["ticker"],
+        "date": ticker_dates,
+        "open": np.round(close * (1 + rng.normal(0, 0.005, size=len(ticker_dates))), 4),
+        "high": np.round(close * (1 + spread[0]), 4),
+        "low": np.round(close * (1 - spread[1]), 4),
+        "close": close,
+        "volume": np.round(rng.lognormal(rng.uniform(10, 16), 0.5, size=len(ticker_dates))),
+        "dividends": dividends,
+        "closeunadj": close,
+        "lastupdated": dates[-1],
+    }, columns=sep_columns)
+
+    return sep
+
+
+def generate_sf1(company: pd.Series, sep: pd.DataFrame, gap_probability: float, restatement_probability: float, \
+    rng: np.random.RandomState) -> tuple:
+    """
+    Quarterly (ARQ) and trailing twelve month (ART) filings of one ticker, from its price history $sep. Returns
+    (sf1_art, sf1_arq).
+    """
+    empty = pd.DataFrame(columns=sf1_columns)
+    if len(sep) == 0:
+        return empty, empty
+
+    calendardates = pd.date_range(sep["date"].iloc[0] - pd.offsets.QuarterEnd(1), sep["date"].iloc[-1] - pd.DateOffset(days=90), freq="Q")
+    if len(calendardates) == 0:
+        return empty, empty
+
+    n = len(calendardates)
+    revenue = rng.lognormal(rng.uniform(15, 21), 0.3) * np.exp(np.cumsum(rng.normal(0.01, 0.05, size=n)))
+    assets = revenue * 4 * rng.uniform(0.5, 3) * np.exp(np.cumsum(rng.normal(0, 0.02, size=n)))
+    shares = rng.lognormal(rng.uniform(16, 21), 0.2) * np.exp(np.cumsum(rng.normal(0.002, 0.01, size=n)))
+
+    items = {"calendardate": calendardates, "revenue": revenue, "assets": assets, "sharesbas": np.round(shares)}
+    for column, (low, high) in flow_fractions.items():
+        items[column] = revenue * rng.uniform(low, high) * rng.uniform(0.9, 1.1, size=n)
+    for column, (low, high) in stock_fractions.items():
+        items[column] = assets * rng.uniform(low, high) * rng.uniform(0.9, 1.1, size=n)
+
+    datekeys = calendardates + pd.to_timedelta(rng.randint(30, 91, size=n), unit="D")
+    close = pd.Series(sep["close"].values, index=sep["date"])
+    items["datekey"] = datekeys
+    items["price"] = close.reindex(datekeys, method="ffill").values
+    items["dps"] = rng.uniform(0, 0.01) * items["price"]
+    arq = pd.DataFrame(items)
+
+    # Missing quarters (never the first) and restated quarters
+    keep = np.concatenate([[True], rng.rand(n - 1) >= gap_probability])
+    restated = rng.rand(n) < restatement_probability
+
+    sf1_art = get_sf1_rows(company, arq, "ART", keep, restated, rng)
+    sf1_arq = get_sf1_rows(company, arq, "ARQ", keep, restated, rng)
+
+    # Nothing is filed after the last price
+    last_date = sep["date"].iloc[-1]
+
+    return sf1_art.loc[sf1_art["datekey"] <= last_date].reset_index(drop=True), sf1_arq.loc[sf1_arq["datekey"] <= last_date].reset_index(drop=True)
+
+
+def get_sf1_rows(company: pd.Series, arq: pd.DataFrame, dimension: str, keep: np.ndarray, restated: np.ndarray, \
+    rng: np.random.RandomState) -> pd.DataFrame:
+    """
+    SF1 rows of $dimension from the quarterly items in $arq, with the derived items (totals, per share values and ratios).
+    """
+    sf1 = arq.copy()
+    flows = ["revenue"] + list(flow_fractions.keys()) + ["dps"]
+
+    if dimension == "ART":
+        sf1[flows] = sf1[flows].rolling(4, min_periods=1).sum() * (4 / np.minimum(np.arange(1, len(sf1) + 1), 4))[:, None]
+
+    sf1["dimension"] = dimension
+    sf1["ticker"] = company["ticker"]
+    sf1["reportperiod"] = sf1["calendardate"] - pd.to_timedelta(rng.randint(0, 4, size=len(sf1)), unit="D")
+
+    sf1 = get_derived_items(sf1, dimension)
+
+    sf1["lastupdated"] = sf1["datekey"]
+    sf1 = sf1[sf1_columns]
+
+    restatements = sf1.loc[restated & keep]
+    numeric = [column for column in sf1_columns[6:] if column not in ["sharefactor", "fxusd"]]
+    restatements = pd.concat([restatements.drop(columns=numeric), restatements[numeric] * rng.uniform(0.95, 1.05, size=(len(restatements), 1))], axis=1)
+    restatements["datekey"] = restatements["datekey"] + pd.to_timedelta(rng.randint(20, 121, size=len(restatements)), unit="D")
+    restatements["lastupdated"] = restatements["datekey"]
+
+    return pd.concat([sf1.loc[keep], restatements[sf1_columns]]).sort_values(by=["calendardate", "datekey"], kind="mergesort")
+
+
+def get_derived_items(sf1: pd.DataFrame, dimension: str) -> pd.DataFrame:
+    """
+    $sf1 with the totals, per share values and ratios of the SF1 columns added.
+    """
+    items = {column: sf1[column] for column in sf1.columns}
+
+    items["gp"] = items["revenue"] - items["cor"]
+    items["opex"] = items["sgna"] + items["rnd"]
+    items["opinc"] = items["gp"] - items["opex"]
+    items["ebit"] = items["opinc"]
+    items["ebitda"] = items["ebit"] + items["depamor"]
+    items["ebt"] = items["ebit"] - items["intexp"]
+    items["taxexp"] = np.maximum(items["ebt"], 0) * 0.25
+    items["netinc"] = items["ebt"] - items["taxexp"]
+    for column in ["consolinc", "netinccmn", "netinccmnusd"]:
+        items[column] = items["netinc"]
+    for column in ["netincdis", "netincnci", "prefdivis", "deposits", "ncfi"]:
+        items[column] = 0.0
+    items["ncfo"] = items["netinc"] + items["depamor"] + items["sbcomp"]
+    items["ncfdiv"] = -items["dps"] * items["sharesbas"]
+    items["ncff"] = items["ncfdebt"] + items["ncfcommon"] + items["ncfdiv"]
+    items["fcf"] = items["ncfo"] + items["capex"]
+    items["ncf"] = items["ncfo"] + items["capex"] + items["ncfbus"] + items["ncfinv"] + items["ncff"] + items["ncfx"]
+
+    items["investments"] = items["investmentsc"] + items["investmentsnc"]
+    items["assetsc"] = items["cashneq"] + items["receivables"] + items["inventory"] + items["investmentsc"]
+    items["assetsnc"] = items["assets"] - items["assetsc"]
+    items["tangibles"] = items["assets"] - items["intangibles"]
+    items["debt"] = items["debtc"] + items["debtnc"]
+    items["liabilitiesc"] = items["payables"] + items["deferredrev"] + items["debtc"]
+    items["liabilitiesnc"] = items["debtnc"] + items["taxliabilities"]
+    items["liabilities"] = items["liabilitiesc"] + items["liabilitiesnc"]
+    items["equity"] = items["assets"] - items["liabilities"]
+    items["workingcapital"] = items["assetsc"] - items["liabilitiesc"]
+    items["invcap"] = items["debt"] + items["equity"] - items["cashneq"]
+    for column in ["cashnequsd", "debtusd", "equityusd", "revenueusd", "ebitusd", "ebitdausd"]:
+        items[column] = items[column[:-3]]
+
+    for column in ["assetsavg", "equityavg", "invcapavg"]:
+        items[column] = items[column[:-3]].rolling(4 if dimension == "ART" else 2, min_periods=1).mean()
+
+    items["sharefactor"] = 1.0
+    items["fxusd"] = 1.0
+    items["shareswa"] = np.round(items["sharesbas"] * 0.995)
+    items["shareswadil"] = np.round(items["sharesbas"] * 1.01)
+    items["eps"] = items["netinc"] / items["shareswa"]
+    items["epsdil"] = items["netinc"] / items["shareswadil"]
+    items["epsusd"] = items["eps"]
+    items["bvps"] = items["equity"] / items["shareswa"]
+    items["tbvps"] = (items["tangibles"] - items["liabilities"]) / items["shareswa"]
+    items["sps"] = items["revenue"] / items["shareswa"]
+    items["fcfps"] = items["fcf"] / items["shareswa"]
+
+    items["marketcap"] = items["price"] * items["sharesbas"]
+    items["ev"] = items["marketcap"] + items["debt"] - items["cashneq"]
+    items["evebit"] = items["ev"] / items["ebit"]
+    items["evebitda"] = items["ev"] / items["ebitda"]
+    items["pb"] = items["marketcap"] / items["equity"]
+    items["pe"] = items["marketcap"] / items["netinc"]
+    items["pe1"] = items["price"] / items["eps"]
+    items["ps"] = items["marketcap"] / items["revenue"]
+    items["ps1"] = items["price"] / items["sps"]
+    items["divyield"] = items["dps"] / items["price"]
+    items["payoutratio"] = items["dps"] / items["eps"]
+    items["currentratio"] = items["assetsc"] / items["liabilitiesc"]
+    items["de"] = items["liabilities"] / items["equity"]
+    items["grossmargin"] = items["gp"] / items["revenue"]
+    items["netmargin"] = items["netinc"] / items["revenue"]
+    items["ebitdamargin"] = items["ebitda"] / items["revenue"]
+    items["ros"] = items["ebit"] / items["revenue"]
+
+    # Return and turnover ratios are only reported for ART
+    ratios = {"roa": ("netinc", "assetsavg"), "roe": ("netinc", "equityavg"), "roic": ("ebit", "invcapavg"), "assetturnover": ("revenue", "assetsavg")}
+    for column, (numerator, denominator) in ratios.items():
+        items[column] = (items[numerator] / items[denominator]) if dimension == "ART" else np.nan
+
+    return pd.DataFrame(items)
+
+
+def generate_tb_rate(dates: pd.DatetimeIndex, rng: np.random.RandomState) -> pd.DataFrame:
+    """
+    Daily 3 month T-bill rates, a random walk between 0 and 8%.
+    """
+    rate = np.clip(0.03 + np.cumsum(rng.normal(0, 0.0005, size=len(dates))), 0, 0.08)
+
+    return pd.DataFrame({"date": dates, "rate": np.round(rate, 4)})
+
+
+def get_synthetic_paths(path: str) -> dict:
+    """
+    Paths of the files written by write_synthetic_sharadar to the directory $path, by name.
+    """
+    file_names = {"sep": "SEP.csv", "sf1_art": "SF1_ART.csv", "sf1_arq": "SF1_ARQ.csv", "metadata": "METADATA.csv", "tb_rate": "t_bill_rate_3m.csv"}
+
+    return {name: os.path.join(path, file_name) for name, file_name in file_names.items()}
+
+
+def write_synthetic_sharadar(path: str, num_tickers: int, years: int=10, end="2019-12-31", num_industries: int=50, \
+    dividend_frequency: int=4, gap_probability: float=0.02, restatement_probability: float=0.05, seed: int=0, \
+    batch_tickers: int=500) -> dict:
+    """
+    Writes SEP.csv, SF1_ART.csv, SF1_ARQ.csv, METADATA.csv and t_bill_rate_3m.csv for $num_tickers tickers and $years years
+    up to $end to the directory $path. Returns the paths by name (sep, sf1_art, sf1_arq, metadata, tb_rate).
+    The same arguments give the same files.
+    """
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    rng = np.random.RandomState(seed)
+    dates = get_trading_days(pd.Timestamp(end) - pd.DateOffset(years=years), end)
+
+    paths = get_synthetic_paths(path)
+
+    metadata = generate_metadata(num_tickers, num_industries, dates, rng)
+    metadata.to_csv(paths["metadata"], index=False, date_format="%Y-%m-%d")
+    generate_tb_rate(dates, rng).to_csv(paths["tb_rate"], index=False, date_format="%Y-%m-%d")
+
+    market, industries = generate_factor_returns(num_industries, dates, rng)
+
+    for batch_start in range(0, num_tickers, batch_tickers):
+        seps, arts, arqs = [], [], []
+        for _, company in metadata.iloc[batch_start:batch_start + batch_tickers].iterrows():
+            sep = generate_sep(company, dates, market, industries, dividend_frequency, rng)
+            sf1_art, sf1_arq = generate_sf1(company, sep, gap_probability, restatement_probability, rng)
+            seps.append(sep)
+            arts.append(sf1_art)
+            arqs.append(sf1_arq)
+
+        first_batch = (batch_start == 0)
+        for name, frames in [("sep", seps), ("sf1_art", arts), ("sf1_arq", arqs)]:
+            pd.concat(frames, ignore_index=True).to_csv(paths[name], index=False, mode="w" if first_batch else "a", \
+                header=first_batch, date_format="%Y-%m-%d")
+
+    return paths
@@ -0,0 +1,64 @@
+import pandas as pd
+import pytest
+
+from ..dataset_exploration import report_gaps, report_updates, report_duplicate_datekeys, report_date_relationship, \
+    report_all_gaps, report_all_updates, report_all_duplicate_datekeys, report_all_date_relationships, compare_report_runtimes
+
+
+sf1_arq = None
+
+@pytest.fixture(scope='module', autouse=True)
+def setup():
+    global sf1_arq
+    sf1_arq = pd.read_csv("../datasets/testing/sf1_arq.csv", parse_dates=["calendardate", "datekey", "reportperiod"])
+
+    # Add a gap over 4 quarters, an updated calendardate and a duplicated datekey
+    sf1_arq = sf1_arq.loc[~((sf1_arq["ticker"] == "FCX") & (sf1_arq["calendardate"].dt.year == 2010))]
+    update = sf1_arq.loc[sf1_arq["ticker"] == "AAPL"].iloc[[10]].copy()
+    update["datekey"] = update["datekey"] + pd.Timedelta(days=20)
+    duplicate = sf1_arq.loc[sf1_arq["ticker"] == "NTK"].iloc[[3]].copy()
+    sf1_arq = pd.concat([sf1_arq, update, duplicate]).sort_values(by=["ticker", "calendardate"], kind="mergesort")
+
+    yield
+
+
+def per_ticker(report, sf1, index_col=None):
+    reports = [report(sf1_ticker.set_index(index_col) if index_col else sf1_ticker.copy()) for _, sf1_ticker in sf1.groupby("ticker")]
+    return pd.concat(reports)
+
+
+def test_report_all_gaps():
+    report = report_all_gaps(sf1_arq)
+    expected = per_ticker(report_gaps, sf1_arq.copy(), "calendardate").dropna(subset=["ticker"])
+
+    assert report["ticker"].tolist() == expected["ticker"].tolist()
+    assert report["gaps over 1q"].tolist() == expected["gaps over 1q"].tolist()
+    assert report["gaps over 4q"].tolist() == expected["gaps over 4q"].fillna(0).tolist()
+    assert report.set_index("ticker").at["FCX", "gaps over 4q"] == 1
+
+
+def test_report_all_updates():
+    report = report_all_updates(sf1_arq)
+    expected = per_ticker(report_updates, sf1_arq, "calendardate")
+
+    assert set(zip(report["ticker"], report["calendardate"], report["count"])) == \
+        set(zip(expected["ticker"], expected["calendardate"], expected["count"]))
+    assert len(report) == 3
+
+
+def test_report_all_duplicate_datekeys_and_date_relationships():
+    duplicates = report_all_duplicate_datekeys(sf1_arq)
+    expected = per_ticker(report_duplicate_datekeys, sf1_arq)
+    pd.testing.assert_frame_equal(duplicates, expected, check_names=False)
+    assert duplicates[0].tolist() == [False, False, True]
+
+    date_relationships = report_all_date_relationships(sf1_arq)
+    expected = per_ticker(report_date_relationship, sf1_arq)
+    pd.testing.assert_frame_equal(date_relationships, expected.astype(bool), check_names=False)
+
+
+def test_compare_report_runtimes():
+    runtimes = compare_report_runtimes(sf1_arq)
+
+    assert list(runtimes.index) == ["gap_report", "update_report", "duplicates_report", "date_relationship_report"]
+    assert (runtimes["whole_universe"] > 0).all()
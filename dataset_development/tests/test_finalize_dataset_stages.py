@@ -0,0 +1,205 @@
+import pandas as pd
+import pytest
+import numpy as np
+import sys, os
+
+myPath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(myPath, ".."))
+
+from finalize_dataset import fix_nans_and_drop_rows, feature_scaling, scale_samples, rank_columns, write_partitioned_dataset, \
+    upsert_partitioned_dataset, get_imputation_moments, impute_and_scale
+from helpers.grouped_moments import GroupedMoments
+
+"""
+Tests of the finalize_dataset stages on small synthetic datasets. test_finalize_dataset.py reads the Consumer
+Electronics dataset and the Sharadar metadata.
+"""
+
+
+def test_fix_nans_and_drop_rows_is_reproducible():
+    rng = np.random.default_rng(0)
+    nr_of_rows = 400
+
+    dataset = pd.DataFrame({
+        "industry": rng.choice(["Banks", "Copper"], nr_of_rows),
+        "size": rng.choice(["nano", "mid", "mega"], nr_of_rows),
+        "mom24m": 1.0, "primary_label_tbm": 1, "return_1m": 0.1, "erp_1m": 0.1,
+        "age": rng.integers(0, 200, nr_of_rows),
+        "bm": rng.normal(5, 2, nr_of_rows),
+        "ep": rng.normal(-3, 1, nr_of_rows),
+    })
+    dataset.loc[rng.random(nr_of_rows) < 0.2, "bm"] = np.nan
+    dataset.loc[dataset["size"] == "mega", "ep"] = np.nan # No industry or market moments, filled from a standard normal
+
+    features = ["bm", "ep"]
+    size_rvs = GroupedMoments.from_dataframe(dataset, features, ["size"])
+
+    fixed = fix_nans_and_drop_rows(dataset, metadata=None, features=features, size_rvs=size_rvs, seed=1)
+
+    assert fixed[features].isnull().sum().sum() == 0
+    assert (fixed.age <= 180).all()
+
+    # Existing values are kept
+    known = dataset.loc[fixed.index, "bm"].notnull()
+    assert fixed.loc[known[known].index, "bm"].equals(dataset.loc[known[known].index, "bm"])
+
+    # Same seed gives the same values, also when the dataset is split by industry (as in the engine)
+    assert fixed.equals(fix_nans_and_drop_rows(dataset, metadata=None, features=features, size_rvs=size_rvs, seed=1))
+
+    fixed_per_industry = pd.concat([fix_nans_and_drop_rows(dataset_industry, metadata=None, features=features, size_rvs=size_rvs, seed=1) \
+        for _, dataset_industry in dataset.groupby("industry")]).sort_index()
+    assert fixed.equals(fixed_per_industry)
+
+    assert not fixed.equals(fix_nans_and_drop_rows(dataset, metadata=None, features=features, size_rvs=size_rvs, seed=2))
+
+
+def test_feature_scaling():
+    rng = np.random.default_rng(0)
+    nr_of_rows = 300
+
+    dataset = pd.DataFrame({
+        "ticker": rng.choice(["AAPL", "MSFT", "NTK"], nr_of_rows),
+        "date": rng.choice(pd.date_range("2010-01-01", periods=20, freq="M"), nr_of_rows),
+        "bm": rng.normal(5, 2, nr_of_rows),
+        "ep": rng.standard_t(2, nr_of_rows),
+        "erp_1m": rng.normal(0, 0.1, nr_of_rows),
+    })
+    dataset.loc[0, "ep"] = 1e6 # Outlier
+    dataset.loc[1, "bm"] = np.nan
+    features = ["bm", "ep"]
+
+    values = np.array([[3, 1, np.nan], [1, 1, 2], [2, 1, np.nan], [3, 5, 1]])
+    assert np.array_equal(rank_columns(values), pd.DataFrame(values).rank().values, equal_nan=True)
+
+    ranked = feature_scaling(dataset, features, method="rank")
+
+    assert (ranked[features].dtypes == np.float32).all()
+    assert ranked["erp_1m"].equals(dataset["erp_1m"])
+    assert np.isnan(ranked.loc[1, "bm"])
+    assert ranked[features].min().min() == -1
+    assert ranked[features].max().max() == 1
+
+    date_dataset = dataset.loc[dataset.date == dataset.loc[0, "date"]]
+    expected = (date_dataset["ep"].rank() - 1) / (date_dataset["ep"].count() - 1) * 2 - 1
+    assert np.allclose(ranked.loc[date_dataset.index, "ep"], expected)
+
+    standardized = feature_scaling(dataset, features, method="zscore", limits=(0.05, 0.95))
+
+    winsorized = date_dataset["ep"].clip(date_dataset["ep"].quantile(0.05), date_dataset["ep"].quantile(0.95))
+    expected = (winsorized - winsorized.mean()) / winsorized.std()
+    assert np.allclose(standardized.loc[date_dataset.index, "ep"], expected, atol=1e-6)
+    assert np.allclose(standardized.groupby("date")[features].mean(), 0, atol=1e-6)
+
+    with pytest.raises(ValueError):
+        feature_scaling(dataset, features, method="minmax")
+
+
+def test_scale_samples():
+    dataset = pd.DataFrame({
+        "ticker": ["AAPL", "MSFT", "NTK", "FCX", "AAPL", "MSFT"],
+        "date": pd.to_datetime(["2010-01-29", "2010-01-29", "2010-01-29", "2010-01-29", "2010-02-26", "2010-02-26"]),
+        "bm": [4.0, 1.0, 3.0, 2.0, 1.0, 2.0],
+        "sin": [1, 0, 0, 1, 0, 0],
+        "ps": [7, 2, 5, 9, 3, 4],
+        "primary_label_tbm": [1, -1, 0, 1, 1, 0],
+    })
+
+    scaled = scale_samples(dataset, ["bm", "sin", "ps"], method="rank")
+
+    # Samples without a side are dropped before the ranks of their date are calculated
+    assert list(scaled.index) == [0, 1, 3, 4]
+    assert list(scaled["bm"]) == [1, -1, 0, 0]
+    # Flags and scores are not scaled, the models use scaled copies of them
+    assert scaled["sin"].equals(dataset.loc[scaled.index, "sin"])
+    assert scaled["ps"].equals(dataset.loc[scaled.index, "ps"])
+    assert list(scaled["ps_scaled"]) == [0, -1, 1, 0]
+    assert list(scaled["sin_scaled"]) == [0.5, -1, 0.5, 0]
+
+
+def test_write_partitioned_dataset(tmp_path):
+    pytest.importorskip("pyarrow")
+    sys.path.insert(0, os.path.join(myPath, "../.."))
+    from dataset_columns import load_ml_dataset, get_feature_matrix
+
+    rng = np.random.default_rng(0)
+    nr_of_rows = 200
+
+    dataset = pd.DataFrame({
+        "ticker": rng.choice(["AAPL", "MSFT", "NTK"], nr_of_rows),
+        "date": rng.choice(pd.date_range("2008-01-01", "2011-12-31", freq="D"), nr_of_rows),
+        "bm": rng.normal(0, 1, nr_of_rows).astype(np.float32),
+        "ep": rng.normal(0, 1, nr_of_rows).astype(np.float32),
+        "erp_1m": rng.normal(0, 0.1, nr_of_rows),
+    })
+    path = str(tmp_path / "ml_dataset")
+
+    write_partitioned_dataset(dataset, path)
+    write_partitioned_dataset(dataset, path) # Replaces, does not add to the previous dataset
+
+    loaded = load_ml_dataset(path=path)
+    assert len(loaded) == nr_of_rows
+    assert set(loaded.columns) == set(["ticker", "bm", "ep", "erp_1m"])
+
+    start = pd.to_datetime("2009-06-15")
+    end = pd.to_datetime("2010-03-01")
+    loaded = load_ml_dataset(columns=["ticker", "bm", "ep"], start=start, end=end, path=path)
+    expected = dataset.loc[(dataset.date >= start) & (dataset.date <= end)].sort_values(by=["date", "ticker"]).set_index("date")
+
+    assert list(loaded.columns) == ["ticker", "bm", "ep"]
+    assert loaded.index.equals(expected.index)
+    assert loaded["ticker"].tolist() == expected["ticker"].tolist()
+
+    feature_matrix = get_feature_matrix(loaded, ["bm", "ep"])
+    assert feature_matrix.dtype == np.float32
+    assert feature_matrix.flags["C_CONTIGUOUS"]
+    assert np.array_equal(feature_matrix, expected[["bm", "ep"]].values)
+
+
+def test_impute_and_scale_one_year():
+    rng = np.random.default_rng(0)
+    nr_of_rows = 600
+
+    dataset = pd.DataFrame({
+        "ticker": rng.choice(["A", "B", "C", "D"], nr_of_rows),
+        "date": rng.choice(pd.date_range("2017-01-02", periods=8, freq="90D"), nr_of_rows),
+        "industry": rng.choice(["Banks", "Copper"], nr_of_rows),
+        "size": rng.choice(["nano", "mid"], nr_of_rows),
+        "mom24m": 1.0, "primary_label_tbm": rng.choice([-1, 1], nr_of_rows), "return_1m": 0.1,
+        "erp_1m": rng.normal(0, 0.1, nr_of_rows),
+        "age": rng.integers(0, 200, nr_of_rows),
+        "bm": rng.normal(5, 2, nr_of_rows),
+        "ep": rng.normal(-3, 1, nr_of_rows),
+    })
+    dataset.loc[rng.random(nr_of_rows) < 0.3, "bm"] = np.nan
+    dataset["year"] = dataset["date"].dt.year
+    industries = pd.DataFrame({"ticker": ["A", "B"], "industry": ["Banks", "Copper"]})
+
+    features = ["bm", "ep"]
+    moments = get_imputation_moments(dataset, features)
+    full = impute_and_scale(dataset, industries, features, moments, num_processes=1)
+
+    # The rows of one year finalized on their own, with the moments of all years, are the same as in the full dataset
+    year = impute_and_scale(dataset.loc[dataset["year"] == 2018], industries, features, moments, num_processes=1)
+
+    assert len(year) > 0
+    pd.testing.assert_frame_equal(year.sort_index(), full.loc[full["date"].dt.year == 2018].sort_index())
+
+
+def test_upsert_partitioned_dataset(tmp_path):
+    pytest.importorskip("pyarrow")
+
+    dates = pd.date_range("2009-11-01", "2010-02-28", freq="D")
+    dataset = pd.DataFrame({"ticker": "AAPL", "date": dates, "bm": np.arange(len(dates), dtype=np.float32)})
+    path = str(tmp_path / "ml_dataset")
+    write_partitioned_dataset(dataset.loc[dataset.date < "2010-02-01"], path)
+
+    start = pd.to_datetime("2009-12-15")
+    updated = dataset.loc[dataset.date >= start].copy()
+    updated["bm"] = -1
+
+    upsert_partitioned_dataset(updated, path, start, dates[-1])
+
+    loaded = pd.read_parquet(path).sort_values(by="date")
+    assert loaded["date"].tolist() == list(dates)
+    assert (loaded.loc[loaded.date < start, "bm"] >= 0).all()
+    assert (loaded.loc[loaded.date >= start, "bm"] == -1).all()
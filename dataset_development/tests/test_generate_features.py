@@ -20,6 +20,13 @@ from labeling import add_labels_via_triple_barrier_method, equity_risk_premium_l
 save_path = ""
 cache_dir = ""
 
+# Columns calculated from the float32 prices of add_sep_panel_features (see helpers/panel_store.py), and the labels
+# calculated from them. They differ from the float64 calculation by up to about 5e-7, which is a large relative
+# difference for returns close to zero, so they are compared with an absolute tolerance.
+panel_columns = ["mom1w", "mom12m_actual", "mom1w_ewa_market", "indmom", "return_1m", "return_2m", "return_3m", "mom1m", \
+    "mom6m", "mom12m", "mom24m", "chmom", "erp_1m", "erp_2m", "erp_3m"]
+panel_atol = 1e-6
+
 
 
 @pytest.fixture(scope='module', autouse=True)
@@ -125,9 +132,7 @@ def test_sep_featured():
 
     tbm_labeled_sep.sort_values(by=["ticker", "date"], ascending=True, inplace=True)
 
-    erp_labeled_sep = pandas_mp_engine(callback=equity_risk_premium_labeling, atoms=tbm_labeled_sep, \
-        data=None, molecule_key='sep_featured', split_strategy= 'ticker', \
-            num_processes=num_processes, molecules_per_process=1, tb_rate=tb_rate)
+    erp_labeled_sep = equity_risk_premium_labeling(tbm_labeled_sep, tb_rate)
 
     erp_labeled_sep.sort_values(by=["ticker", "date"], ascending=True, inplace=True)
 
@@ -166,6 +171,11 @@ def test_sep_featured():
     eq_result.to_csv("./testing_datasets/eq_result_sep_featured.csv")
     """
 
+    # generate_sep_featured only reads the SEP columns its tasks use (see "columns": "infer"), so the raw columns no task
+    # reads (high, low, closeunadj, lastupdated) are not passed through
+    assert set(sep_featured_2.columns) <= set(sep_featured.columns)
+    sep_featured = sep_featured[sep_featured_2.columns]
+
     assert sep_featured.shape[0] == sep_featured_2.shape[0]
     assert sep_featured.shape[1] == sep_featured_2.shape[1]
     
@@ -194,7 +204,8 @@ def test_sep_featured():
                     pos = (index, column)
                     errors.append(pos)
             else:
-                if correct_val != pytest.approx(sep_featured_2.iloc[index][column]):
+                atol = panel_atol if column in panel_columns else None
+                if correct_val != pytest.approx(sep_featured_2.iloc[index][column], abs=atol):
                     failed = True
                     pos = (index, column)
                     errors.append(pos)
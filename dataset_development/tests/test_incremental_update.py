@@ -0,0 +1,220 @@
+import os
+import pandas as pd
+import pytest
+import numpy as np
+
+from ..incremental_update import get_changed_rows, get_sf1_windows, get_sep_window, get_sep_windows, get_sf1_changes, \
+    update_sf1_featured, update_sep_featured, update_ml_dataset, check_parity, label_horizon, sf1_sampling_margin, \
+    sep_sf1_art_columns
+from ..helpers.columnar_store import merge_csv_into_ticker_sorted_parquet, read_changes
+from ..sf1_features import add_sf1_features_for_all_tickers
+from ..sf1_industry_features import add_industry_sf1_features
+from ..synthetic_data import write_synthetic_sharadar
+
+
+sf1_art = None
+sf1_arq = None
+metadata = None
+
+keys = ["ticker", "calendardate", "datekey"]
+
+@pytest.fixture(scope='module', autouse=True)
+def setup():
+    global sf1_art, sf1_arq, metadata
+    sf1_art = pd.read_csv("../datasets/testing/sf1_art.csv", parse_dates=["calendardate", "datekey"], index_col="calendardate")
+    sf1_arq = pd.read_csv("../datasets/testing/sf1_arq.csv", parse_dates=["calendardate", "datekey"], index_col="calendardate")
+
+    # AAPL and NTK in the same industry, so industry features of peers are updated as well
+    metadata = pd.DataFrame({
+        "ticker": ["AAPL", "NTK", "FCX"],
+        "industry": ["Consumer Electronics", "Consumer Electronics", "Copper"],
+        "firstpricedate": pd.Timestamp("1990-01-02"),
+    })
+
+    yield
+
+
+def generate_sf1_featured(sf1_art, sf1_arq):
+    # Same steps as generate_sf1_featured, without the engine
+    sf1_featured = add_sf1_features_for_all_tickers(sf1_art.copy(), sf1_arq.copy(), metadata)
+    sf1_featured = add_industry_sf1_features(sf1_featured, metadata).reset_index()
+
+    return sf1_featured.sort_values(by=keys, kind="mergesort").set_index("calendardate")
+
+
+def test_get_changed_rows():
+    old = pd.DataFrame({"ticker": ["A", "A", "B"], "date": pd.to_datetime(["2019-01-02", "2019-01-03", "2019-01-02"]), \
+        "close": [1.0, np.nan, 3.0]})
+    new = pd.DataFrame({"ticker": ["A", "A", "B", "B"], "date": pd.to_datetime(["2019-01-02", "2019-01-03", "2019-01-02", "2019-01-03"]), \
+        "close": [1.0, np.nan, 3.5, 4.0]})
+
+    changed = get_changed_rows(old, new, ["ticker", "date"])
+
+    assert list(zip(changed.ticker, changed.date)) == [("B", pd.Timestamp("2019-01-02")), ("B", pd.Timestamp("2019-01-03"))]
+    assert len(get_changed_rows(new, new, ["ticker", "date"])) == 0
+    assert len(get_changed_rows(new, old, ["ticker", "date"])) == 2 # Removed rows
+
+
+def test_get_windows():
+    changed = pd.DataFrame({"ticker": ["AAPL", "AAPL"], "calendardate": pd.to_datetime(["2010-03-31", "2012-12-31"])})
+    windows = get_sf1_windows(changed)
+
+    assert windows.loc["AAPL", "start"] == pd.Timestamp("2010-03-31")
+    assert windows.loc["AAPL", "end"] == pd.Timestamp("2015-06-30")
+    assert windows.loc["AAPL", "input_start"] == pd.Timestamp("2006-09-30")
+
+    changed = pd.DataFrame({"ticker": ["AAPL", "MSFT"], "date": pd.to_datetime(["2018-06-01", "2018-06-04"])})
+    start, end, input_start = get_sep_window(changed, pd.Timestamp("2018-12-31"))
+
+    assert start == pd.Timestamp("2018-06-01") - label_horizon
+    assert end == pd.Timestamp("2018-12-31")
+    assert input_start == start - pd.DateOffset(years=5)
+
+
+def test_update_sf1_featured_with_new_filings():
+    cutoff = pd.Timestamp("2015-06-01")
+    sf1_art_old = sf1_art.loc[sf1_art.datekey < cutoff]
+    sf1_arq_old = sf1_arq.loc[sf1_arq.datekey < cutoff]
+
+    changed = pd.concat([get_sf1_changes(sf1_art_old, sf1_art), get_sf1_changes(sf1_arq_old, sf1_arq)])
+    sf1_featured = update_sf1_featured(generate_sf1_featured(sf1_art_old, sf1_arq_old), changed, sf1_art, sf1_arq, metadata)
+
+    assert len(check_parity(sf1_featured, generate_sf1_featured(sf1_art, sf1_arq), keys)) == 0
+
+
+def test_update_sf1_featured_with_restatement():
+    sf1_art_restated = sf1_art.copy()
+    sf1_art_restated.loc[(sf1_art_restated.ticker == "AAPL") & (sf1_art_restated.index == "2009-12-31"), "revenueusd"] *= 1.1
+
+    sf1_featured_old = generate_sf1_featured(sf1_art, sf1_arq)
+    sf1_featured_full = generate_sf1_featured(sf1_art_restated, sf1_arq)
+
+    sf1_featured = update_sf1_featured(sf1_featured_old, get_sf1_changes(sf1_art, sf1_art_restated), sf1_art_restated, \
+        sf1_arq, metadata)
+
+    assert len(check_parity(sf1_featured, sf1_featured_full, keys)) == 0
+    assert len(check_parity(sf1_featured_old, sf1_featured_full, keys)) > 0
+
+
+def test_get_sep_windows():
+    changed_sep = pd.DataFrame({"ticker": ["AAPL"], "date": pd.to_datetime(["2018-06-01"])})
+    changed_sf1_art = pd.DataFrame({"ticker": ["NTK", "NTK"], "datekey": pd.to_datetime(["2015-05-04", "2016-05-04"])})
+    last_date = pd.Timestamp("2018-12-31")
+
+    windows = get_sep_windows(changed_sep.iloc[:0], changed_sf1_art, ["AAPL", "NTK"], last_date)
+
+    # A changed filing only affects its ticker, from its datekey on
+    assert list(windows.index) == ["NTK"]
+    assert windows.loc["NTK", "start"] == pd.Timestamp("2015-05-04") - sf1_sampling_margin
+    assert windows.loc["NTK", "end"] == last_date
+    assert windows.loc["NTK", "input_start"] == windows.loc["NTK", "start"] - pd.DateOffset(years=5)
+
+    # Changed prices affect all tickers
+    windows = get_sep_windows(changed_sep, changed_sf1_art, ["AAPL", "NTK"], last_date)
+    start, end, input_start = get_sep_window(changed_sep, last_date)
+
+    assert (windows.loc["AAPL"] == [start, end, input_start]).all()
+    assert windows.loc["NTK", "start"] == pd.Timestamp("2015-05-04") - sf1_sampling_margin
+
+    assert len(get_sep_windows(changed_sep.iloc[:0], changed_sf1_art.iloc[:0], ["AAPL"], last_date)) == 0
+
+
+def generate_sep_featured_from(path, sep, sf1_art, metadata, tb_rate):
+    from ..generate_features import generate_sep_featured
+
+    os.makedirs(os.path.join(path, "molecules_cache"))
+    sep.to_csv(os.path.join(path, "sep.csv"))
+    sf1_art.to_csv(os.path.join(path, "sf1_art.csv"))
+    metadata.to_csv(os.path.join(path, "metadata.csv"), index=False)
+
+    return generate_sep_featured(num_processes=1, cache_dir=os.path.join(path, "molecules_cache"), tb_rate=tb_rate, \
+        sep_path=os.path.join(path, "sep.csv"), sf1_art_path=os.path.join(path, "sf1_art.csv"), \
+            metadata_path=os.path.join(path, "metadata.csv"), resume=False)
+
+
+@pytest.fixture(scope="module")
+def synthetic(tmpdir_factory):
+    paths = write_synthetic_sharadar(str(tmpdir_factory.mktemp("synthetic")), 6, years=4, restatement_probability=0.2)
+
+    return {
+        "sep": pd.read_csv(paths["sep"], parse_dates=["date"], index_col="date"),
+        "sf1_art": pd.read_csv(paths["sf1_art"], parse_dates=["calendardate", "datekey"], index_col="calendardate"),
+        "sf1_arq": pd.read_csv(paths["sf1_arq"], parse_dates=["calendardate", "datekey"], index_col="calendardate"),
+        "metadata": pd.read_csv(paths["metadata"], parse_dates=["firstpricedate"]),
+        "tb_rate": pd.read_csv(paths["tb_rate"], parse_dates=["date"], index_col="date"),
+    }
+
+
+def check_sep_featured_update(tmpdir, synthetic, sep_old, sf1_art_old, changed_sep, changed_sf1_art):
+    sep, sf1_art, metadata, tb_rate = synthetic["sep"], synthetic["sf1_art"], synthetic["metadata"], synthetic["tb_rate"]
+
+    sep_featured_old = generate_sep_featured_from(str(tmpdir.mkdir("old")), sep_old, sf1_art_old, metadata, tb_rate)
+    sep_featured_full = generate_sep_featured_from(str(tmpdir.mkdir("full")), sep, sf1_art, metadata, tb_rate)
+
+    sep_featured = update_sep_featured(sep_featured_old, changed_sep, changed_sf1_art, sep, sf1_art, metadata, tb_rate, \
+        num_processes=1, work_dir=str(tmpdir.mkdir("incremental")))
+
+    # New dividends rescale the adjusted prices, the returns of the rescaled prices round differently in the float32 panel
+    assert len(check_parity(sep_featured, sep_featured_full, ["ticker", "date"], rtol=1e-6, atol=1e-6)) == 0
+    assert len(check_parity(sep_featured_old, sep_featured_full, ["ticker", "date"], rtol=1e-6, atol=1e-6)) > 0
+
+
+def test_update_sep_featured_with_new_prices(tmpdir, synthetic):
+    sep = synthetic["sep"]
+    sep_old = sep.loc[sep.index < sep.index.max() - pd.DateOffset(months=2)]
+
+    # The new prices are read from the changes of the ingest of the full export into the store of the old one
+    store = str(tmpdir.join("SEP_PURGED.parquet"))
+    sep_old.to_csv(str(tmpdir.join("sep_old.csv")))
+    sep.to_csv(str(tmpdir.join("sep.csv")))
+    merge_csv_into_ticker_sorted_parquet(str(tmpdir.join("sep_old.csv")), store, keys=["ticker", "date"], parse_dates=["date"])
+    merge_csv_into_ticker_sorted_parquet(str(tmpdir.join("sep.csv")), store, keys=["ticker", "date"], parse_dates=["date"])
+
+    changed_sep = read_changes(store, since=1)
+    assert len(changed_sep) == len(get_changed_rows(sep_old.reset_index(), sep.reset_index(), ["ticker", "date"]))
+
+    check_sep_featured_update(tmpdir, synthetic, sep_old, synthetic["sf1_art"], changed_sep, \
+        pd.DataFrame(columns=["ticker", "datekey"]))
+
+
+def test_update_sep_featured_with_restated_shares(tmpdir, synthetic):
+    sf1_art = synthetic["sf1_art"]
+
+    # The shares of a (not restated) filing in the middle of one ticker's history are restated
+    ticker = sf1_art["ticker"].iloc[0]
+    restated = sf1_art.reset_index().duplicated(subset=["ticker", "calendardate"], keep=False).values
+    filings = np.flatnonzero((sf1_art["ticker"] == ticker).values & ~restated)
+    sf1_art_old = sf1_art.copy()
+    sf1_art_old.iloc[filings[len(filings) // 2], sf1_art_old.columns.get_loc("sharesbas")] *= 0.5
+
+    check_sep_featured_update(tmpdir, synthetic, synthetic["sep"], sf1_art_old, pd.DataFrame(columns=["ticker", "date"]), \
+        get_sf1_changes(sf1_art_old, sf1_art, sep_sf1_art_columns))
+
+
+def test_update_ml_dataset(tmpdir, synthetic):
+    from ..finalize_dataset import finalize_dataset, write_partitioned_dataset
+
+    metadata = synthetic["metadata"]
+    sep_featured = generate_sep_featured_from(str(tmpdir.mkdir("sep")), synthetic["sep"], synthetic["sf1_art"], metadata, \
+        synthetic["tb_rate"])
+    sf1_featured = add_sf1_features_for_all_tickers(synthetic["sf1_art"].copy(), synthetic["sf1_arq"].copy(), metadata)
+    sf1_featured = add_industry_sf1_features(sf1_featured, metadata)
+
+    # Changed and missing values in the samples of the last months
+    start = sep_featured.index.max() - pd.DateOffset(months=4)
+    sep_featured_new = sep_featured.copy()
+    sep_featured_new.loc[sep_featured_new.index >= start, "dolvol"] *= 2
+    sep_featured_new.iloc[np.flatnonzero(sep_featured_new.index >= start)[::2], sep_featured_new.columns.get_loc("ill")] = np.nan
+
+    path = str(tmpdir.join("ml_dataset"))
+    moments_path = str(tmpdir.join("ml_dataset_moments.pickle"))
+    write_partitioned_dataset(finalize_dataset(metadata, sep_featured.reset_index(), sf1_featured.reset_index(), num_processes=1, \
+        moments_path=moments_path), path)
+
+    update_ml_dataset(sep_featured_new, sf1_featured, metadata, start, sep_featured.index.max(), path, moments_path, num_processes=1)
+
+    full = finalize_dataset(metadata, sep_featured_new.reset_index(), sf1_featured.reset_index(), num_processes=1)
+    updated = pd.read_parquet(path).drop("year", axis=1)
+
+    assert len(full.loc[full["date"] >= start]) > 0
+    assert len(check_parity(updated.set_index(["ticker", "date"]), full.set_index(["ticker", "date"]), ["ticker", "date"])) == 0
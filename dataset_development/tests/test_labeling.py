@@ -1,4 +1,5 @@
 import pandas as pd
+import numpy as np
 import pytest
 import math
 from dateutil.relativedelta import *
@@ -8,7 +9,8 @@ import plotly.graph_objs as go
 import plotly.tools as tls
 from datetime import datetime
 
-from ..labeling import equity_risk_premium_labeling, add_labels_via_triple_barrier_method
+from ..labeling import equity_risk_premium_labeling, add_labels_via_triple_barrier_method, get_first_touch_positions, \
+    get_event_positions, triple_barrier_sweep, meta_labeling_via_triple_barrier_method, BarrierPathCache
 from ..processing.engine import pandas_mp_engine
 from ..utils.visualization import visualize_triple_barrier_method, candlestick_chart
 from sep_features import dividend_adjusting_prices_backwards
@@ -53,9 +55,7 @@ def test_equity_risk_premium_labeling():
 
     tb_rate = pd.read_csv("../datasets/macro/t_bill_rate_3m.csv", parse_dates=["date"] ,index_col="date", low_memory=False)
 
-    sep_aapl_labeled = pandas_mp_engine(callback=equity_risk_premium_labeling, atoms=sep_featured, \
-        data=None, molecule_key='sep_featured', split_strategy='ticker', \
-                num_processes=1, molecules_per_process=1, tb_rate=tb_rate)
+    sep_aapl_labeled = equity_risk_premium_labeling(sep_featured.loc[sep_featured.ticker == "AAPL"].copy(), tb_rate)
 
     date0 = pd.to_datetime("2013-05-24")
     date1 = date0 + relativedelta(days=30)
@@ -67,6 +67,14 @@ def test_equity_risk_premium_labeling():
 
     assert sep_aapl_labeled.loc[date0]["erp_1m"] == erp_1m
 
+    # Dates without a t-bill rate use the most recent rate before it
+    tb_rate_gaps = tb_rate.drop(index=[date0])
+    sep_labeled_gaps = equity_risk_premium_labeling(sep_featured.copy(), tb_rate_gaps)
+    sep_aapl_gaps = sep_labeled_gaps.loc[sep_labeled_gaps.ticker == "AAPL"]
+    rf_rate_before = tb_rate_gaps.loc[tb_rate_gaps.index < date0].iloc[-1]["rate"] / 3
+
+    assert sep_aapl_gaps.loc[date0]["erp_1m"] == sep_aapl_gaps.loc[date0]["return_1m"] - rf_rate_before
+
     """
     with pd.option_context('display.max_rows', None, 'display.max_columns', None):
         print(sep_aapl_labeled.head(10))
@@ -96,3 +104,86 @@ def test_add_labels_via_triple_barrier_method():
 
     visualize_triple_barrier_method(2, 2, dates, "AAPL", sep_triple_barrier, sep_aapl)
 
+
+
+def test_get_first_touch_positions():
+    close = np.array([10, 10.8, 11.5, 8.5, 12, 7, 10, 10], dtype=np.float64)
+    dates = pd.date_range("2010-01-01", periods=len(close))
+
+    starts, ends = get_event_positions(dates, pd.to_datetime(["2010-01-01", "2010-01-04", "2010-01-07"]), \
+        pd.to_datetime(["2010-01-05", "2010-01-08", "2010-01-08"]))
+
+    assert list(starts) == [0, 3, 6]
+    assert list(ends) == [5, 8, 8]
+
+    take_profit = np.array([0.1, 0.1, 0.1])
+    stop_loss = np.array([-0.05, -0.05, -0.05])
+
+    # Long
+    take_profit_positions, stop_loss_positions = get_first_touch_positions(close, starts, ends, take_profit, stop_loss, np.array([1.0, 1.0, 1.0]))
+
+    assert list(take_profit_positions) == [2, 4, -1]
+    assert list(stop_loss_positions) == [3, 5, -1]
+
+    # Short, and blocks of a single event must give the same result
+    take_profit_positions, stop_loss_positions = get_first_touch_positions(close, starts, ends, take_profit, stop_loss, \
+        np.array([-1.0, -1.0, -1.0]), block_size=1)
+
+    assert list(take_profit_positions) == [3, 5, -1]
+    assert list(stop_loss_positions) == [1, 4, -1]
+
+
+def test_triple_barrier_sweep():
+    sep_aapl_adjusted = dividend_adjusting_prices_backwards(sep.loc[sep.ticker == "AAPL"].copy()).sort_index()
+    sep_featured_aapl = sep_featured.loc[sep_featured.ticker == "AAPL"]
+
+    barrier_grid = [(0.8, -0.8, 1), (1, -1, 1), (1, -1, 3)]
+
+    sweep = triple_barrier_sweep(sep_featured_aapl.copy(), sep_aapl_adjusted, barrier_grid)
+
+    assert len(sweep) == len(barrier_grid) * len(sep_featured_aapl)
+
+    # Configurations with a timeout multiplier of 1 must match the single configuration labeling
+    for take_profit, stop_loss in [(0.8, -0.8), (1, -1)]:
+        labeled = add_labels_via_triple_barrier_method(sep_featured_aapl.copy(), sep_aapl_adjusted, [take_profit, stop_loss], None)
+        config = sweep.loc[(sweep.take_profit == take_profit) & (sweep.stop_loss == stop_loss) & (sweep.timeout_multiplier == 1)]
+
+        assert config["date_of_touch"].equals(labeled["date_of_touch"])
+        assert np.allclose(config["return_tbm"], labeled["return_tbm"], equal_nan=True)
+
+    # A longer vertical barrier can only delay the touch
+    short = sweep.loc[(sweep.take_profit == 1) & (sweep.timeout_multiplier == 1)]
+    long = sweep.loc[(sweep.take_profit == 1) & (sweep.timeout_multiplier == 3)]
+    assert (long["date_of_touch"].values >= short["date_of_touch"].values).all()
+
+    wide = triple_barrier_sweep(sep_featured_aapl.copy(), sep_aapl_adjusted, barrier_grid, long_format=False)
+    assert np.allclose(wide["return_tbm_pt1_sl-1_t3"], long["return_tbm"], equal_nan=True)
+
+
+def test_barrier_path_cache():
+    sep_adjusted = pd.concat([dividend_adjusting_prices_backwards(sep.loc[sep.ticker == ticker].copy()).sort_index() \
+        for ticker in sep_featured.ticker.unique()])
+
+    barrier_path_cache = BarrierPathCache(sep_featured, sep_adjusted)
+
+    # The same cache must give the correct meta labels for any side vector
+    for seed in [0, 1]:
+        dataset = sep_featured.copy()
+        dataset["side_prediction"] = np.random.default_rng(seed).choice([-1, 1], len(dataset))
+
+        meta_labeled = barrier_path_cache.meta_labels(dataset.copy(), ptSl=[1, -0.8])
+
+        for ticker in dataset.ticker.unique():
+            expected = meta_labeling_via_triple_barrier_method(dataset.loc[dataset.ticker == ticker].copy(), \
+                sep_adjusted.loc[sep_adjusted.ticker == ticker], [1, -0.8], None)
+            result = meta_labeled.loc[meta_labeled.ticker == ticker]
+
+            assert result["m_date_of_touch"].equals(expected["m_date_of_touch"])
+            assert np.allclose(result["m_return_tbm"], expected["m_return_tbm"], equal_nan=True)
+            assert np.allclose(result["m_primary_label_tbm"], expected["m_primary_label_tbm"], equal_nan=True)
+
+    with pytest.raises(KeyError):
+        unknown = sep_featured.iloc[:1].copy()
+        unknown["timeout"] = unknown["timeout"] + pd.Timedelta(days=1)
+        unknown["side_prediction"] = 1
+        barrier_path_cache.meta_labels(unknown, ptSl=[1, -0.8])
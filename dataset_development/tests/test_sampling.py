@@ -2,7 +2,6 @@ import pandas as pd
 import pytest
 
 from ..sampling import extend_sep_for_sampling, rebase_at_each_filing_sampling
-from ..dataset import Dataset
 from ..processing.engine import pandas_mp_engine
 
 """
@@ -159,8 +158,6 @@ def test_rebase_at_each_filing_sampling():
     """
 
 
-
-
 @pytest.mark.skip()
 def test_rebase_at_each_filing_sampling_OLD():
     global sep_extended
@@ -209,7 +206,6 @@ def test_rebase_at_each_filing_sampling_OLD():
         index += 1
 
 
-
 @pytest.mark.skip(reason="Not interested in this atm, this test is not completed")
 def test_first_filing_based_sampling():
     global sep_extended
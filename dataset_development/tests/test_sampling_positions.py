@@ -0,0 +1,96 @@
+import pandas as pd
+import numpy as np
+
+from ..sampling import rebase_at_each_filing_sampling, get_rebase_sample_positions, to_day_numbers, cusum_filter_sampling, \
+    get_cusum_event_positions
+
+"""
+Tests of the samplers that only need the testing datasets (/datasets/testing/...). test_sampling.py also reads the
+Sharadar metadata and runs the engine.
+"""
+
+
+def test_rebase_at_each_filing_sampling_many_tickers():
+    sep_extended_csv = pd.read_csv("../datasets/testing/sep_extended.csv", parse_dates=["date", "datekey"], index_col="date", low_memory=False)
+    sep_extended_csv = sep_extended_csv.sort_values(by=["ticker", "date"])
+
+    # All tickers in one call gives the same samples as one call per ticker
+    samples_all = rebase_at_each_filing_sampling(sep_extended_csv.copy(), days_of_distance=20)
+
+    for ticker in ["AAPL", "FCX", "NTK"]:
+        samples_ticker = rebase_at_each_filing_sampling(sep_extended_csv.loc[sep_extended_csv.ticker == ticker].copy(), days_of_distance=20)
+        assert list(samples_all.loc[samples_all.ticker == ticker].index) == list(samples_ticker.index)
+
+    sep_sampled_aapl = samples_all.loc[samples_all.ticker == "AAPL"]
+
+    assert sep_sampled_aapl.index[0] == pd.to_datetime("1997-12-31")
+    assert sep_sampled_aapl.index[1] == pd.to_datetime("1998-02-09")
+    assert sep_sampled_aapl.index[2] == pd.to_datetime("1998-03-09")
+    assert sep_sampled_aapl.index[3] == pd.to_datetime("1998-04-09")
+    assert sep_sampled_aapl.index[4] == pd.to_datetime("1998-05-11")
+    assert sep_sampled_aapl.index[11] == pd.to_datetime("1998-12-23")
+
+    sep_sampled_ntk = samples_all.loc[samples_all.ticker == "NTK"]
+
+    assert sep_sampled_ntk.index[0] == pd.to_datetime("2011-03-31")
+    assert sep_sampled_ntk.index[1] == pd.to_datetime("2011-05-12") # 2011-04-29 is less than 20 days before a new filing and is dropped
+
+
+def test_get_rebase_sample_positions():
+    dates = to_day_numbers(pd.to_datetime(["2010-01-29", "2010-02-01", "2010-02-26", "2010-03-01", "2010-03-15", "2010-03-29", "2010-04-30"]))
+    datekeys = to_day_numbers(pd.to_datetime(["2010-01-20", "2010-01-20", "2010-01-20", "2010-01-20", "2010-03-15", "2010-03-15", "2010-03-15"]))
+
+    positions = get_rebase_sample_positions(dates, datekeys, days_of_distance=20)
+
+    # 2010-03-01 is closest to the desired date (2010-02-28), but is dropped because the filing on 2010-03-15 is less than 20 days later.
+    # Sampling is then based of 2010-03-15, so the next desired date is 2010-04-15 and 2010-04-30 is closer than 2010-03-29.
+    assert list(positions) == [0, 4, 6]
+
+    # Two segments (tickers) are sampled independently
+    positions = get_rebase_sample_positions(np.concatenate([dates, dates]), np.concatenate([datekeys, datekeys]), 20, segment_starts=[7])
+    
+    assert list(positions) == [0, 4, 6, 7, 11, 13]
+
+
+def test_get_cusum_event_positions():
+    values = np.array([np.nan, 0.0, 0.5, 1.2, 1.0, 0.1, -0.2, -0.1, 0.6, 0.7])
+    thresholds = np.array([1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, np.nan, 1.0, 1.0])
+
+    # Up 1.2 from 0.0 at position 3, then down 1.1 from 1.2 at position 5 (runs start over at each event),
+    # the rise of 0.9 from -0.2 at position 9 is below the threshold
+    assert list(get_cusum_event_positions(values, thresholds)) == [3, 5]
+
+    # The windows of the running minimum and maximum does not change the events
+    assert list(get_cusum_event_positions(values, thresholds, window=1)) == [3, 5]
+    assert list(get_cusum_event_positions(values, thresholds / 2, window=2)) == list(get_cusum_event_positions(values, thresholds / 2))
+
+
+def test_cusum_filter_sampling_many_tickers():
+    sep_prepared = pd.read_csv("../datasets/testing/sep_prepared.csv", parse_dates=["date"], index_col="date", low_memory=False)
+    sep_prepared = sep_prepared.sort_values(by=["ticker", "date"])
+
+    samples_all = cusum_filter_sampling(sep_prepared.copy(), threshold_multiplier=1.5)
+
+    for ticker in ["AAPL", "FCX", "NTK"]:
+        sep_ticker = sep_prepared.loc[sep_prepared.ticker == ticker]
+        samples_ticker = cusum_filter_sampling(sep_ticker.copy(), threshold_multiplier=1.5)
+        assert list(samples_all.loc[samples_all.ticker == ticker].index) == list(samples_ticker.index)
+
+        # Fewer samples than monthly sampling, none before there are two months of returns
+        assert 0 < len(samples_ticker) < len(sep_ticker) / 21
+        assert samples_ticker.index[0] > sep_ticker.index[0] + pd.DateOffset(months=2)
+
+
+def test_cusum_filter_sampling_starts_at_first_datekey():
+    sep_prepared = pd.read_csv("../datasets/testing/sep_prepared.csv", parse_dates=["date", "datekey"], index_col="date", low_memory=False)
+    sep_aapl = sep_prepared.loc[sep_prepared.ticker == "AAPL"].sort_index()
+
+    # As if the first filing of AAPL was in 2005, the prices before it are still used for the thresholds
+    sep_aapl.loc[sep_aapl.index < pd.to_datetime("2005-01-03"), "datekey"] = pd.NaT
+
+    samples = cusum_filter_sampling(sep_aapl.copy(), threshold_multiplier=1.5)
+
+    assert len(samples) > 0
+    assert samples["datekey"].notnull().all()
+    assert samples.index[0] > pd.to_datetime("2005-01-03")
+    assert samples.index[0] < pd.to_datetime("2005-01-03") + pd.DateOffset(months=2) # No new warm up of the thresholds
@@ -6,7 +6,8 @@ from datetime import datetime, timedelta
 from ..processing.engine import pandas_mp_engine
 from ..sep_features import add_weekly_and_12m_stock_returns,\
         add_equally_weighted_weekly_market_returns,\
-        dividend_adjusting_prices_backwards, dividend_adjusting_prices_forwards
+        dividend_adjusting_prices_backwards, dividend_adjusting_prices_forwards,\
+        add_indmom, add_sep_panel_features
 
 sep = None
 
@@ -139,3 +140,24 @@ def test_add_equally_weighted_weekly_market_returns():
     # assert sep.loc[sep.index == "1998-01-07", "mom1w"].mean() == pytest.approx(sep_aapl.loc["1998-01-07"]["ewmm"])
     assert sep.loc[sep.index == "2000-01-07", "mom1w"].mean() == pytest.approx(sep_aapl.loc["2000-01-07"]["mom1w_ewa_market"])
 
+
+def test_add_sep_panel_features():
+    sep_prepared = pd.read_csv("../datasets/testing/sep_prepared.csv", parse_dates=["date"], index_col="date")
+    sep_prepared = sep_prepared.drop(columns=["mom1w", "mom12m_actual", "mom1w_ewa_market"])
+
+    # Same values as the per ticker, per date and per industry functions
+    expected = pd.concat([add_weekly_and_12m_stock_returns(sep_ticker.copy()) for _, sep_ticker in sep_prepared.groupby("ticker")])
+    expected = pd.concat([add_equally_weighted_weekly_market_returns(sep_date.copy()) for _, sep_date in expected.groupby(level=0)])
+    expected = pd.concat([add_indmom(sep_industry.copy()) for _, sep_industry in expected.groupby("industry")])
+
+    sep_panel = add_sep_panel_features(sep_prepared.copy())
+
+    expected = expected.reset_index().sort_values(by=["ticker", "date"]).reset_index(drop=True)
+    sep_panel = sep_panel.reset_index().sort_values(by=["ticker", "date"]).reset_index(drop=True)
+
+    for column in ["mom1w", "mom12m_actual", "mom1w_ewa_market", "indmom"]:
+        pd.testing.assert_series_equal(sep_panel[column], expected[column].astype(float), check_exact=False, atol=1e-6)
+
+    sep_aapl = sep_panel.loc[sep_panel["ticker"] == "AAPL"].set_index("date")
+    assert sep_aapl.loc["2001-01-30", "mom1m"] == pytest.approx((sep_aapl.loc["2001-01-30", "adj_close"] / sep_aapl.loc["2000-12-29", "adj_close"]) - 1)
+    assert sep_aapl.loc["2001-01-30", "mom12m"] == pytest.approx((sep_aapl.loc["2000-12-29", "adj_close"] / sep_aapl.loc["2000-01-31", "adj_close"]) - 1)
@@ -3,7 +3,8 @@ import pytest
 import numpy as np
 import math
 
-from ..sf1_features import add_sf1_features
+from ..sf1_features import add_sf1_features, add_sf1_features_for_all_tickers, get_ps, get_ps_batch, sf1_feature_registry
+from ..helpers.fundamentals_index import FundamentalsIndex
 from ..processing.engine import pandas_mp_engine
 from ..helpers.helpers import forward_fill_gaps, get_most_up_to_date_10q_filing, get_most_up_to_date_10k_filing
 
@@ -975,6 +976,110 @@ def test_feature_coverage():
             print(len(sf1_art_featured_selected) - sf1_art_featured_selected.count())
 
 
+def test_get_ps_batch():
+    sf1_art_filled = forward_fill_gaps(sf1_art.sort_values(by=["calendardate", "datekey"]), 3).reset_index()
+    sf1_art_1y_ago = FundamentalsIndex(sf1_art_filled, by_ticker=True).get_rows(sf1_art_filled["calendardate"], \
+        sf1_art_filled["datekey"], 4, tickers=sf1_art_filled["ticker"])
+
+    ps = get_ps_batch(sf1_art_filled, sf1_art_1y_ago)
+
+    assert np.isnan(ps).sum() < len(ps)
+
+    for i in range(len(sf1_art_filled)):
+        if sf1_art_1y_ago.iloc[i].dropna().empty:
+            continue
+        expected = get_ps(sf1_art_filled.iloc[i], sf1_art_1y_ago.iloc[i])
+        assert (ps[i] == expected) or (np.isnan(ps[i]) and np.isnan(expected))
+
+
+def get_rowwise_snapshot_metadata(tickers):
+    # Fixed metadata used when producing lacking_sf1_art_featured_rowwise_snapshot.csv with the row by row implementation
+    return pd.DataFrame({
+        "ticker": tickers,
+        "industry": ["Tobacco" if ticker == "NTK" else "Copper" for ticker in tickers],
+        "firstpricedate": pd.Timestamp("1990-01-02"),
+    })
+
+
+def assert_matches_rowwise_snapshot(sf1_art_featured_ticker, snapshot_ticker):
+    assert list(sf1_art_featured_ticker.index) == list(snapshot_ticker.index)
+
+    for column in features:
+        if column == "industry":
+            assert list(sf1_art_featured_ticker[column]) == list(snapshot_ticker[column])
+            continue
+
+        expected = pd.to_numeric(snapshot_ticker[column], errors="coerce").values.astype(np.float64)
+        result = pd.to_numeric(sf1_art_featured_ticker[column], errors="coerce").values.astype(np.float64)
+
+        assert np.allclose(result, expected, rtol=1e-12, atol=0, equal_nan=True), column
+
+
+def test_add_sf1_features_matches_rowwise_snapshot():
+    snapshot = pd.read_csv("../datasets/testing/lacking_sf1_art_featured_rowwise_snapshot.csv", parse_dates=["calendardate", \
+        "datekey", "reportperiod"], index_col="calendardate", low_memory=False)
+
+    sf1_art_sorted = sf1_art.sort_values(by=["calendardate", "datekey"])
+    sf1_arq_sorted = sf1_arq.sort_values(by=["calendardate", "datekey"])
+    metadata_snapshot = get_rowwise_snapshot_metadata(list(sf1_art_sorted.ticker.unique()))
+
+    for ticker in list(sf1_art_sorted.ticker.unique()):
+        sf1_art_featured_ticker = add_sf1_features(sf1_art_sorted.loc[sf1_art_sorted.ticker == ticker], \
+            sf1_arq_sorted.loc[sf1_arq_sorted.ticker == ticker], metadata_snapshot.loc[metadata_snapshot.ticker == ticker])
+
+        assert_matches_rowwise_snapshot(sf1_art_featured_ticker, snapshot.loc[snapshot.ticker == ticker])
+
+
+def test_add_sf1_features_for_all_tickers_matches_rowwise_snapshot():
+    snapshot = pd.read_csv("../datasets/testing/lacking_sf1_art_featured_rowwise_snapshot.csv", parse_dates=["calendardate", \
+        "datekey", "reportperiod"], index_col="calendardate", low_memory=False)
+
+    sf1_art_sorted = sf1_art.sort_values(by=["calendardate", "datekey"])
+    sf1_arq_sorted = sf1_arq.sort_values(by=["calendardate", "datekey"])
+    metadata_snapshot = get_rowwise_snapshot_metadata(list(sf1_art_sorted.ticker.unique()))
+
+    sf1_art_featured_all = add_sf1_features_for_all_tickers(sf1_art_sorted, sf1_arq_sorted, metadata_snapshot)
+
+    assert len(sf1_art_featured_all) == len(snapshot)
+
+    for ticker in list(sf1_art_sorted.ticker.unique()):
+        assert_matches_rowwise_snapshot(sf1_art_featured_all.loc[sf1_art_featured_all.ticker == ticker], \
+            snapshot.loc[snapshot.ticker == ticker])
+
+    # Tickers without metadata are returned as they are
+    sf1_art_featured_partial = add_sf1_features_for_all_tickers(sf1_art_sorted, sf1_arq_sorted, \
+        metadata_snapshot.loc[metadata_snapshot.ticker != "NTK"])
+
+    sf1_art_ntk = sf1_art_featured_partial.loc[sf1_art_featured_partial.ticker == "NTK"]
+    assert len(sf1_art_ntk) == (sf1_art_sorted.ticker == "NTK").sum()
+    assert sf1_art_ntk["roaq"].isnull().all()
+
+
+def test_add_sf1_features_cached_per_feature(tmp_path):
+    sf1_art_sorted = sf1_art.sort_values(by=["calendardate", "datekey"])
+    sf1_arq_sorted = sf1_arq.sort_values(by=["calendardate", "datekey"])
+    metadata_snapshot = get_rowwise_snapshot_metadata(list(sf1_art_sorted.ticker.unique()))
+
+    featured = add_sf1_features_for_all_tickers(sf1_art_sorted, sf1_arq_sorted, metadata_snapshot)
+    cached = add_sf1_features_for_all_tickers(sf1_art_sorted, sf1_arq_sorted, metadata_snapshot, feature_cache_dir=str(tmp_path))
+
+    pd.testing.assert_frame_equal(featured, cached)
+    pd.testing.assert_frame_equal(featured, add_sf1_features_for_all_tickers(sf1_art_sorted, sf1_arq_sorted, metadata_snapshot, \
+        feature_cache_dir=str(tmp_path)))
+    assert all(len(list((tmp_path / name).iterdir())) == 1 for name in sf1_feature_registry.features)
+
+    # Changing one feature only recalculates that feature
+    code_hash = sf1_feature_registry.features["bm"].code_hash
+    sf1_feature_registry.features["bm"].code_hash = "changed"
+    try:
+        add_sf1_features_for_all_tickers(sf1_art_sorted, sf1_arq_sorted, metadata_snapshot, feature_cache_dir=str(tmp_path))
+    finally:
+        sf1_feature_registry.features["bm"].code_hash = code_hash
+
+    assert len(list((tmp_path / "bm").iterdir())) == 2
+    assert all(len(list((tmp_path / name).iterdir())) == 1 for name in sf1_feature_registry.features if name != "bm")
+
+
 
 
 
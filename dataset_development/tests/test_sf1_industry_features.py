@@ -3,7 +3,7 @@ import pytest
 import numpy as np
 
 from ..processing.engine import pandas_mp_engine
-from ..sf1_industry_features import add_industry_sf1_features
+from ..sf1_industry_features import add_industry_sf1_features, get_industry_statistics, get_ms, get_ms_batch
 from ..helpers.helpers import get_most_up_to_date_10k_filing
 
 
@@ -212,3 +212,33 @@ def test_add_ms():
 
     assert check_row["ms"] == ms
 
+
+
+def test_add_industry_sf1_features_for_several_industries():
+    global sf1_art_featured
+
+    # Industry statistics are per (industry, calendardate), so all industries at once equals one industry at a time
+    industry_sf1_art_all = add_industry_sf1_features(sf1_art_featured, metadata)
+
+    for industry in list(sf1_art_featured.industry.unique()):
+        industry_sf1_art_industry = add_industry_sf1_features(sf1_art_featured.loc[sf1_art_featured.industry == industry], metadata)
+        industry_sf1_art_from_all = industry_sf1_art_all.loc[industry_sf1_art_all.industry == industry]
+
+        for feature in features:
+            if feature not in industry_sf1_art_industry.columns:
+                continue
+            assert np.array_equal(industry_sf1_art_from_all[feature].values.astype(np.float64), \
+                industry_sf1_art_industry[feature].values.astype(np.float64), equal_nan=True), feature
+
+
+def test_get_ms_batch():
+    global sf1_art_featured
+
+    sf1_art = sf1_art_featured.reset_index()
+    industry_means = sf1_art.groupby("calendardate").apply(get_industry_statistics)
+
+    ms = get_ms_batch(sf1_art, industry_means.reindex(sf1_art["calendardate"]))
+
+    for i, art_row_cur in sf1_art.iterrows():
+        expected = get_ms(art_row_cur, industry_means, art_row_cur["calendardate"])
+        assert (ms[i] == expected) or (np.isnan(ms[i]) and np.isnan(expected))
@@ -0,0 +1,88 @@
+import os
+import filecmp
+import pandas as pd
+import pytest
+
+from ..synthetic_data import write_synthetic_sharadar, sep_columns, sf1_columns, metadata_columns
+from ..benchmark_pipeline import record_results, compare_results
+
+
+paths = None
+
+@pytest.fixture(scope='module', autouse=True)
+def setup(tmpdir_factory):
+    global paths
+    paths = write_synthetic_sharadar(str(tmpdir_factory.mktemp("synthetic")), 20, years=3, restatement_probability=0.2, \
+        batch_tickers=7)
+
+    yield
+
+
+def test_schema():
+    # Same columns as the Sharadar files the pipeline reads
+    assert list(pd.read_csv(paths["sep"], nrows=1).columns) == sep_columns
+    assert list(pd.read_csv(paths["sf1_art"], nrows=1).columns) == sf1_columns
+    assert list(pd.read_csv(paths["sf1_arq"], nrows=1).columns) == sf1_columns
+    assert list(pd.read_csv(paths["metadata"], nrows=1).columns) == metadata_columns
+
+    testing_sf1_art = pd.read_csv("../datasets/testing/sf1_art.csv", nrows=1)
+    assert list(testing_sf1_art.columns) == sf1_columns
+
+
+def test_sep():
+    sep = pd.read_csv(paths["sep"], parse_dates=["date"])
+    metadata = pd.read_csv(paths["metadata"], parse_dates=["firstpricedate", "lastpricedate"])
+
+    # Batches are appended without repeating the header
+    assert set(sep["ticker"].unique()) == set(metadata["ticker"])
+    assert not sep.duplicated(subset=["ticker", "date"]).any()
+    assert (sep["close"] > 0).all()
+    assert (sep["high"] >= sep["low"]).all()
+
+    first_dates = sep.groupby("ticker")["date"].min()
+    last_dates = sep.groupby("ticker")["date"].max()
+    metadata = metadata.set_index("ticker")
+    assert (first_dates == metadata.loc[first_dates.index, "firstpricedate"]).all()
+    assert (last_dates == metadata.loc[last_dates.index, "lastpricedate"]).all()
+
+
+def test_sf1_restatements_and_gaps():
+    sf1_art = pd.read_csv(paths["sf1_art"], parse_dates=["calendardate", "datekey"])
+    sep = pd.read_csv(paths["sep"], parse_dates=["date"])
+
+    # Restated filings: the same calendardate filed again later, with different values
+    restated = sf1_art.loc[sf1_art.duplicated(subset=["ticker", "calendardate"], keep=False)]
+    assert len(restated) > 0
+    assert not sf1_art.duplicated(subset=["ticker", "calendardate", "datekey"]).any()
+    assert (restated.groupby(["ticker", "calendardate"])["revenue"].nunique() > 1).any()
+
+    # Nothing is filed after the last price of the ticker
+    last_dates = sep.groupby("ticker")["date"].max()
+    assert (sf1_art["datekey"].values <= last_dates.loc[sf1_art["ticker"]].values).all()
+    assert (sf1_art["datekey"] > sf1_art["calendardate"]).all()
+
+
+def test_deterministic(tmpdir):
+    other_paths = write_synthetic_sharadar(str(tmpdir), 20, years=3, restatement_probability=0.2, batch_tickers=5)
+
+    for name in paths:
+        assert filecmp.cmp(paths[name], other_paths[name], shallow=False)
+
+
+def test_record_and_compare_results(tmpdir):
+    path = os.path.join(str(tmpdir), "benchmarks", "results.json")
+    run = {"num_tickers": 10, "years": 3, "sampling": "rebase", "stages": [{"stage": "SEP: Add sep features", "seconds": 2.0}, \
+        {"stage": "finalize_dataset", "seconds": 1.0}], "total_seconds": 3.0}
+    slower_run = dict(run, stages=[{"stage": "SEP: Add sep features", "seconds": 3.0}, {"stage": "finalize_dataset", "seconds": 1.0}], \
+        total_seconds=4.0)
+
+    record_results([run], path)
+    results = record_results([slower_run], path)
+    assert len(results["runs"]) == 2
+    assert "pandas" in results["runs"][0]
+
+    comparison = compare_results(path).set_index("stage")
+    assert comparison.loc["SEP: Add sep features", "ratio"] == 1.5
+    assert comparison.loc["SEP: Add sep features", "regression"]
+    assert not comparison.loc["finalize_dataset", "regression"]
+    assert comparison.loc["Total", "latest_seconds"] == 4.0
@@ -0,0 +1,90 @@
+import os
+import sys
+import shutil
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from helpers.columnar_store import merge_csv_into_ticker_sorted_parquet, read_ticker_index
+
+
+"""
+Merges a Sharadar export that is already on disk (the full table or only recent rows) into the ticker sorted columnar
+stores the pipeline reads, instead of overwriting the tables. Only rows that are new or changed are written, and
+each ingest is logged with the keys it changed, so incremental_update.py picks up what changed since the last ingest
+it processed (helpers.columnar_store.read_changes). Nothing is downloaded.
+- SEP is merged into SEP_PURGED.parquet (written by purge_tickers_from_sources.py). Like the purge, only tickers in the
+  SF1_ART store are kept if it exists, so SF1 is ingested first.
+- SF1 is split by dimension, the ART and ARQ rows are merged into SHARADAR_SF1_ART.parquet and SHARADAR_SF1_ARQ.parquet.
+  Rows of other dimensions are not used and skipped.
+
+Run from dataset_development/ with the table and the export file, optionally the directory of the stores:
+    python utils/ingest_sharadar_export.py SF1 ./datasets/sharadar/SHARADAR_SF1_2019-12-31.csv
+    python utils/ingest_sharadar_export.py SEP ./datasets/sharadar/SHARADAR_SEP_2019-12-31.csv
+"""
+
+# Rows are unique by keys, the stores are sorted by them
+tables = {
+    "SEP": {
+        "stores": {None: "SEP_PURGED.parquet"},
+        "keys": ["ticker", "date"],
+        "parse_dates": ["date"],
+    },
+    "SF1": {
+        "stores": {"ART": "SHARADAR_SF1_ART.parquet", "ARQ": "SHARADAR_SF1_ARQ.parquet"}, # By dimension
+        "keys": ["ticker", "calendardate", "datekey"],
+        "parse_dates": ["calendardate", "datekey"],
+    },
+}
+
+# The ticker "NA" must not be read as nan
+read_csv_kwargs = {"keep_default_na": False, "na_values": [""], "low_memory": False}
+
+
+def split_by_dimension(export_path: str, dimensions: list, work_dir: str, chunksize: int=1000000) -> dict:
+    """
+    Writes the rows of each of $dimensions in the SF1 export $export_path to a csv file in $work_dir, one chunk at a time.
+    Returns the csv path of each dimension, values are written as they are in the export.
+    """
+    paths = {dimension: os.path.join(work_dir, dimension + ".csv") for dimension in dimensions}
+
+    for chunk_number, chunk in enumerate(pd.read_csv(export_path, chunksize=chunksize, dtype=str, keep_default_na=False, \
+        na_values=[""])):
+        for dimension in dimensions:
+            chunk.loc[chunk["dimension"] == dimension].to_csv(paths[dimension], index=False, \
+                mode="w" if chunk_number == 0 else "a", header=(chunk_number == 0))
+
+    return paths
+
+
+if __name__ == "__main__":
+    table = sys.argv[1]
+    export_path = sys.argv[2]
+
+    if table not in tables:
+        print(table + " not a valid option! Options: " + ", ".join(tables.keys()))
+        sys.exit(1)
+
+    config = tables[table]
+    store_dir = sys.argv[3] if len(sys.argv) > 3 else "./datasets/sharadar"
+
+    tickers = None
+    if table == "SEP":
+        sf1_art_path = os.path.join(store_dir, tables["SF1"]["stores"]["ART"])
+        tickers = set(read_ticker_index(sf1_art_path).index) if os.path.isfile(sf1_art_path) else None
+        export_paths = {None: export_path}
+    else:
+        work_dir = os.path.join(store_dir, "sf1_dimensions.work")
+        if not os.path.exists(work_dir):
+            os.makedirs(work_dir)
+        export_paths = split_by_dimension(export_path, list(config["stores"]), work_dir)
+
+    for dimension, store in config["stores"].items():
+        path = os.path.join(store_dir, store)
+        ingest = merge_csv_into_ticker_sorted_parquet(export_paths[dimension], path, keys=config["keys"], \
+            tickers=tickers, parse_dates=config["parse_dates"], **read_csv_kwargs)
+
+        print("Ingest {} into {}: {} rows added, {} rows changed, {} rows in total, last date {}".format(ingest["ingest"], path, \
+            ingest["rows_added"], ingest["rows_changed"], ingest["rows"], ingest["last_date"]))
+
+    if table == "SF1":
+        shutil.rmtree(work_dir)
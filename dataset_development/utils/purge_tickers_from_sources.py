@@ -1,29 +1,50 @@
+import os
+import sys
 import pandas as pd
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from helpers.columnar_store import count_ticker_rows, csv_to_ticker_sorted_parquet
 
-if __name__ == "__main__":
 
-    sf1_art = pd.read_csv("./datasets/sharadar/SHARADAR_SF1_ART.csv", low_memory=False)
-    
-    sep = pd.read_csv("./datasets/sharadar/SHARADAR_SEP.csv", low_memory=False)
-    metadata = pd.read_csv("./datasets/sharadar/SHARADAR_TICKERS_METADATA.csv", low_memory=False)
+"""
+Removes tickers without SF1 data from SEP and the metadata. The source files are streamed in chunks, so memory use
+does not grow with the size of SHARADAR_SEP.csv. Besides SEP_PURGED.csv, a ticker sorted columnar copy
+(SEP_PURGED.parquet) is written with a row offset index per ticker (SEP_PURGED.parquet.index.csv), so one ticker's
+history can be read with helpers.columnar_store.read_tickers.
 
-    print("sf1_art length: ", len(sf1_art))
-    print("sep length: ", len(sep))
-    print("metadata length: ", len(metadata))
+Run from dataset_development/.
+"""
 
 
-    wanted_tickers = list(sf1_art.ticker.unique())
-    print("Wanded tickers length: ", len(wanted_tickers))
+def purge_csv(path: str, out_path: str, tickers: set, chunksize: int=1000000) -> int:
+    """
+    Writes the rows of $path for $tickers to $out_path, one chunk at a time. Returns the number of rows written.
+    """
+    rows_written = 0
 
-    purged_sep = sep.loc[sep.ticker.isin(wanted_tickers)]
-    purged_metadata = metadata[metadata.ticker.isin(wanted_tickers) & (metadata.table=="SF1")]
+    for chunk_number, chunk in enumerate(pd.read_csv(path, chunksize=chunksize, low_memory=False)):
+        chunk = chunk.loc[chunk["ticker"].isin(tickers)]
+        chunk.to_csv(out_path, index=False, mode="w" if chunk_number == 0 else "a", header=(chunk_number == 0))
+        rows_written += len(chunk)
 
+    return rows_written
 
-    purged_sep.to_csv("./datasets/sharadar/SEP_PURGED.csv", index=False)
-    purged_metadata.to_csv("./datasets/sharadar/METADATA_PURGED.csv", index=False)
 
+if __name__ == "__main__":
+    chunksize = 1000000
+
+    wanted_tickers = set(count_ticker_rows("./datasets/sharadar/SHARADAR_SF1_ART.csv", chunksize=chunksize).index)
+    print("Wanted tickers length: ", len(wanted_tickers))
+
+    purged_sep_length = purge_csv("./datasets/sharadar/SHARADAR_SEP.csv", "./datasets/sharadar/SEP_PURGED.csv", wanted_tickers, chunksize)
+
+    index = csv_to_ticker_sorted_parquet("./datasets/sharadar/SHARADAR_SEP.csv", "./datasets/sharadar/SEP_PURGED.parquet", \
+        tickers=wanted_tickers, sort_by=["ticker", "date"], chunksize=chunksize, parse_dates=["date"])
+
+    metadata = pd.read_csv("./datasets/sharadar/SHARADAR_TICKERS_METADATA.csv", low_memory=False) # Small, one row per ticker and table
+    purged_metadata = metadata[metadata.ticker.isin(wanted_tickers) & (metadata.table=="SF1")]
+    purged_metadata.to_csv("./datasets/sharadar/METADATA_PURGED.csv", index=False)
 
-    print("sf1_art length: ", len(sf1_art))
-    print("Purged sep length: ", len(purged_sep))
-    print("Purged metadata length: ", len(purged_metadata))
\ No newline at end of file
+    print("Purged sep length: ", purged_sep_length)
+    print("Tickers in SEP_PURGED.parquet: ", len(index))
+    print("Purged metadata length: ", len(purged_metadata))
@@ -12,7 +12,6 @@ import pickle
 import copy
 
 from sklearn.metrics import mean_squared_error, r2_score
-from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import mean_squared_error, mean_absolute_error
 # https://scikit-learn.org/stable/modules/generated/sklearn.model_selection.ParameterGrid.html#sklearn.model_selection.ParameterGrid
 from sklearn.model_selection import ParameterGrid
@@ -20,7 +19,7 @@ from sklearn.metrics import mean_squared_error, mean_absolute_error
 
 import matplotlib.pyplot as plt
 
-from dataset_columns import features, labels, base_cols
+from dataset_columns import features, scaled_features, labels, base_cols, load_ml_dataset, get_feature_matrix
 from model_and_performance_visualization import plot_history
 
 from performance_measurement import zero_benchmarked_r_squared
@@ -34,13 +33,10 @@ One cannot expect deep intuition about what type of network is best suited for t
 """
 
 # DATASET PREPARATION
-dataset = pd.read_csv("./dataset_development/datasets/completed/ml_dataset.csv", parse_dates=["date", "timeout"], index_col=["date"])
+dataset = load_ml_dataset(columns=base_cols + scaled_features + ["erp_1m", "primary_label_tbm", "timeout"]) # Features are scaled per date in finalize_dataset
 dataset = dataset.loc[dataset.primary_label_tbm != 0]
 
 dataset = dataset.sort_values(by=["date"]) # important for cross validation
-# Feature scaling
-std_scaler = StandardScaler()
-dataset[features] = std_scaler.fit_transform(dataset[features]) 
 
 train_end = pd.to_datetime("2012-01-01")
 test_start = pd.to_datetime("2012-03-01")
@@ -48,7 +44,7 @@ test_start = pd.to_datetime("2012-03-01")
 train_set = dataset.loc[dataset.index < train_end]
 test_set = dataset.loc[dataset.index >= test_start]
 
-test_x = test_set[features]
+test_x = get_feature_matrix(test_set)
 test_y = test_set["erp_1m"]
 
 
@@ -103,9 +99,9 @@ class KerasGridSearchCV(object):
                 train_set = self.train_set.iloc[train_index] # self.train_set.index < train_end
                 validation_set = self.train_set.iloc[test_index] # self.train_set.index >= validation_start
 
-                train_x = train_set[features]
+                train_x = get_feature_matrix(train_set)
                 train_y = train_set["erp_1m"]
-                validation_x = validation_set[features]
+                validation_x = get_feature_matrix(validation_set)
                 validation_y = validation_set["erp_1m"]            
 
                 scores, model, history = model_trainer(train_x, train_y, validation_x, validation_y, params)
@@ -164,9 +160,9 @@ class KerasGridSearchCV(object):
         
         train_set = self.train_set.loc[self.train_set.index < train_end]
         validation_set = self.train_set.loc[self.train_set.index >= validation_start] 
-        train_x = train_set[features]
+        train_x = get_feature_matrix(train_set)
         train_y = train_set["erp_1m"]
-        validation_x = validation_set[features]
+        validation_x = get_feature_matrix(validation_set)
         validation_y = validation_set["erp_1m"]      
 
         for _ in range(n_estimators):
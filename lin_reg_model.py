@@ -2,7 +2,6 @@
 # Algorithms
 from sklearn.model_selection import RandomizedSearchCV
 from sklearn.decomposition import PCA
-from sklearn.preprocessing import StandardScaler
 from sklearn import linear_model
 from sklearn.model_selection import cross_val_predict # Don't know if I will use
 from sklearn.metrics import mean_squared_error, r2_score
@@ -18,22 +17,18 @@ import pandas as pd
 import pickle
 
 from cross_validation import PurgedKFold, cv_score
-from dataset_columns import features, labels, base_cols
+from dataset_columns import features, scaled_features, labels, base_cols, load_ml_dataset, get_feature_matrix
 
 from performance_measurement import zero_benchmarked_r_squared
 
 # DATASET PREPARATION
 print("Reading ML Dataset")
-dataset = pd.read_csv("./dataset_development/datasets/completed/ml_dataset.csv", parse_dates=["date", "timeout"], index_col=["date"])
+dataset = load_ml_dataset(columns=base_cols + scaled_features + ["erp_1m", "primary_label_tbm", "timeout"]) # Features are scaled per date in finalize_dataset
 dataset = dataset.loc[dataset.primary_label_tbm != 0]
 
 dataset = dataset.sort_values(by=["date"]) # important for cross validation
 
 
-# Feature scaling
-std_scaler = StandardScaler()
-# Maybe not standardize labels..., also many of the columns are not numeric at this point, do this process below...
-dataset[features] = std_scaler.fit_transform(dataset[features]) 
 scaled_dataset = dataset
 # scaled_dataset["erp_1m"] = dataset["erp_1m"]
 
@@ -57,10 +52,10 @@ print("test set shape ", test_set.shape)
 # print("test set num tickers", len(test_set["ticker"].unique()))
 print(scaled_dataset.columns)
 
-train_x = train_set[features]
+train_x = get_feature_matrix(train_set)
 train_y = train_set["erp_1m"]
 
-test_x = test_set[features]
+test_x = get_feature_matrix(test_set)
 test_y = test_set["erp_1m"]
 
 
@@ -20,11 +20,11 @@ import numpy as np
 import pickle
 
 
-from dataset_development.labeling import meta_labeling_via_triple_barrier_method
+from dataset_development.labeling import BarrierPathCache
 from dataset_development.processing.engine import pandas_mp_engine
 from dataset_development.sep_features import dividend_adjusting_prices_backwards
 
-from dataset_columns import features, labels, base_cols
+from dataset_columns import features, labels, base_cols, load_ml_dataset
 from cross_validation import PurgedKFold
 
 if __name__ == "__main__":
@@ -34,7 +34,7 @@ if __name__ == "__main__":
 
     # DATASET PREPARATION
     print("Reading inn Dataset")
-    dataset = pd.read_csv("./dataset_development/datasets/completed/ml_dataset.csv", parse_dates=["date", "timeout"], index_col="date")
+    dataset = load_ml_dataset()
     dataset = dataset.loc[dataset.primary_label_tbm != 0]
 
     print("Labels After dropping zero labels")
@@ -119,18 +119,12 @@ if __name__ == "__main__":
     # NOTE: must allways relabel and retrain the certainty model every time the side model changes... (this is not every time though...)
     # NOTE: maybe better to have a sepereate script for model testing and performance measurement.
 
+    # NOTE: Only the side changes between retrains, so the paths of returns are extracted once for both train and test set.
+    print("Building barrier path cache")
+    barrier_path_cache = BarrierPathCache(pd.concat([train_set, test_set]), sep_adjusted)
+
     print("Meta Labeling of train set")
-    train_set_with_meta_labels = pandas_mp_engine(
-        callback=meta_labeling_via_triple_barrier_method, 
-        atoms=train_set_with_predictions,
-        data={'sep': sep_adjusted}, 
-        molecule_key='dataset', 
-        split_strategy= 'ticker_new', 
-        num_processes=num_processes, 
-        molecules_per_process=1, 
-        ptSl=[1, -0.8], # 
-        min_ret=None
-    )
+    train_set_with_meta_labels = barrier_path_cache.meta_labels(train_set_with_predictions, ptSl=[1, -0.8])
 
 
     # Set up training of second model
@@ -179,17 +173,7 @@ if __name__ == "__main__":
 
     # Run triple barrier search using the side predictions on the test set -> This will be the correct labels for the certainty-model
     print("Running triple barrier search on test set with side set by side classifier... (Meta labeling on test set)")
-    test_set_meta_labeled = pandas_mp_engine(
-        callback=meta_labeling_via_triple_barrier_method, 
-        atoms=test_set_with_predictions,
-        data={'sep': sep_adjusted}, 
-        molecule_key='dataset', 
-        split_strategy= 'ticker_new', 
-        num_processes=num_processes, 
-        molecules_per_process=1, 
-        ptSl=[1, -0.8], # NOTE: less tolerant for movement downwards... 
-        min_ret=None
-    )
+    test_set_meta_labeled = barrier_path_cache.meta_labels(test_set_with_predictions, ptSl=[1, -0.8]) # NOTE: less tolerant for movement downwards... 
 
     # Score the certainty model 
     certainty_test_x = test_set_meta_labeled[features] 
@@ -24,7 +24,7 @@ from dataset_development.labeling import meta_labeling_via_triple_barrier_method
 from dataset_development.processing.engine import pandas_mp_engine
 from dataset_development.sep_features import dividend_adjusting_prices_backwards
 
-from dataset_columns import features, labels, base_cols
+from dataset_columns import features, labels, base_cols, load_ml_dataset
 from cross_validation import PurgedKFold
 
 
@@ -35,7 +35,7 @@ if __name__ == "__main__":
 
     # DATASET PREPARATION
     print("Reading inn Dataset")
-    dataset = pd.read_csv("./dataset_development/datasets/completed/ml_dataset.csv", parse_dates=["date", "timeout"], index_col="date")
+    dataset = load_ml_dataset()
     dataset = dataset.loc[dataset.primary_label_tbm != 0]
     dataset = dataset.sort_values(by="date")
 
@@ -2,7 +2,6 @@
 # Algorithms
 from sklearn.model_selection import RandomizedSearchCV
 from sklearn.decomposition import PCA
-from sklearn.preprocessing import StandardScaler
 from sklearn import linear_model
 from sklearn.model_selection import cross_val_predict # Don't know if I will use
 from sklearn.metrics import mean_squared_error, r2_score
@@ -18,26 +17,21 @@ import pandas as pd
 import pickle
 
 from cross_validation import PurgedKFold, cv_score
-from dataset_columns import features, labels, base_cols
+from dataset_columns import features, scaled_features, labels, base_cols, load_ml_dataset, get_feature_matrix
 
 from performance_measurement import zero_benchmarked_r_squared
 
 # DATASET PREPARATION
 print("Reading ML Dataset")
-dataset = pd.read_csv("./dataset_development/datasets/completed/ml_dataset.csv", parse_dates=["date", "timeout"], index_col=["date"])
+dataset = load_ml_dataset(columns=base_cols + scaled_features + ["erp_1m", "primary_label_tbm", "timeout"]) # Features are scaled per date in finalize_dataset
 dataset = dataset.loc[dataset.primary_label_tbm != 0]
 
 dataset = dataset.sort_values(by=["date"]) # important for cross validation
 
-dataset_x = dataset[features]
+dataset_x = get_feature_matrix(dataset)
 # dataset_y = dataset["erp_1m"] # No need to scale dependent variable
 
 
-# Feature scaling
-std_scaler = StandardScaler()
-# Maybe not standardize labels..., also many of the columns are not numeric at this point, do this process below...
-dataset_x = std_scaler.fit_transform(dataset_x) 
-
 # Encoding Categorical Features: NOTE: Not using industry now
 pca = PCA(n_components=5) # NOTE: How many principal complents?
 reduced_dataset = pca.fit_transform(dataset_x)
@@ -21,7 +21,7 @@ import scipy
 from scipy.stats import randint
 
 from cross_validation import PurgedKFold, cv_score
-from dataset_columns import features, labels, base_cols
+from dataset_columns import features, labels, base_cols, load_ml_dataset
 from performance_measurement import sample_binary_predictor, single_sample_t_test
 from model_and_performance_visualization import plot_feature_importances
 
@@ -29,7 +29,7 @@ from model_and_performance_visualization import plot_feature_importances
 n_jobs = 5
 
 # DATASET PREPARATION
-dataset = pd.read_csv("./dataset_development/datasets/completed/ml_dataset.csv", parse_dates=["date", "timeout"], index_col=["date"])
+dataset = load_ml_dataset()
 dataset = dataset.loc[dataset.erp_1m != 0]
 
 dataset = dataset.sort_values(by=["date"]) # important for cross validation
@@ -14,7 +14,7 @@ import scipy
 from scipy.stats import randint
 
 from cross_validation import PurgedKFold, cv_score
-from dataset_columns import features, labels, base_cols
+from dataset_columns import features, labels, base_cols, load_ml_dataset
 from performance_measurement import zero_benchmarked_r_squared
 
 from model_and_performance_visualization import plot_feature_importances
@@ -23,7 +23,7 @@ n_jobs = 6
 
 # DATASET PREPARATION
 print("Reading dataset")
-dataset = pd.read_csv("./dataset_development/datasets/completed/ml_dataset.csv", parse_dates=["date", "timeout"], index_col=["date"])
+dataset = load_ml_dataset()
 dataset = dataset.loc[dataset.erp_1m != 0]
 
 dataset = dataset.sort_values(by=["date"]) # important for cross validation